@@ -0,0 +1,228 @@
+"""
+Analítica - Control de Patio
+Ocupación de rampas por día de semana y hora, y distribución de estadías por
+tipo de camión, sobre los movimientos de los últimos `dias` (un trimestre por
+defecto). GET /api/analytics/*.
+
+Las horas de cada etapa se leen como columnas (arreglos NumPy de segundos) en
+una sola consulta, sin armar objetos por fila: el motor devuelve segundos
+desde 1970 en hora local de pared (SQLite guarda la hora local; en PostgreSQL
+el timestamptz se pasa a la zona de la sesión), así día de semana y hora salen
+con aritmética. Un NULL queda como NaN.
+
+Ocupación: cada movimiento ocupa su rampa en [hora_en_rampa, salida), con
+salida = hora_salida_rampa, o hora_salida_cd, o el fin de la consulta (ahora)
+si sigue en la rampa.
+Con los inicios y finales ordenados, la integral de rampas ocupadas hasta T es
+
+    F(T) = sum(T - inicio, inicio < T) - sum(T - fin, fin < T)
+
+y se evalúa en todos los bordes de hora a la vez con searchsorted y sumas
+acumuladas; la diferencia entre bordes son los segundos-rampa de cada hora, que
+se suman por (día, hora) con bincount. El costo es O(n log n) en movimientos
+y lineal en horas de la ventana, sin importar cuántas horas dure cada estadía.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Sequence
+
+import numpy as np
+from sqlalchemy import DateTime, Float, cast, func, select
+from sqlalchemy.orm import Session
+
+from database import hora_local
+from models import Camion, Movimiento, Rampa, TipoCamion
+
+DIAS_POR_DEFECTO = 91
+DIAS_MAXIMO = 366
+# Los movimientos que ingresaron hasta un día antes de la ventana pueden
+# seguir en rampa dentro de ella
+MARGEN = timedelta(days=1)
+LOTE = 50_000
+JULIANO_1970 = 2440587.5
+
+DIAS_SEMANA = ("lunes", "martes", "miércoles", "jueves", "viernes", "sábado", "domingo")
+TIPOS = tuple(TipoCamion)
+
+# Tramo -> (columna de inicio, columna de fin)
+TRAMOS = {
+    "patio": ("hora_ingreso_garita", "hora_en_rampa"),      # espera hasta llegar a la rampa
+    "traslado": ("hora_asignado", "hora_en_rampa"),         # de la asignación a la rampa
+    "rampa": ("hora_en_rampa", "hora_salida_rampa"),        # carga
+    "total": ("hora_ingreso_garita", "hora_salida_cd"),     # garita a garita
+}
+PERCENTILES = (50, 90, 95)
+
+
+def _epoca(momento: datetime) -> float:
+    """Segundos desde 1970 de la hora local de pared, como los devuelve segundos()"""
+    return (hora_local(momento) - datetime(1970, 1, 1)).total_seconds()
+
+
+def segundos(columna, dialecto: str):
+    """Expresión SQL: la columna de hora como segundos en hora local de pared"""
+    if dialecto == "sqlite":
+        # julianday es más barato que strftime('%s') y conserva los decimales
+        return (func.julianday(columna) - JULIANO_1970) * 86400.0
+    return cast(func.extract("epoch", cast(columna, DateTime())), Float)
+
+
+def columnas(
+    db: Session, sitio_id: int, desde: datetime, nombres: Sequence[str],
+    hasta: datetime = None, rampa_id: int = None
+) -> Dict[str, np.ndarray]:
+    """
+    Columnas de los movimientos del sitio ingresados en [desde, hasta) (índice
+    ix_movimientos_sitio_hora_ingreso), como arreglos float64 alineados. Las
+    columnas hora_* vienen en segundos; las demás (camion_id, rampa_id) tal cual.
+    """
+    dialecto = db.get_bind().dialect.name
+    expresiones = [
+        segundos(getattr(Movimiento, n), dialecto) if n.startswith("hora_") else cast(getattr(Movimiento, n), Float)
+        for n in nombres
+    ]
+    query = select(*expresiones).where(Movimiento.sitio_id == sitio_id, Movimiento.hora_ingreso_garita >= desde)
+    if hasta is not None:
+        query = query.where(Movimiento.hora_ingreso_garita < hasta)
+    if rampa_id is not None:
+        query = query.where(Movimiento.rampa_id == rampa_id)
+
+    # Todas las columnas ya son float en SQL: se leen las tuplas del cursor
+    # DBAPI sin armar un Row por fila
+    bloques = []
+    cursor = db.connection().execute(query).cursor
+    while True:
+        filas = cursor.fetchmany(LOTE)
+        if not filas:
+            break
+        # None -> NaN al convertir a float64
+        bloques.append(np.array(filas, dtype=np.float64).reshape(len(filas), len(nombres)))
+    matriz = np.concatenate(bloques) if bloques else np.empty((0, len(nombres)))
+    return {n: matriz[:, i] for i, n in enumerate(nombres)}
+
+
+def _integral(bordes: np.ndarray, ordenados: np.ndarray) -> np.ndarray:
+    """sum(T - x, x < T) para cada T de bordes"""
+    antes = np.searchsorted(ordenados, bordes, side="left")
+    acumulado = np.concatenate(([0.0], np.cumsum(ordenados)))
+    return bordes * antes - acumulado[antes]
+
+
+def segundos_rampa_por_hora(inicio: np.ndarray, fin: np.ndarray, desde: float, horas: int) -> np.ndarray:
+    """Segundos-rampa ocupados en cada una de las `horas` horas que empiezan en desde"""
+    bordes = desde + 3600.0 * np.arange(horas + 1)
+    inicio = np.sort(np.clip(inicio, bordes[0], bordes[-1]))
+    fin = np.sort(np.clip(fin, bordes[0], bordes[-1]))
+    return np.diff(_integral(bordes, inicio) - _integral(bordes, fin))
+
+
+def ocupacion(
+    db: Session, sitio_id: int, dias: int = DIAS_POR_DEFECTO, rampa_id: int = None, hasta: datetime = None
+) -> dict:
+    """
+    Rampas ocupadas en promedio por día de semana y hora (7 x 24), y la
+    fracción de las rampas activas que eso representa, en los `dias` que
+    terminan con la hora de `hasta` (por defecto, ahora).
+    """
+    ahora = hora_local(hasta) if hasta else datetime.now()
+    fin_ventana = ahora.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    desde = fin_ventana - timedelta(days=dias)
+    datos = columnas(
+        db, sitio_id, desde - MARGEN, ("hora_en_rampa", "hora_salida_rampa", "hora_salida_cd"), ahora, rampa_id
+    )
+
+    inicio = datos["hora_en_rampa"]
+    fin = np.where(np.isnan(datos["hora_salida_rampa"]), datos["hora_salida_cd"], datos["hora_salida_rampa"])
+    fin = np.minimum(np.where(np.isnan(fin), np.inf, fin), _epoca(ahora))
+    validos = ~np.isnan(inicio) & (fin > inicio)
+    inicio, fin = inicio[validos], fin[validos]
+
+    horas = dias * 24
+    inicio_s = _epoca(desde)
+    por_hora = segundos_rampa_por_hora(inicio, fin, inicio_s, horas)
+
+    # Casilla (día de semana, hora) de cada hora de la ventana; 1970-01-01 fue jueves
+    absolutas = (inicio_s // 3600 + np.arange(horas)).astype(np.int64)
+    casillas = ((absolutas // 24 + 3) % 7) * 24 + absolutas % 24
+    ocupadas = np.bincount(casillas, weights=por_hora, minlength=7 * 24)
+    veces = np.bincount(casillas, minlength=7 * 24)
+    promedio = (ocupadas / (3600.0 * np.maximum(veces, 1))).reshape(7, 24)
+
+    if rampa_id is None:
+        rampas = db.query(func.count(Rampa.id)).filter(Rampa.sitio_id == sitio_id, Rampa.activo == True).scalar()
+    else:
+        rampas = 1
+    utilizacion = promedio / rampas if rampas else np.zeros_like(promedio)
+
+    return {
+        "desde": desde,
+        "hasta": fin_ventana,
+        "rampas": rampas,
+        "movimientos": int(validos.sum()),
+        "dias": list(DIAS_SEMANA),
+        "ocupacion": promedio.round(3).tolist(),
+        "utilizacion": utilizacion.round(4).tolist(),
+    }
+
+
+def _tipos_por_camion(db: Session, sitio_id: int, camion_id: np.ndarray) -> np.ndarray:
+    """Índice en TIPOS del tipo de cada camion_id (-1 si el camión ya no está)"""
+    tabla = db.query(Camion.id, Camion.tipo).filter(Camion.sitio_id == sitio_id).all()
+    ids = camion_id.astype(np.int64)
+    tope = max([id_ for id_, _ in tabla] + [int(ids.max()) if len(ids) else 0])
+    codigos = np.full(tope + 1, -1, dtype=np.int64)
+    for id_, tipo in tabla:
+        codigos[id_] = TIPOS.index(tipo)
+    return codigos[ids]
+
+
+def estadias(
+    db: Session, sitio_id: int, dias: int = DIAS_POR_DEFECTO, ancho_min: int = 15, max_min: int = 480,
+    hasta: datetime = None
+) -> dict:
+    """
+    Histograma de minutos por tramo (TRAMOS) y tipo de camión de los
+    movimientos ingresados en los `dias` anteriores a `hasta` (por defecto,
+    ahora), con intervalos de ancho_min; el último junta todo lo que pasa de max_min.
+    """
+    ahora = hora_local(hasta) if hasta else datetime.now()
+    desde = ahora - timedelta(days=dias)
+    nombres = sorted({c for par in TRAMOS.values() for c in par})
+    datos = columnas(db, sitio_id, desde, ["camion_id", *nombres], ahora)
+    tipo = _tipos_por_camion(db, sitio_id, datos["camion_id"])
+
+    intervalos = -(-max_min // ancho_min)
+    bordes = ancho_min * np.arange(intervalos + 1)
+    tramos = {}
+    for tramo, (columna_inicio, columna_fin) in TRAMOS.items():
+        minutos = (datos[columna_fin] - datos[columna_inicio]) / 60.0
+        # Sin alguna de las dos horas: NaN; negativos: relojes desfasados
+        validos = (minutos >= 0) & (tipo >= 0)
+        minutos, tipo_tramo = minutos[validos], tipo[validos]
+        casilla = np.minimum((minutos // ancho_min).astype(np.int64), intervalos - 1)
+        conteos = np.bincount(
+            tipo_tramo * intervalos + casilla, minlength=len(TIPOS) * intervalos
+        ).reshape(len(TIPOS), intervalos)
+
+        por_tipo = {}
+        for i, tipo_camion in enumerate(TIPOS):
+            valores = minutos[tipo_tramo == i]
+            if not len(valores):
+                por_tipo[tipo_camion.value] = {"n": 0, "promedio": None, "percentiles": {}, "conteos": conteos[i].tolist()}
+                continue
+            por_tipo[tipo_camion.value] = {
+                "n": int(len(valores)),
+                "promedio": round(float(valores.mean()), 2),
+                "percentiles": {
+                    f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(valores, PERCENTILES))
+                },
+                "conteos": conteos[i].tolist(),
+            }
+        tramos[tramo] = por_tipo
+
+    return {
+        "desde": desde,
+        "hasta": ahora,
+        "ancho_min": ancho_min,
+        "bordes": bordes.tolist(),
+        "tramos": tramos,
+    }
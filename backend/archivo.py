@@ -0,0 +1,182 @@
+"""
+Archivo Histórico - Control de Patio
+Filas antiguas de movimientos, notificaciones y log de eventos guardadas fuera
+de la BD en archivos NDJSON comprimidos, una carpeta por tabla y mes:
+
+    ARCHIVO_DIR/<tabla>/<AAAA-MM>/<lote>.ndjson.gz
+
+Las escribe el job de mantenimiento (mantenimiento.py archivar) y las leen los
+endpoints de historial para fechas que ya no están en las tablas vivas.
+"""
+import gzip
+import json
+import os
+from datetime import datetime, date
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database import hora_local
+from models import Camion, Usuario, Rampa, SITIO_POR_DEFECTO
+from serializacion import (
+    Seleccion, COLUMNAS_MOVIMIENTO, COLUMNAS_CAMION, COLUMNAS_USUARIO, COLUMNAS_RAMPA,
+    fila_a_movimiento
+)
+
+ARCHIVO_DIR = os.getenv("ARCHIVO_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "archivo"))
+
+# Columnas de fecha que se guardan como texto ISO y se vuelven a leer como datetime
+_COLUMNAS_FECHA = {
+    "movimientos": set(c for c in COLUMNAS_MOVIMIENTO if c.startswith("hora_")) | {"created_at", "updated_at"},
+    "notificaciones": {"created_at", "leida_at", "confirmada_at", "entregada_at"},
+    "log_eventos": {"created_at"},
+    "transiciones": {"momento"},
+}
+
+# ========================================
+# ESCRITURA
+# ========================================
+
+def _a_json(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def mes_de(fecha: datetime) -> str:
+    return f"{fecha.year:04d}-{fecha.month:02d}"
+
+
+class EscritorLote:
+    """
+    Escribe las filas de un lote en un archivo por mes. Los archivos se
+    escriben con sufijo .tmp y se renombran al cerrar, así un lote a medias
+    nunca queda visible para los lectores.
+    """
+    def __init__(self, tabla: str, lote: str, directorio: str = None):
+        self.directorio = os.path.join(directorio or ARCHIVO_DIR, tabla)
+        self.lote = lote
+        self._archivos: Dict[str, gzip.GzipFile] = {}
+        self.filas = 0
+
+    def _ruta(self, mes: str) -> str:
+        return os.path.join(self.directorio, mes, f"{self.lote}.ndjson.gz")
+
+    def escribir(self, mes: str, fila: dict):
+        archivo = self._archivos.get(mes)
+        if archivo is None:
+            os.makedirs(os.path.dirname(self._ruta(mes)), exist_ok=True)
+            archivo = self._archivos[mes] = gzip.open(self._ruta(mes) + ".tmp", "wt", encoding="utf-8")
+        archivo.write(json.dumps(fila, default=_a_json, ensure_ascii=False, separators=(",", ":")))
+        archivo.write("\n")
+        self.filas += 1
+
+    def cerrar(self):
+        for mes, archivo in self._archivos.items():
+            archivo.close()
+            os.replace(self._ruta(mes) + ".tmp", self._ruta(mes))
+        self._archivos.clear()
+
+    def descartar(self):
+        for mes, archivo in self._archivos.items():
+            archivo.close()
+            os.remove(self._ruta(mes) + ".tmp")
+        self._archivos.clear()
+
+# ========================================
+# LECTURA
+# ========================================
+
+def _meses(desde: datetime, hasta: datetime) -> Iterator[str]:
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        yield f"{anio:04d}-{mes:02d}"
+        anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def hay_archivo(tabla: str, desde: datetime, hasta: datetime, directorio: str = None) -> bool:
+    base = os.path.join(directorio or ARCHIVO_DIR, tabla)
+    return any(os.path.isdir(os.path.join(base, mes)) for mes in _meses(desde, hasta))
+
+
+def leer(tabla: str, columna_fecha: str, desde: datetime, hasta: datetime,
+         directorio: str = None) -> Iterator[dict]:
+    """Filas archivadas con desde <= columna_fecha < hasta (solo abre los meses del rango)"""
+    base = os.path.join(directorio or ARCHIVO_DIR, tabla)
+    fechas = _COLUMNAS_FECHA.get(tabla, set())
+    vistos = set()
+    for mes in _meses(desde, hasta):
+        carpeta = os.path.join(base, mes)
+        if not os.path.isdir(carpeta):
+            continue
+        for nombre in sorted(os.listdir(carpeta)):
+            if not nombre.endswith(".ndjson.gz"):
+                continue
+            with gzip.open(os.path.join(carpeta, nombre), "rt", encoding="utf-8") as archivo:
+                for linea in archivo:
+                    fila = json.loads(linea)
+                    # Un lote repetido tras un corte deja duplicados: gana el primero
+                    if fila["id"] in vistos:
+                        continue
+                    for columna in fechas:
+                        if fila.get(columna):
+                            fila[columna] = datetime.fromisoformat(fila[columna])
+                    valor = fila.get(columna_fecha)
+                    if valor is not None and desde <= hora_local(valor) < hasta:
+                        vistos.add(fila["id"])
+                        yield fila
+
+
+def _por_id(db: Session, modelo, ids, columnas) -> Dict[int, dict]:
+    ids = {i for i in ids if i is not None}
+    if not ids:
+        return {}
+    return {
+        objeto.id: {c: getattr(objeto, c) for c in columnas}
+        for objeto in db.query(modelo).filter(modelo.id.in_(ids))
+    }
+
+
+def movimientos_archivados(db: Session, desde: datetime, hasta: datetime,
+                           seleccion: Seleccion, sitio_id: int) -> List[dict]:
+    """
+    Movimientos archivados del sitio en el rango, con la misma forma que
+    consulta_movimientos: camiones, usuarios y rampas (tablas pequeñas, nunca
+    archivadas) se completan desde la BD con un query por tabla.
+    """
+    # Meses archivados antes de los sitios: sus filas no traen sitio_id
+    movimientos = [
+        m for m in leer("movimientos", "hora_ingreso_garita", desde, hasta)
+        if m.setdefault("sitio_id", SITIO_POR_DEFECTO) == sitio_id
+    ]
+    if not movimientos:
+        return []
+
+    camiones = _por_id(db, Camion, (m["camion_id"] for m in movimientos), COLUMNAS_CAMION) \
+        if "camion" in seleccion.bloques else {}
+    ids_usuarios = []
+    if "camion.chofer" in seleccion.bloques:
+        ids_usuarios += [c["chofer_id"] for c in camiones.values()]
+    if "asignado_por" in seleccion.bloques:
+        ids_usuarios += [m.get("asignado_por_id") for m in movimientos]
+    usuarios = _por_id(db, Usuario, ids_usuarios, COLUMNAS_USUARIO)
+    rampas = _por_id(db, Rampa, (m.get("rampa_id") for m in movimientos), COLUMNAS_RAMPA) \
+        if "rampa" in seleccion.bloques else {}
+
+    resultado = []
+    for movimiento in movimientos:
+        camion = camiones.get(movimiento["camion_id"], {})
+        relacionados = {
+            "": movimiento,
+            "camion": camion,
+            "camion.chofer": usuarios.get(camion.get("chofer_id"), {}),
+            "rampa": rampas.get(movimiento.get("rampa_id"), {}),
+            "asignado_por": usuarios.get(movimiento.get("asignado_por_id"), {}),
+        }
+        # Tupla con el mismo orden de columnas que el SELECT de la selección
+        fila = tuple(
+            relacionados[ruta].get(columna)
+            for ruta, columnas in seleccion.bloques.items() for columna in columnas
+        )
+        resultado.append(fila_a_movimiento(fila, seleccion))
+    return resultado
@@ -0,0 +1,345 @@
+"""
+Búsqueda - Control de Patio
+GET /api/buscar?q=: camiones por placa y usuarios por código o nombre, el más
+parecido primero. Tolera errores de tipeo y placas mal leídas: la garita
+escribe lo que alcanza a ver y el admin busca sin abrir las listas completas.
+
+Índice en memoria por sitio, armado con una consulta por tabla la primera vez
+que se busca en el sitio (el sitio principal, al arrancar: main.calentar):
+
+    claves      placa, código y cada palabra del nombre, en mayúsculas, sin
+                tildes ni signos y con O->0 e I->1 (lo que más se confunde al
+                leer una placa; se aplica igual a lo buscado)
+    trigramas   trigrama -> claves que lo contienen (un arreglo NumPy ordenado),
+                con el inicio marcado dos veces y el fin una ("^^A", "^A1",
+                "56$"): la primera letra cuenta, así una palabra corta con un
+                error todavía se encuentra
+    prefijos    claves ordenadas: bisect da las que empiezan con lo buscado
+
+Puntaje de una clave para una palabra buscada: trigramas en común sobre los de
+ambas (Jaccard, como pg_trgm), +1 si la clave empieza con la palabra y +1 más
+si es igual. Un resultado vale el promedio, sobre las palabras buscadas, de su
+mejor clave (o lo buscado todo junto, para "A 123456"); quedan los que pasan
+UMBRAL. Los mejores (CANDIDATOS por resultado pedido) suman además la mitad de
+su parecido con lo buscado (difflib, de 0 a 1), que separa los que comparten
+los mismos trigramas: "PEERZ" queda más cerca de PEREZ que de PENA.
+
+Las altas y cambios de camiones y usuarios de este proceso entran enseguida
+(main.py llama a actualizar() tras el commit). Con más de un proceso, lo que
+cambia otro aparece al rearmar el índice: la primera búsqueda pasados
+BUSQUEDA_VIGENCIA_S lo rearma en un hilo aparte y mientras tanto se sigue
+buscando en el anterior. El hilo arma con el recolector de ciclos apagado: con
+cientos de miles de objetos nuevos, cada pasada completa frenaba ~150 ms a las
+búsquedas que esperaban el GIL.
+"""
+import bisect
+import difflib
+import gc
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from database import REPLICA_MARGEN_S, SessionLectura
+from models import Camion, RolUsuario, Usuario
+
+VIGENCIA_S = float(os.getenv("BUSQUEDA_VIGENCIA_S", "60"))
+# Cambios sueltos sobre el índice antes de rearmarlo entero
+MAX_CAMBIOS = 1000
+UMBRAL = 0.2
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+# Candidatos por resultado pedido que se comparan con difflib, y cuánto pesa
+CANDIDATOS = 2
+PESO_PARECIDO = 0.5
+# Filas por lectura al armar: el hilo de fondo no retiene el GIL toda la consulta
+LOTE_LECTURA = 2000
+
+CAMION = "camion"
+USUARIO = "usuario"
+_CONFUSIONES = str.maketrans("OI", "01")
+_SEPARADORES = re.compile(r"[^A-Z0-9]+")
+
+
+def normalizar(texto: str) -> List[str]:
+    """Palabras en mayúsculas, sin tildes ni signos, con O->0 e I->1"""
+    texto = (texto or "").upper()
+    if not texto.isascii():
+        texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return _SEPARADORES.sub(" ", texto).translate(_CONFUSIONES).split()
+
+
+def trigramas(clave: str) -> set:
+    marcada = f"^^{clave}$"
+    return {marcada[i:i + 3] for i in range(len(marcada) - 2)}
+
+
+class Documento:
+    __slots__ = ("tipo", "id", "etiqueta", "detalle", "rol", "activo", "claves")
+
+    def __init__(self, tipo: str, id_: int, etiqueta: str, detalle: str, rol: Optional[RolUsuario],
+                 activo: bool, claves: List[str]):
+        self.tipo = tipo
+        self.id = id_
+        self.etiqueta = etiqueta
+        self.detalle = detalle
+        self.rol = rol
+        self.activo = bool(activo)
+        self.claves = claves or [""]
+
+    @classmethod
+    def de_camion(cls, id_: int, placa: str, tipo, activo: bool) -> "Documento":
+        return cls(CAMION, id_, placa, tipo.value, None, activo, ["".join(normalizar(placa))])
+
+    @classmethod
+    def de_usuario(cls, id_: int, codigo: str, nombre: str, rol: RolUsuario, activo: bool) -> "Documento":
+        return cls(USUARIO, id_, codigo, nombre, rol, activo, ["".join(normalizar(codigo)), *normalizar(nombre)])
+
+    def a_dict(self, puntaje: float) -> dict:
+        return {
+            "tipo": self.tipo, "id": self.id, "etiqueta": self.etiqueta, "detalle": self.detalle,
+            "rol": self.rol, "activo": self.activo, "puntaje": round(puntaje, 3),
+        }
+
+
+def _puntaje_clave(palabra: str, clave: str) -> float:
+    """El mismo puntaje que _Indice.puntajes, para una sola clave"""
+    buscados, propios = trigramas(palabra), trigramas(clave)
+    comunes = len(buscados & propios)
+    puntaje = comunes / (len(buscados) + len(propios) - comunes)
+    if clave.startswith(palabra):
+        puntaje += 2 if clave == palabra else 1
+    return puntaje
+
+
+def _puntaje_documento(documento: Documento, palabras: List[str]) -> float:
+    promedio = sum(max(_puntaje_clave(p, c) for c in documento.claves) for p in palabras) / len(palabras)
+    if len(palabras) == 1:
+        return promedio
+    junto = "".join(palabras)
+    return max(promedio, max(_puntaje_clave(junto, c) for c in documento.claves))
+
+
+def _parecido(documento: Documento, palabras: List[str]) -> float:
+    """Como el puntaje, con la proporción de difflib en vez de los trigramas"""
+    def mejor(palabra):
+        return max(difflib.SequenceMatcher(None, palabra, clave).ratio() for clave in documento.claves)
+    promedio = sum(mejor(p) for p in palabras) / len(palabras)
+    return promedio if len(palabras) == 1 else max(promedio, mejor("".join(palabras)))
+
+
+# ========================================
+# ÍNDICE DE UN SITIO
+# ========================================
+
+class _Indice:
+    def __init__(self, documentos: List[Documento], leido: float):
+        self.documentos = documentos
+        self.leido = leido  # time.time() de la lectura
+        self.posicion = {(d.tipo, d.id): i for i, d in enumerate(documentos)}
+        self.cambios: Dict[Tuple[str, int], Tuple[Documento, float]] = {}  # posteriores a la lectura
+        self.tapados = np.zeros(len(documentos), dtype=bool)  # reemplazados por un cambio
+        self.activos = np.array([d.activo for d in documentos], dtype=bool)
+        self.camiones = np.array([d.tipo == CAMION for d in documentos], dtype=bool)
+
+        # Claves de cada documento contiguas: el mejor puntaje por documento sale con reduceat
+        self.claves: List[str] = []
+        self.inicio = np.zeros(len(documentos), dtype=np.intp)
+        for i, documento in enumerate(documentos):
+            self.inicio[i] = len(self.claves)
+            self.claves.extend(documento.claves)
+
+        vocabulario: Dict[str, int] = {}
+        ids_trigrama, ids_clave, tamanos = array("i"), array("i"), array("f")
+        for k, clave in enumerate(self.claves):
+            propios = trigramas(clave)
+            tamanos.append(len(propios))
+            for trigrama in propios:
+                ids_trigrama.append(vocabulario.setdefault(trigrama, len(vocabulario)))
+                ids_clave.append(k)
+        self.n_trigramas = np.frombuffer(tamanos, dtype=np.float32)
+        por_trigrama = np.frombuffer(ids_trigrama, dtype=np.int32)
+        orden = np.argsort(por_trigrama, kind="stable")
+        self.claves_por_trigrama = np.frombuffer(ids_clave, dtype=np.int32)[orden]
+        limites = np.searchsorted(por_trigrama[orden], np.arange(len(vocabulario) + 1)).tolist()
+        self.trigramas = {t: (limites[i], limites[i + 1]) for t, i in vocabulario.items()}
+
+        self.orden = np.argsort(np.array(self.claves), kind="stable") if self.claves else np.zeros(0, np.intp)
+        self.ordenadas = [self.claves[k] for k in self.orden.tolist()]
+
+    def aplicar(self, documento: Documento, momento: float):
+        clave = (documento.tipo, documento.id)
+        self.cambios[clave] = (documento, momento)
+        posicion = self.posicion.get(clave)
+        if posicion is not None:
+            self.tapados[posicion] = True
+
+    def _por_clave(self, palabra: str) -> np.ndarray:
+        buscados = trigramas(palabra)
+        tramos = [self.claves_por_trigrama[a:b] for a, b in (self.trigramas.get(t, (0, 0)) for t in buscados) if b > a]
+        if tramos:
+            comunes = np.bincount(np.concatenate(tramos), minlength=len(self.claves)).astype(np.float32)
+            puntaje = comunes / (len(buscados) + self.n_trigramas - comunes)
+        else:
+            puntaje = np.zeros(len(self.claves), dtype=np.float32)
+        desde = bisect.bisect_left(self.ordenadas, palabra)
+        iguales = bisect.bisect_right(self.ordenadas, palabra, desde)
+        hasta = bisect.bisect_left(self.ordenadas, palabra + "\x7f", iguales)
+        puntaje[self.orden[desde:hasta]] += 1
+        puntaje[self.orden[desde:iguales]] += 1
+        return puntaje
+
+    def puntajes(self, palabras: List[str]) -> np.ndarray:
+        """Puntaje por documento: promedio sobre las palabras de su mejor clave"""
+        total = np.zeros(len(self.documentos), dtype=np.float32)
+        for palabra in palabras:
+            total += np.maximum.reduceat(self._por_clave(palabra), self.inicio)
+        total /= len(palabras)
+        if len(palabras) > 1:
+            total = np.maximum(total, np.maximum.reduceat(self._por_clave("".join(palabras)), self.inicio))
+        return total
+
+
+# ========================================
+# ÍNDICES POR SITIO
+# ========================================
+
+def _leer(sitio_id: int) -> List[Documento]:
+    db = SessionLectura()
+    try:
+        camiones = db.query(Camion.id, Camion.placa, Camion.tipo, Camion.activo).filter(
+            Camion.sitio_id == sitio_id
+        ).yield_per(LOTE_LECTURA)
+        documentos = [Documento.de_camion(*fila) for fila in camiones]
+        usuarios = db.query(Usuario.id, Usuario.codigo, Usuario.nombre, Usuario.rol, Usuario.activo).filter(
+            Usuario.sitio_id == sitio_id
+        ).yield_per(LOTE_LECTURA)
+        documentos += [Documento.de_usuario(*fila) for fila in usuarios]
+    finally:
+        db.close()
+    return documentos
+
+
+class Busqueda:
+    def __init__(self, vigencia_s: float = VIGENCIA_S):
+        self.vigencia_s = vigencia_s
+        self._indices: Dict[int, _Indice] = {}
+        self._armando: Dict[int, threading.Lock] = {}
+        self._rearmando = set()
+        self._lock = threading.Lock()
+        self.busquedas = 0
+        self.armados = 0
+        self.ultimo_armado_ms: Optional[float] = None
+
+    def _armar(self, sitio_id: int) -> _Indice:
+        inicio = time.perf_counter()
+        leido = time.time()
+        nuevo = _Indice(_leer(sitio_id), leido)
+        with self._lock:
+            anterior = self._indices.get(sitio_id)
+            if anterior is not None:
+                # Lo que cambió durante la lectura (o no había llegado a la réplica) se conserva
+                for documento, momento in anterior.cambios.values():
+                    if momento >= leido - REPLICA_MARGEN_S:
+                        nuevo.aplicar(documento, momento)
+            self._indices[sitio_id] = nuevo
+            self.armados += 1
+            self.ultimo_armado_ms = round((time.perf_counter() - inicio) * 1000, 1)
+        return nuevo
+
+    def _rearmar(self, sitio_id: int):
+        # El índice no arma ciclos: se libera por conteo de referencias igual
+        encendido = gc.isenabled()
+        gc.disable()
+        try:
+            self._armar(sitio_id)
+        finally:
+            if encendido:
+                gc.enable()
+            with self._lock:
+                self._rearmando.discard(sitio_id)
+
+    def indice(self, sitio_id: int) -> _Indice:
+        """El índice del sitio; el primero se arma en la request, los siguientes en un hilo"""
+        indice = self._indices.get(sitio_id)
+        if indice is None:
+            with self._lock:
+                lock = self._armando.setdefault(sitio_id, threading.Lock())
+            with lock:  # dos búsquedas a la vez en un sitio nuevo leen la BD una sola vez
+                indice = self._indices.get(sitio_id) or self._armar(sitio_id)
+        vencido = time.time() - indice.leido > self.vigencia_s or len(indice.cambios) > MAX_CAMBIOS
+        if vencido and sitio_id not in self._rearmando:
+            with self._lock:
+                if sitio_id in self._rearmando:
+                    return indice
+                self._rearmando.add(sitio_id)
+            threading.Thread(target=self._rearmar, args=(sitio_id,), daemon=True).start()
+        return indice
+
+    def actualizar(self, objeto):
+        """Tras el commit de un Camion o Usuario: el índice del sitio (si ya existe) lo ve enseguida"""
+        if objeto.sitio_id not in self._indices:
+            return  # se lee de la BD en la primera búsqueda
+        if isinstance(objeto, Camion):
+            documento = Documento.de_camion(objeto.id, objeto.placa, objeto.tipo, objeto.activo)
+        else:
+            documento = Documento.de_usuario(objeto.id, objeto.codigo, objeto.nombre, objeto.rol, objeto.activo)
+        with self._lock:
+            indice = self._indices.get(objeto.sitio_id)
+            if indice is not None:
+                indice.aplicar(documento, time.time())
+
+    def buscar(self, sitio_id: int, q: str, tipo: Optional[str] = None, activo: Optional[bool] = True,
+               limite: int = LIMITE_POR_DEFECTO) -> List[dict]:
+        palabras = normalizar(q)
+        if not palabras:
+            return []
+        self.busquedas += 1
+        indice = self.indice(sitio_id)
+
+        def admitido(documento: Documento) -> bool:
+            return (tipo is None or documento.tipo == tipo) and (activo is None or documento.activo == activo)
+
+        encontrados = []
+        if indice.documentos:
+            puntajes = indice.puntajes(palabras)
+            validos = ~indice.tapados & (puntajes >= UMBRAL)
+            if tipo is not None:
+                validos &= indice.camiones if tipo == CAMION else ~indice.camiones
+            if activo is not None:
+                validos &= indice.activos == activo
+            candidatos = np.flatnonzero(validos)
+            maximo = limite * CANDIDATOS
+            if len(candidatos) > maximo:
+                candidatos = candidatos[np.argpartition(-puntajes[candidatos], maximo - 1)[:maximo]]
+            encontrados = [(float(puntajes[i]), indice.documentos[i]) for i in candidatos.tolist()]
+        for documento, _ in list(indice.cambios.values()):
+            if admitido(documento):
+                puntaje = _puntaje_documento(documento, palabras)
+                if puntaje >= UMBRAL:
+                    encontrados.append((puntaje, documento))
+
+        encontrados = [(puntaje + PESO_PARECIDO * _parecido(documento, palabras), documento)
+                       for puntaje, documento in encontrados]
+        encontrados.sort(key=lambda e: (-e[0], e[1].etiqueta))
+        return [documento.a_dict(puntaje) for puntaje, documento in encontrados[:limite]]
+
+    def estadisticas(self) -> dict:
+        indices = list(self._indices.values())
+        return {
+            "sitios": len(indices),
+            "documentos": sum(len(i.documentos) for i in indices),
+            "claves": sum(len(i.claves) for i in indices),
+            "cambios_sin_rearmar": sum(len(i.cambios) for i in indices),
+            "busquedas": self.busquedas,
+            "armados": self.armados,
+            "ultimo_armado_ms": self.ultimo_armado_ms,
+        }
+
+
+busqueda = Busqueda()
@@ -0,0 +1,129 @@
+"""
+Cambios - Control de Patio
+Registro de transiciones de los movimientos y feed incremental para BI
+(GET /api/changes?since=<offset>).
+
+Todo cambio de etapa pasa por pasar(): marca el estado y su hora en el
+movimiento y agrega una fila a transiciones en la misma transacción, así el
+registro nunca se adelanta ni se atrasa respecto de la tabla viva.
+
+El offset es el id de la fila. Un consumidor guarda el último offset que
+procesó y pide desde ahí; para no saltear filas, los offsets de un sitio
+tienen que hacerse visibles en orden:
+
+    SQLite       un solo escritor a la vez: el id se asigna y se confirma en orden
+    PostgreSQL   pg_advisory_xact_lock por sitio antes de insertar: las
+                 transacciones que registran transiciones del mismo sitio se
+                 confirman de a una (la secuencia sola no alcanza, un id menor
+                 puede confirmarse después de uno mayor)
+
+El archivado (mantenimiento.py) borra las transiciones viejas y, en la misma
+transacción, deja en el sitio el mayor offset archivado: pedir desde antes de
+esa marca levanta CambiosArchivados (410 en la API) en vez de devolver un
+feed con un hueco.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+from flujo import HORA_DE_ESTADO
+from models import EstadoMovimiento, Movimiento, Sitio, Transicion
+
+# Espacio del advisory lock (el segundo entero es el sitio)
+CLAVE_LOCK = 4601
+
+LIMITE_POR_DEFECTO = 500
+LIMITE_MAXIMO = 5000
+
+COLUMNAS = ("id", "movimiento_id", "estado_anterior", "estado", "rampa_id", "momento")
+
+
+class CambiosArchivados(Exception):
+    def __init__(self, hasta: int):
+        super().__init__(
+            f"Las transiciones hasta el offset {hasta} pasaron al archivo histórico "
+            f"(transiciones/<AAAA-MM>/*.ndjson.gz); seguir con since={hasta}"
+        )
+        self.hasta = hasta
+
+
+def registrar(db: Session, movimiento: Movimiento, anterior: Optional[EstadoMovimiento], momento: datetime):
+    """Agrega la transición del movimiento (ya con su estado nuevo) a la sesión"""
+    if movimiento.id is None:
+        db.flush()  # movimiento recién creado: el INSERT va igual, solo se adelanta
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(CLAVE_LOCK, movimiento.sitio_id)))
+    db.add(Transicion(
+        sitio_id=movimiento.sitio_id,
+        movimiento_id=movimiento.id,
+        estado_anterior=anterior,
+        estado=movimiento.estado,
+        rampa_id=movimiento.rampa_id,
+        momento=momento,
+    ))
+
+
+def pasar(db: Session, movimiento: Movimiento, destino: EstadoMovimiento, columna_hora: str = None) -> datetime:
+    """
+    Lleva el movimiento a destino, marca la hora de la etapa y registra la
+    transición. columna_hora sirve para las marcas que no cambian de etapa
+    (hora_confirmado_chofer). Devuelve la hora marcada.
+    """
+    ahora = datetime.now()
+    anterior = movimiento.estado
+    movimiento.estado = destino
+    setattr(movimiento, columna_hora or HORA_DE_ESTADO[destino], ahora)
+    registrar(db, movimiento, anterior, ahora)
+    return ahora
+
+
+def marcar_archivadas(db: Session, condicion, id_maximo: int):
+    """Antes de borrar las transiciones archivadas: sube la marca de cada sitio (sin commit)"""
+    maximos = db.execute(
+        select(Transicion.sitio_id, func.max(Transicion.id))
+        .where(condicion, Transicion.id <= id_maximo)
+        .group_by(Transicion.sitio_id)
+    ).all()
+    marca = Sitio.transiciones_archivadas_hasta
+    for sitio_id, maximo in maximos:
+        db.execute(
+            update(Sitio)
+            .where(Sitio.id == sitio_id, or_(marca.is_(None), marca < maximo))
+            .values(transiciones_archivadas_hasta=maximo)
+        )
+
+
+def leer(db: Session, sitio_id: int, desde: int, limite: int = LIMITE_POR_DEFECTO) -> dict:
+    """Transiciones del sitio con offset > desde, en orden, y el offset para seguir"""
+    archivadas = db.execute(
+        select(Sitio.transiciones_archivadas_hasta).where(Sitio.id == sitio_id)
+    ).scalar()
+    if archivadas is not None and desde < archivadas:
+        raise CambiosArchivados(archivadas)
+    
+    columnas = [getattr(Transicion, c) for c in COLUMNAS]
+    filas = db.execute(
+        select(*columnas)
+        .where(Transicion.sitio_id == sitio_id, Transicion.id > desde)
+        .order_by(Transicion.id)
+        .limit(limite + 1)
+    ).all()
+    hay_mas = len(filas) > limite
+    cambios = [
+        {
+            "offset": id_,
+            "movimiento_id": movimiento_id,
+            "estado_anterior": anterior.value if anterior else None,
+            "estado": estado.value,
+            "rampa_id": rampa_id,
+            "momento": momento,
+        }
+        for id_, movimiento_id, anterior, estado, rampa_id, momento in filas[:limite]
+    ]
+    return {
+        "cambios": cambios,
+        "siguiente": cambios[-1]["offset"] if cambios else desde,
+        "hay_mas": hay_mas,
+    }
@@ -0,0 +1,178 @@
+"""
+Conexiones WebSocket - Control de Patio
+Sockets abiertos por usuario y envío de mensajes en tiempo real.
+
+Los teléfonos que pierden el Wi-Fi dejan sockets medio abiertos que nunca
+reciben WebSocketDisconnect. Mientras haya conexiones, una tarea de latido
+envía {"tipo": "ping"} cada WS_PING_S; el cliente responde {"tipo": "pong"}
+(cualquier mensaje cuenta como actividad). Los sockets sin actividad en
+WS_IDLE_TIMEOUT_S, o que fallan al enviar, se cierran y se quitan.
+
+Los envíos reciben un Mensaje (mensajes.py): se codifica una vez por formato
+y el mismo texto va a todos los sockets.
+
+Cada usuario conectado pertenece a un sitio (sitios.py): los broadcasts van
+solo a los usuarios del sitio del movimiento. Cada broadcast también se publica
+en el feed SSE del sitio (transmision.py), haya o no sockets abiertos.
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+from sqlalchemy.orm import Session
+
+from models import Usuario, SITIO_POR_DEFECTO
+from mensajes import Mensaje, COMPLETO
+from transmision import transmision
+
+PING_S = float(os.getenv("WS_PING_S", "25"))
+IDLE_TIMEOUT_S = float(os.getenv("WS_IDLE_TIMEOUT_S", "75"))
+# Un socket medio abierto puede bloquear el envío al llenarse el buffer TCP
+ENVIO_TIMEOUT_S = 5
+MENSAJE_PING = Mensaje("ping")
+
+
+class ConnectionManager:
+    def __init__(self, ping_s: float = PING_S, idle_timeout_s: float = IDLE_TIMEOUT_S):
+        self.active_connections: Dict[int, List[WebSocket]] = {}  # {user_id: [websockets]}
+        self.ultima_actividad: Dict[WebSocket, float] = {}
+        self.formatos: Dict[WebSocket, str] = {}  # solo sockets con formato distinto de COMPLETO
+        self.usuarios_sitio: Dict[int, Set[int]] = {}  # {sitio_id: {user_id}} con sockets abiertos
+        self.sitio_de: Dict[int, int] = {}  # {user_id: sitio_id}
+        self.ping_s = ping_s
+        self.idle_timeout_s = idle_timeout_s
+        self.desalojados = 0
+        self._latido: Optional[asyncio.Task] = None
+
+    async def connect(self, websocket: WebSocket, user_id: int, formato: str = COMPLETO,
+                      sitio_id: int = SITIO_POR_DEFECTO):
+        await websocket.accept()
+        if formato != COMPLETO:
+            self.formatos[websocket] = formato
+        if user_id not in self.active_connections:
+            self.active_connections[user_id] = []
+        self.active_connections[user_id].append(websocket)
+        anterior = self.sitio_de.get(user_id)
+        if anterior != sitio_id:
+            if anterior is not None:
+                self._quitar_de_sitio(user_id, anterior)
+            self.sitio_de[user_id] = sitio_id
+            self.usuarios_sitio.setdefault(sitio_id, set()).add(user_id)
+        self.ultima_actividad[websocket] = time.monotonic()
+        self._asegurar_latido()
+
+    def disconnect(self, websocket: WebSocket, user_id: int):
+        """Idempotente: el socket puede haber sido desalojado antes"""
+        self.ultima_actividad.pop(websocket, None)
+        self.formatos.pop(websocket, None)
+        conexiones = self.active_connections.get(user_id)
+        if conexiones is None:
+            return
+        if websocket in conexiones:
+            conexiones.remove(websocket)
+        if not conexiones:
+            del self.active_connections[user_id]
+            sitio_id = self.sitio_de.pop(user_id, None)
+            if sitio_id is not None:
+                self._quitar_de_sitio(user_id, sitio_id)
+        if not self.ultima_actividad:
+            # Los dict no se achican al borrar: sin sockets se libera la tabla del pico
+            self.ultima_actividad = {}
+            self.formatos = {}
+            self.sitio_de = {}
+
+    def _quitar_de_sitio(self, user_id: int, sitio_id: int):
+        usuarios = self.usuarios_sitio.get(sitio_id)
+        if usuarios is not None:
+            usuarios.discard(user_id)
+            if not usuarios:
+                del self.usuarios_sitio[sitio_id]
+
+    def actividad(self, websocket: WebSocket):
+        if websocket in self.ultima_actividad:
+            self.ultima_actividad[websocket] = time.monotonic()
+
+    def conectado(self, user_id: int) -> bool:
+        return bool(self.active_connections.get(user_id))
+
+    def total_sockets(self) -> int:
+        return len(self.ultima_actividad)
+
+    async def _enviar(self, websocket: WebSocket, user_id: int, message: Mensaje) -> bool:
+        texto = message.codificar(self.formatos.get(websocket, COMPLETO))
+        try:
+            await asyncio.wait_for(websocket.send_text(texto), timeout=ENVIO_TIMEOUT_S)
+            return True
+        except Exception:
+            await self._desalojar(websocket, user_id)
+            return False
+
+    async def send_to_user(self, user_id: int, message: Mensaje) -> int:
+        """Envía a todos los sockets del usuario; devuelve a cuántos llegó"""
+        enviados = 0
+        # Copia: un envío fallido quita el socket de la lista
+        for connection in list(self.active_connections.get(user_id, ())):
+            enviados += await self._enviar(connection, user_id, message)
+        return enviados
+
+    async def broadcast_to_role(self, role: str, message: Mensaje, db: Session, sitio_id: int):
+        transmision.publicar(message, sitio_id)
+        conectados = self.usuarios_sitio.get(sitio_id)
+        if not conectados:
+            return
+        usuarios = db.query(Usuario.id).filter(Usuario.sitio_id == sitio_id, Usuario.rol == role).all()
+        for (usuario_id,) in usuarios:
+            if usuario_id in conectados:
+                await self.send_to_user(usuario_id, message)
+
+    async def broadcast_all(self, message: Mensaje, sitio_id: int):
+        """A todos los usuarios conectados del sitio"""
+        transmision.publicar(message, sitio_id)
+        for user_id in list(self.usuarios_sitio.get(sitio_id, ())):
+            for connection in list(self.active_connections.get(user_id, ())):
+                await self._enviar(connection, user_id, message)
+
+    # ----------------------------------------
+    # Latido y desalojo
+    # ----------------------------------------
+
+    async def _desalojar(self, websocket: WebSocket, user_id: int):
+        if websocket not in self.ultima_actividad:
+            return
+        self.disconnect(websocket, user_id)
+        self.desalojados += 1
+        try:
+            await asyncio.wait_for(websocket.close(code=1001), timeout=ENVIO_TIMEOUT_S)
+        except Exception:
+            pass
+
+    def _asegurar_latido(self):
+        loop = asyncio.get_running_loop()
+        if self._latido is None or self._latido.done() or self._latido.get_loop() is not loop:
+            self._latido = loop.create_task(self._latir())
+
+    async def _latir(self):
+        # Termina sola cuando no quedan conexiones; connect() la vuelve a crear
+        while self.active_connections:
+            await asyncio.sleep(self.ping_s)
+            limite = time.monotonic() - self.idle_timeout_s
+            for user_id, connections in list(self.active_connections.items()):
+                for connection in list(connections):
+                    if self.ultima_actividad.get(connection, 0) < limite:
+                        await self._desalojar(connection, user_id)
+                    else:
+                        await self._enviar(connection, user_id, MENSAJE_PING)
+
+    def estadisticas(self) -> dict:
+        return {
+            "usuarios": len(self.active_connections),
+            "sockets": self.total_sockets(),
+            "sitios": len(self.usuarios_sitio),
+            "desalojados": self.desalojados,
+            "ping_s": self.ping_s,
+            "idle_timeout_s": self.idle_timeout_s,
+        }
+
+manager = ConnectionManager()
@@ -0,0 +1,240 @@
+"""
+Archivos Estáticos - Control de Patio
+Build del frontend y cómo se sirve.
+
+    python estaticos.py          # genera ../frontend/dist
+
+El build copia los activos (CSS) con el hash del contenido en el nombre, reescribe
+las páginas para que apunten a esos nombres y deja de cada archivo una versión
+.gz y, si está instalado el paquete brotli, .br. También genera el service worker
+de la app del chofer (sw-chofer.js) con la lista de archivos a precachear.
+
+Al servir:
+    /static/<activo con hash>   Cache-Control: immutable (un año)
+    páginas y sw-chofer.js      Cache-Control: no-cache + ETag (revalidan con 304)
+y se elige br, gzip o sin comprimir según Accept-Encoding. Sin build (desarrollo)
+se sirven los archivos originales de ../frontend sin caché.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli solo se genera .gz
+    brotli = None
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "frontend")
+DIST_DIR = os.path.join(FRONTEND_DIR, "dist")
+MANIFIESTO = "manifest.json"
+
+PAGINAS = ("index.html", "admin.html", "chofer.html", "despacho.html")
+ACTIVOS = ("styles.css",)
+SERVICE_WORKER = "sw-chofer.js"
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+CACHE_REVALIDAR = "no-cache"
+
+# Preferencia del servidor; el cliente decide con Accept-Encoding
+CODIFICACIONES = (("br", ".br"), ("gzip", ".gz"))
+
+PLANTILLA_SW = """// Generado por backend/estaticos.py - no editar
+const CACHE = 'chofer-__VERSION__';
+const PRECACHE = __PRECACHE__;
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(
+    caches.open(CACHE).then((cache) => cache.addAll(PRECACHE)).then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((nombres) => Promise.all(
+        nombres.filter((n) => n.startsWith('chofer-') && n !== CACHE).map((n) => caches.delete(n))
+      ))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+  // Activos con hash: nunca cambian, primero la caché
+  if (url.pathname.startsWith('/static/')) {
+    event.respondWith(
+      caches.match(event.request).then((guardada) => guardada || fetch(event.request).then((respuesta) => {
+        const copia = respuesta.clone();
+        caches.open(CACHE).then((cache) => cache.put(event.request, copia));
+        return respuesta;
+      }))
+    );
+    return;
+  }
+
+  // La página abre al instante desde la caché y se actualiza en segundo plano
+  if (event.request.mode === 'navigate' && url.pathname === '/chofer') {
+    event.respondWith(caches.open(CACHE).then(async (cache) => {
+      const guardada = await cache.match('/chofer');
+      const red = fetch(event.request).then((respuesta) => {
+        if (respuesta.ok) cache.put('/chofer', respuesta.clone());
+        return respuesta;
+      }).catch(() => guardada);
+      return guardada || red;
+    }));
+  }
+  // /api y /ws siempre van a la red
+});
+"""
+
+# ========================================
+# BUILD
+# ========================================
+
+def _huella(datos: bytes) -> str:
+    return hashlib.sha256(datos).hexdigest()[:10]
+
+
+def _escribir(nombre: str, datos: bytes):
+    ruta = os.path.join(DIST_DIR, nombre)
+    with open(ruta, "wb") as f:
+        f.write(datos)
+    with open(ruta + ".gz", "wb") as f:
+        # mtime=0: mismo contenido, mismo .gz entre builds
+        f.write(gzip.compress(datos, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(ruta + ".br", "wb") as f:
+            f.write(brotli.compress(datos, quality=11))
+
+
+def construir() -> dict:
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    os.makedirs(DIST_DIR)
+
+    activos = {}
+    for nombre in ACTIVOS:
+        with open(os.path.join(FRONTEND_DIR, nombre), "rb") as f:
+            datos = f.read()
+        base, extension = os.path.splitext(nombre)
+        con_huella = f"{base}.{_huella(datos)}{extension}"
+        _escribir(con_huella, datos)
+        activos[nombre] = con_huella
+
+    paginas = {}
+    for nombre in PAGINAS:
+        with open(os.path.join(FRONTEND_DIR, nombre), encoding="utf-8") as f:
+            html = f.read()
+        for original, con_huella in activos.items():
+            html = html.replace(f"/static/{original}", f"/static/{con_huella}")
+        datos = html.encode("utf-8")
+        _escribir(nombre, datos)
+        paginas[nombre] = _huella(datos)
+
+    version = _huella(json.dumps([activos, paginas], sort_keys=True).encode())
+    precache = ["/chofer"] + [f"/static/{activos[nombre]}" for nombre in ACTIVOS]
+    sw = PLANTILLA_SW.replace("__VERSION__", version).replace("__PRECACHE__", json.dumps(precache))
+    _escribir(SERVICE_WORKER, sw.encode("utf-8"))
+
+    manifiesto = {
+        "version": version,
+        "activos": activos,
+        "huellas": dict(paginas, **{SERVICE_WORKER: _huella(sw.encode("utf-8"))}),
+        "brotli": brotli is not None,
+    }
+    with open(os.path.join(DIST_DIR, MANIFIESTO), "w") as f:
+        json.dump(manifiesto, f, indent=2)
+    return manifiesto
+
+# ========================================
+# SERVIR
+# ========================================
+
+class Estaticos:
+    """Lee el manifiesto del build una vez; sin build sirve ../frontend tal cual"""
+    def __init__(self, dist_dir: str = DIST_DIR, frontend_dir: str = FRONTEND_DIR):
+        self.dist_dir = dist_dir
+        self.frontend_dir = frontend_dir
+        self._manifiesto: Optional[dict] = None
+        self._cargado = False
+
+    @property
+    def manifiesto(self) -> Optional[dict]:
+        if not self._cargado:
+            ruta = os.path.join(self.dist_dir, MANIFIESTO)
+            if os.path.exists(ruta):
+                with open(ruta) as f:
+                    self._manifiesto = json.load(f)
+            self._cargado = True
+        return self._manifiesto
+
+    def _inmutables(self) -> Dict[str, str]:
+        return {v: k for k, v in self.manifiesto["activos"].items()} if self.manifiesto else {}
+
+    @staticmethod
+    def _aceptadas(cabecera: str) -> set:
+        """Codificaciones de Accept-Encoding, sin las rechazadas con q=0"""
+        aceptadas = set()
+        for parte in cabecera.split(","):
+            nombre, _, parametros = parte.partition(";")
+            q = parametros.strip().partition("q=")[2]
+            try:
+                if q and float(q) == 0:
+                    continue
+            except ValueError:
+                continue
+            aceptadas.add(nombre.strip().lower())
+        return aceptadas
+
+    def _comprimido(self, request: Request, nombre: str, cache: str, etag: Optional[str]) -> Response:
+        aceptadas = self._aceptadas(request.headers.get("accept-encoding", ""))
+        media_type = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+        ruta, codificacion = os.path.join(self.dist_dir, nombre), None
+        for candidata, extension in CODIFICACIONES:
+            if candidata in aceptadas and os.path.exists(ruta + extension):
+                ruta, codificacion = ruta + extension, candidata
+                break
+        headers = {"Cache-Control": cache, "Vary": "Accept-Encoding"}
+        if codificacion:
+            headers["Content-Encoding"] = codificacion
+        if etag:
+            etag = f'"{etag}-{codificacion or "identity"}"'
+            if request.headers.get("if-none-match") == etag:
+                return Response(status_code=304, headers=dict(headers, ETag=etag))
+            headers["ETag"] = etag
+        return FileResponse(ruta, media_type=media_type, headers=headers)
+
+    def pagina(self, request: Request, nombre: str) -> Response:
+        if self.manifiesto is None:
+            return FileResponse(os.path.join(self.frontend_dir, nombre), headers={"Cache-Control": CACHE_REVALIDAR})
+        return self._comprimido(request, nombre, CACHE_REVALIDAR, self.manifiesto["huellas"][nombre])
+
+    def activo(self, request: Request, ruta: str) -> Response:
+        if ruta in self._inmutables():
+            return self._comprimido(request, ruta, CACHE_INMUTABLE, None)
+        # Nombre sin hash (o sin build): el original, revalidando siempre
+        if os.path.basename(ruta) != ruta or not os.path.isfile(os.path.join(self.frontend_dir, ruta)):
+            raise HTTPException(status_code=404, detail="Archivo no encontrado")
+        return FileResponse(os.path.join(self.frontend_dir, ruta), headers={"Cache-Control": CACHE_REVALIDAR})
+
+    def service_worker(self, request: Request) -> Response:
+        if self.manifiesto is None:
+            raise HTTPException(status_code=404, detail="Frontend sin build")
+        return self._comprimido(request, SERVICE_WORKER, CACHE_REVALIDAR, self.manifiesto["huellas"][SERVICE_WORKER])
+
+
+if __name__ == "__main__":
+    resultado = construir()
+    print(f"Frontend {resultado['version']} en {os.path.normpath(DIST_DIR)}"
+          f"{'' if resultado['brotli'] else ' (sin brotli: solo .gz)'}")
+    for original, con_huella in resultado["activos"].items():
+        print(f"  {original} -> {con_huella}")
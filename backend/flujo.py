@@ -0,0 +1,75 @@
+"""
+Flujo del Movimiento - Control de Patio
+Etapas del ciclo de un camión, la columna de hora que marca cada una y las
+transiciones permitidas. La API y el simulador usan las mismas reglas.
+"""
+from typing import Optional
+from models import EstadoMovimiento, EstadoRampa, TipoCamion
+
+# Orden del ciclo. La confirmación del chofer no cambia el estado,
+# solo marca hora_confirmado_chofer dentro de ASIGNADO_EN_CAMINO.
+ETAPAS = (
+    (EstadoMovimiento.INGRESADO_GARITA, "hora_ingreso_garita"),
+    (EstadoMovimiento.DISPONIBLE_PATIO, "hora_disponible_patio"),
+    (EstadoMovimiento.SOLICITADO, "hora_solicitado"),
+    (EstadoMovimiento.ASIGNADO_EN_CAMINO, "hora_asignado"),
+    (EstadoMovimiento.EN_RAMPA, "hora_en_rampa"),
+    (EstadoMovimiento.CARGA_LISTA, "hora_carga_lista"),
+    (EstadoMovimiento.SALIDA_RAMPA, "hora_salida_rampa"),
+    (EstadoMovimiento.SALIDA_CD, "hora_salida_cd"),
+)
+
+HORA_DE_ESTADO = dict(ETAPAS)
+ORDEN_ESTADO = {estado: i for i, (estado, _) in enumerate(ETAPAS)}
+
+# Estado destino -> estados desde los que se puede llegar
+TRANSICIONES = {
+    EstadoMovimiento.DISPONIBLE_PATIO: (EstadoMovimiento.INGRESADO_GARITA,),
+    EstadoMovimiento.SOLICITADO: (EstadoMovimiento.DISPONIBLE_PATIO,),
+    EstadoMovimiento.ASIGNADO_EN_CAMINO: (EstadoMovimiento.DISPONIBLE_PATIO, EstadoMovimiento.SOLICITADO),
+    EstadoMovimiento.EN_RAMPA: (EstadoMovimiento.ASIGNADO_EN_CAMINO,),
+    EstadoMovimiento.CARGA_LISTA: (EstadoMovimiento.EN_RAMPA,),
+    EstadoMovimiento.SALIDA_RAMPA: (EstadoMovimiento.CARGA_LISTA,),
+    # La salida del CD se registra desde cualquier estado (escaneo QR en garita)
+    EstadoMovimiento.SALIDA_CD: tuple(EstadoMovimiento),
+}
+
+# El chofer confirma la asignación sin cambiar de estado
+ESTADOS_CONFIRMACION_CHOFER = (EstadoMovimiento.ASIGNADO_EN_CAMINO,)
+
+
+def puede_pasar(origen: EstadoMovimiento, destino: EstadoMovimiento) -> bool:
+    return origen in TRANSICIONES.get(destino, ())
+
+
+def rampa_asignable(estado: EstadoRampa) -> bool:
+    """Solo se asignan rampas libres (la rampa se ocupa al llegar el camión, no al asignarla)"""
+    return estado == EstadoRampa.LIBRE
+
+
+def rampa_compatible(tipo_permitido: Optional[TipoCamion], tipo_camion: TipoCamion) -> bool:
+    """Una rampa sin tipo permitido acepta cualquier camión"""
+    return tipo_permitido is None or tipo_permitido == tipo_camion
+
+
+COLUMNAS_HORA = (
+    "hora_ingreso_garita", "hora_disponible_patio", "hora_solicitado", "hora_asignado",
+    "hora_confirmado_chofer", "hora_en_rampa", "hora_carga_lista", "hora_salida_rampa",
+    "hora_salida_cd",
+)
+
+# Colas del patio: estado -> (nombre en ColaCamiones, hora por la que se ordena)
+COLAS = {
+    EstadoMovimiento.DISPONIBLE_PATIO: ("disponibles", "hora_ingreso_garita"),
+    EstadoMovimiento.SOLICITADO: ("solicitados", "hora_solicitado"),
+    EstadoMovimiento.ASIGNADO_EN_CAMINO: ("en_camino", "hora_asignado"),
+}
+
+# Estados en que el movimiento ocupa su rampa
+ESTADOS_EN_RAMPA = (EstadoMovimiento.EN_RAMPA, EstadoMovimiento.CARGA_LISTA)
+
+
+def ordenar_colas(colas: dict):
+    """Ordena en sitio cada cola por la hora de su etapa (los NULL al final)"""
+    for nombre, campo_orden in COLAS.values():
+        colas[nombre].sort(key=lambda m: (m[campo_orden] is None, m[campo_orden] or 0))
@@ -0,0 +1,121 @@
+"""
+Histórico del Patio - Control de Patio
+Reconstruye la cola de camiones y el estado de las rampas en un instante pasado
+a partir de las horas de cada etapa del movimiento
+"""
+from datetime import datetime
+from sqlalchemy import DateTime, func, literal, or_
+from sqlalchemy.orm import Session
+
+from models import Movimiento, Rampa, EstadoMovimiento, EstadoRampa, rango_estadia
+from flujo import ETAPAS, ORDEN_ESTADO, COLUMNAS_HORA, COLAS, ESTADOS_EN_RAMPA, ordenar_colas
+from serializacion import Seleccion, consulta_movimientos, fila_a_movimiento, fila_a_rampa, recortar
+
+
+class Instante:
+    """
+    Instante consultado, comparable tanto con fechas con zona horaria (PostgreSQL)
+    como con fechas naive (hora local del servidor, como las guarda datetime.now()).
+    """
+    def __init__(self, momento: datetime):
+        self.con_tz = momento if momento.tzinfo else momento.astimezone()
+        self.local = self.con_tz.astimezone().replace(tzinfo=None)
+
+    def para(self, valor: datetime) -> datetime:
+        return self.con_tz if valor.tzinfo else self.local
+
+    def alcanzado(self, valor) -> bool:
+        return valor is not None and valor <= self.para(valor)
+
+    def minutos_desde(self, valor: datetime) -> float:
+        return (self.para(valor) - valor).total_seconds() / 60
+
+
+def estado_en(movimiento: dict, instante: Instante):
+    """Última etapa cuya hora ya había ocurrido en el instante (None si aún no ingresaba)"""
+    estado = None
+    for etapa, columna in ETAPAS:
+        if instante.alcanzado(movimiento.get(columna)):
+            estado = etapa
+    return estado
+
+
+def _retroceder(movimiento: dict, instante: Instante):
+    """Deja el movimiento como se veía en el instante: estado de entonces y sin horas futuras"""
+    estado = estado_en(movimiento, instante)
+    movimiento["estado"] = estado
+    for columna in COLUMNAS_HORA:
+        if not instante.alcanzado(movimiento.get(columna)):
+            movimiento[columna] = None
+
+    # La rampa se conoce desde la solicitud (o la asignación); quien asignó, desde la asignación
+    orden = ORDEN_ESTADO.get(estado, -1)
+    if orden < ORDEN_ESTADO[EstadoMovimiento.SOLICITADO]:
+        movimiento["rampa_id"] = None
+        if "rampa" in movimiento:
+            movimiento["rampa"] = None
+    if orden < ORDEN_ESTADO[EstadoMovimiento.ASIGNADO_EN_CAMINO]:
+        movimiento["asignado_por_id"] = None
+        if "asignado_por" in movimiento:
+            movimiento["asignado_por"] = None
+    return estado
+
+
+def reconstruir_patio(db: Session, momento: datetime, seleccion: Seleccion, sitio_id: int) -> dict:
+    """
+    Cola de camiones y resumen de rampas del sitio tal como estaban en `momento`.
+
+    En PostgreSQL solo se leen los movimientos cuyo intervalo de estadía contiene
+    el instante, vía el índice GiST ix_movimientos_sitio_estadia (sitio e
+    intervalo: costo logarítmico en el historial del sitio, sin recorrer los
+    intervalos de los demás). El
+    estado de mantenimiento de las rampas no tiene historial: cada rampa se
+    reporta libre u ocupada según sus movimientos.
+    """
+    instante = Instante(momento)
+    interna = seleccion.con_columnas("estado", "rampa_id", "asignado_por_id", *COLUMNAS_HORA)
+
+    query = consulta_movimientos(db, interna, sitio_id)
+    if db.get_bind().dialect.name == "postgresql":
+        query = query.filter(rango_estadia().op("@>")(literal(instante.con_tz, DateTime(timezone=True))))
+    else:
+        fin = func.coalesce(Movimiento.hora_salida_rampa, Movimiento.hora_salida_cd)
+        query = query.filter(
+            Movimiento.hora_ingreso_garita <= instante.local,
+            or_(fin.is_(None), fin > instante.local)
+        )
+
+    cola = {nombre: [] for nombre, _ in COLAS.values()}
+    ocupacion = {}
+    for fila in query.all():
+        movimiento = fila_a_movimiento(fila, interna)
+        estado = _retroceder(movimiento, instante)
+        if estado in COLAS:
+            cola[COLAS[estado][0]].append(movimiento)
+        elif estado in ESTADOS_EN_RAMPA and movimiento["rampa_id"]:
+            ocupacion.setdefault(movimiento["rampa_id"], movimiento)
+
+    ordenar_colas(cola)
+    for movimientos in cola.values():
+        for movimiento in movimientos:
+            recortar(movimiento, seleccion)
+
+    rampas = []
+    for rampa in db.query(Rampa).filter(Rampa.sitio_id == sitio_id, Rampa.activo == True).order_by(Rampa.numero):
+        if rampa.created_at and not instante.alcanzado(rampa.created_at):
+            continue
+        movimiento_actual = ocupacion.get(rampa.id)
+        datos_rampa = fila_a_rampa(rampa)
+        datos_rampa["estado"] = EstadoRampa.OCUPADA if movimiento_actual else EstadoRampa.LIBRE
+        tiempo_ocupada = None
+        if movimiento_actual:
+            if movimiento_actual["hora_en_rampa"]:
+                tiempo_ocupada = instante.minutos_desde(movimiento_actual["hora_en_rampa"])
+            recortar(movimiento_actual, seleccion)
+        rampas.append({
+            "rampa": datos_rampa,
+            "movimiento_actual": movimiento_actual,
+            "tiempo_ocupada": tiempo_ocupada
+        })
+
+    return {"instante": instante.con_tz, "cola": cola, "rampas": rampas}
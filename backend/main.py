@@ -1,37 +1,107 @@
 """
 API Principal - Control de Patio y Asignación de Rampas
-from fastapi import FastAPI, Depends, HTTPException, WebSocket, WebSocketDisconnect
+"""
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session, joinedload
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session, joinedload, configure_mappers
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
 from sqlalchemy import func, and_, or_
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+import asyncio
 import json
+import secrets
+import time
 
-from database import engine, get_db, Base
+from database import (
+    SessionLocal, get_db, get_db_lectura, crear_esquema, calentar_pool, estadisticas_pool,
+    engine, engine_lectura, metricas_pool_replica, COOKIE_ESCRITURA, REPLICA_MARGEN_S
+)
 from models import (
-    Usuario, Camion, Rampa, Movimiento, Notificacion, LogEvento,
-    EstadoMovimiento, EstadoRampa, RolUsuario, TipoCamion, Prioridad
+    Sitio, Usuario, Camion, Rampa, Movimiento, Notificacion, LogEvento,
+    EstadoMovimiento, EstadoRampa, RolUsuario, TipoCamion, Prioridad, SITIO_POR_DEFECTO
 )
 from schemas import (
-    UsuarioCreate, UsuarioUpdate, UsuarioResponse, LoginRequest, LoginResponse,
+    SitioCreate, SitioUpdate, SitioResponse,
+    UsuarioCreate, UsuarioUpdate, UsuarioResponse, LoginRequest, LoginResponse, SesionResponse,
     CamionCreate, CamionUpdate, CamionResponse, CamionConChofer,
     RampaCreate, RampaUpdate, RampaResponse,
     MovimientoCreate, MovimientoResponse, MovimientoCompleto,
     SolicitudDespacho, AsignacionRampa, ConfirmacionChofer, CambioEstado,
-    NotificacionResponse, EstadisticasPatio, ResumenRampa, ColaCamiones,
-    QRIngreso, QRSalida, MensajeResponse
+    NotificacionResponse, LecturaNotificaciones, ConteoNoLeidas, ResultadoLectura,
+    EstadisticasPatio, ResumenRampa, ColaCamiones, SnapshotPatio, LoteCambios,
+    OcupacionRampas, DistribucionEstadias, ReporteCreate, ReporteResponse,
+    TipoResultado, ResultadoBusqueda, QRIngreso, QRSalida, MensajeResponse
+)
+from flujo import (
+    COLAS, ESTADOS_EN_RAMPA, ESTADOS_CONFIRMACION_CHOFER, ordenar_colas, puede_pasar, rampa_asignable
+)
+from historico import reconstruir_patio
+import analitica
+import cambios
+from busqueda import busqueda, LIMITE_POR_DEFECTO, LIMITE_MAXIMO
+from reportes import reportes, ColaLlena, TIPOS_MIME
+from conexiones import manager
+from transmision import transmision
+from mensajes import Mensaje, COMPLETO, FORMATOS, esquema_publico
+from notificaciones import Buzon, ContadorNoLeidas, marcar_leidas
+from vigilancia import Vigilante
+from archivo import hay_archivo, movimientos_archivados
+from estaticos import Estaticos
+from sitios import registro as sitios, sitio_pedido, SitioInvalido, COOKIE_SITIO, COOKIE_SITIO_MAX_AGE_S
+from sesiones import (
+    sesiones, Sesion, SesionInvalida, token_pedido, ip_cliente, hashear_pin, verificar_pin,
+    necesita_rehash, hash_ficticio, COOKIE_SESION
+)
+from serializacion import (
+    Seleccion, resolver_seleccion, consulta_movimientos, fila_a_movimiento, fila_a_rampa,
+    recortar, respuesta_json, sin_datos_personales
 )
 
-# Crear tablas
-Base.metadata.create_all(bind=engine)
+# ========================================
+# ARRANQUE
+# ========================================
+# Importar este módulo no toca la BD: el esquema se aplica aparte
+# (python mantenimiento.py migrar). Al iniciar, el calentamiento corre en
+# segundo plano y la app responde desde el primer momento.
+
+arranque = {"listo": False, "calentamiento_ms": None, "conexiones": 0, "error": None}
+
+async def calentar():
+    """Mappers, pool, vencimientos SLA, índice de búsqueda y hash del login, antes de que los pida una request"""
+    inicio = time.perf_counter()
+    try:
+        await run_in_threadpool(configure_mappers)
+        arranque["conexiones"] = await run_in_threadpool(calentar_pool, engine)
+        if engine_lectura is not engine:
+            arranque["conexiones"] += await run_in_threadpool(calentar_pool, engine_lectura)
+        await vigilante.cargar_activos()
+        # Índice de búsqueda del sitio principal: la primera búsqueda no lo arma (ver busqueda.py)
+        await run_in_threadpool(busqueda.indice, SITIO_POR_DEFECTO)
+        await run_in_threadpool(hash_ficticio)
+        estaticos.manifiesto
+    except Exception as error:
+        # La app sigue: cada request abrirá su conexión como antes
+        arranque["error"] = str(error)
+        print(f"Error en el calentamiento: {error}")
+    arranque["calentamiento_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    arranque["listo"] = True
+
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    tarea = asyncio.create_task(calentar())
+    yield
+    tarea.cancel()
+    reportes.cerrar()
 
 app = FastAPI(
     title="Control de Patio - Supermercados Bravo",
     description="Sistema de gestión de patio y asignación de rampas",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=ciclo_de_vida
 )
 
 # CORS - permitir acceso desde cualquier origen (ajustar en producción)
@@ -43,101 +113,297 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Servir archivos estáticos del frontend
-app.mount("/static", StaticFiles(directory="../frontend"), name="static")
+# Read-your-writes: tras una escritura exitosa, el cliente lee de la primaria
+# durante REPLICA_MARGEN_S aunque haya réplica (ver get_db_lectura).
+# ASGI puro: @app.middleware("http") pasa cada chunk de las respuestas en
+# streaming (feed SSE) por un memory stream y una tarea extra por request.
+class MarcarEscritura:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            await self.app(scope, receive, send)
+            return
+
+        async def enviar(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                MutableHeaders(scope=message).append("set-cookie", (
+                    f"{COOKIE_ESCRITURA}={time.time():.3f}; HttpOnly; "
+                    f"Max-Age={int(REPLICA_MARGEN_S) + 1}; Path=/; SameSite=lax"
+                ))
+            await send(message)
+
+        await self.app(scope, receive, enviar)
+
+app.add_middleware(MarcarEscritura)
 
 # ========================================
-# WEBSOCKET - Notificaciones en tiempo real
+# SESIÓN Y SITIO DE LA REQUEST
 # ========================================
+# async: verificar el token son microsegundos de CPU, no vale un salto al threadpool
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict = {}  # {user_id: [websockets]}
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
-        await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-    
-    def disconnect(self, websocket: WebSocket, user_id: int):
-        if user_id in self.active_connections:
-            self.active_connections[user_id].remove(websocket)
-    
-    async def send_to_user(self, user_id: int, message: dict):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
-    
-    async def broadcast_to_role(self, role: str, message: dict, db: Session):
-        usuarios = db.query(Usuario).filter(Usuario.rol == role).all()
-        for usuario in usuarios:
-            await self.send_to_user(usuario.id, message)
-    
-    async def broadcast_all(self, message: dict):
-        for user_id, connections in self.active_connections.items():
-            for connection in connections:
-                try:
-                    await connection.send_json(message)
-                except:
-                    pass
+async def sesion_actual(request: Request) -> Sesion:
+    """Usuario de la request según su token, verificado en memoria (ver sesiones.py)"""
+    token = token_pedido(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Inicie sesión", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return sesiones.verificar(token)
+    except SesionInvalida as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+def con_rol(*roles: RolUsuario):
+    async def verificar_rol(sesion: Sesion = Depends(sesion_actual)) -> Sesion:
+        if sesion.rol not in roles:
+            raise HTTPException(status_code=403, detail="Sin permiso para esta operación")
+        return sesion
+    return verificar_rol
+
+async def sesion_opcional(request: Request) -> Optional[Sesion]:
+    """Como sesion_actual, pero sin token devuelve None (un token inválido igual es 401)"""
+    if not token_pedido(request):
+        return None
+    return await sesion_actual(request)
 
-manager = ConnectionManager()
+solo_admin = con_rol(RolUsuario.ADMIN)
+gestion = con_rol(RolUsuario.ADMIN, RolUsuario.LOGISTICA)
+# Etapas del flujo (README → Flujo de Operación): el personal del patio mueve los
+# camiones; en la garita también el chofer, pero solo con su camión
+personal = con_rol(RolUsuario.ADMIN, RolUsuario.LOGISTICA, RolUsuario.DESPACHO)
+garita = con_rol(RolUsuario.ADMIN, RolUsuario.LOGISTICA, RolUsuario.CHOFER)
+chofer_o_admin = con_rol(RolUsuario.ADMIN, RolUsuario.CHOFER)
+
+def exigir_propio(sesion: Sesion, usuario_id: int):
+    """Rutas con el usuario en la URL: solo el mismo usuario (o un admin)"""
+    if sesion.usuario_id != usuario_id and sesion.rol != RolUsuario.ADMIN:
+        raise HTTPException(status_code=403, detail="Sin permiso sobre otro usuario")
+
+def exigir_admin_para_rol(sesion: Sesion, *roles: Optional[RolUsuario]):
+    """Logística gestiona usuarios, pero dar o tocar una cuenta admin es solo de un admin"""
+    if RolUsuario.ADMIN in roles and sesion.rol != RolUsuario.ADMIN:
+        raise HTTPException(status_code=403, detail="Solo un admin puede crear o modificar un admin")
+
+def exigir_camion_propio(sesion: Sesion, chofer_id: Optional[int]):
+    """Un chofer solo mueve su propio camión; el resto de los roles ya pasó con_rol"""
+    if sesion.rol == RolUsuario.CHOFER and chofer_id != sesion.usuario_id:
+        raise HTTPException(status_code=403, detail="El camión es de otro chofer")
+
+async def _sitio_existente(sitio_id: int) -> int:
+    if not sitios.conocido(sitio_id) and not await run_in_threadpool(sitios.existe, sitio_id):
+        raise HTTPException(status_code=404, detail="Sitio no encontrado")
+    return sitio_id
+
+async def sitio_actual(request: Request, sesion: Sesion = Depends(sesion_actual)) -> int:
+    """
+    Centro de distribución sobre el que trabaja la request (ver sitios.py): por
+    defecto el de la sesión; otro solo para los admin.
+    """
+    try:
+        sitio_id = sitio_pedido(request, sesion.sitio_id)
+    except SitioInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if sitio_id != sesion.sitio_id and sesion.rol != RolUsuario.ADMIN:
+        raise HTTPException(status_code=403, detail="El usuario no pertenece a este sitio")
+    return await _sitio_existente(sitio_id)
+
+async def sitio_publico(request: Request) -> int:
+    """Sitio de las rutas sin sesión: pantallas del patio"""
+    try:
+        return await _sitio_existente(sitio_pedido(request))
+    except SitioInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def sitio_de_pantalla(
+    request: Request, sesion: Optional[Sesion] = Depends(sesion_opcional)
+) -> Tuple[int, Optional[Sesion]]:
+    """Pantallas del patio: sin sesión, cualquier sitio; con sesión, las reglas de sitio_actual"""
+    if sesion is None:
+        return await sitio_publico(request), None
+    return await sitio_actual(request, sesion), sesion
+
+async def sitio_de_instalacion(request: Request, sesion: Optional[Sesion] = Depends(sesion_opcional)) -> int:
+    """
+    Sitio de los datos de demo: sin sesión solo en una instalación nueva (sin
+    ningún usuario, lo revisa el endpoint); con sesión, solo un admin.
+    """
+    if sesion is None:
+        return await sitio_publico(request)
+    if sesion.rol != RolUsuario.ADMIN:
+        raise HTTPException(status_code=403, detail="Sin permiso para esta operación")
+    return await sitio_actual(request, sesion)
+
+# ========================================
+# WEBSOCKET - Notificaciones en tiempo real
+# ========================================
+
+no_leidas = ContadorNoLeidas()
+buzon = Buzon(manager, no_leidas)
+vigilante = Vigilante(manager)
 
 @app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: int):
-    await manager.connect(websocket, user_id)
+async def websocket_endpoint(websocket: WebSocket, user_id: int, formato: str = COMPLETO):
+    # Handshake: token del mismo usuario de la URL (cookie del login o Authorization)
     try:
+        sesion = sesiones.verificar(token_pedido(websocket) or "")
+        sitio_id = sitio_pedido(websocket, sesion.sitio_id)
+    except (SesionInvalida, SitioInvalido):
+        await websocket.close(code=1008)
+        return
+    if sesion.usuario_id != user_id or (sitio_id != sesion.sitio_id and sesion.rol != RolUsuario.ADMIN):
+        await websocket.close(code=1008)
+        return
+    # ?formato=compacto: avisos como [código, IDs...], el cliente arma el texto
+    await manager.connect(websocket, user_id, formato if formato in FORMATOS else COMPLETO, sitio_id)
+    try:
+        await buzon.al_conectar(user_id)
         while True:
             data = await websocket.receive_text()
-            # Manejar mensajes entrantes si es necesario
-    except WebSocketDisconnect:
+            # Cualquier mensaje (incluido el pong del latido) mantiene vivo el socket
+            manager.actividad(websocket)
+            try:
+                mensaje = json.loads(data)
+            except ValueError:
+                continue
+            # Ack de una notificación del buzón; lo que no trae un ID entero se ignora
+            if not isinstance(mensaje, dict) or mensaje.get("tipo") != "ack":
+                continue
+            notificacion_id = mensaje.get("notificacion_id")
+            if isinstance(notificacion_id, int) and not isinstance(notificacion_id, bool):
+                await buzon.confirmar(user_id, notificacion_id)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: el latido ya cerró el socket por inactividad
+        pass
+    finally:
         manager.disconnect(websocket, user_id)
 
 # ========================================
 # PÁGINAS FRONTEND
 # ========================================
 
+# Build de ../frontend/dist si existe (python estaticos.py), si no los originales
+estaticos = Estaticos()
+
 @app.get("/")
-async def root():
-    return FileResponse("../frontend/index.html")
+async def root(request: Request):
+    return estaticos.pagina(request, "index.html")
 
 @app.get("/admin")
-async def admin_page():
-    return FileResponse("../frontend/admin.html")
+async def admin_page(request: Request):
+    return estaticos.pagina(request, "admin.html")
 
 @app.get("/chofer")
-async def chofer_page():
-    return FileResponse("../frontend/chofer.html")
+async def chofer_page(request: Request):
+    return estaticos.pagina(request, "chofer.html")
 
 @app.get("/despacho")
-async def despacho_page():
-    return FileResponse("../frontend/despacho.html")
+async def despacho_page(request: Request):
+    return estaticos.pagina(request, "despacho.html")
+
+@app.get("/sw-chofer.js")
+async def service_worker_chofer(request: Request):
+    return estaticos.service_worker(request)
+
+@app.get("/static/{ruta:path}")
+async def archivo_estatico(request: Request, ruta: str):
+    return estaticos.activo(request, ruta)
 
 # ========================================
 # AUTENTICACIÓN
 # ========================================
 
 @app.post("/api/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest, db: Session = Depends(get_db)):
+def login(request: LoginRequest, response: Response, conexion: Request, db: Session = Depends(get_db)):
+    ip = ip_cliente(conexion)
+    if sesiones.bloqueado(request.codigo, ip):
+        raise HTTPException(status_code=429, detail="Demasiados intentos fallidos, espere unos minutos")
+    
     usuario = db.query(Usuario).filter(
         Usuario.codigo == request.codigo,
-        Usuario.pin == request.pin,
         Usuario.activo == True
     ).first()
     
-    if not usuario:
+    # Sin usuario se calcula igual un hash: el tiempo no delata qué códigos existen
+    if not verificar_pin(request.pin, usuario.pin if usuario else hash_ficticio()) or not usuario:
+        sesiones.fallo(request.codigo, ip)
         return LoginResponse(success=False, mensaje="Código o PIN incorrecto")
+    sesiones.exito(request.codigo, ip)
+    
+    datos = UsuarioResponse.model_validate(usuario)
+    if necesita_rehash(usuario.pin):
+        usuario.pin = hashear_pin(request.pin)
+        db.commit()
     
+    token = sesiones.emitir(usuario.id, usuario.rol, usuario.sitio_id)
+    vence = datetime.now() + timedelta(seconds=sesiones.duracion_s)
+    response.set_cookie(
+        COOKIE_SESION, token, max_age=int(sesiones.duracion_s), httponly=True, samesite="lax"
+    )
+    # Desde aquí el navegador trabaja sobre el sitio del usuario
+    response.set_cookie(
+        COOKIE_SITIO, str(usuario.sitio_id), max_age=COOKIE_SITIO_MAX_AGE_S, httponly=True, samesite="lax"
+    )
     return LoginResponse(
         success=True,
         mensaje="Login exitoso",
-        usuario=UsuarioResponse.model_validate(usuario)
+        usuario=datos,
+        token=token,
+        vence=vence
     )
 
+@app.post("/api/auth/logout", response_model=MensajeResponse)
+def logout(response: Response, sesion: Sesion = Depends(sesion_actual)):
+    sesiones.revocar(sesion)
+    response.delete_cookie(COOKIE_SESION)
+    return MensajeResponse(success=True, mensaje="Sesión cerrada")
+
+@app.get("/api/auth/sesion", response_model=SesionResponse)
+async def sesion_vigente(sesion: Sesion = Depends(sesion_actual)):
+    return sesion.a_dict()
+
+# ========================================
+# SITIOS
+# ========================================
+
+@app.get("/api/sitios", response_model=List[SitioResponse])
+def listar_sitios(activo: Optional[bool] = True, db: Session = Depends(get_db_lectura)):
+    query = db.query(Sitio)
+    if activo is not None:
+        query = query.filter(Sitio.activo == activo)
+    return query.order_by(Sitio.id).all()
+
+@app.post("/api/sitios", response_model=SitioResponse)
+def crear_sitio(sitio: SitioCreate, sesion: Sesion = Depends(solo_admin), db: Session = Depends(get_db)):
+    existente = db.query(Sitio).filter(Sitio.codigo == sitio.codigo).first()
+    if existente:
+        raise HTTPException(status_code=400, detail="El código de sitio ya existe")
+    
+    db_sitio = Sitio(**sitio.model_dump())
+    db.add(db_sitio)
+    db.commit()
+    db.refresh(db_sitio)
+    sitios.agregar(db_sitio.id)
+    return db_sitio
+
+@app.put("/api/sitios/{sitio_id}", response_model=SitioResponse)
+def actualizar_sitio(
+    sitio_id: int, sitio: SitioUpdate, sesion: Sesion = Depends(solo_admin), db: Session = Depends(get_db)
+):
+    db_sitio = db.query(Sitio).filter(Sitio.id == sitio_id).first()
+    if not db_sitio:
+        raise HTTPException(status_code=404, detail="Sitio no encontrado")
+    
+    for key, value in sitio.model_dump(exclude_unset=True).items():
+        setattr(db_sitio, key, value)
+    
+    db.commit()
+    db.refresh(db_sitio)
+    if db_sitio.activo:
+        sitios.agregar(db_sitio.id)
+    else:
+        sitios.quitar(db_sitio.id)
+    return db_sitio
+
 # ========================================
 # USUARIOS
 # ========================================
@@ -146,9 +412,12 @@ def login(request: LoginRequest, db: Session = Depends(get_db)):
 def listar_usuarios(
     rol: Optional[RolUsuario] = None,
     activo: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    sesion: Sesion = Depends(personal),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
 ):
-    query = db.query(Usuario)
+    """Usuarios del sitio, con su código de login: solo el personal"""
+    query = db.query(Usuario).filter(Usuario.sitio_id == sitio_id)
     if rol:
         query = query.filter(Usuario.rol == rol)
     if activo is not None:
@@ -156,29 +425,46 @@ def listar_usuarios(
     return query.all()
 
 @app.post("/api/usuarios", response_model=UsuarioResponse)
-def crear_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
-    # Verificar código único
+def crear_usuario(
+    usuario: UsuarioCreate, sesion: Sesion = Depends(gestion),
+    sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)
+):
+    exigir_admin_para_rol(sesion, usuario.rol)
+    # Verificar código único (entre todos los sitios: el login es solo código y PIN)
     existente = db.query(Usuario).filter(Usuario.codigo == usuario.codigo).first()
     if existente:
         raise HTTPException(status_code=400, detail="El código ya existe")
     
-    db_usuario = Usuario(**usuario.model_dump())
+    db_usuario = Usuario(**usuario.model_dump(exclude={"pin"}), pin=hashear_pin(usuario.pin), sitio_id=sitio_id)
     db.add(db_usuario)
     db.commit()
     db.refresh(db_usuario)
+    busqueda.actualizar(db_usuario)
     return db_usuario
 
 @app.put("/api/usuarios/{usuario_id}", response_model=UsuarioResponse)
-def actualizar_usuario(usuario_id: int, usuario: UsuarioUpdate, db: Session = Depends(get_db)):
-    db_usuario = db.query(Usuario).filter(Usuario.id == usuario_id).first()
+def actualizar_usuario(
+    usuario_id: int, usuario: UsuarioUpdate, sesion: Sesion = Depends(gestion),
+    sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)
+):
+    db_usuario = db.query(Usuario).filter(Usuario.sitio_id == sitio_id, Usuario.id == usuario_id).first()
     if not db_usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     
-    for key, value in usuario.model_dump(exclude_unset=True).items():
+    cambios_usuario = usuario.model_dump(exclude_unset=True)
+    # El rol no se edita (UsuarioUpdate no lo trae); el PIN o la baja de un admin, solo otro admin
+    exigir_admin_para_rol(sesion, db_usuario.rol)
+    if cambios_usuario.get("pin"):
+        cambios_usuario["pin"] = hashear_pin(cambios_usuario["pin"])
+    for key, value in cambios_usuario.items():
         setattr(db_usuario, key, value)
     
     db.commit()
     db.refresh(db_usuario)
+    busqueda.actualizar(db_usuario)
+    # PIN nuevo o usuario desactivado: las sesiones abiertas dejan de valer
+    if cambios_usuario.get("pin") or cambios_usuario.get("activo") is False:
+        sesiones.revocar_usuario(usuario_id)
     return db_usuario
 
 # ========================================
@@ -189,9 +475,12 @@ def actualizar_usuario(usuario_id: int, usuario: UsuarioUpdate, db: Session = De
 def listar_camiones(
     tipo: Optional[TipoCamion] = None,
     activo: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    sesion: Sesion = Depends(personal),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
 ):
-    query = db.query(Camion).options(joinedload(Camion.chofer))
+    """Camiones del sitio con su chofer (código y teléfono): solo el personal"""
+    query = db.query(Camion).options(joinedload(Camion.chofer)).filter(Camion.sitio_id == sitio_id)
     if tipo:
         query = query.filter(Camion.tipo == tipo)
     if activo is not None:
@@ -199,20 +488,27 @@ def listar_camiones(
     return query.all()
 
 @app.post("/api/camiones", response_model=CamionResponse)
-def crear_camion(camion: CamionCreate, db: Session = Depends(get_db)):
-    existente = db.query(Camion).filter(Camion.placa == camion.placa).first()
+def crear_camion(
+    camion: CamionCreate, sesion: Sesion = Depends(gestion),
+    sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)
+):
+    existente = db.query(Camion).filter(Camion.sitio_id == sitio_id, Camion.placa == camion.placa).first()
     if existente:
         raise HTTPException(status_code=400, detail="La placa ya existe")
     
-    db_camion = Camion(**camion.model_dump())
+    db_camion = Camion(**camion.model_dump(), sitio_id=sitio_id)
     db.add(db_camion)
     db.commit()
     db.refresh(db_camion)
+    busqueda.actualizar(db_camion)
     return db_camion
 
 @app.put("/api/camiones/{camion_id}", response_model=CamionResponse)
-def actualizar_camion(camion_id: int, camion: CamionUpdate, db: Session = Depends(get_db)):
-    db_camion = db.query(Camion).filter(Camion.id == camion_id).first()
+def actualizar_camion(
+    camion_id: int, camion: CamionUpdate, sesion: Sesion = Depends(gestion),
+    sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)
+):
+    db_camion = db.query(Camion).filter(Camion.sitio_id == sitio_id, Camion.id == camion_id).first()
     if not db_camion:
         raise HTTPException(status_code=404, detail="Camión no encontrado")
     
@@ -221,8 +517,44 @@ def actualizar_camion(camion_id: int, camion: CamionUpdate, db: Session = Depend
     
     db.commit()
     db.refresh(db_camion)
+    busqueda.actualizar(db_camion)
     return db_camion
 
+# ========================================
+# BÚSQUEDA
+# ========================================
+
+@app.get("/api/buscar", response_model=List[ResultadoBusqueda])
+def buscar(
+    q: str = Query(..., min_length=1, max_length=100, description="Placa, código o nombre, completo o en parte"),
+    tipo: Optional[TipoResultado] = None,
+    activo: Optional[bool] = True,
+    limit: int = Query(LIMITE_POR_DEFECTO, ge=1, le=LIMITE_MAXIMO),
+    sesion: Sesion = Depends(personal),
+    sitio_id: int = Depends(sitio_actual)
+):
+    """
+    Camiones y usuarios del sitio más parecidos a q, el mejor primero (índice en
+    memoria, ver busqueda.py). Solo el personal: devuelve los códigos de login.
+    """
+    return busqueda.buscar(sitio_id, q, tipo.value if tipo else None, activo, limit)
+
+# ========================================
+# CAMPOS DE RESPUESTA (sparse fieldsets)
+# ========================================
+
+def seleccion_campos(
+    campos: Optional[str] = Query(
+        None, alias="fields",
+        description="Campos a devolver, ej: id,estado,camion.placa,rampa.numero"
+    ),
+    vista: Optional[str] = Query(None, description="Vista compacta por rol: chofer | despacho")
+) -> Seleccion:
+    try:
+        return resolver_seleccion(campos, vista)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # ========================================
 # RAMPAS
 # ========================================
@@ -231,9 +563,10 @@ def actualizar_camion(camion_id: int, camion: CamionUpdate, db: Session = Depend
 def listar_rampas(
     estado: Optional[EstadoRampa] = None,
     activo: Optional[bool] = True,
-    db: Session = Depends(get_db)
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
 ):
-    query = db.query(Rampa)
+    query = db.query(Rampa).filter(Rampa.sitio_id == sitio_id)
     if estado:
         query = query.filter(Rampa.estado == estado)
     if activo is not None:
@@ -241,20 +574,26 @@ def listar_rampas(
     return query.order_by(Rampa.numero).all()
 
 @app.post("/api/rampas", response_model=RampaResponse)
-def crear_rampa(rampa: RampaCreate, db: Session = Depends(get_db)):
-    existente = db.query(Rampa).filter(Rampa.numero == rampa.numero).first()
+def crear_rampa(
+    rampa: RampaCreate, sesion: Sesion = Depends(gestion),
+    sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)
+):
+    existente = db.query(Rampa).filter(Rampa.sitio_id == sitio_id, Rampa.numero == rampa.numero).first()
     if existente:
         raise HTTPException(status_code=400, detail="El número de rampa ya existe")
     
-    db_rampa = Rampa(**rampa.model_dump())
+    db_rampa = Rampa(**rampa.model_dump(), sitio_id=sitio_id)
     db.add(db_rampa)
     db.commit()
     db.refresh(db_rampa)
     return db_rampa
 
 @app.put("/api/rampas/{rampa_id}", response_model=RampaResponse)
-def actualizar_rampa(rampa_id: int, rampa: RampaUpdate, db: Session = Depends(get_db)):
-    db_rampa = db.query(Rampa).filter(Rampa.id == rampa_id).first()
+def actualizar_rampa(
+    rampa_id: int, rampa: RampaUpdate, sesion: Sesion = Depends(gestion),
+    sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)
+):
+    db_rampa = db.query(Rampa).filter(Rampa.sitio_id == sitio_id, Rampa.id == rampa_id).first()
     if not db_rampa:
         raise HTTPException(status_code=404, detail="Rampa no encontrada")
     
@@ -266,102 +605,127 @@ def actualizar_rampa(rampa_id: int, rampa: RampaUpdate, db: Session = Depends(ge
     return db_rampa
 
 @app.get("/api/rampas/resumen", response_model=List[ResumenRampa])
-def resumen_rampas(db: Session = Depends(get_db)):
-    """Obtiene todas las rampas con su movimiento actual si está ocupada"""
-    rampas = db.query(Rampa).filter(Rampa.activo == True).order_by(Rampa.numero).all()
-    resultado = []
+def resumen_rampas(
+    seleccion: Seleccion = Depends(seleccion_campos),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
+):
+    """Obtiene todas las rampas del sitio con su movimiento actual si está ocupada"""
+    rampas = db.query(Rampa).filter(Rampa.sitio_id == sitio_id, Rampa.activo == True).order_by(Rampa.numero).all()
+    
+    # Un solo query para los movimientos de todas las rampas ocupadas
+    ocupadas = [r.id for r in rampas if r.estado == EstadoRampa.OCUPADA]
+    actuales = {}
+    if ocupadas:
+        interna = seleccion.con_columnas("rampa_id", "hora_en_rampa")
+        filas = consulta_movimientos(db, interna, sitio_id).filter(
+            Movimiento.rampa_id.in_(ocupadas),
+            Movimiento.estado.in_(ESTADOS_EN_RAMPA)
+        ).all()
+        for fila in filas:
+            movimiento = fila_a_movimiento(fila, interna)
+            actuales.setdefault(movimiento["rampa_id"], movimiento)
     
+    resultado = []
     for rampa in rampas:
-        movimiento_actual = None
+        movimiento_actual = actuales.get(rampa.id)
         tiempo_ocupada = None
         
-        if rampa.estado == EstadoRampa.OCUPADA:
-            movimiento = db.query(Movimiento).options(
-                joinedload(Movimiento.camion).joinedload(Camion.chofer)
-            ).filter(
-                Movimiento.rampa_id == rampa.id,
-                Movimiento.estado.in_([EstadoMovimiento.EN_RAMPA, EstadoMovimiento.CARGA_LISTA])
-            ).first()
-            
-            if movimiento:
-                movimiento_actual = MovimientoCompleto.model_validate(movimiento)
-                if movimiento.hora_en_rampa:
-                    tiempo_ocupada = (datetime.now() - movimiento.hora_en_rampa).total_seconds() / 60
+        if movimiento_actual:
+            hora_en_rampa = movimiento_actual["hora_en_rampa"]
+            if hora_en_rampa:
+                tiempo_ocupada = (datetime.now(hora_en_rampa.tzinfo) - hora_en_rampa).total_seconds() / 60
+            recortar(movimiento_actual, seleccion)
         
-        resultado.append(ResumenRampa(
-            rampa=RampaResponse.model_validate(rampa),
-            movimiento_actual=movimiento_actual,
-            tiempo_ocupada=tiempo_ocupada
-        ))
+        resultado.append({
+            "rampa": fila_a_rampa(rampa),
+            "movimiento_actual": movimiento_actual,
+            "tiempo_ocupada": tiempo_ocupada
+        })
     
-    return resultado
+    return respuesta_json(resultado)
 
 # ========================================
 # MOVIMIENTOS - FLUJO PRINCIPAL
 # ========================================
 
-def obtener_movimiento_completo(db: Session, movimiento_id: int) -> Movimiento:
+def obtener_movimiento_completo(db: Session, movimiento_id: int, sitio_id: int) -> Movimiento:
     return db.query(Movimiento).options(
         joinedload(Movimiento.camion).joinedload(Camion.chofer),
         joinedload(Movimiento.rampa),
         joinedload(Movimiento.asignado_por)
-    ).filter(Movimiento.id == movimiento_id).first()
+    ).filter(Movimiento.sitio_id == sitio_id, Movimiento.id == movimiento_id).first()
 
 @app.get("/api/movimientos", response_model=List[MovimientoCompleto])
 def listar_movimientos(
     estado: Optional[EstadoMovimiento] = None,
     fecha: Optional[str] = None,  # YYYY-MM-DD
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    seleccion: Seleccion = Depends(seleccion_campos),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
 ):
-    query = db.query(Movimiento).options(
-        joinedload(Movimiento.camion).joinedload(Camion.chofer),
-        joinedload(Movimiento.rampa),
-        joinedload(Movimiento.asignado_por)
-    )
+    fecha_inicio = fecha_fin = None
+    if fecha:
+        fecha_inicio = datetime.strptime(fecha, "%Y-%m-%d")
+        fecha_fin = fecha_inicio + timedelta(days=1)
+    # Fechas viejas: los movimientos ya archivados se leen de su mes comprimido
+    con_archivo = bool(fecha) and hay_archivo("movimientos", fecha_inicio, fecha_fin)
+    interna = seleccion.con_columnas("hora_ingreso_garita") if con_archivo else seleccion
+    
+    query = consulta_movimientos(db, interna, sitio_id)
     
     if estado:
         query = query.filter(Movimiento.estado == estado)
     
     if fecha:
-        fecha_inicio = datetime.strptime(fecha, "%Y-%m-%d")
-        fecha_fin = fecha_inicio + timedelta(days=1)
         query = query.filter(
             Movimiento.hora_ingreso_garita >= fecha_inicio,
             Movimiento.hora_ingreso_garita < fecha_fin
         )
     
-    return query.order_by(Movimiento.hora_ingreso_garita.desc()).limit(limit).all()
+    filas = query.order_by(Movimiento.hora_ingreso_garita.desc()).limit(limit).all()
+    resultado = [fila_a_movimiento(f, interna) for f in filas]
+    
+    if con_archivo:
+        vivos = {m["id"] for m in resultado}
+        resultado += [
+            m for m in movimientos_archivados(db, fecha_inicio, fecha_fin, interna.con_columnas("estado"), sitio_id)
+            if m["id"] not in vivos and (not estado or m["estado"] == estado)
+        ]
+        resultado.sort(key=lambda m: m["hora_ingreso_garita"], reverse=True)
+        resultado = [recortar(m, seleccion) for m in resultado[:limit]]
+    return respuesta_json(resultado)
 
 @app.get("/api/movimientos/activos", response_model=ColaCamiones)
-def movimientos_activos(db: Session = Depends(get_db)):
-    """Obtiene los movimientos activos organizados por estado"""
-    base_query = db.query(Movimiento).options(
-        joinedload(Movimiento.camion).joinedload(Camion.chofer),
-        joinedload(Movimiento.rampa)
-    )
+def movimientos_activos(
+    seleccion: Seleccion = Depends(seleccion_campos),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
+):
+    """Obtiene los movimientos activos del sitio organizados por estado"""
+    interna = seleccion.con_columnas("estado", *(campo for _, campo in COLAS.values()))
     
-    disponibles = base_query.filter(
-        Movimiento.estado == EstadoMovimiento.DISPONIBLE_PATIO
-    ).order_by(Movimiento.hora_ingreso_garita).all()
+    filas = consulta_movimientos(db, interna, sitio_id).filter(
+        Movimiento.estado.in_(list(COLAS))
+    ).all()
     
-    solicitados = base_query.filter(
-        Movimiento.estado == EstadoMovimiento.SOLICITADO
-    ).order_by(Movimiento.hora_solicitado).all()
+    resultado = {nombre: [] for nombre, _ in COLAS.values()}
+    for fila in filas:
+        movimiento = fila_a_movimiento(fila, interna)
+        resultado[COLAS[movimiento["estado"]][0]].append(movimiento)
     
-    en_camino = base_query.filter(
-        Movimiento.estado == EstadoMovimiento.ASIGNADO_EN_CAMINO
-    ).order_by(Movimiento.hora_asignado).all()
+    # Cada cola se ordena por la hora de su etapa
+    ordenar_colas(resultado)
+    for cola in resultado.values():
+        for movimiento in cola:
+            recortar(movimiento, seleccion)
     
-    return ColaCamiones(
-        disponibles=[MovimientoCompleto.model_validate(m) for m in disponibles],
-        solicitados=[MovimientoCompleto.model_validate(m) for m in solicitados],
-        en_camino=[MovimientoCompleto.model_validate(m) for m in en_camino]
-    )
+    return respuesta_json(resultado)
 
 @app.get("/api/movimientos/{movimiento_id}", response_model=MovimientoCompleto)
-def obtener_movimiento(movimiento_id: int, db: Session = Depends(get_db)):
-    movimiento = obtener_movimiento_completo(db, movimiento_id)
+def obtener_movimiento(movimiento_id: int, sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db)):
+    movimiento = obtener_movimiento_completo(db, movimiento_id, sitio_id)
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     return movimiento
@@ -371,20 +735,25 @@ def obtener_movimiento(movimiento_id: int, db: Session = Depends(get_db)):
 # ========================================
 
 @app.post("/api/movimientos/ingreso", response_model=MovimientoResponse)
-async def registrar_ingreso(datos: QRIngreso, db: Session = Depends(get_db)):
+async def registrar_ingreso(
+    datos: QRIngreso, sesion: Sesion = Depends(garita), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Chofer escanea QR en garita - registra ingreso"""
     # Buscar camión
-    camion = db.query(Camion).filter(Camion.placa == datos.placa.upper()).first()
+    camion = db.query(Camion).filter(Camion.sitio_id == sitio_id, Camion.placa == datos.placa.upper()).first()
     if not camion:
         raise HTTPException(status_code=404, detail="Camión no registrado")
     
     # Verificar chofer
     chofer = db.query(Usuario).filter(
+        Usuario.sitio_id == sitio_id,
         Usuario.codigo == datos.chofer_codigo,
         Usuario.rol == RolUsuario.CHOFER
     ).first()
     if not chofer:
         raise HTTPException(status_code=404, detail="Chofer no registrado")
+    exigir_camion_propio(sesion, chofer.id)
     
     # Verificar que no tenga un movimiento activo
     movimiento_activo = db.query(Movimiento).filter(
@@ -396,11 +765,13 @@ async def registrar_ingreso(datos: QRIngreso, db: Session = Depends(get_db)):
     
     # Crear movimiento
     movimiento = Movimiento(
+        sitio_id=sitio_id,
         camion_id=camion.id,
         estado=EstadoMovimiento.INGRESADO_GARITA,
         hora_ingreso_garita=datetime.now()
     )
     db.add(movimiento)
+    cambios.registrar(db, movimiento, None, movimiento.hora_ingreso_garita)
     
     # Log
     log = LogEvento(
@@ -413,13 +784,12 @@ async def registrar_ingreso(datos: QRIngreso, db: Session = Depends(get_db)):
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
     
     # Notificar a logística
-    await manager.broadcast_to_role("logistica", {
-        "tipo": "nuevo_ingreso",
-        "mensaje": f"Camión {camion.placa} ingresó a garita",
-        "movimiento_id": movimiento.id
-    }, db)
+    await manager.broadcast_to_role("logistica", Mensaje(
+        "nuevo_ingreso", movimiento_id=movimiento.id, placa=camion.placa
+    ), db, sitio_id)
     
     return movimiento
 
@@ -428,27 +798,26 @@ async def registrar_ingreso(datos: QRIngreso, db: Session = Depends(get_db)):
 # ========================================
 
 @app.post("/api/movimientos/{movimiento_id}/disponible", response_model=MovimientoResponse)
-async def marcar_disponible(movimiento_id: int, db: Session = Depends(get_db)):
+async def marcar_disponible(
+    movimiento_id: int, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Marcar camión como disponible en patio (después de ingreso)"""
-    movimiento = db.query(Movimiento).filter(Movimiento.id == movimiento_id).first()
+    movimiento = db.query(Movimiento).filter(Movimiento.sitio_id == sitio_id, Movimiento.id == movimiento_id).first()
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     
-    if movimiento.estado != EstadoMovimiento.INGRESADO_GARITA:
+    if not puede_pasar(movimiento.estado, EstadoMovimiento.DISPONIBLE_PATIO):
         raise HTTPException(status_code=400, detail="Estado inválido para esta acción")
     
-    movimiento.estado = EstadoMovimiento.DISPONIBLE_PATIO
-    movimiento.hora_disponible_patio = datetime.now()
+    cambios.pasar(db, movimiento, EstadoMovimiento.DISPONIBLE_PATIO)
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
     
     # Notificar
-    await manager.broadcast_all({
-        "tipo": "camion_disponible",
-        "mensaje": "Nuevo camión disponible en patio",
-        "movimiento_id": movimiento.id
-    })
+    await manager.broadcast_all(Mensaje("camion_disponible", movimiento_id=movimiento.id), sitio_id)
     
     return movimiento
 
@@ -457,17 +826,21 @@ async def marcar_disponible(movimiento_id: int, db: Session = Depends(get_db)):
 # ========================================
 
 @app.post("/api/movimientos/solicitar", response_model=MovimientoResponse)
-async def solicitar_camion(solicitud: SolicitudDespacho, db: Session = Depends(get_db)):
+async def solicitar_camion(
+    solicitud: SolicitudDespacho, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Despacho solicita un camión específico"""
-    movimiento = db.query(Movimiento).filter(Movimiento.id == solicitud.movimiento_id).first()
+    movimiento = db.query(Movimiento).filter(
+        Movimiento.sitio_id == sitio_id, Movimiento.id == solicitud.movimiento_id
+    ).first()
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     
-    if movimiento.estado != EstadoMovimiento.DISPONIBLE_PATIO:
+    if not puede_pasar(movimiento.estado, EstadoMovimiento.SOLICITADO):
         raise HTTPException(status_code=400, detail="El camión no está disponible")
     
-    movimiento.estado = EstadoMovimiento.SOLICITADO
-    movimiento.hora_solicitado = datetime.now()
+    cambios.pasar(db, movimiento, EstadoMovimiento.SOLICITADO)
     movimiento.solicitado_por_despacho = solicitud.solicitado_por
     
     if solicitud.rampa_id:
@@ -479,13 +852,12 @@ async def solicitar_camion(solicitud: SolicitudDespacho, db: Session = Depends(g
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
     
     # Notificar a logística
-    await manager.broadcast_to_role("logistica", {
-        "tipo": "solicitud_camion",
-        "mensaje": f"Despacho solicita camión - Prioridad: {movimiento.prioridad.value}",
-        "movimiento_id": movimiento.id
-    }, db)
+    await manager.broadcast_to_role("logistica", Mensaje(
+        "solicitud_camion", movimiento_id=movimiento.id, prioridad=movimiento.prioridad.value
+    ), db, sitio_id)
     
     return movimiento
 
@@ -494,31 +866,33 @@ async def solicitar_camion(solicitud: SolicitudDespacho, db: Session = Depends(g
 # ========================================
 
 @app.post("/api/movimientos/asignar", response_model=MovimientoResponse)
-async def asignar_rampa(asignacion: AsignacionRampa, db: Session = Depends(get_db)):
+async def asignar_rampa(
+    asignacion: AsignacionRampa, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Logística asigna rampa a un camión"""
     movimiento = db.query(Movimiento).options(
         joinedload(Movimiento.camion).joinedload(Camion.chofer)
-    ).filter(Movimiento.id == asignacion.movimiento_id).first()
+    ).filter(Movimiento.sitio_id == sitio_id, Movimiento.id == asignacion.movimiento_id).first()
     
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     
-    if movimiento.estado not in [EstadoMovimiento.DISPONIBLE_PATIO, EstadoMovimiento.SOLICITADO]:
+    if not puede_pasar(movimiento.estado, EstadoMovimiento.ASIGNADO_EN_CAMINO):
         raise HTTPException(status_code=400, detail="Estado inválido para asignar rampa")
     
     # Verificar rampa
-    rampa = db.query(Rampa).filter(Rampa.id == asignacion.rampa_id).first()
+    rampa = db.query(Rampa).filter(Rampa.sitio_id == sitio_id, Rampa.id == asignacion.rampa_id).first()
     if not rampa:
         raise HTTPException(status_code=404, detail="Rampa no encontrada")
     
-    if rampa.estado != EstadoRampa.LIBRE:
+    if not rampa_asignable(rampa.estado):
         raise HTTPException(status_code=400, detail="La rampa no está disponible")
     
     # Actualizar movimiento
-    movimiento.estado = EstadoMovimiento.ASIGNADO_EN_CAMINO
     movimiento.rampa_id = rampa.id
-    movimiento.hora_asignado = datetime.now()
-    movimiento.asignado_por_id = asignacion.asignado_por_id
+    movimiento.asignado_por_id = sesion.usuario_id
+    cambios.pasar(db, movimiento, EstadoMovimiento.ASIGNADO_EN_CAMINO)
     
     if asignacion.notas:
         movimiento.notas = (movimiento.notas or "") + f"\n{asignacion.notas}"
@@ -528,26 +902,24 @@ async def asignar_rampa(asignacion: AsignacionRampa, db: Session = Depends(get_d
     
     # Crear notificación para el chofer
     chofer_id = movimiento.camion.chofer_id if movimiento.camion else None
+    notificacion = None
     if chofer_id:
-        notificacion = Notificacion(
-            usuario_id=chofer_id,
-            movimiento_id=movimiento.id,
-            tipo="asignacion_rampa",
-            mensaje=f"Diríjase a la Rampa {rampa.numero}"
+        notificacion = buzon.crear(
+            db, chofer_id, movimiento.id, "asignacion_rampa",
+            f"Diríjase a la Rampa {rampa.numero}",
+            Mensaje("asignacion_rampa", movimiento_id=movimiento.id, rampa=rampa.numero)
         )
-        db.add(notificacion)
-        
-        # Notificar por WebSocket
-        await manager.send_to_user(chofer_id, {
-            "tipo": "asignacion_rampa",
-            "mensaje": f"¡ATENCIÓN! Diríjase a la Rampa {rampa.numero}",
-            "movimiento_id": movimiento.id,
-            "rampa": rampa.numero,
-            "requiere_confirmacion": True
-        })
+    # Para el feed de las pantallas; después del commit rampa.numero costaría otra consulta
+    aviso_patio = Mensaje("asignacion_rampa", movimiento_id=movimiento.id, rampa=rampa.numero)
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
+    
+    # Notificar por WebSocket (solo lo ya confirmado en la BD)
+    if notificacion:
+        await buzon.enviar(notificacion)
+    transmision.publicar(aviso_patio, sitio_id)
     
     return movimiento
 
@@ -556,16 +928,22 @@ async def asignar_rampa(asignacion: AsignacionRampa, db: Session = Depends(get_d
 # ========================================
 
 @app.post("/api/movimientos/{movimiento_id}/confirmar-chofer", response_model=MovimientoResponse)
-async def confirmar_asignacion_chofer(movimiento_id: int, db: Session = Depends(get_db)):
+async def confirmar_asignacion_chofer(
+    movimiento_id: int, sesion: Sesion = Depends(chofer_o_admin), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Chofer confirma que recibió la asignación"""
-    movimiento = db.query(Movimiento).filter(Movimiento.id == movimiento_id).first()
+    movimiento = db.query(Movimiento).options(joinedload(Movimiento.camion)).filter(
+        Movimiento.sitio_id == sitio_id, Movimiento.id == movimiento_id
+    ).first()
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
+    exigir_camion_propio(sesion, movimiento.camion.chofer_id if movimiento.camion else None)
     
-    if movimiento.estado != EstadoMovimiento.ASIGNADO_EN_CAMINO:
+    if movimiento.estado not in ESTADOS_CONFIRMACION_CHOFER:
         raise HTTPException(status_code=400, detail="Estado inválido para confirmar")
     
-    movimiento.hora_confirmado_chofer = datetime.now()
+    cambios.pasar(db, movimiento, movimiento.estado, "hora_confirmado_chofer")
     
     # Marcar notificación como confirmada
     notificacion = db.query(Notificacion).filter(
@@ -575,16 +953,16 @@ async def confirmar_asignacion_chofer(movimiento_id: int, db: Session = Depends(
     if notificacion:
         notificacion.confirmada = True
         notificacion.confirmada_at = datetime.now()
+        # Confirmar por HTTP también cuenta como entrega
+        if notificacion.entregada_at is None:
+            notificacion.entregada_at = notificacion.confirmada_at
+        buzon.descartar(notificacion.id)
     
     db.commit()
     db.refresh(movimiento)
     
     # Notificar a logística y despacho
-    await manager.broadcast_to_role("logistica", {
-        "tipo": "chofer_confirmo",
-        "mensaje": f"Chofer confirmó asignación - En camino a rampa",
-        "movimiento_id": movimiento.id
-    }, db)
+    await manager.broadcast_to_role("logistica", Mensaje("chofer_confirmo", movimiento_id=movimiento.id), db, sitio_id)
     
     return movimiento
 
@@ -593,17 +971,19 @@ async def confirmar_asignacion_chofer(movimiento_id: int, db: Session = Depends(
 # ========================================
 
 @app.post("/api/movimientos/{movimiento_id}/en-rampa", response_model=MovimientoResponse)
-async def confirmar_en_rampa(movimiento_id: int, db: Session = Depends(get_db)):
+async def confirmar_en_rampa(
+    movimiento_id: int, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Despacho confirma que el camión llegó a la rampa"""
-    movimiento = db.query(Movimiento).filter(Movimiento.id == movimiento_id).first()
+    movimiento = db.query(Movimiento).filter(Movimiento.sitio_id == sitio_id, Movimiento.id == movimiento_id).first()
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     
-    if movimiento.estado != EstadoMovimiento.ASIGNADO_EN_CAMINO:
+    if not puede_pasar(movimiento.estado, EstadoMovimiento.EN_RAMPA):
         raise HTTPException(status_code=400, detail="Estado inválido para esta acción")
     
-    movimiento.estado = EstadoMovimiento.EN_RAMPA
-    movimiento.hora_en_rampa = datetime.now()
+    cambios.pasar(db, movimiento, EstadoMovimiento.EN_RAMPA)
     
     # Marcar rampa como ocupada
     if movimiento.rampa_id:
@@ -613,12 +993,9 @@ async def confirmar_en_rampa(movimiento_id: int, db: Session = Depends(get_db)):
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
     
-    await manager.broadcast_all({
-        "tipo": "camion_en_rampa",
-        "mensaje": f"Camión en rampa - Iniciando carga",
-        "movimiento_id": movimiento.id
-    })
+    await manager.broadcast_all(Mensaje("camion_en_rampa", movimiento_id=movimiento.id), sitio_id)
     
     return movimiento
 
@@ -627,41 +1004,41 @@ async def confirmar_en_rampa(movimiento_id: int, db: Session = Depends(get_db)):
 # ========================================
 
 @app.post("/api/movimientos/{movimiento_id}/carga-lista", response_model=MovimientoResponse)
-async def marcar_carga_lista(movimiento_id: int, db: Session = Depends(get_db)):
+async def marcar_carga_lista(
+    movimiento_id: int, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Despacho marca que la carga está lista"""
     movimiento = db.query(Movimiento).options(
         joinedload(Movimiento.camion).joinedload(Camion.chofer),
         joinedload(Movimiento.rampa)
-    ).filter(Movimiento.id == movimiento_id).first()
+    ).filter(Movimiento.sitio_id == sitio_id, Movimiento.id == movimiento_id).first()
     
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     
-    if movimiento.estado != EstadoMovimiento.EN_RAMPA:
+    if not puede_pasar(movimiento.estado, EstadoMovimiento.CARGA_LISTA):
         raise HTTPException(status_code=400, detail="Estado inválido para esta acción")
     
-    movimiento.estado = EstadoMovimiento.CARGA_LISTA
-    movimiento.hora_carga_lista = datetime.now()
+    cambios.pasar(db, movimiento, EstadoMovimiento.CARGA_LISTA)
     
     # Notificar al chofer
     chofer_id = movimiento.camion.chofer_id if movimiento.camion else None
+    notificacion = None
     if chofer_id:
-        notificacion = Notificacion(
-            usuario_id=chofer_id,
-            movimiento_id=movimiento.id,
-            tipo="carga_lista",
-            mensaje=f"¡Carga lista! Puede retirarse de Rampa {movimiento.rampa.numero if movimiento.rampa else ''}"
+        notificacion = buzon.crear(
+            db, chofer_id, movimiento.id, "carga_lista",
+            f"¡Carga lista! Puede retirarse de Rampa {movimiento.rampa.numero if movimiento.rampa else ''}",
+            Mensaje("carga_lista", movimiento_id=movimiento.id)
         )
-        db.add(notificacion)
-        
-        await manager.send_to_user(chofer_id, {
-            "tipo": "carga_lista",
-            "mensaje": f"¡CARGA LISTA! Puede retirarse de la rampa",
-            "movimiento_id": movimiento.id
-        })
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
+    
+    if notificacion:
+        await buzon.enviar(notificacion)
+    transmision.publicar(Mensaje("carga_lista", movimiento_id=movimiento.id), sitio_id)
     
     return movimiento
 
@@ -670,17 +1047,19 @@ async def marcar_carga_lista(movimiento_id: int, db: Session = Depends(get_db)):
 # ========================================
 
 @app.post("/api/movimientos/{movimiento_id}/salida-rampa", response_model=MovimientoResponse)
-async def registrar_salida_rampa(movimiento_id: int, db: Session = Depends(get_db)):
+async def registrar_salida_rampa(
+    movimiento_id: int, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Registrar salida del camión de la rampa"""
-    movimiento = db.query(Movimiento).filter(Movimiento.id == movimiento_id).first()
+    movimiento = db.query(Movimiento).filter(Movimiento.sitio_id == sitio_id, Movimiento.id == movimiento_id).first()
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
     
-    if movimiento.estado != EstadoMovimiento.CARGA_LISTA:
+    if not puede_pasar(movimiento.estado, EstadoMovimiento.SALIDA_RAMPA):
         raise HTTPException(status_code=400, detail="Estado inválido para esta acción")
     
-    movimiento.estado = EstadoMovimiento.SALIDA_RAMPA
-    movimiento.hora_salida_rampa = datetime.now()
+    cambios.pasar(db, movimiento, EstadoMovimiento.SALIDA_RAMPA)
     
     # Liberar rampa
     if movimiento.rampa_id:
@@ -690,13 +1069,11 @@ async def registrar_salida_rampa(movimiento_id: int, db: Session = Depends(get_d
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
     
-    await manager.broadcast_all({
-        "tipo": "rampa_liberada",
-        "mensaje": f"Rampa liberada",
-        "movimiento_id": movimiento.id,
-        "rampa_id": movimiento.rampa_id
-    })
+    await manager.broadcast_all(
+        Mensaje("rampa_liberada", movimiento_id=movimiento.id, rampa_id=movimiento.rampa_id), sitio_id
+    )
     
     return movimiento
 
@@ -705,17 +1082,23 @@ async def registrar_salida_rampa(movimiento_id: int, db: Session = Depends(get_d
 # ========================================
 
 @app.post("/api/movimientos/salida-cd", response_model=MovimientoResponse)
-async def registrar_salida_cd(datos: QRSalida, db: Session = Depends(get_db)):
+async def registrar_salida_cd(
+    datos: QRSalida, sesion: Sesion = Depends(garita), sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Chofer escanea QR al salir del CD"""
-    movimiento = db.query(Movimiento).filter(Movimiento.id == datos.movimiento_id).first()
+    movimiento = db.query(Movimiento).options(joinedload(Movimiento.camion)).filter(
+        Movimiento.sitio_id == sitio_id, Movimiento.id == datos.movimiento_id
+    ).first()
     if not movimiento:
         raise HTTPException(status_code=404, detail="Movimiento no encontrado")
+    exigir_camion_propio(sesion, movimiento.camion.chofer_id if movimiento.camion else None)
     
-    movimiento.estado = EstadoMovimiento.SALIDA_CD
-    movimiento.hora_salida_cd = datetime.now()
+    cambios.pasar(db, movimiento, EstadoMovimiento.SALIDA_CD)
     
     db.commit()
     db.refresh(movimiento)
+    vigilante.rearmar(movimiento)
     
     return movimiento
 
@@ -724,8 +1107,8 @@ async def registrar_salida_cd(datos: QRSalida, db: Session = Depends(get_db)):
 # ========================================
 
 @app.get("/api/estadisticas", response_model=EstadisticasPatio)
-def obtener_estadisticas(db: Session = Depends(get_db)):
-    """Estadísticas generales del patio"""
+def obtener_estadisticas(sitio_id: int = Depends(sitio_actual), db: Session = Depends(get_db_lectura)):
+    """Estadísticas generales del patio del sitio"""
     hoy = datetime.now().date()
     inicio_hoy = datetime.combine(hoy, datetime.min.time())
     
@@ -739,30 +1122,27 @@ def obtener_estadisticas(db: Session = Depends(get_db)):
         EstadoMovimiento.CARGA_LISTA
     ]
     
-    camiones_en_patio = db.query(Movimiento).filter(
+    movimientos = db.query(Movimiento).filter(Movimiento.sitio_id == sitio_id)
+    rampas = db.query(Rampa).filter(Rampa.sitio_id == sitio_id, Rampa.activo == True)
+    
+    camiones_en_patio = movimientos.filter(
         Movimiento.estado.in_(estados_activos)
     ).count()
     
-    camiones_disponibles = db.query(Movimiento).filter(
+    camiones_disponibles = movimientos.filter(
         Movimiento.estado == EstadoMovimiento.DISPONIBLE_PATIO
     ).count()
     
-    camiones_en_rampa = db.query(Movimiento).filter(
+    camiones_en_rampa = movimientos.filter(
         Movimiento.estado.in_([EstadoMovimiento.EN_RAMPA, EstadoMovimiento.CARGA_LISTA])
     ).count()
     
-    rampas_libres = db.query(Rampa).filter(
-        Rampa.estado == EstadoRampa.LIBRE,
-        Rampa.activo == True
-    ).count()
+    rampas_libres = rampas.filter(Rampa.estado == EstadoRampa.LIBRE).count()
     
-    rampas_ocupadas = db.query(Rampa).filter(
-        Rampa.estado == EstadoRampa.OCUPADA,
-        Rampa.activo == True
-    ).count()
+    rampas_ocupadas = rampas.filter(Rampa.estado == EstadoRampa.OCUPADA).count()
     
     # Tiempos promedio (movimientos completados hoy)
-    movimientos_completados = db.query(Movimiento).filter(
+    movimientos_completados = movimientos.filter(
         Movimiento.hora_ingreso_garita >= inicio_hoy,
         Movimiento.hora_salida_rampa.isnot(None),
         Movimiento.hora_en_rampa.isnot(None)
@@ -799,6 +1179,189 @@ def obtener_estadisticas(db: Session = Depends(get_db)):
         tiempo_promedio_rampa=tiempo_promedio_rampa
     )
 
+@app.get("/api/patio/snapshot", response_model=SnapshotPatio)
+def snapshot_patio(
+    at: datetime = Query(..., description="Instante a reconstruir, ej: 2024-05-14T07:42:00"),
+    seleccion: Seleccion = Depends(seleccion_campos),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
+):
+    """Reconstruye la cola de camiones y las rampas tal como estaban en un instante pasado"""
+    return respuesta_json(reconstruir_patio(db, at, seleccion, sitio_id))
+
+def estado_patio(sitio_id: int, seleccion: Seleccion) -> bytes:
+    """Rampas y colas actuales en un JSON; de la primaria, porque el feed sigue desde acá"""
+    db = SessionLocal()
+    try:
+        rampas = resumen_rampas(seleccion, sitio_id, db).body
+        colas = movimientos_activos(seleccion, sitio_id, db).body
+    finally:
+        db.close()
+    return b'{"rampas":' + rampas + b',"colas":' + colas + b'}'
+
+@app.get("/api/stream/patio")
+async def stream_patio(
+    request: Request,
+    last_event_id: Optional[str] = Query(None, description="Para reanudar sin la cabecera Last-Event-ID"),
+    seleccion: Seleccion = Depends(seleccion_campos),
+    pantalla: Tuple[int, Optional[Sesion]] = Depends(sitio_de_pantalla)
+):
+    """Feed SSE de rampas y colas del sitio para pantallas de solo lectura (ver transmision.py)"""
+    sitio_id, sesion = pantalla
+    # Sin sesión (o un chofer): sin códigos, teléfonos ni quién asignó, pida lo que pida
+    if sesion is None or sesion.rol == RolUsuario.CHOFER:
+        seleccion = sin_datos_personales(seleccion)
+    
+    async def estado() -> bytes:
+        return await run_in_threadpool(estado_patio, sitio_id, seleccion)
+    
+    return StreamingResponse(
+        transmision.eventos(
+            sitio_id, request.headers.get("last-event-id") or last_event_id, estado,
+            repr(seleccion.bloques)
+        ),
+        media_type="text/event-stream",
+        # Sin caché ni buffer de proxy (nginx): cada evento sale apenas se publica
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/changes", response_model=LoteCambios)
+def feed_cambios(
+    since: int = Query(0, ge=0, description="Último offset ya procesado (0 = desde el principio)"),
+    limit: int = Query(cambios.LIMITE_POR_DEFECTO, ge=1, le=cambios.LIMITE_MAXIMO),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
+):
+    """Transiciones de movimientos del sitio posteriores a since, en orden (ver cambios.py)"""
+    # La réplica aplica las transacciones en orden de commit: tampoco saltea offsets
+    # (y ve la marca de archivado junto con el borrado de las filas)
+    try:
+        return respuesta_json(cambios.leer(db, sitio_id, since, limit))
+    except cambios.CambiosArchivados as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+@app.get("/api/salud")
+def salud():
+    """Responde desde que arranca el proceso; listo=true cuando terminó el calentamiento"""
+    return arranque
+
+@app.get("/api/metricas/db")
+def metricas_db():
+    """Uso del pool de conexiones: en uso, saturación y espera por checkout"""
+    metricas = {"primaria": estadisticas_pool()}
+    if metricas_pool_replica is not None:
+        metricas["replica"] = estadisticas_pool(engine_lectura, metricas_pool_replica)
+    return metricas
+
+@app.get("/api/ws/esquema")
+def esquema_ws():
+    """Códigos, campos y plantillas para expandir los mensajes compactos"""
+    return esquema_publico()
+
+@app.get("/api/metricas/ws")
+def metricas_ws():
+    """Usuarios y sockets conectados, y sockets desalojados por inactividad"""
+    return manager.estadisticas()
+
+@app.get("/api/metricas/stream")
+def metricas_stream():
+    """Pantallas conectadas al feed SSE y eventos en el buffer por sitio"""
+    return transmision.estadisticas()
+
+@app.get("/api/metricas/notificaciones")
+def metricas_notificaciones():
+    """Entregas en espera de ack, reintentos y descartes por falta de memoria"""
+    return buzon.estadisticas()
+
+@app.get("/api/metricas/sesiones")
+def metricas_sesiones():
+    """Tokens emitidos y rechazados, revocaciones en memoria y códigos bloqueados"""
+    return sesiones.estadisticas()
+
+@app.get("/api/metricas/busqueda")
+def metricas_busqueda():
+    """Documentos y claves indexados, cambios sin rearmar y tiempo del último armado"""
+    return busqueda.estadisticas()
+
+@app.get("/api/metricas/reportes")
+def metricas_reportes():
+    """Reportes en cola y generándose, generados, servidos desde el caché y rechazados"""
+    return reportes.estadisticas()
+
+# ========================================
+# ANALÍTICA
+# ========================================
+# Ventanas largas (un trimestre): cálculo columnar con NumPy, ver analitica.py
+
+@app.get("/api/analytics/ocupacion", response_model=OcupacionRampas)
+def analitica_ocupacion(
+    dias: int = Query(analitica.DIAS_POR_DEFECTO, ge=1, le=analitica.DIAS_MAXIMO),
+    rampa_id: Optional[int] = Query(None, description="Solo esta rampa (por defecto, todas las del sitio)"),
+    hasta: Optional[datetime] = Query(None, description="Fin de la ventana (por defecto, ahora)"),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
+):
+    """Rampas ocupadas en promedio y utilización por día de semana y hora"""
+    if rampa_id is not None and not db.query(Rampa.id).filter(Rampa.sitio_id == sitio_id, Rampa.id == rampa_id).first():
+        raise HTTPException(status_code=404, detail="Rampa no encontrada")
+    return respuesta_json(analitica.ocupacion(db, sitio_id, dias, rampa_id, hasta))
+
+@app.get("/api/analytics/estadias", response_model=DistribucionEstadias)
+def analitica_estadias(
+    dias: int = Query(analitica.DIAS_POR_DEFECTO, ge=1, le=analitica.DIAS_MAXIMO),
+    ancho_min: int = Query(15, ge=1, le=240, description="Ancho de cada intervalo del histograma"),
+    max_min: int = Query(480, ge=1, le=7 * 24 * 60, description="Los tiempos mayores van al último intervalo"),
+    hasta: Optional[datetime] = Query(None, description="Fin de la ventana (por defecto, ahora)"),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db_lectura)
+):
+    """Histogramas y percentiles de minutos por tramo del ciclo y tipo de camión"""
+    if max_min < ancho_min:
+        raise HTTPException(status_code=400, detail="max_min debe ser mayor o igual que ancho_min")
+    return respuesta_json(analitica.estadias(db, sitio_id, dias, ancho_min, max_min, hasta))
+
+# ========================================
+# REPORTES
+# ========================================
+# Se generan en procesos aparte (ver reportes.py): pedir, consultar y descargar
+
+@app.post("/api/reportes", response_model=ReporteResponse, status_code=202)
+def pedir_reporte(reporte: ReporteCreate, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual)):
+    """Pide un reporte de turno; si ya existe o se está generando, devuelve ese"""
+    if reporte.fecha > datetime.now().date():
+        raise HTTPException(status_code=400, detail="La fecha del reporte no puede ser futura")
+    try:
+        trabajo = reportes.pedir(sitio_id, reporte.tipo.value, reporte.fecha, reporte.formato.value)
+    except ColaLlena:
+        raise HTTPException(
+            status_code=429, detail="Hay demasiados reportes en curso, intente en unos segundos",
+            headers={"Retry-After": "10"}
+        )
+    return trabajo.a_dict()
+
+def _reporte_del_sitio(reporte_id: str, sitio_id: int):
+    trabajo = reportes.obtener(reporte_id)
+    if trabajo is None or trabajo.sitio_id != sitio_id:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    return trabajo
+
+@app.get("/api/reportes/{reporte_id}", response_model=ReporteResponse)
+def estado_reporte(reporte_id: str, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual)):
+    return _reporte_del_sitio(reporte_id, sitio_id).a_dict()
+
+@app.get("/api/reportes/{reporte_id}/descarga")
+def descargar_reporte(reporte_id: str, sesion: Sesion = Depends(personal), sitio_id: int = Depends(sitio_actual)):
+    trabajo = _reporte_del_sitio(reporte_id, sitio_id)
+    estado = trabajo.estado
+    if estado == "error":
+        raise HTTPException(status_code=409, detail=f"El reporte falló: {trabajo.error}")
+    if estado != "listo":
+        raise HTTPException(status_code=409, detail="El reporte todavía no está listo")
+    ruta = reportes.archivo(trabajo)
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="El archivo del reporte ya no existe, vuelva a pedirlo")
+    return FileResponse(ruta, media_type=TIPOS_MIME[trabajo.formato], filename=f"reporte-{trabajo.id}")
+
 # ========================================
 # NOTIFICACIONES
 # ========================================
@@ -807,23 +1370,55 @@ def obtener_estadisticas(db: Session = Depends(get_db)):
 def obtener_notificaciones(
     usuario_id: int,
     solo_no_leidas: bool = False,
+    sesion: Sesion = Depends(sesion_actual),
     db: Session = Depends(get_db)
 ):
+    exigir_propio(sesion, usuario_id)
     query = db.query(Notificacion).filter(Notificacion.usuario_id == usuario_id)
     if solo_no_leidas:
         query = query.filter(Notificacion.leida == False)
     return query.order_by(Notificacion.created_at.desc()).limit(50).all()
 
+@app.get("/api/notificaciones/{usuario_id}/no-leidas", response_model=ConteoNoLeidas)
+def contar_no_leidas(usuario_id: int, sesion: Sesion = Depends(sesion_actual), db: Session = Depends(get_db)):
+    exigir_propio(sesion, usuario_id)
+    return ConteoNoLeidas(usuario_id=usuario_id, no_leidas=no_leidas.obtener(db, usuario_id))
+
+@app.post("/api/notificaciones/{usuario_id}/leer-todas", response_model=ResultadoLectura)
+def marcar_todas_leidas(usuario_id: int, sesion: Sesion = Depends(sesion_actual), db: Session = Depends(get_db)):
+    """Vacía la bandeja del usuario con un solo UPDATE"""
+    exigir_propio(sesion, usuario_id)
+    marcadas = marcar_leidas(db, Notificacion.usuario_id == usuario_id)
+    no_leidas.reiniciar(usuario_id)
+    return ResultadoLectura(marcadas=len(marcadas))
+
+@app.post("/api/notificaciones/leer", response_model=ResultadoLectura)
+def marcar_varias_leidas(
+    lectura: LecturaNotificaciones, sesion: Sesion = Depends(sesion_actual), db: Session = Depends(get_db)
+):
+    """Marca un lote de notificaciones por ID con un solo UPDATE (solo las del usuario, salvo admin)"""
+    if not lectura.ids:
+        return ResultadoLectura(marcadas=0)
+    condicion = Notificacion.id.in_(lectura.ids)
+    if sesion.rol != RolUsuario.ADMIN:
+        condicion = and_(condicion, Notificacion.usuario_id == sesion.usuario_id)
+    marcadas = marcar_leidas(db, condicion)
+    no_leidas.restar_leidas(marcadas)
+    return ResultadoLectura(marcadas=len(marcadas))
+
 @app.post("/api/notificaciones/{notificacion_id}/leer", response_model=NotificacionResponse)
-def marcar_leida(notificacion_id: int, db: Session = Depends(get_db)):
+def marcar_leida(notificacion_id: int, sesion: Sesion = Depends(sesion_actual), db: Session = Depends(get_db)):
     notificacion = db.query(Notificacion).filter(Notificacion.id == notificacion_id).first()
-    if not notificacion:
+    # La de otro usuario se trata como inexistente
+    if not notificacion or (notificacion.usuario_id != sesion.usuario_id and sesion.rol != RolUsuario.ADMIN):
         raise HTTPException(status_code=404, detail="Notificación no encontrada")
     
-    notificacion.leida = True
-    notificacion.leida_at = datetime.now()
-    db.commit()
-    db.refresh(notificacion)
+    if not notificacion.leida:
+        notificacion.leida = True
+        notificacion.leida_at = datetime.now()
+        db.commit()
+        db.refresh(notificacion)
+        no_leidas.sumar(notificacion.usuario_id, -1)
     return notificacion
 
 # ========================================
@@ -831,23 +1426,45 @@ def marcar_leida(notificacion_id: int, db: Session = Depends(get_db)):
 # ========================================
 
 @app.post("/api/setup/datos-demo", response_model=MensajeResponse)
-def crear_datos_demo(db: Session = Depends(get_db)):
-    """Crea datos iniciales para demo/pruebas"""
+def crear_datos_demo(
+    sitio_id: int = Depends(sitio_de_instalacion),
+    sesion: Optional[Sesion] = Depends(sesion_opcional),
+    db: Session = Depends(get_db)
+):
+    """
+    Crea datos iniciales para demo/pruebas en el sitio. Sin sesión solo en una
+    instalación sin usuarios: crea además el admin. Después, solo un admin (en
+    el sitio que elija). Cada usuario recibe un PIN al azar, que se devuelve una
+    sola vez en data.pines.
+    """
+    if sesion is None and db.query(Usuario.id).first():
+        raise HTTPException(status_code=401, detail="Inicie sesión como admin para crear datos de demo",
+                            headers={"WWW-Authenticate": "Bearer"})
     
     # Verificar si ya hay datos
-    if db.query(Usuario).first():
+    if db.query(Usuario).filter(Usuario.sitio_id == sitio_id).first():
         return MensajeResponse(success=False, mensaje="Ya existen datos en la base de datos")
     
-    # Crear usuarios
+    # Los códigos de usuario son únicos entre sitios: fuera del principal llevan el sitio
+    sufijo = "" if sitio_id == SITIO_POR_DEFECTO else f"-{sitio_id}"
+    
+    # Crear usuarios: sin PIN compartido, cada uno el suyo
     usuarios = [
-        Usuario(codigo="ADMIN01", nombre="Administrador", pin="1234", rol=RolUsuario.ADMIN),
-        Usuario(codigo="LOG001", nombre="Rafico - Logística", pin="1234", rol=RolUsuario.LOGISTICA),
-        Usuario(codigo="DES001", nombre="Juan Despacho", pin="1234", rol=RolUsuario.DESPACHO),
-        Usuario(codigo="DES002", nombre="María Despacho", pin="1234", rol=RolUsuario.DESPACHO),
-        Usuario(codigo="CHO001", nombre="Pedro Chofer", pin="1234", rol=RolUsuario.CHOFER, telefono="809-555-0001"),
-        Usuario(codigo="CHO002", nombre="Carlos Chofer", pin="1234", rol=RolUsuario.CHOFER, telefono="809-555-0002"),
-        Usuario(codigo="CHO003", nombre="Miguel Chofer", pin="1234", rol=RolUsuario.CHOFER, telefono="809-555-0003"),
+        Usuario(codigo="LOG001", nombre="Rafico - Logística", rol=RolUsuario.LOGISTICA),
+        Usuario(codigo="DES001", nombre="Juan Despacho", rol=RolUsuario.DESPACHO),
+        Usuario(codigo="DES002", nombre="María Despacho", rol=RolUsuario.DESPACHO),
+        Usuario(codigo="CHO001", nombre="Pedro Chofer", rol=RolUsuario.CHOFER, telefono="809-555-0001"),
+        Usuario(codigo="CHO002", nombre="Carlos Chofer", rol=RolUsuario.CHOFER, telefono="809-555-0002"),
+        Usuario(codigo="CHO003", nombre="Miguel Chofer", rol=RolUsuario.CHOFER, telefono="809-555-0003"),
     ]
+    if sesion is None:
+        usuarios.insert(0, Usuario(codigo="ADMIN01", nombre="Administrador", rol=RolUsuario.ADMIN))
+    pines = {}
+    for usuario in usuarios:
+        usuario.codigo += sufijo
+        usuario.sitio_id = sitio_id
+        pines[usuario.codigo] = f"{secrets.randbelow(10 ** 4):04d}"  # el login admite 4 dígitos
+        usuario.pin = hashear_pin(pines[usuario.codigo])
     db.add_all(usuarios)
     db.flush()
     
@@ -860,10 +1477,12 @@ def crear_datos_demo(db: Session = Depends(get_db)):
         Rampa(numero=5, nombre="Rampa 5 - Mixta"),
         Rampa(numero=6, nombre="Rampa 6 - Mixta"),
     ]
+    for rampa in rampas:
+        rampa.sitio_id = sitio_id
     db.add_all(rampas)
     
     # Crear camiones
-    choferes = {u.codigo: u for u in usuarios if u.rol == RolUsuario.CHOFER}
+    choferes = {u.codigo.removesuffix(sufijo): u for u in usuarios if u.rol == RolUsuario.CHOFER}
     camiones = [
         Camion(placa="A123456", tipo=TipoCamion.SECO, chofer_id=choferes["CHO001"].id, capacidad="10 ton"),
         Camion(placa="B789012", tipo=TipoCamion.REFRIGERADO, chofer_id=choferes["CHO002"].id, capacidad="8 ton"),
@@ -871,9 +1490,13 @@ def crear_datos_demo(db: Session = Depends(get_db)):
         Camion(placa="D901234", tipo=TipoCamion.SECO, capacidad="10 ton"),
         Camion(placa="E567890", tipo=TipoCamion.REFRIGERADO, capacidad="8 ton"),
     ]
+    for camion in camiones:
+        camion.sitio_id = sitio_id
     db.add_all(camiones)
     
     db.commit()
+    for objeto in usuarios + camiones:
+        busqueda.actualizar(objeto)
     
     return MensajeResponse(
         success=True,
@@ -881,7 +1504,9 @@ def crear_datos_demo(db: Session = Depends(get_db)):
         data={
             "usuarios": len(usuarios),
             "rampas": len(rampas),
-            "camiones": len(camiones)
+            "camiones": len(camiones),
+            # Única vez que se ven los PINs: {código: PIN}
+            "pines": pines
         }
     )
 
@@ -890,23 +1515,27 @@ def crear_datos_demo(db: Session = Depends(get_db)):
 # ========================================
 
 @app.get("/api/chofer/{chofer_id}/movimiento-activo", response_model=Optional[MovimientoCompleto])
-def obtener_movimiento_activo_chofer(chofer_id: int, db: Session = Depends(get_db)):
+def obtener_movimiento_activo_chofer(
+    chofer_id: int,
+    seleccion: Seleccion = Depends(seleccion_campos),
+    sesion: Sesion = Depends(sesion_actual),
+    sitio_id: int = Depends(sitio_actual),
+    db: Session = Depends(get_db)
+):
     """Obtiene el movimiento activo del chofer"""
-    # Buscar camión del chofer
-    camion = db.query(Camion).filter(Camion.chofer_id == chofer_id).first()
-    if not camion:
-        return None
+    exigir_propio(sesion, chofer_id)
+    # Camiones del chofer como subquery: un solo viaje a la BD
+    camiones_chofer = db.query(Camion.id).filter(Camion.chofer_id == chofer_id)
     
-    movimiento = db.query(Movimiento).options(
-        joinedload(Movimiento.camion),
-        joinedload(Movimiento.rampa)
-    ).filter(
-        Movimiento.camion_id == camion.id,
+    fila = consulta_movimientos(db, seleccion, sitio_id).filter(
+        Movimiento.camion_id.in_(camiones_chofer.scalar_subquery()),
         Movimiento.estado.notin_([EstadoMovimiento.SALIDA_CD])
     ).order_by(Movimiento.created_at.desc()).first()
     
-    return movimiento
+    return respuesta_json(fila_a_movimiento(fila, seleccion) if fila else None)
 
 if __name__ == "__main__":
     import uvicorn
+    # Desarrollo: migra y arranca en un paso
+    crear_esquema()
     uvicorn.run(app, host="0.0.0.0", port=8000)
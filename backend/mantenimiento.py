@@ -0,0 +1,154 @@
+"""
+Mantenimiento - Control de Patio
+Tareas programadas fuera del proceso web (cron de Railway o a mano):
+
+    python mantenimiento.py migrar
+    python mantenimiento.py archivar [--retencion-dias 180] [--seco]
+
+migrar: crea las tablas, columnas e índices que falten y reemplaza los PINs
+en texto plano por su hash (sesiones.py). Corre una vez por deploy antes de
+iniciar la app (importar main.py no toca la BD).
+
+archivar: pasa a ARCHIVO_DIR (NDJSON gzip, un archivo por tabla/mes/lote) las
+filas de notificaciones, log_eventos, transiciones y movimientos anteriores a
+la ventana de retención, y las borra de las tablas vivas para que los queries
+del dashboard sigan recorriendo solo datos recientes. Los movimientos se
+archivan sitio por sitio (el rango usa el índice por sitio y fecha de ingreso).
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, crear_esquema
+from models import Movimiento, Notificacion, LogEvento, Transicion, EstadoMovimiento, Sitio
+from archivo import EscritorLote, mes_de, ARCHIVO_DIR
+from cambios import marcar_archivadas
+from sesiones import hashear_pines
+
+RETENCION_DIAS = int(os.getenv("RETENCION_DIAS", "180"))
+
+# Tablas hijas primero: un movimiento solo se archiva cuando ya no tiene
+# notificaciones ni eventos vivos que lo referencien.
+TABLAS = (
+    (Notificacion, Notificacion.created_at),
+    (LogEvento, LogEvento.created_at),
+    (Transicion, Transicion.momento),
+    (Movimiento, Movimiento.hora_ingreso_garita),
+)
+
+LOTE_FILAS = 1000
+
+
+def limite_retencion(dias: int, ahora: datetime = None) -> datetime:
+    """Inicio del mes que contiene (ahora - dias): se archivan solo meses completos"""
+    corte = (ahora or datetime.now()) - timedelta(days=dias)
+    return datetime(corte.year, corte.month, 1)
+
+
+def _condicion(modelo, columna_fecha, limite: datetime, sitio_id: int = None):
+    condicion = columna_fecha < limite
+    if sitio_id is not None:
+        condicion = and_(modelo.sitio_id == sitio_id, condicion)
+    if modelo is Movimiento:
+        # Solo movimientos cerrados: uno viejo que sigue en el patio queda vivo
+        condicion = and_(
+            condicion,
+            Movimiento.estado == EstadoMovimiento.SALIDA_CD,
+            ~exists().where(Notificacion.movimiento_id == Movimiento.id),
+            ~exists().where(LogEvento.movimiento_id == Movimiento.id),
+        )
+    return condicion
+
+
+def archivar_tabla(db: Session, modelo, columna_fecha, limite: datetime, lote: str,
+                   seco: bool = False, directorio: str = None, sitio_id: int = None) -> int:
+    tabla = modelo.__table__
+    condicion = _condicion(modelo, columna_fecha, limite, sitio_id)
+    if seco:
+        return db.execute(select(func.count()).select_from(tabla).where(condicion)).scalar()
+
+    escritor = EscritorLote(tabla.name, lote, directorio)
+    id_maximo = None
+    try:
+        resultado = db.execute(
+            select(tabla).where(condicion).order_by(tabla.c.id),
+            execution_options={"yield_per": LOTE_FILAS}
+        ).mappings()
+        for fila in resultado:
+            escritor.escribir(mes_de(fila[columna_fecha.key]), dict(fila))
+            id_maximo = fila["id"]
+        if id_maximo is None:
+            escritor.descartar()
+            return 0
+        escritor.cerrar()
+    except Exception:
+        escritor.descartar()
+        raise
+
+    # Los archivos ya están completos en disco: recién ahora se borran las filas.
+    # id <= id_maximo deja fuera cualquier fila que haya llegado mientras tanto.
+    if modelo is Transicion:
+        # /api/changes responde 410 a quien pida desde antes de lo archivado
+        marcar_archivadas(db, condicion, id_maximo)
+    db.execute(delete(tabla).where(condicion, tabla.c.id <= id_maximo))
+    db.commit()
+    return escritor.filas
+
+
+def archivar(retencion_dias: int = RETENCION_DIAS, seco: bool = False, directorio: str = None) -> dict:
+    limite = limite_retencion(retencion_dias)
+    lote = datetime.now().strftime("%Y%m%dT%H%M%S")
+    resumen = {}
+    db = SessionLocal()
+    try:
+        sitios = [sitio_id for (sitio_id,) in db.query(Sitio.id).order_by(Sitio.id)]
+        for modelo, columna_fecha in TABLAS:
+            if modelo is Movimiento:
+                # Un archivo por sitio y mes: el lote lleva el sitio en el nombre
+                resumen[modelo.__tablename__] = sum(
+                    archivar_tabla(db, modelo, columna_fecha, limite, f"{lote}-sitio{sitio_id}",
+                                   seco, directorio, sitio_id)
+                    for sitio_id in sitios
+                )
+            else:
+                resumen[modelo.__tablename__] = archivar_tabla(db, modelo, columna_fecha, limite, lote, seco, directorio)
+    finally:
+        db.close()
+    return {"limite": limite.isoformat(), "seco": seco, "filas": resumen}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="tarea", required=True)
+
+    sub.add_parser("migrar", help="Crear tablas, columnas e índices que falten")
+
+    p_archivar = sub.add_parser("archivar", help="Archivar filas fuera de la ventana de retención")
+    p_archivar.add_argument("--retencion-dias", type=int, default=RETENCION_DIAS)
+    p_archivar.add_argument("--seco", action="store_true", help="Solo contar, sin escribir ni borrar")
+    p_archivar.add_argument("--directorio", default=ARCHIVO_DIR)
+
+    args = parser.parse_args()
+    if args.tarea == "migrar":
+        inicio = time.perf_counter()
+        crear_esquema()
+        db = SessionLocal()
+        try:
+            pines = hashear_pines(db)
+        finally:
+            db.close()
+        print(f"Esquema al día ({time.perf_counter() - inicio:.2f} s), {pines} PINs pasados a hash")
+    elif args.tarea == "archivar":
+        resultado = archivar(args.retencion_dias, args.seco, args.directorio)
+        accion = "a archivar" if resultado["seco"] else "archivadas"
+        print(f"Filas anteriores a {resultado['limite']} {accion}:")
+        for tabla, filas in resultado["filas"].items():
+            print(f"  {tabla:15s} {filas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Mensajes WebSocket - Control de Patio
+Cada mensaje en tiempo real es un tipo más sus datos (IDs, placa, rampa). Se
+codifica una sola vez por envío y formato, y el mismo texto se manda a todos
+los sockets destinatarios.
+
+Formatos:
+    completo   {"tipo": ..., "mensaje": "texto", ...datos}   (por defecto)
+    compacto   [código, dato1, dato2, ...]                    (?formato=compacto)
+
+En el formato compacto el cliente arma el texto con el esquema que publica
+GET /api/ws/esquema (código -> tipo, campos y plantilla), así los teléfonos de
+los choferes no reciben la prosa en cada aviso.
+"""
+import json
+from typing import Dict, Optional
+
+COMPLETO = "completo"
+COMPACTO = "compacto"
+FORMATOS = (COMPLETO, COMPACTO)
+
+# tipo -> (código, campos en orden, plantilla del texto)
+# La plantilla puede ser un dict por valor de "estado" (alerta_sla).
+ESQUEMA = {
+    "ping": (0, (), None),
+    "nuevo_ingreso": (1, ("movimiento_id", "placa"), "Camión {placa} ingresó a garita"),
+    "camion_disponible": (2, ("movimiento_id",), "Nuevo camión disponible en patio"),
+    "solicitud_camion": (3, ("movimiento_id", "prioridad"), "Despacho solicita camión - Prioridad: {prioridad}"),
+    "asignacion_rampa": (4, ("movimiento_id", "rampa", "notificacion_id"), "¡ATENCIÓN! Diríjase a la Rampa {rampa}"),
+    "chofer_confirmo": (5, ("movimiento_id",), "Chofer confirmó asignación - En camino a rampa"),
+    "camion_en_rampa": (6, ("movimiento_id",), "Camión en rampa - Iniciando carga"),
+    "carga_lista": (7, ("movimiento_id", "notificacion_id"), "¡CARGA LISTA! Puede retirarse de la rampa"),
+    "rampa_liberada": (8, ("movimiento_id", "rampa_id"), "Rampa liberada"),
+    "alerta_sla": (9, ("movimiento_id", "estado", "minutos", "placa", "rampa"), {
+        "disponible_patio": "Camión {placa} lleva {minutos} min disponible en patio sin asignar",
+        "en_rampa": "Camión {placa} lleva {minutos} min en la Rampa {rampa}",
+    }),
+}
+
+# Datos fijos por tipo que el formato completo incluye y el compacto omite
+CONSTANTES = {
+    "asignacion_rampa": {"requiere_confirmacion": True},
+}
+
+
+def texto(tipo: str, datos: dict) -> Optional[str]:
+    plantilla = ESQUEMA[tipo][2]
+    if isinstance(plantilla, dict):
+        plantilla = plantilla.get(datos.get("estado"))
+    return plantilla.format(**datos) if plantilla else None
+
+
+class Mensaje:
+    """Mensaje listo para enviar; cada formato se codifica a lo sumo una vez"""
+    __slots__ = ("tipo", "datos", "_codificado")
+
+    def __init__(self, tipo: str, **datos):
+        if tipo not in ESQUEMA:
+            raise ValueError(f"Tipo de mensaje desconocido: {tipo}")
+        self.tipo = tipo
+        self.datos = datos
+        self._codificado: Dict[str, str] = {}
+
+    @classmethod
+    def desde_dict(cls, payload: dict, **extra) -> "Mensaje":
+        """Reconstruye un mensaje guardado (payload de Notificacion)"""
+        tipo = payload["tipo"]
+        campos = ESQUEMA[tipo][1]
+        datos = {c: payload[c] for c in campos if c in payload}
+        datos.update(extra)
+        return cls(tipo, **datos)
+
+    def como_dict(self) -> dict:
+        """Formato completo"""
+        completo = {"tipo": self.tipo}
+        mensaje = texto(self.tipo, self.datos)
+        if mensaje is not None:
+            completo["mensaje"] = mensaje
+        completo.update(self.datos)
+        completo.update(CONSTANTES.get(self.tipo, {}))
+        return completo
+
+    def como_lista(self) -> list:
+        """Formato compacto: código y datos en el orden del esquema"""
+        codigo, campos, _ = ESQUEMA[self.tipo]
+        valores = [self.datos.get(c) for c in campos]
+        # Los campos opcionales al final no viajan
+        while valores and valores[-1] is None:
+            valores.pop()
+        return [codigo, *valores]
+
+    def codificar(self, formato: str = COMPLETO) -> str:
+        codificado = self._codificado.get(formato)
+        if codificado is None:
+            carga = self.como_lista() if formato == COMPACTO else self.como_dict()
+            codificado = self._codificado[formato] = json.dumps(
+                carga, ensure_ascii=False, separators=(",", ":")
+            )
+        return codificado
+
+
+def esquema_publico() -> dict:
+    """Lo que el cliente necesita para expandir el formato compacto"""
+    return {
+        str(codigo): {"tipo": tipo, "campos": list(campos), "plantilla": plantilla,
+                      "constantes": CONSTANTES.get(tipo, {})}
+        for tipo, (codigo, campos, plantilla) in ESQUEMA.items()
+    }
@@ -1,10 +1,10 @@
 """
 Modelos de Base de Datos - Control de Patio
 """
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, FechaHora
 import enum
 
 # ========================================
@@ -45,53 +45,97 @@ class Prioridad(str, enum.Enum):
 # ========================================
 # MODELOS
 # ========================================
+# Enum(create_constraint=True): en SQLite agrega el CHECK de valores; en
+# PostgreSQL no cambia nada (el tipo ENUM nativo ya los valida).
+# FechaHora: timestamptz en PostgreSQL, hora local en SQLite (ver database.py).
+#
+# Cada centro de distribución es un Sitio. Usuarios, camiones, rampas y
+# movimientos pertenecen a uno (sitio_id) y los índices empiezan por sitio_id:
+# las consultas de un patio no recorren las filas de los demás. Las filas
+# anteriores a los sitios quedan en SITIO_POR_DEFECTO.
+
+SITIO_POR_DEFECTO = 1
+
+
+def columna_sitio():
+    return Column(Integer, ForeignKey("sitios.id"), nullable=False, server_default=str(SITIO_POR_DEFECTO))
+
+
+class Sitio(Base):
+    __tablename__ = "sitios"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    codigo = Column(String(20), unique=True, nullable=False)  # Ej: "CD-SANTIAGO"
+    nombre = Column(String(100), nullable=False)
+    activo = Column(Boolean, default=True)
+    created_at = Column(FechaHora(), server_default=func.now())
+    # Último offset de /api/changes que pasó al archivo (mantenimiento.py archivar)
+    transiciones_archivadas_hasta = Column(Integer, nullable=True)
+
 
 class Usuario(Base):
     __tablename__ = "usuarios"
     
     id = Column(Integer, primary_key=True, index=True)
-    codigo = Column(String(20), unique=True, index=True, nullable=False)  # Para login simple
+    sitio_id = columna_sitio()
+    codigo = Column(String(20), unique=True, index=True, nullable=False)  # Para login simple (único entre sitios)
     nombre = Column(String(100), nullable=False)
-    pin = Column(String(10), nullable=False)  # PIN simple de 4 dígitos
-    rol = Column(Enum(RolUsuario), nullable=False)
+    pin = Column(String(128), nullable=False)  # hash del PIN de 4 dígitos (ver sesiones.py)
+    rol = Column(Enum(RolUsuario, create_constraint=True), nullable=False)
     activo = Column(Boolean, default=True)
     telefono = Column(String(20), nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(FechaHora(), server_default=func.now())
     
     # Relaciones
     camiones = relationship("Camion", back_populates="chofer")
     movimientos_asignados = relationship("Movimiento", back_populates="asignado_por", foreign_keys="Movimiento.asignado_por_id")
+    
+    __table_args__ = (
+        # Listados y avisos por rol dentro del sitio
+        Index("ix_usuarios_sitio_rol", "sitio_id", "rol"),
+    )
 
 
 class Camion(Base):
     __tablename__ = "camiones"
     
     id = Column(Integer, primary_key=True, index=True)
-    placa = Column(String(20), unique=True, index=True, nullable=False)
-    tipo = Column(Enum(TipoCamion), nullable=False)
+    sitio_id = columna_sitio()
+    placa = Column(String(20), nullable=False)
+    tipo = Column(Enum(TipoCamion, create_constraint=True), nullable=False)
     chofer_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
     capacidad = Column(String(50), nullable=True)  # Ej: "10 toneladas"
     activo = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(FechaHora(), server_default=func.now())
     
     # Relaciones
     chofer = relationship("Usuario", back_populates="camiones")
     movimientos = relationship("Movimiento", back_populates="camion")
+    
+    __table_args__ = (
+        # La misma placa puede estar registrada en varios CDs
+        Index("ix_camiones_sitio_placa", "sitio_id", "placa", unique=True),
+    )
 
 
 class Rampa(Base):
     __tablename__ = "rampas"
     
     id = Column(Integer, primary_key=True, index=True)
-    numero = Column(Integer, unique=True, nullable=False)
+    sitio_id = columna_sitio()
+    numero = Column(Integer, nullable=False)  # único dentro del sitio
     nombre = Column(String(50), nullable=True)  # Ej: "Rampa 1 - Secos"
-    tipo_permitido = Column(Enum(TipoCamion), nullable=True)  # None = cualquier tipo
-    estado = Column(Enum(EstadoRampa), default=EstadoRampa.LIBRE)
+    tipo_permitido = Column(Enum(TipoCamion, create_constraint=True), nullable=True)  # None = cualquier tipo
+    estado = Column(Enum(EstadoRampa, create_constraint=True), default=EstadoRampa.LIBRE)
     activo = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(FechaHora(), server_default=func.now())
     
     # Relaciones
     movimientos = relationship("Movimiento", back_populates="rampa")
+    
+    __table_args__ = (
+        Index("ix_rampas_sitio_numero", "sitio_id", "numero", unique=True),
+    )
 
 
 class Movimiento(Base):
@@ -102,36 +146,75 @@ class Movimiento(Base):
     __tablename__ = "movimientos"
     
     id = Column(Integer, primary_key=True, index=True)
+    sitio_id = columna_sitio()
     camion_id = Column(Integer, ForeignKey("camiones.id"), nullable=False)
     rampa_id = Column(Integer, ForeignKey("rampas.id"), nullable=True)
     asignado_por_id = Column(Integer, ForeignKey("usuarios.id"), nullable=True)
     
     # Estado actual
-    estado = Column(Enum(EstadoMovimiento), default=EstadoMovimiento.INGRESADO_GARITA)
-    prioridad = Column(Enum(Prioridad), default=Prioridad.NORMAL)
+    estado = Column(Enum(EstadoMovimiento, create_constraint=True), default=EstadoMovimiento.INGRESADO_GARITA)
+    prioridad = Column(Enum(Prioridad, create_constraint=True), default=Prioridad.NORMAL)
     
     # Timestamps de cada etapa
-    hora_ingreso_garita = Column(DateTime(timezone=True), server_default=func.now())
-    hora_disponible_patio = Column(DateTime(timezone=True), nullable=True)
-    hora_solicitado = Column(DateTime(timezone=True), nullable=True)
-    hora_asignado = Column(DateTime(timezone=True), nullable=True)
-    hora_confirmado_chofer = Column(DateTime(timezone=True), nullable=True)
-    hora_en_rampa = Column(DateTime(timezone=True), nullable=True)
-    hora_carga_lista = Column(DateTime(timezone=True), nullable=True)
-    hora_salida_rampa = Column(DateTime(timezone=True), nullable=True)
-    hora_salida_cd = Column(DateTime(timezone=True), nullable=True)
+    hora_ingreso_garita = Column(FechaHora(), server_default=func.now())
+    hora_disponible_patio = Column(FechaHora(), nullable=True)
+    hora_solicitado = Column(FechaHora(), nullable=True)
+    hora_asignado = Column(FechaHora(), nullable=True)
+    hora_confirmado_chofer = Column(FechaHora(), nullable=True)
+    hora_en_rampa = Column(FechaHora(), nullable=True)
+    hora_carga_lista = Column(FechaHora(), nullable=True)
+    hora_salida_rampa = Column(FechaHora(), nullable=True)
+    hora_salida_cd = Column(FechaHora(), nullable=True)
     
     # Notas y observaciones
     notas = Column(Text, nullable=True)
     solicitado_por_despacho = Column(String(100), nullable=True)  # Nombre/área que solicitó
+    # Etapa cuya alerta SLA ya salió (vigilancia.py): con varios procesos, la envía uno solo
+    alerta_sla = Column(Enum(EstadoMovimiento, create_constraint=True), nullable=True)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    created_at = Column(FechaHora(), server_default=func.now())
+    updated_at = Column(FechaHora(), onupdate=func.now())
     
     # Relaciones
     camion = relationship("Camion", back_populates="movimientos")
     rampa = relationship("Rampa", back_populates="movimientos")
     asignado_por = relationship("Usuario", back_populates="movimientos_asignados", foreign_keys=[asignado_por_id])
+    
+    __table_args__ = (
+        # Historial por fecha de ingreso (listados y snapshot fuera de PostgreSQL)
+        Index("ix_movimientos_sitio_hora_ingreso", "sitio_id", "hora_ingreso_garita"),
+        # Colas y estadísticas: movimientos activos del sitio por estado
+        Index("ix_movimientos_sitio_estado", "sitio_id", "estado"),
+        # Intervalo de estadía [ingreso, salida) del sitio, indexado con GiST para el
+        # snapshot histórico (sitio_id en un GiST necesita la extensión btree_gist)
+        Index(
+            "ix_movimientos_sitio_estadia",
+            "sitio_id",
+            func.tstzrange(hora_ingreso_garita, func.coalesce(hora_salida_rampa, hora_salida_cd)),
+            postgresql_using="gist"
+        ).ddl_if(dialect="postgresql"),
+    )
+
+
+# Reemplazados por los índices por sitio (mantenimiento.py migrar los borra)
+INDICES_OBSOLETOS = {
+    "camiones": ("ix_camiones_placa",),
+    "movimientos": ("ix_movimientos_hora_ingreso_garita", "ix_movimientos_estadia"),
+}
+RESTRICCIONES_OBSOLETAS = {
+    "rampas": ("rampas_numero_key",),  # numero único global (PostgreSQL)
+}
+
+
+def rango_estadia():
+    """
+    Intervalo en que el movimiento ocupa el patio o una rampa. Debe coincidir
+    con la expresión de ix_movimientos_sitio_estadia para que PostgreSQL use el índice.
+    """
+    return func.tstzrange(
+        Movimiento.hora_ingreso_garita,
+        func.coalesce(Movimiento.hora_salida_rampa, Movimiento.hora_salida_cd)
+    )
 
 
 class Notificacion(Base):
@@ -149,9 +232,21 @@ class Notificacion(Base):
     leida = Column(Boolean, default=False)
     confirmada = Column(Boolean, default=False)
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
-    leida_at = Column(DateTime(timezone=True), nullable=True)
-    confirmada_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(FechaHora(), server_default=func.now())
+    leida_at = Column(FechaHora(), nullable=True)
+    confirmada_at = Column(FechaHora(), nullable=True)
+    
+    # Entrega por WebSocket (ver notificaciones.py): mensaje tal como se envía
+    # y momento en que el cliente devolvió el ack
+    payload = Column(Text, nullable=True)
+    entregada_at = Column(FechaHora(), nullable=True)
+    
+    __table_args__ = (
+        # Rango por fecha para el archivado mensual (mantenimiento.py)
+        Index("ix_notificaciones_created_at", "created_at"),
+        # Bandeja de cada usuario y reenvío al reconectar
+        Index("ix_notificaciones_usuario_created", "usuario_id", "created_at"),
+    )
 
 
 class LogEvento(Base):
@@ -168,4 +263,34 @@ class LogEvento(Base):
     descripcion = Column(Text, nullable=True)
     datos_json = Column(Text, nullable=True)  # Para guardar datos adicionales en JSON
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(FechaHora(), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_log_eventos_created_at", "created_at"),
+    )
+
+
+class Transicion(Base):
+    """
+    Registro de solo inserción de cada cambio de etapa de un movimiento (feed
+    GET /api/changes). El id es el offset del feed. Sin FKs: el registro
+    sobrevive al archivado de movimientos y rampas.
+    """
+    __tablename__ = "transiciones"
+    
+    id = Column(Integer, primary_key=True)
+    sitio_id = columna_sitio()
+    movimiento_id = Column(Integer, nullable=False)
+    
+    # Igual a estado en la confirmación del chofer (cambia la hora, no la etapa)
+    estado_anterior = Column(Enum(EstadoMovimiento, create_constraint=True), nullable=True)
+    estado = Column(Enum(EstadoMovimiento, create_constraint=True), nullable=False)
+    rampa_id = Column(Integer, nullable=True)
+    momento = Column(FechaHora(), nullable=False)
+    
+    __table_args__ = (
+        # Lectura incremental del feed de un sitio
+        Index("ix_transiciones_sitio_id", "sitio_id", "id"),
+        # Rango por fecha para el archivado mensual (mantenimiento.py)
+        Index("ix_transiciones_momento", "momento"),
+    )
@@ -0,0 +1,298 @@
+"""
+Buzón de Notificaciones - Control de Patio
+Entrega confiable de avisos al chofer (outbox):
+
+1. El endpoint crea la Notificacion con el mensaje WebSocket (payload: tipo y
+   datos) en la misma transacción que el cambio de estado.
+2. Después del commit se envía por el socket con su notificacion_id.
+3. El cliente responde {"tipo": "ack", "notificacion_id": N}; ahí se marca
+   entregada_at y deja de reintentarse.
+4. Sin ack en NOTIF_ACK_TIMEOUT_S se reenvía (hasta NOTIF_MAX_INTENTOS), y al
+   reconectar se reenvían las pendientes que sigan vigentes.
+
+En memoria solo se siguen NOTIF_MAX_PENDIENTES entregas; si se llena se
+descarta la más vieja, que igual queda en la BD y se reenvía al reconectar.
+
+ContadorNoLeidas mantiene en memoria las no leídas por usuario, para no contar
+filas en cada consulta de la bandeja. El conteo es del proceso: ve lo que crea
+y marca este proceso, no lo que cambian otros workers ni el archivado
+(mantenimiento.py archivar borra notificaciones, también no leídas). Por eso
+cada conteo se vuelve a leer de la BD pasados NOTIF_CONTEO_VIGENCIA_S.
+"""
+import asyncio
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal
+from models import Notificacion, Movimiento, EstadoMovimiento
+from conexiones import ConnectionManager
+from mensajes import Mensaje
+
+ACK_TIMEOUT_S = float(os.getenv("NOTIF_ACK_TIMEOUT_S", "15"))
+MAX_INTENTOS = int(os.getenv("NOTIF_MAX_INTENTOS", "5"))
+MAX_PENDIENTES = int(os.getenv("NOTIF_MAX_PENDIENTES", "5000"))
+VENTANA_REENVIO_H = float(os.getenv("NOTIF_VENTANA_REENVIO_H", "12"))
+REENVIO_LIMITE = 20
+CONTEO_VIGENCIA_S = float(os.getenv("NOTIF_CONTEO_VIGENCIA_S", "300"))
+
+# Un aviso solo se reenvía mientras el movimiento siga en el estado que lo generó
+VIGENTE_EN = {
+    "asignacion_rampa": EstadoMovimiento.ASIGNADO_EN_CAMINO,
+    "carga_lista": EstadoMovimiento.CARGA_LISTA,
+}
+
+
+class Pendiente:
+    __slots__ = ("usuario_id", "mensaje", "intentos", "vence")
+
+    def __init__(self, usuario_id: int, mensaje: Mensaje):
+        self.usuario_id = usuario_id
+        self.mensaje = mensaje
+        self.intentos = 0
+        self.vence = None  # hora monotónica del próximo reintento; None = no enviado
+
+
+class Buzon:
+    def __init__(self, conexiones: ConnectionManager, no_leidas: "ContadorNoLeidas",
+                 max_pendientes: int = MAX_PENDIENTES):
+        self.conexiones = conexiones
+        self.no_leidas = no_leidas
+        self.max_pendientes = max_pendientes
+        self.pendientes: "OrderedDict[int, Pendiente]" = OrderedDict()  # {notificacion_id: Pendiente}
+        self._vencimientos = []  # heap (vence, notificacion_id); entradas viejas se ignoran al salir
+        self._tarea: Optional[asyncio.Task] = None
+        self.reintentos = 0
+        self.descartadas = 0
+
+    # ----------------------------------------
+    # Creación (dentro de la transacción del endpoint)
+    # ----------------------------------------
+
+    def crear(self, db: Session, usuario_id: int, movimiento_id: int, tipo: str,
+              mensaje: str, payload: Mensaje) -> Notificacion:
+        """Agrega la notificación a la sesión; se envía con enviar() después del commit"""
+        notificacion = Notificacion(
+            usuario_id=usuario_id,
+            movimiento_id=movimiento_id,
+            tipo=tipo,
+            mensaje=mensaje,
+            payload=json.dumps(dict(payload.datos, tipo=payload.tipo), ensure_ascii=False),
+        )
+        db.add(notificacion)
+        return notificacion
+
+    # ----------------------------------------
+    # Envío y reintentos
+    # ----------------------------------------
+
+    async def enviar(self, notificacion: Notificacion):
+        self.no_leidas.sumar(notificacion.usuario_id)
+        self._seguir(notificacion.id, Pendiente(notificacion.usuario_id, _mensaje_de(notificacion)))
+        await self._entregar(notificacion.id)
+
+    def _seguir(self, notificacion_id: int, pendiente: Pendiente):
+        if notificacion_id in self.pendientes:
+            return
+        while len(self.pendientes) >= self.max_pendientes:
+            self.pendientes.popitem(last=False)
+            self.descartadas += 1
+        self.pendientes[notificacion_id] = pendiente
+
+    async def _entregar(self, notificacion_id: int):
+        pendiente = self.pendientes.get(notificacion_id)
+        if pendiente is None:
+            return
+        if not await self.conexiones.send_to_user(pendiente.usuario_id, pendiente.mensaje):
+            # Sin socket abierto: se reenvía cuando el usuario reconecte
+            pendiente.vence = None
+            return
+        pendiente.intentos += 1
+        if pendiente.intentos >= MAX_INTENTOS:
+            # Queda sin entregar en la BD; el próximo reenvío será al reconectar
+            self.pendientes.pop(notificacion_id, None)
+            return
+        pendiente.vence = time.monotonic() + ACK_TIMEOUT_S
+        heapq.heappush(self._vencimientos, (pendiente.vence, notificacion_id))
+        if len(self._vencimientos) > 2 * self.max_pendientes:
+            self._compactar()
+        self._asegurar_tarea()
+
+    def _compactar(self):
+        self._vencimientos = [
+            (p.vence, nid) for nid, p in self.pendientes.items() if p.vence is not None
+        ]
+        heapq.heapify(self._vencimientos)
+
+    def _asegurar_tarea(self):
+        loop = asyncio.get_running_loop()
+        if self._tarea is None or self._tarea.done() or self._tarea.get_loop() is not loop:
+            self._tarea = loop.create_task(self._reintentar())
+
+    async def _reintentar(self):
+        while self._vencimientos:
+            vence, notificacion_id = self._vencimientos[0]
+            espera = vence - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(min(espera, ACK_TIMEOUT_S))
+                continue
+            heapq.heappop(self._vencimientos)
+            pendiente = self.pendientes.get(notificacion_id)
+            if pendiente is None or pendiente.vence != vence:
+                continue  # ya confirmada, descartada o reprogramada
+            self.reintentos += 1
+            await self._entregar(notificacion_id)
+
+    # ----------------------------------------
+    # Confirmación y reconexión
+    # ----------------------------------------
+
+    async def confirmar(self, usuario_id: int, notificacion_id: int):
+        """Ack del cliente por el socket"""
+        pendiente = self.pendientes.get(notificacion_id)
+        if pendiente is not None and pendiente.usuario_id == usuario_id:
+            del self.pendientes[notificacion_id]
+        await run_in_threadpool(_marcar_entregada, usuario_id, notificacion_id)
+
+    def descartar(self, notificacion_id: int):
+        """La acción ya ocurrió por otra vía (p. ej. el chofer confirmó por HTTP)"""
+        self.pendientes.pop(notificacion_id, None)
+
+    async def al_conectar(self, usuario_id: int):
+        """Reenvía lo que el usuario no confirmó mientras estaba desconectado"""
+        for notificacion in await run_in_threadpool(_pendientes_de, usuario_id):
+            self._seguir(notificacion.id, Pendiente(usuario_id, _mensaje_de(notificacion)))
+            await self._entregar(notificacion.id)
+
+    def estadisticas(self) -> dict:
+        return {
+            "pendientes": len(self.pendientes),
+            "max_pendientes": self.max_pendientes,
+            "reintentos": self.reintentos,
+            "descartadas": self.descartadas,
+        }
+
+
+def _mensaje_de(notificacion: Notificacion) -> Mensaje:
+    return Mensaje.desde_dict(json.loads(notificacion.payload), notificacion_id=notificacion.id)
+
+
+def _marcar_entregada(usuario_id: int, notificacion_id: int):
+    db = SessionLocal()
+    try:
+        db.query(Notificacion).filter(
+            Notificacion.id == notificacion_id,
+            Notificacion.usuario_id == usuario_id,
+            Notificacion.entregada_at.is_(None)
+        ).update({Notificacion.entregada_at: datetime.now()}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _pendientes_de(usuario_id: int):
+    db = SessionLocal()
+    try:
+        filas = db.query(Notificacion, Movimiento.estado).outerjoin(
+            Movimiento, Movimiento.id == Notificacion.movimiento_id
+        ).filter(
+            Notificacion.usuario_id == usuario_id,
+            Notificacion.entregada_at.is_(None),
+            Notificacion.payload.isnot(None),
+            Notificacion.created_at >= datetime.now() - timedelta(hours=VENTANA_REENVIO_H)
+        ).order_by(Notificacion.created_at).limit(REENVIO_LIMITE).all()
+        return [
+            notificacion for notificacion, estado in filas
+            if VIGENTE_EN.get(notificacion.tipo) in (None, estado)
+        ]
+    finally:
+        db.close()
+
+
+class ContadorNoLeidas:
+    """
+    No leídas por usuario. Se carga con un COUNT la primera vez que se pide un
+    usuario (y otra vez pasada la vigencia) y después se actualiza al crear y al
+    marcar leídas; los usuarios que nunca se consultaron no ocupan memoria.
+
+    Un cambio que llega mientras se cuenta puede estar o no en el COUNT (la fila
+    ya commiteada, sumar() todavía no): ese conteo se devuelve pero no se guarda,
+    y la próxima consulta vuelve a contar.
+    """
+    def __init__(self, vigencia_s: float = CONTEO_VIGENCIA_S):
+        self.vigencia_s = vigencia_s
+        self._conteos: Dict[int, int] = {}
+        self._cargados: Dict[int, float] = {}   # {usuario_id: hora monotónica del COUNT}
+        self._cargando: Dict[int, list] = {}    # {usuario_id: [conteos en curso, cambios]}
+        self._lock = threading.Lock()
+
+    def obtener(self, db: Session, usuario_id: int) -> int:
+        conteo = self._conteos.get(usuario_id)
+        if conteo is not None and time.monotonic() - self._cargados[usuario_id] < self.vigencia_s:
+            return conteo
+        with self._lock:
+            carga = self._cargando.setdefault(usuario_id, [0, 0])
+            carga[0] += 1
+            cambios = carga[1]
+        inicio = time.monotonic()
+        try:
+            conteo = db.query(func.count(Notificacion.id)).filter(
+                Notificacion.usuario_id == usuario_id,
+                Notificacion.leida == False
+            ).scalar()
+        finally:
+            with self._lock:
+                carga[0] -= 1
+                limpio = carga[1] == cambios
+                if not carga[0]:
+                    del self._cargando[usuario_id]
+        if limpio:
+            with self._lock:
+                self._conteos[usuario_id] = conteo
+                self._cargados[usuario_id] = inicio
+        return conteo
+
+    def sumar(self, usuario_id: int, cantidad: int = 1):
+        with self._lock:
+            if usuario_id in self._cargando:
+                self._cargando[usuario_id][1] += 1
+            # Si el usuario aún no está cargado, el COUNT inicial ya incluirá la fila
+            if usuario_id in self._conteos:
+                self._conteos[usuario_id] = max(self._conteos[usuario_id] + cantidad, 0)
+
+    def restar_leidas(self, usuarios: Iterable[int]):
+        for usuario_id in usuarios:
+            self.sumar(usuario_id, -1)
+
+    def reiniciar(self, usuario_id: int):
+        with self._lock:
+            if usuario_id in self._cargando:
+                self._cargando[usuario_id][1] += 1
+            self._conteos[usuario_id] = 0
+            self._cargados[usuario_id] = time.monotonic()
+
+
+def marcar_leidas(db: Session, condicion) -> list:
+    """
+    Marca como leídas, en un solo UPDATE, las no leídas que cumplan la condición;
+    devuelve el usuario_id de cada fila marcada.
+    """
+    resultado = db.execute(
+        update(Notificacion)
+        .where(condicion, Notificacion.leida == False)
+        .values(leida=True, leida_at=datetime.now())
+        .returning(Notificacion.usuario_id)
+        .execution_options(synchronize_session=False)
+    )
+    usuarios = [fila[0] for fila in resultado]
+    db.commit()
+    return usuarios
@@ -0,0 +1,513 @@
+"""
+Reportes - Control de Patio
+Reportes de turno (diario o semanal) en CSV o XLSX, generados fuera de la API:
+
+    POST /api/reportes                  pide el reporte: devuelve su id y estado
+    GET  /api/reportes/{id}             en_cola, generando, listo o error
+    GET  /api/reportes/{id}/descarga    el archivo, cuando está listo
+
+Cada reporte trae tres hojas (secciones en el CSV):
+
+    rampas        camiones atendidos, minutos en rampa y vuelta completa por rampa
+    atrasados     movimientos que pasaron el límite SLA de una etapa (vigilancia.LIMITES)
+    confirmacion  minutos de hora_asignado a hora_confirmado_chofer por chofer
+
+Se generan en un ProcessPoolExecutor de REPORTES_PROCESOS procesos (spawn,
+con prioridad baja): la consulta y el armado del archivo no ocupan el event
+loop ni los hilos de la API, y nunca hay más de REPORTES_PROCESOS reportes en
+marcha ni más de una conexión a la BD por proceso. Con REPORTES_COLA_MAX
+pedidos pendientes, los siguientes se rechazan (429) hasta que baje la cola.
+
+El id es el nombre del archivo (sitio, tipo, inicio del período y formato): el
+mismo pedido nunca se genera dos veces a la vez, y si el archivo ya existe se
+devuelve listo sin generar nada. Un período que terminó hace más de CIERRE ya
+no cambia y su archivo vale para siempre; el de un período abierto (hoy, esta
+semana) se regenera si tiene más de REPORTES_VIGENCIA_S segundos. Los archivos
+quedan en REPORTES_DIR y se pueden borrar en cualquier momento.
+"""
+import csv
+import multiprocessing
+import os
+import re
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+
+from sqlalchemy.orm import Session
+
+from archivo import hay_archivo, movimientos_archivados
+from database import SessionLectura, hora_local
+from flujo import COLUMNAS_HORA, ETAPAS, HORA_DE_ESTADO, ORDEN_ESTADO
+from models import Movimiento
+from serializacion import consulta_movimientos, fila_a_movimiento, parsear_campos
+from vigilancia import LIMITES
+
+REPORTES_DIR = os.getenv("REPORTES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "reportes"))
+PROCESOS = int(os.getenv("REPORTES_PROCESOS", "2"))
+COLA_MAX = int(os.getenv("REPORTES_COLA_MAX", "20"))
+VIGENCIA_S = float(os.getenv("REPORTES_VIGENCIA_S", "300"))
+# Un período se da por cerrado cuando ya salieron los camiones que ingresaron en él
+CIERRE = timedelta(hours=12)
+# Prioridad de los procesos de reportes (os.nice): la API va primero
+NICE = 10
+# Trabajos terminados que se recuerdan en memoria (los archivos siguen en disco)
+RECORDADOS = 500
+
+DIAS = {"diario": 1, "semanal": 7}
+TIPOS_MIME = {
+    "csv": "text/csv",  # FileResponse agrega el charset
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+PATRON_ID = re.compile(r"^(\d+)-(diario|semanal)-(\d{8})\.(csv|xlsx)$")
+
+CAMPOS = parsear_campos(
+    "id,estado," + ",".join(COLUMNAS_HORA) + ",camion.placa,camion.chofer.codigo,camion.chofer.nombre,"
+    "rampa.numero,rampa.nombre"
+)
+
+
+class ColaLlena(Exception):
+    """Ya hay COLA_MAX reportes pendientes"""
+
+
+def periodo(tipo: str, fecha: date) -> Tuple[datetime, datetime]:
+    """[desde, hasta) del reporte: el día, o la semana de lunes a domingo que contiene la fecha"""
+    inicio = fecha - timedelta(days=fecha.weekday()) if tipo == "semanal" else fecha
+    desde = datetime.combine(inicio, datetime.min.time())
+    return desde, desde + timedelta(days=DIAS[tipo])
+
+
+def id_reporte(sitio_id: int, tipo: str, fecha: date, formato: str) -> str:
+    return f"{sitio_id}-{tipo}-{periodo(tipo, fecha)[0]:%Y%m%d}.{formato}"
+
+# ========================================
+# CONTENIDO (corre en los procesos del pool)
+# ========================================
+
+def _minutos(inicio: Optional[datetime], fin: Optional[datetime]) -> Optional[float]:
+    if inicio is None or fin is None or fin < inicio:
+        return None
+    return (fin - inicio).total_seconds() / 60
+
+
+def _percentil(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round((len(ordenados) - 1) * p / 100)))]
+
+
+def _promedio(valores: List[float]) -> Optional[float]:
+    return sum(valores) / len(valores) if valores else None
+
+
+def _redondear(valor: Optional[float]) -> Optional[float]:
+    return round(valor, 1) if valor is not None else None
+
+
+def movimientos_del_periodo(db: Session, sitio_id: int, desde: datetime, hasta: datetime) -> List[dict]:
+    """Movimientos ingresados en [desde, hasta), de la BD y del archivo"""
+    filas = consulta_movimientos(db, CAMPOS, sitio_id).filter(
+        Movimiento.hora_ingreso_garita >= desde,
+        Movimiento.hora_ingreso_garita < hasta
+    ).all()
+    movimientos = [fila_a_movimiento(fila, CAMPOS) for fila in filas]
+    if hay_archivo("movimientos", desde, hasta):
+        vivos = {m["id"] for m in movimientos}
+        movimientos += [
+            m for m in movimientos_archivados(db, desde, hasta, CAMPOS, sitio_id) if m["id"] not in vivos
+        ]
+    for movimiento in movimientos:
+        for columna in COLUMNAS_HORA:
+            movimiento[columna] = hora_local(movimiento[columna])
+    movimientos.sort(key=lambda m: m["hora_ingreso_garita"])
+    return movimientos
+
+
+def seccion_rampas(movimientos: List[dict]) -> Tuple[Sequence[str], List[list]]:
+    por_rampa = {}
+    for m in movimientos:
+        rampa = m.get("rampa")
+        if not rampa or m["hora_en_rampa"] is None:
+            continue
+        datos = por_rampa.setdefault(rampa["numero"], {"nombre": rampa["nombre"], "camiones": 0, "rampa": [], "vuelta": []})
+        datos["camiones"] += 1
+        en_rampa = _minutos(m["hora_en_rampa"], m["hora_salida_rampa"])
+        if en_rampa is not None:
+            datos["rampa"].append(en_rampa)
+        vuelta = _minutos(m["hora_ingreso_garita"], m["hora_salida_cd"])
+        if vuelta is not None:
+            datos["vuelta"].append(vuelta)
+    columnas = ("rampa", "nombre", "camiones", "min_rampa_promedio", "min_rampa_p90",
+                "min_vuelta_promedio", "horas_ocupada")
+    filas = [
+        [numero, datos["nombre"], datos["camiones"], _redondear(_promedio(datos["rampa"])),
+         _redondear(_percentil(datos["rampa"], 90)), _redondear(_promedio(datos["vuelta"])),
+         round(sum(datos["rampa"]) / 60, 2)]
+        for numero, datos in sorted(por_rampa.items())
+    ]
+    return columnas, filas
+
+
+def _fin_de_etapa(movimiento: dict, estado) -> Optional[datetime]:
+    """Hora de la primera etapa posterior que el movimiento alcanzó"""
+    for _, columna in ETAPAS[ORDEN_ESTADO[estado] + 1:]:
+        if movimiento[columna] is not None:
+            return movimiento[columna]
+    return None
+
+
+def seccion_atrasados(movimientos: List[dict], ahora: datetime) -> Tuple[Sequence[str], List[list]]:
+    """Etapas que duraron más que su límite SLA; las que siguen abiertas se miden hasta ahora"""
+    filas = []
+    for m in movimientos:
+        for estado, limite in LIMITES.items():
+            inicio = m[HORA_DE_ESTADO[estado]]
+            if inicio is None:
+                continue
+            fin = _fin_de_etapa(m, estado) or (ahora if m["estado"] == estado else None)
+            minutos = _minutos(inicio, fin)
+            if minutos is None or minutos <= limite.total_seconds() / 60:
+                continue
+            camion = m.get("camion") or {}
+            chofer = camion.get("chofer") or {}
+            rampa = m.get("rampa") or {}
+            filas.append([m["id"], camion.get("placa"), chofer.get("codigo"), rampa.get("numero"),
+                          estado.value, inicio, round(minutos, 1), limite.total_seconds() / 60])
+    filas.sort(key=lambda fila: -fila[6])
+    columnas = ("movimiento", "placa", "chofer", "rampa", "etapa", "inicio", "minutos", "limite_min")
+    return columnas, filas
+
+
+def seccion_confirmacion(movimientos: List[dict]) -> Tuple[Sequence[str], List[list]]:
+    """Demora de cada chofer en confirmar la rampa asignada"""
+    por_chofer = {}
+    for m in movimientos:
+        chofer = (m.get("camion") or {}).get("chofer")
+        if not chofer or m["hora_asignado"] is None:
+            continue
+        datos = por_chofer.setdefault(chofer["codigo"], {"nombre": chofer["nombre"], "asignaciones": 0, "minutos": []})
+        datos["asignaciones"] += 1
+        minutos = _minutos(m["hora_asignado"], m["hora_confirmado_chofer"])
+        if minutos is not None:
+            datos["minutos"].append(minutos)
+    columnas = ("chofer", "nombre", "asignaciones", "confirmadas", "sin_confirmar",
+                "min_promedio", "min_p90", "min_max")
+    filas = [
+        [codigo, datos["nombre"], datos["asignaciones"], len(datos["minutos"]),
+         datos["asignaciones"] - len(datos["minutos"]), _redondear(_promedio(datos["minutos"])),
+         _redondear(_percentil(datos["minutos"], 90)), _redondear(max(datos["minutos"], default=None))]
+        for codigo, datos in por_chofer.items()
+    ]
+    # Los más lentos primero
+    filas.sort(key=lambda fila: -(fila[5] if fila[5] is not None else -1))
+    return columnas, filas
+
+
+def _celda(valor):
+    if isinstance(valor, datetime):
+        return valor.strftime("%Y-%m-%d %H:%M")
+    return valor
+
+
+def escribir_csv(ruta: str, secciones: List[tuple]):
+    # utf-8-sig: Excel abre el CSV con los acentos bien
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as archivo:
+        escritor = csv.writer(archivo)
+        for i, (nombre, columnas, filas) in enumerate(secciones):
+            if i:
+                escritor.writerow([])
+            escritor.writerow([f"# {nombre}"])
+            escritor.writerow(columnas)
+            escritor.writerows([_celda(v) for v in fila] for fila in filas)
+
+
+def _columna_xlsx(indice: int) -> str:
+    letras = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+
+def _hoja_xlsx(columnas: Sequence[str], filas: List[list]) -> str:
+    lineas = []
+    for numero, fila in enumerate([list(columnas)] + filas, start=1):
+        celdas = []
+        for indice, valor in enumerate(fila):
+            valor = _celda(valor)
+            if valor is None:
+                continue
+            referencia = f"{_columna_xlsx(indice)}{numero}"
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+                celdas.append(f'<c r="{referencia}"><v>{valor}</v></c>')
+            else:
+                celdas.append(f'<c r="{referencia}" t="inlineStr"><is><t>{escape(str(valor))}</t></is></c>')
+        lineas.append(f'<row r="{numero}">{"".join(celdas)}</row>')
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        f'<sheetData>{"".join(lineas)}</sheetData></worksheet>'
+    )
+
+
+def escribir_xlsx(ruta: str, secciones: List[tuple]):
+    """XLSX mínimo (una hoja por sección, celdas de texto en línea), sin dependencias"""
+    hojas = range(1, len(secciones) + 1)
+    tipos = "".join(
+        f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        for i in hojas
+    )
+    with zipfile.ZipFile(ruta, "w", zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            f'{tipos}</Types>'
+        ))
+        libro.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ))
+        libro.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(
+                f'<sheet name="{escape(nombre)}" sheetId="{i}" r:id="rId{i}"/>'
+                for i, (nombre, _, _) in zip(hojas, secciones)
+            )
+            + '</sheets></workbook>'
+        ))
+        libro.writestr("xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+                for i in hojas
+            )
+            + '</Relationships>'
+        ))
+        for i, (_, columnas, filas) in zip(hojas, secciones):
+            libro.writestr(f"xl/worksheets/sheet{i}.xml", _hoja_xlsx(columnas, filas))
+
+
+ESCRITORES = {"csv": escribir_csv, "xlsx": escribir_xlsx}
+
+
+def generar(sitio_id: int, desde: datetime, hasta: datetime, formato: str, ruta: str) -> int:
+    """
+    Escribe el reporte en ruta (vía un .tmp, así nunca se descarga a medias) y
+    devuelve cuántos movimientos leyó. Corre en un proceso del pool: la sesión
+    es de la réplica si hay, y el engine del proceso abre una sola conexión.
+    """
+    db = SessionLectura()
+    try:
+        movimientos = movimientos_del_periodo(db, sitio_id, desde, hasta)
+    finally:
+        db.close()
+    ahora = min(datetime.now(), hasta)
+    secciones = [
+        ("rampas", *seccion_rampas(movimientos)),
+        ("atrasados", *seccion_atrasados(movimientos, ahora)),
+        ("confirmacion", *seccion_confirmacion(movimientos)),
+    ]
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    ESCRITORES[formato](temporal, secciones)
+    os.replace(temporal, ruta)
+    return len(movimientos)
+
+
+def _iniciar_proceso():
+    if hasattr(os, "nice"):
+        os.nice(NICE)
+
+# ========================================
+# TRABAJOS (proceso de la API)
+# ========================================
+
+class Trabajo:
+    def __init__(self, id_: str, sitio_id: int, tipo: str, desde: datetime, hasta: datetime, formato: str):
+        self.id = id_
+        self.sitio_id = sitio_id
+        self.tipo = tipo
+        self.desde = desde
+        self.hasta = hasta
+        self.formato = formato
+        self.creado = datetime.now()
+        self.terminado: Optional[datetime] = None
+        self.movimientos: Optional[int] = None
+        self.error: Optional[str] = None
+        self.futuro: Optional[Future] = None
+
+    @property
+    def estado(self) -> str:
+        if self.futuro is not None and not self.futuro.done():
+            return "generando" if self.futuro.running() else "en_cola"
+        return "error" if self.error else "listo"
+
+    def a_dict(self) -> dict:
+        estado = self.estado
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "formato": self.formato,
+            "desde": self.desde,
+            "hasta": self.hasta,
+            "estado": estado,
+            "creado": self.creado,
+            "terminado": self.terminado,
+            "movimientos": self.movimientos,
+            "error": self.error,
+            "descarga": f"/api/reportes/{self.id}/descarga" if estado == "listo" else None,
+        }
+
+
+class Reportes:
+    def __init__(self, directorio: str = None, procesos: int = PROCESOS, cola_max: int = COLA_MAX,
+                 vigencia_s: float = VIGENCIA_S):
+        self.directorio = directorio or REPORTES_DIR
+        self.procesos = procesos
+        self.cola_max = cola_max
+        self.vigencia_s = vigencia_s
+        self.trabajos: Dict[str, Trabajo] = {}
+        # Los endpoints son síncronos (hilos del threadpool); el callback del
+        # futuro corre en el hilo del executor, a veces con el lock tomado
+        self._lock = threading.RLock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.generados = 0
+        self.desde_cache = 0
+        self.rechazados = 0
+        self.fallidos = 0
+
+    def ruta(self, id_: str) -> str:
+        return os.path.join(self.directorio, id_)
+
+    def archivo(self, trabajo: Trabajo) -> Optional[str]:
+        """Ruta del archivo generado, o None si se borró"""
+        ruta = self.ruta(trabajo.id)
+        return ruta if os.path.exists(ruta) else None
+
+    def _vigente(self, id_: str, hasta: datetime) -> bool:
+        try:
+            generado = os.path.getmtime(self.ruta(id_))
+        except OSError:
+            return False
+        if datetime.fromtimestamp(generado) >= hasta + CIERRE:
+            return True
+        return time.time() - generado < self.vigencia_s
+
+    def _desde_archivo(self, id_: str) -> Optional[Trabajo]:
+        """Trabajo listo a partir de un archivo ya generado (de antes de reiniciar, por ejemplo)"""
+        partes = PATRON_ID.match(id_)
+        if partes is None or not os.path.exists(self.ruta(id_)):
+            return None
+        sitio_id, tipo, inicio, formato = partes.groups()
+        desde, hasta = periodo(tipo, datetime.strptime(inicio, "%Y%m%d").date())
+        trabajo = Trabajo(id_, int(sitio_id), tipo, desde, hasta, formato)
+        trabajo.creado = trabajo.terminado = datetime.fromtimestamp(os.path.getmtime(self.ruta(id_)))
+        return trabajo
+
+    def _ejecutor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            os.makedirs(self.directorio, exist_ok=True)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                # fork copiaría los hilos y conexiones abiertas de la API
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_proceso,
+            )
+        return self._pool
+
+    def pendientes(self) -> int:
+        return sum(1 for t in self.trabajos.values() if t.futuro is not None and not t.futuro.done())
+
+    def pedir(self, sitio_id: int, tipo: str, fecha: date, formato: str) -> Trabajo:
+        """El trabajo del reporte: el que ya está en curso, el archivo vigente o uno nuevo"""
+        id_ = id_reporte(sitio_id, tipo, fecha, formato)
+        desde, hasta = periodo(tipo, fecha)
+        with self._lock:
+            trabajo = self.trabajos.get(id_)
+            if trabajo is not None and trabajo.estado in ("en_cola", "generando"):
+                return trabajo
+            if self._vigente(id_, hasta):
+                self.desde_cache += 1
+                if trabajo is not None and trabajo.estado == "listo":
+                    return trabajo
+                return self._desde_archivo(id_)
+            if self.pendientes() >= self.cola_max:
+                self.rechazados += 1
+                raise ColaLlena()
+
+            self._olvidar()
+            trabajo = self.trabajos[id_] = Trabajo(id_, sitio_id, tipo, desde, hasta, formato)
+            trabajo.futuro = self._ejecutor().submit(generar, sitio_id, desde, hasta, formato, self.ruta(id_))
+            trabajo.futuro.add_done_callback(lambda futuro: self._terminar(trabajo, futuro))
+            return trabajo
+
+    def _terminar(self, trabajo: Trabajo, futuro: Future):
+        with self._lock:
+            trabajo.terminado = datetime.now()
+            if futuro.cancelled():
+                trabajo.error = "Cancelado al apagar el servidor"
+            elif futuro.exception() is not None:
+                error = futuro.exception()
+                trabajo.error = str(error) or type(error).__name__
+                if isinstance(error, BrokenProcessPool):
+                    self._pool = None  # un proceso murió: el próximo pedido arma un pool nuevo
+            else:
+                trabajo.movimientos = futuro.result()
+            if trabajo.error:
+                self.fallidos += 1
+            else:
+                self.generados += 1
+
+    def _olvidar(self):
+        terminados = [t for t in self.trabajos.values() if t.futuro is None or t.futuro.done()]
+        if len(terminados) >= RECORDADOS:
+            terminados.sort(key=lambda t: t.terminado or t.creado)
+            for trabajo in terminados[:len(terminados) - RECORDADOS // 2]:
+                del self.trabajos[trabajo.id]
+
+    def obtener(self, id_: str) -> Optional[Trabajo]:
+        if PATRON_ID.match(id_) is None:
+            return None
+        with self._lock:
+            trabajo = self.trabajos.get(id_)
+        return trabajo or self._desde_archivo(id_)
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            estados = [t.estado for t in self.trabajos.values()]
+        return {
+            "procesos": self.procesos,
+            "cola_max": self.cola_max,
+            "en_cola": estados.count("en_cola"),
+            "generando": estados.count("generando"),
+            "generados": self.generados,
+            "desde_cache": self.desde_cache,
+            "rechazados": self.rechazados,
+            "fallidos": self.fallidos,
+        }
+
+
+reportes = Reportes()
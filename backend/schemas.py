@@ -3,8 +3,8 @@ Schemas Pydantic - Control de Patio
 Para validación y serialización de datos
 """
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
+from typing import Dict, Optional, List
+from datetime import date, datetime
 from enum import Enum
 
 # ========================================
@@ -42,6 +42,26 @@ class Prioridad(str, Enum):
     URGENTE = "urgente"
     CRITICO = "critico"
 
+# ========================================
+# SCHEMAS DE SITIO
+# ========================================
+
+class SitioCreate(BaseModel):
+    codigo: str
+    nombre: str
+
+class SitioUpdate(BaseModel):
+    nombre: Optional[str] = None
+    activo: Optional[bool] = None
+
+class SitioResponse(SitioCreate):
+    id: int
+    activo: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 # ========================================
 # SCHEMAS DE USUARIO
 # ========================================
@@ -63,6 +83,7 @@ class UsuarioUpdate(BaseModel):
 
 class UsuarioResponse(UsuarioBase):
     id: int
+    sitio_id: int
     activo: bool
     created_at: datetime
     
@@ -77,6 +98,15 @@ class LoginResponse(BaseModel):
     success: bool
     mensaje: str
     usuario: Optional[UsuarioResponse] = None
+    # También queda en la cookie patio_sesion; los scripts lo mandan como Authorization: Bearer
+    token: Optional[str] = None
+    vence: Optional[datetime] = None
+
+class SesionResponse(BaseModel):
+    usuario_id: int
+    rol: RolUsuario
+    sitio_id: int
+    vence: datetime
 
 # ========================================
 # SCHEMAS DE CAMIÓN
@@ -99,6 +129,7 @@ class CamionUpdate(BaseModel):
 
 class CamionResponse(CamionBase):
     id: int
+    sitio_id: int
     chofer_id: Optional[int]
     activo: bool
     created_at: datetime
@@ -129,6 +160,7 @@ class RampaUpdate(BaseModel):
 
 class RampaResponse(RampaBase):
     id: int
+    sitio_id: int
     estado: EstadoRampa
     activo: bool
     created_at: datetime
@@ -158,8 +190,7 @@ class SolicitudDespacho(BaseModel):
 class AsignacionRampa(BaseModel):
     movimiento_id: int
     rampa_id: int
-    asignado_por_id: int
-    notas: Optional[str] = None
+    notas: Optional[str] = None  # quien asigna sale de la sesión
 
 class ConfirmacionChofer(BaseModel):
     movimiento_id: int
@@ -171,6 +202,7 @@ class CambioEstado(BaseModel):
 
 class MovimientoResponse(BaseModel):
     id: int
+    sitio_id: int
     camion_id: int
     rampa_id: Optional[int]
     asignado_por_id: Optional[int]
@@ -218,6 +250,16 @@ class NotificacionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class LecturaNotificaciones(BaseModel):
+    ids: List[int]
+
+class ConteoNoLeidas(BaseModel):
+    usuario_id: int
+    no_leidas: int
+
+class ResultadoLectura(BaseModel):
+    marcadas: int
+
 # ========================================
 # SCHEMAS DE DASHBOARD/REPORTES
 # ========================================
@@ -241,6 +283,101 @@ class ColaCamiones(BaseModel):
     solicitados: List[MovimientoCompleto]
     en_camino: List[MovimientoCompleto]
 
+class SnapshotPatio(BaseModel):
+    """Cola y rampas tal como estaban en un instante pasado"""
+    instante: datetime
+    cola: ColaCamiones
+    rampas: List[ResumenRampa]
+
+class Transicion(BaseModel):
+    offset: int
+    movimiento_id: int
+    estado_anterior: Optional[EstadoMovimiento]  # null al ingresar
+    estado: EstadoMovimiento
+    rampa_id: Optional[int]
+    momento: datetime
+
+class LoteCambios(BaseModel):
+    """Transiciones en orden; la próxima página se pide con since=siguiente"""
+    cambios: List[Transicion]
+    siguiente: int
+    hay_mas: bool
+
+# ========================================
+# SCHEMAS DE ANALÍTICA
+# ========================================
+
+class OcupacionRampas(BaseModel):
+    """Promedio por día de semana (filas, lunes primero) y hora (columnas 0-23)"""
+    desde: datetime
+    hasta: datetime
+    rampas: int
+    movimientos: int
+    dias: List[str]
+    ocupacion: List[List[float]]    # rampas ocupadas en promedio
+    utilizacion: List[List[float]]  # fracción de las rampas activas (0-1)
+
+class DistribucionTipo(BaseModel):
+    n: int
+    promedio: Optional[float]  # minutos
+    percentiles: Dict[str, float]  # p50, p90, p95 en minutos
+    conteos: List[int]  # uno por intervalo de bordes; el último incluye los mayores
+
+class DistribucionEstadias(BaseModel):
+    """Minutos por tramo (patio, traslado, rampa, total) y tipo de camión"""
+    desde: datetime
+    hasta: datetime
+    ancho_min: int
+    bordes: List[int]
+    tramos: Dict[str, Dict[str, DistribucionTipo]]
+
+# ========================================
+# SCHEMAS DE REPORTES
+# ========================================
+
+class TipoReporte(str, Enum):
+    DIARIO = "diario"
+    SEMANAL = "semanal"  # lunes a domingo
+
+class FormatoReporte(str, Enum):
+    CSV = "csv"
+    XLSX = "xlsx"
+
+class ReporteCreate(BaseModel):
+    tipo: TipoReporte = TipoReporte.DIARIO
+    fecha: date  # un día del período
+    formato: FormatoReporte = FormatoReporte.CSV
+
+class ReporteResponse(BaseModel):
+    id: str
+    tipo: TipoReporte
+    formato: FormatoReporte
+    desde: datetime
+    hasta: datetime
+    estado: str  # en_cola, generando, listo, error
+    creado: datetime
+    terminado: Optional[datetime] = None
+    movimientos: Optional[int] = None
+    error: Optional[str] = None
+    descarga: Optional[str] = None  # URL, cuando está listo
+
+# ========================================
+# SCHEMAS DE BÚSQUEDA
+# ========================================
+
+class TipoResultado(str, Enum):
+    CAMION = "camion"
+    USUARIO = "usuario"
+
+class ResultadoBusqueda(BaseModel):
+    tipo: TipoResultado
+    id: int
+    etiqueta: str  # placa o código
+    detalle: str   # tipo de camión o nombre del usuario
+    rol: Optional[RolUsuario] = None  # solo usuarios
+    activo: bool
+    puntaje: float  # mayor primero; 3.5 = igual a lo buscado
+
 # ========================================
 # SCHEMAS DE QR
 # ========================================
@@ -0,0 +1,216 @@
+"""
+Serialización rápida - Control de Patio
+Arma el JSON de las respuestas más consultadas una sola vez, a partir de
+tuplas de columnas (sin instancias ORM ni doble validación Pydantic)
+"""
+import json
+from datetime import datetime, date
+from typing import Optional
+from fastapi.responses import Response
+from sqlalchemy.orm import Session, aliased
+
+from models import Movimiento, Camion, Usuario, Rampa
+
+# ========================================
+# COLUMNAS (mismo orden que los schemas de respuesta)
+# ========================================
+
+COLUMNAS_MOVIMIENTO = (
+    "id", "sitio_id", "camion_id", "rampa_id", "asignado_por_id", "estado", "prioridad",
+    "hora_ingreso_garita", "hora_disponible_patio", "hora_solicitado", "hora_asignado",
+    "hora_confirmado_chofer", "hora_en_rampa", "hora_carga_lista", "hora_salida_rampa",
+    "hora_salida_cd",
+    "notas", "solicitado_por_despacho", "created_at", "updated_at",
+)
+COLUMNAS_CAMION = ("placa", "tipo", "capacidad", "id", "sitio_id", "chofer_id", "activo", "created_at")
+COLUMNAS_USUARIO = ("codigo", "nombre", "rol", "telefono", "id", "sitio_id", "activo", "created_at")
+COLUMNAS_RAMPA = ("numero", "nombre", "tipo_permitido", "id", "sitio_id", "estado", "activo", "created_at")
+
+Chofer = aliased(Usuario, name="chofer")
+AsignadoPor = aliased(Usuario, name="asignado_por")
+
+# ruta del bloque -> (entidad, columnas disponibles, bloque padre, condición de join)
+BLOQUES = {
+    "": (Movimiento, COLUMNAS_MOVIMIENTO, None, None),
+    "camion": (Camion, COLUMNAS_CAMION, "", Movimiento.camion_id == Camion.id),
+    "camion.chofer": (Chofer, COLUMNAS_USUARIO, "camion", Camion.chofer_id == Chofer.id),
+    "rampa": (Rampa, COLUMNAS_RAMPA, "", Movimiento.rampa_id == Rampa.id),
+    "asignado_por": (AsignadoPor, COLUMNAS_USUARIO, "", Movimiento.asignado_por_id == AsignadoPor.id),
+}
+
+# ========================================
+# SELECCIÓN DE CAMPOS (sparse fieldsets)
+# ========================================
+
+class Seleccion:
+    """
+    Columnas a traer de cada bloque de un MovimientoCompleto.
+    Los bloques que no aparecen no se consultan ni se incluyen en la respuesta.
+    """
+    def __init__(self, bloques: dict):
+        # Orden fijo de BLOQUES para que el SELECT y el decodificador coincidan
+        self.bloques = {ruta: tuple(bloques[ruta]) for ruta in BLOQUES if ruta in bloques}
+    
+    def con_columnas(self, *columnas: str) -> "Seleccion":
+        """Copia que además trae columnas del movimiento que el endpoint necesita internamente"""
+        bloques = dict(self.bloques)
+        propias = bloques.get("", ())
+        bloques[""] = propias + tuple(c for c in columnas if c not in propias)
+        return Seleccion(bloques)
+
+
+COMPLETA = Seleccion({ruta: columnas for ruta, (_, columnas, _, _) in BLOQUES.items()})
+
+
+def parsear_campos(texto: str) -> Seleccion:
+    """
+    Convierte "id,estado,camion.placa,camion.chofer.nombre,rampa" en una Seleccion.
+    Un bloque sin columna (ej. "rampa") trae el bloque completo.
+    """
+    bloques = {}
+    for campo in filter(None, (c.strip() for c in texto.split(","))):
+        if campo in BLOQUES:
+            ruta, columnas = campo, BLOQUES[campo][1]
+        else:
+            ruta, _, columna = campo.rpartition(".")
+            if ruta not in BLOQUES or columna not in BLOQUES[ruta][1]:
+                raise ValueError(f"Campo desconocido: {campo}")
+            columnas = (columna,)
+        bloques.setdefault(ruta, [])
+        bloques[ruta].extend(c for c in columnas if c not in bloques[ruta])
+    
+    # El id de cada bloque siempre viaja: identifica la fila y detecta el NULL del outer join
+    for ruta in list(bloques):
+        padre = BLOQUES[ruta][2]
+        while padre is not None:
+            bloques.setdefault(padre, [])
+            padre = BLOQUES[padre][2]
+    for ruta, columnas in bloques.items():
+        if "id" not in columnas:
+            columnas.insert(0, "id")
+    return Seleccion(bloques)
+
+
+# Vistas compactas por rol: solo lo que cada pantalla pinta
+VISTAS = {
+    "chofer": parsear_campos(
+        "id,estado,prioridad,hora_asignado,hora_confirmado_chofer,hora_en_rampa,hora_salida_rampa,"
+        "camion.placa,camion.tipo,camion.chofer.id,rampa.numero,rampa.nombre"
+    ),
+    "despacho": parsear_campos(
+        "id,estado,prioridad,hora_ingreso_garita,hora_disponible_patio,hora_solicitado,hora_asignado,"
+        "hora_confirmado_chofer,hora_en_rampa,hora_carga_lista,hora_salida_rampa,"
+        "camion.placa,camion.tipo,camion.chofer.nombre,rampa.numero,rampa.nombre"
+    ),
+}
+
+
+def resolver_seleccion(campos: Optional[str], vista: Optional[str]) -> Seleccion:
+    """Selección pedida por query string; sin parámetros devuelve el MovimientoCompleto entero"""
+    if campos:
+        return parsear_campos(campos)
+    if vista:
+        if vista not in VISTAS:
+            raise ValueError(f"Vista desconocida: {vista}")
+        return VISTAS[vista]
+    return COMPLETA
+
+
+# Datos de contacto y login: fuera de las pantallas sin sesión y de los choferes
+COLUMNAS_PERSONALES = ("codigo", "telefono")
+
+
+def sin_datos_personales(seleccion: Seleccion) -> Seleccion:
+    """Copia sin el código ni el teléfono de los usuarios, y sin quién asignó la rampa"""
+    bloques = {}
+    for ruta, columnas in seleccion.bloques.items():
+        if ruta == "asignado_por":
+            continue
+        if BLOQUES[ruta][1] is COLUMNAS_USUARIO:
+            columnas = tuple(c for c in columnas if c not in COLUMNAS_PERSONALES)
+        bloques[ruta] = columnas
+    return Seleccion(bloques)
+
+# ========================================
+# CONSULTA Y DECODIFICACIÓN
+# ========================================
+
+def consulta_movimientos(db: Session, seleccion: Seleccion = COMPLETA, sitio_id: Optional[int] = None):
+    """
+    Query de tuplas equivalente a un MovimientoCompleto (movimiento, camión con
+    chofer, rampa y usuario que asignó) en un solo SELECT con outer joins.
+    Solo se unen las tablas de los bloques seleccionados. Con sitio_id, solo
+    los movimientos de ese sitio.
+    """
+    columnas = [
+        getattr(BLOQUES[ruta][0], c)
+        for ruta, nombres in seleccion.bloques.items() for c in nombres
+    ]
+    query = db.query(*columnas).select_from(Movimiento)
+    for ruta in seleccion.bloques:
+        entidad, _, padre, condicion = BLOQUES[ruta]
+        if padre is not None:
+            query = query.outerjoin(entidad, condicion)
+    if sitio_id is not None:
+        query = query.filter(Movimiento.sitio_id == sitio_id)
+    return query
+
+
+def fila_a_movimiento(fila, seleccion: Seleccion = COMPLETA) -> dict:
+    """Convierte una fila de consulta_movimientos en el dict (anidado) del movimiento"""
+    movimiento = None
+    objetos = {}
+    inicio = 0
+    for ruta, nombres in seleccion.bloques.items():
+        valores = fila[inicio:inicio + len(nombres)]
+        inicio += len(nombres)
+        if ruta == "":
+            movimiento = objetos[ruta] = dict(zip(nombres, valores))
+            continue
+        padre = objetos.get(BLOQUES[ruta][2])
+        if padre is None:
+            continue
+        # Outer join sin coincidencia: la fila relacionada viene toda en NULL
+        if valores[nombres.index("id")] is None:
+            objeto = None
+        else:
+            objeto = objetos[ruta] = dict(zip(nombres, valores))
+        padre[ruta.rpartition(".")[2]] = objeto
+    return movimiento
+
+
+def fila_a_rampa(rampa: Rampa) -> dict:
+    return {c: getattr(rampa, c) for c in COLUMNAS_RAMPA}
+
+
+def recortar(movimiento: dict, seleccion: Seleccion) -> dict:
+    """Quita las columnas internas que el cliente no pidió (ver Seleccion.con_columnas)"""
+    pedidas = seleccion.bloques.get("", ())
+    for columna in list(movimiento):
+        if columna in COLUMNAS_MOVIMIENTO and columna not in pedidas:
+            del movimiento[columna]
+    return movimiento
+
+# ========================================
+# CODIFICACIÓN JSON
+# ========================================
+
+def _por_defecto(valor):
+    # Los Enum(str) los codifica json directamente; solo quedan las fechas
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    raise TypeError(f"Tipo no serializable: {type(valor).__name__}")
+
+
+def codificar(payload) -> bytes:
+    return json.dumps(
+        payload, default=_por_defecto, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def respuesta_json(payload) -> Response:
+    """
+    Respuesta con el JSON ya codificado. FastAPI no vuelve a validar ni a
+    serializar un Response, así que el response_model queda solo para la documentación.
+    """
+    return Response(content=codificar(payload), media_type="application/json")
@@ -0,0 +1,288 @@
+"""
+Sesiones - Control de Patio
+PINs con hash y tokens de sesión firmados. El login verifica el PIN contra el
+hash guardado y entrega un token
+
+    base64url(claims JSON) . base64url(HMAC-SHA256(SESION_SECRETO, claims))
+
+con claims {"sub": usuario, "rol", "sitio", "iat", "exp", "jti"}. Cada request
+y cada handshake de /ws/{user_id} lo verifica en memoria (firma, vencimiento y
+revocaciones): la autorización no agrega consultas a la BD.
+
+El token viaja en la cabecera Authorization: Bearer <token> (scripts, pruebas
+de carga) o en la cookie patio_sesion, que deja el login (navegador, también
+en el handshake del WebSocket).
+
+Revocaciones, en memoria del proceso:
+
+    por token     logout: el jti queda revocado hasta que el token vence
+    por usuario   cambio de PIN o usuario desactivado: se rechazan los tokens
+                  emitidos antes (iat) de ese momento
+
+Intentos de login fallidos, también en memoria del proceso:
+
+    por código e IP   MAX_INTENTOS seguidos bloquean ese código desde esa IP
+                      (otra IP no puede dejar afuera al dueño del código)
+    por IP            MAX_INTENTOS_IP en total, con cualquier código, bloquean
+                      la IP (probar un PIN común contra muchos códigos)
+
+La IP es la de la conexión: detrás de un proxy, uvicorn con --proxy-headers.
+
+Sin SESION_SECRETO cada arranque usa una clave al azar: reiniciar cierra todas
+las sesiones. Con más de un proceso, todos necesitan la misma clave, y cada uno
+lleva sus propias revocaciones y sus propios intentos fallidos.
+"""
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+from starlette.requests import HTTPConnection
+
+from models import RolUsuario, Usuario
+
+SECRETO = os.getenv("SESION_SECRETO", "").encode() or secrets.token_bytes(32)
+DURACION_S = float(os.getenv("SESION_DURACION_H", "12")) * 3600  # un turno
+COOKIE_SESION = "patio_sesion"
+CABECERA = "authorization"
+PREFIJO_BEARER = "bearer "
+
+# PBKDF2-SHA256: el PIN tiene 4 dígitos, el costo es lo que frena a quien se
+# lleve la tabla
+ITERACIONES = int(os.getenv("PIN_ITERACIONES", "100000"))
+ESQUEMA_HASH = "pbkdf2_sha256"
+# Intentos fallidos seguidos por código (desde una IP) antes de bloquear el login un rato
+MAX_INTENTOS = 5
+# Intentos fallidos desde una IP, con cualquier código, antes de bloquear la IP
+MAX_INTENTOS_IP = int(os.getenv("LOGIN_MAX_INTENTOS_IP", "50"))
+BLOQUEO_S = 300
+# Códigos e IPs con intentos fallidos que se recuerdan antes de olvidar los ya vencidos
+RECORDADOS = 10_000
+
+
+class SesionInvalida(Exception):
+    pass
+
+# ========================================
+# PINS
+# ========================================
+
+def hashear_pin(pin: str, iteraciones: int = ITERACIONES) -> str:
+    sal = secrets.token_bytes(16)
+    derivado = hashlib.pbkdf2_hmac("sha256", pin.encode(), sal, iteraciones)
+    return f"{ESQUEMA_HASH}${iteraciones}${sal.hex()}${derivado.hex()}"
+
+
+def es_hash(guardado: str) -> bool:
+    return guardado.startswith(ESQUEMA_HASH + "$")
+
+
+def verificar_pin(pin: str, guardado: str) -> bool:
+    """Compara en tiempo constante; acepta PINs en texto plano de antes del hash"""
+    if not es_hash(guardado):
+        return hmac.compare_digest(pin.encode(), guardado.encode())
+    try:
+        _, iteraciones, sal, esperado = guardado.split("$")
+        derivado = hashlib.pbkdf2_hmac("sha256", pin.encode(), bytes.fromhex(sal), int(iteraciones))
+    except ValueError:
+        return False
+    return hmac.compare_digest(derivado.hex(), esperado)
+
+
+def necesita_rehash(guardado: str) -> bool:
+    """PIN en texto plano o con menos iteraciones que las actuales"""
+    return not es_hash(guardado) or int(guardado.split("$")[1]) < ITERACIONES
+
+
+def hashear_pines(db: Session) -> int:
+    """Reemplaza los PINs en texto plano por su hash (mantenimiento.py migrar)"""
+    usuarios = db.query(Usuario).filter(~Usuario.pin.startswith(ESQUEMA_HASH + "$")).all()
+    for usuario in usuarios:
+        usuario.pin = hashear_pin(usuario.pin)
+    db.commit()
+    return len(usuarios)
+
+
+@functools.lru_cache(maxsize=None)
+def hash_ficticio() -> str:
+    """
+    Para gastar lo mismo cuando el código no existe. Se arma al primer uso (o en
+    main.calentar): importar el módulo no corre el PBKDF2
+    """
+    return hashear_pin("0000")
+
+# ========================================
+# TOKENS
+# ========================================
+
+def _b64(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(datos).rstrip(b"=").decode()
+
+
+def _desde_b64(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+
+
+class Sesion:
+    __slots__ = ("usuario_id", "rol", "sitio_id", "emitido", "vence", "jti")
+
+    def __init__(self, usuario_id: int, rol: RolUsuario, sitio_id: int, emitido: float, vence: float, jti: str):
+        self.usuario_id = usuario_id
+        self.rol = rol
+        self.sitio_id = sitio_id
+        self.emitido = emitido
+        self.vence = vence
+        self.jti = jti
+
+    def a_dict(self) -> dict:
+        return {
+            "usuario_id": self.usuario_id,
+            "rol": self.rol,
+            "sitio_id": self.sitio_id,
+            "vence": datetime.fromtimestamp(self.vence),
+        }
+
+
+class Sesiones:
+    def __init__(self, secreto: bytes = SECRETO, duracion_s: float = DURACION_S):
+        self.secreto = secreto
+        self.duracion_s = duracion_s
+        self._revocados: Dict[str, float] = {}        # {jti: vence}
+        self._revocado_desde: Dict[int, float] = {}   # {usuario_id: momento}
+        self._fallidos: Dict[Tuple[str, str], list] = {}  # {(codigo, ip): [cantidad, hasta]}
+        self._fallidos_ip: Dict[str, list] = {}       # {ip: [cantidad, hasta]}
+        self._lock = threading.Lock()
+        self.emitidos = 0
+        self.rechazados = 0
+
+    def emitir(self, usuario_id: int, rol: RolUsuario, sitio_id: int) -> str:
+        ahora = time.time()
+        claims = {
+            "sub": usuario_id,
+            "rol": RolUsuario(rol).value,
+            "sitio": sitio_id,
+            # Con decimales: un login justo después de revocar al usuario ya vale
+            "iat": ahora,
+            "exp": int(ahora + self.duracion_s),
+            "jti": secrets.token_hex(8),
+        }
+        carga = json.dumps(claims, separators=(",", ":")).encode()
+        self.emitidos += 1
+        return f"{_b64(carga)}.{_b64(hmac.new(self.secreto, carga, hashlib.sha256).digest())}"
+
+    def verificar(self, token: str) -> Sesion:
+        try:
+            carga_b64, firma_b64 = token.split(".")
+            carga = _desde_b64(carga_b64)
+            firma = _desde_b64(firma_b64)
+        except (ValueError, binascii.Error):
+            return self._rechazar("Token mal formado")
+        if not hmac.compare_digest(hmac.new(self.secreto, carga, hashlib.sha256).digest(), firma):
+            return self._rechazar("Firma inválida")
+        claims = json.loads(carga)
+        if claims["exp"] <= time.time():
+            return self._rechazar("Sesión vencida")
+        if claims["jti"] in self._revocados:
+            return self._rechazar("Sesión cerrada")
+        if claims["iat"] < self._revocado_desde.get(claims["sub"], 0):
+            return self._rechazar("Sesión revocada")
+        return Sesion(
+            claims["sub"], RolUsuario(claims["rol"]), claims["sitio"], claims["iat"], claims["exp"], claims["jti"]
+        )
+
+    def _rechazar(self, motivo: str):
+        self.rechazados += 1
+        raise SesionInvalida(motivo)
+
+    def revocar(self, sesion: Sesion):
+        """Logout: el token deja de valer aunque no haya vencido"""
+        with self._lock:
+            self._limpiar()
+            self._revocados[sesion.jti] = sesion.vence
+
+    def revocar_usuario(self, usuario_id: int):
+        """Cierra todas las sesiones abiertas del usuario"""
+        with self._lock:
+            self._limpiar()
+            self._revocado_desde[usuario_id] = time.time()
+
+    def _limpiar(self):
+        """Las revocaciones de tokens que ya vencieron no hacen falta"""
+        ahora = time.time()
+        for jti in [j for j, vence in self._revocados.items() if vence <= ahora]:
+            del self._revocados[jti]
+        for usuario_id in [u for u, desde in self._revocado_desde.items() if desde + self.duracion_s <= ahora]:
+            del self._revocado_desde[usuario_id]
+
+    # ----------------------------------------
+    # Intentos de login
+    # ----------------------------------------
+
+    @staticmethod
+    def _vigente(fallidos: Optional[list], maximo: int) -> bool:
+        return fallidos is not None and fallidos[0] >= maximo and fallidos[1] > time.time()
+
+    @staticmethod
+    def _contar(tabla: dict, clave):
+        """Suma un fallo a la clave; cada fallo extiende la ventana BLOQUEO_S"""
+        ahora = time.time()
+        if len(tabla) >= RECORDADOS:
+            for vencida in [c for c, f in tabla.items() if f[1] <= ahora]:
+                del tabla[vencida]
+        fallidos = tabla.get(clave)
+        if fallidos is None or fallidos[1] <= ahora:
+            fallidos = tabla[clave] = [0, 0.0]
+        fallidos[0] += 1
+        fallidos[1] = ahora + BLOQUEO_S
+
+    def bloqueado(self, codigo: str, ip: str) -> bool:
+        return (self._vigente(self._fallidos.get((codigo, ip)), MAX_INTENTOS)
+                or self._vigente(self._fallidos_ip.get(ip), MAX_INTENTOS_IP))
+
+    def fallo(self, codigo: str, ip: str):
+        with self._lock:
+            self._contar(self._fallidos, (codigo, ip))
+            self._contar(self._fallidos_ip, ip)
+
+    def exito(self, codigo: str, ip: str):
+        # El contador de la IP sigue: un login bueno no habilita otra ronda de códigos
+        self._fallidos.pop((codigo, ip), None)
+
+    def estadisticas(self) -> dict:
+        return {
+            "emitidos": self.emitidos,
+            "rechazados": self.rechazados,
+            "revocados": len(self._revocados),
+            "usuarios_revocados": len(self._revocado_desde),
+            "codigos_bloqueados": sum(
+                1 for fallidos in list(self._fallidos.values()) if self._vigente(fallidos, MAX_INTENTOS)
+            ),
+            "ips_bloqueadas": sum(
+                1 for fallidos in list(self._fallidos_ip.values()) if self._vigente(fallidos, MAX_INTENTOS_IP)
+            ),
+        }
+
+
+sesiones = Sesiones()
+
+
+def ip_cliente(conexion: HTTPConnection) -> str:
+    """IP de quien llama (la del proxy, salvo uvicorn --proxy-headers)"""
+    return conexion.client.host if conexion.client else ""
+
+
+def token_pedido(conexion: HTTPConnection) -> Optional[str]:
+    """Token de la request o del handshake: cabecera Authorization o cookie del login"""
+    cabecera = conexion.headers.get(CABECERA)
+    if cabecera and cabecera[:len(PREFIJO_BEARER)].lower() == PREFIJO_BEARER:
+        return cabecera[len(PREFIJO_BEARER):].strip()
+    return conexion.cookies.get(COOKIE_SESION)
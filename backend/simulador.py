@@ -0,0 +1,374 @@
+"""
+Simulador del Patio - Control de Patio
+Simulación de eventos discretos (heap de eventos) para planificar capacidad:
+reproduce llegadas y tiempos reales del historial de movimientos bajo
+configuraciones hipotéticas de rampas y demanda.
+
+Uso (desde backend/):
+    python simulador.py --dias 30
+    python simulador.py --dias 30 --rampas seco:3,refrigerado:2,mixta:2 --factor-llegadas 1.2
+    python simulador.py --dias 30 --sitio 2
+"""
+import argparse
+import heapq
+import json
+import random
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from models import EstadoMovimiento, EstadoRampa, TipoCamion, SITIO_POR_DEFECTO
+from flujo import puede_pasar, rampa_asignable, rampa_compatible
+
+# Tiempos por defecto (minutos) cuando el historial no tiene datos suficientes
+DURACIONES_POR_DEFECTO = {
+    "preparacion": [10.0],   # ingreso garita -> disponible en patio
+    "traslado": [8.0],       # asignado -> en rampa
+    "servicio": [45.0],      # en rampa -> salida de rampa
+}
+LLEGADAS_POR_HORA_POR_DEFECTO = 4.0
+
+# Eventos, en orden de desempate cuando coinciden en el tiempo
+LLEGADA, DISPONIBLE, EN_RAMPA, SALIDA_RAMPA = range(4)
+
+# ========================================
+# PERFIL HISTÓRICO
+# ========================================
+
+class Perfil:
+    """
+    Distribuciones empíricas tomadas del historial: tasa de llegadas por
+    (día de semana, hora), mezcla de tipos de camión y duraciones por tipo.
+    """
+    def __init__(self):
+        self.llegadas_por_hora = [[LLEGADAS_POR_HORA_POR_DEFECTO] * 24 for _ in range(7)]
+        self.mezcla_tipos: Dict[TipoCamion, float] = {tipo: 1.0 for tipo in TipoCamion}
+        self.duraciones: Dict[str, Dict[TipoCamion, List[float]]] = {
+            etapa: {} for etapa in DURACIONES_POR_DEFECTO
+        }
+        self.movimientos = 0
+
+    def muestra(self, rng: random.Random, etapa: str, tipo: TipoCamion) -> float:
+        valores = self.duraciones[etapa].get(tipo) or DURACIONES_POR_DEFECTO[etapa]
+        return rng.choice(valores)
+
+    def tipo_aleatorio(self, rng: random.Random) -> TipoCamion:
+        tipos = list(self.mezcla_tipos)
+        return rng.choices(tipos, weights=[self.mezcla_tipos[t] for t in tipos])[0]
+
+
+def _minutos(inicio: Optional[datetime], fin: Optional[datetime]) -> Optional[float]:
+    if inicio is None or fin is None:
+        return None
+    minutos = (fin - inicio).total_seconds() / 60
+    return minutos if minutos >= 0 else None
+
+
+def perfil_desde_historial(db, dias: int = 90, sitio_id: int = SITIO_POR_DEFECTO) -> Perfil:
+    """Lee las horas de etapa de los últimos `dias` días del sitio en un solo query de columnas"""
+    from models import Movimiento, Camion
+
+    perfil = Perfil()
+    desde = datetime.now() - timedelta(days=dias)
+    filas = db.query(
+        Camion.tipo,
+        Movimiento.hora_ingreso_garita,
+        Movimiento.hora_disponible_patio,
+        Movimiento.hora_asignado,
+        Movimiento.hora_en_rampa,
+        Movimiento.hora_salida_rampa,
+    ).join(Camion, Movimiento.camion_id == Camion.id).filter(
+        Movimiento.sitio_id == sitio_id,
+        Movimiento.hora_ingreso_garita >= desde
+    ).all()
+    if not filas:
+        return perfil
+
+    conteo_llegadas = [[0] * 24 for _ in range(7)]
+    fechas = set()
+    mezcla = defaultdict(int)
+    duraciones = {etapa: defaultdict(list) for etapa in DURACIONES_POR_DEFECTO}
+    for tipo, ingreso, disponible, asignado, en_rampa, salida_rampa in filas:
+        conteo_llegadas[ingreso.weekday()][ingreso.hour] += 1
+        fechas.add(ingreso.date())
+        mezcla[tipo] += 1
+        for etapa, valor in (
+            ("preparacion", _minutos(ingreso, disponible)),
+            ("traslado", _minutos(asignado, en_rampa)),
+            ("servicio", _minutos(en_rampa, salida_rampa)),
+        ):
+            if valor is not None:
+                duraciones[etapa][tipo].append(valor)
+
+    # Tasa = llegadas observadas / cantidad de días de ese día de semana en la ventana
+    dias_por_semana = [0] * 7
+    for fecha in fechas:
+        dias_por_semana[fecha.weekday()] += 1
+    for dia in range(7):
+        if dias_por_semana[dia]:
+            perfil.llegadas_por_hora[dia] = [c / dias_por_semana[dia] for c in conteo_llegadas[dia]]
+        else:
+            perfil.llegadas_por_hora[dia] = [0.0] * 24
+
+    perfil.mezcla_tipos = dict(mezcla)
+    perfil.duraciones = {etapa: dict(por_tipo) for etapa, por_tipo in duraciones.items()}
+    perfil.movimientos = len(filas)
+    return perfil
+
+# ========================================
+# MOTOR DE EVENTOS
+# ========================================
+
+class _Camion:
+    __slots__ = ("id", "tipo", "estado", "hora_disponible", "hora_asignado", "rampa")
+
+    def __init__(self, id: int, tipo: TipoCamion):
+        self.id = id
+        self.tipo = tipo
+        self.estado = EstadoMovimiento.INGRESADO_GARITA
+        self.hora_disponible = None
+        self.hora_asignado = None
+        self.rampa = None
+
+    def pasar(self, destino: EstadoMovimiento):
+        # Mismas reglas de transición que los endpoints de la API
+        if not puede_pasar(self.estado, destino):
+            raise RuntimeError(f"Transición inválida {self.estado.value} -> {destino.value}")
+        self.estado = destino
+
+
+class _Rampa:
+    __slots__ = ("numero", "tipo_permitido", "estado", "reservada", "minutos_ocupada")
+
+    def __init__(self, numero: int, tipo_permitido: Optional[TipoCamion]):
+        self.numero = numero
+        self.tipo_permitido = tipo_permitido
+        self.estado = EstadoRampa.LIBRE
+        # La API no reserva la rampa al asignar; el simulador asume que
+        # logística no vuelve a asignar una rampa con un camión en camino.
+        self.reservada = False
+        self.minutos_ocupada = 0.0
+
+
+def _percentil(valores: List[float], p: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    bajo = int(k)
+    alto = min(bajo + 1, len(ordenados) - 1)
+    return ordenados[bajo] + (ordenados[alto] - ordenados[bajo]) * (k - bajo)
+
+
+class Simulacion:
+    def __init__(self, perfil: Perfil, rampas: List[Optional[TipoCamion]],
+                 dias: int = 30, factor_llegadas: float = 1.0, semilla: int = 1):
+        self.perfil = perfil
+        self.rampas = [_Rampa(i + 1, tipo) for i, tipo in enumerate(rampas)]
+        self.dias = dias
+        self.factor_llegadas = factor_llegadas
+        self.rng = random.Random(semilla)
+
+        self.eventos = []
+        self._secuencia = 0
+        self.ahora = 0.0
+        # Una cola FIFO por tipo de camión: al liberarse una rampa se mira solo
+        # la cabeza de cada cola compatible, sin recorrer el patio completo.
+        self.colas: Dict[TipoCamion, deque] = {tipo: deque() for tipo in TipoCamion}
+
+        self.esperas: List[float] = []
+        self.esperas_por_tipo: Dict[TipoCamion, List[float]] = defaultdict(list)
+        self.atendidos = 0
+        self._largo_cola = 0
+        self._ultimo_cambio_cola = 0.0
+        self._area_cola = 0.0
+        self.cola_maxima = 0
+
+    def _programar(self, minuto: float, evento: int, camion: _Camion):
+        self._secuencia += 1
+        heapq.heappush(self.eventos, (minuto, evento, self._secuencia, camion))
+
+    def _cambiar_cola(self, delta: int):
+        # Largo de cola ponderado por tiempo
+        self._area_cola += self._largo_cola * (self.ahora - self._ultimo_cambio_cola)
+        self._ultimo_cambio_cola = self.ahora
+        self._largo_cola += delta
+        self.cola_maxima = max(self.cola_maxima, self._largo_cola)
+
+    def _generar_llegadas(self):
+        inicio = datetime(2024, 1, 1)  # lunes
+        total = 0
+        for dia in range(self.dias):
+            dia_semana = (inicio + timedelta(days=dia)).weekday()
+            for hora in range(24):
+                tasa = self.perfil.llegadas_por_hora[dia_semana][hora] * self.factor_llegadas
+                if tasa <= 0:
+                    continue
+                minuto = 0.0
+                while True:
+                    minuto += self.rng.expovariate(tasa) * 60
+                    if minuto >= 60:
+                        break
+                    total += 1
+                    camion = _Camion(total, self.perfil.tipo_aleatorio(self.rng))
+                    self._programar((dia * 24 + hora) * 60 + minuto, LLEGADA, camion)
+
+    def _asignar(self, camion: _Camion, rampa: _Rampa):
+        camion.pasar(EstadoMovimiento.ASIGNADO_EN_CAMINO)
+        camion.hora_asignado = self.ahora
+        camion.rampa = rampa
+        rampa.reservada = True
+        espera = self.ahora - camion.hora_disponible
+        self.esperas.append(espera)
+        self.esperas_por_tipo[camion.tipo].append(espera)
+        self._programar(self.ahora + self.perfil.muestra(self.rng, "traslado", camion.tipo), EN_RAMPA, camion)
+
+    def _rampa_libre_para(self, camion: _Camion) -> Optional[_Rampa]:
+        for rampa in self.rampas:
+            if not rampa.reservada and rampa_asignable(rampa.estado) \
+                    and rampa_compatible(rampa.tipo_permitido, camion.tipo):
+                return rampa
+        return None
+
+    def _siguiente_en_cola(self, rampa: _Rampa) -> Optional[_Camion]:
+        candidatos = [
+            cola for tipo, cola in self.colas.items()
+            if cola and rampa_compatible(rampa.tipo_permitido, tipo)
+        ]
+        if not candidatos:
+            return None
+        cola = min(candidatos, key=lambda c: c[0].hora_disponible)
+        return cola.popleft()
+
+    def ejecutar(self) -> dict:
+        self._generar_llegadas()
+        fin = self.dias * 24 * 60
+        while self.eventos:
+            minuto, evento, _, camion = heapq.heappop(self.eventos)
+            self.ahora = minuto
+
+            if evento == LLEGADA:
+                self._programar(minuto + self.perfil.muestra(self.rng, "preparacion", camion.tipo), DISPONIBLE, camion)
+
+            elif evento == DISPONIBLE:
+                camion.pasar(EstadoMovimiento.DISPONIBLE_PATIO)
+                camion.hora_disponible = minuto
+                rampa = self._rampa_libre_para(camion)
+                if rampa:
+                    self._asignar(camion, rampa)
+                else:
+                    self.colas[camion.tipo].append(camion)
+                    self._cambiar_cola(+1)
+
+            elif evento == EN_RAMPA:
+                camion.pasar(EstadoMovimiento.EN_RAMPA)
+                camion.rampa.estado = EstadoRampa.OCUPADA
+                servicio = self.perfil.muestra(self.rng, "servicio", camion.tipo)
+                camion.rampa.minutos_ocupada += servicio
+                self._programar(minuto + servicio, SALIDA_RAMPA, camion)
+
+            elif evento == SALIDA_RAMPA:
+                camion.pasar(EstadoMovimiento.CARGA_LISTA)
+                camion.pasar(EstadoMovimiento.SALIDA_RAMPA)
+                rampa = camion.rampa
+                rampa.estado = EstadoRampa.LIBRE
+                rampa.reservada = False
+                self.atendidos += 1
+                siguiente = self._siguiente_en_cola(rampa)
+                if siguiente:
+                    self._cambiar_cola(-1)
+                    self._asignar(siguiente, rampa)
+
+        self._cambiar_cola(0)
+        duracion = max(self.ahora, fin)
+        return {
+            "dias": self.dias,
+            "rampas": len(self.rampas),
+            "camiones_atendidos": self.atendidos,
+            "camiones_sin_atender": self._largo_cola,
+            "cola_promedio": self._area_cola / duracion if duracion else 0.0,
+            "cola_maxima": self.cola_maxima,
+            "espera_minutos": {
+                f"p{p}": _percentil(self.esperas, p) for p in (50, 90, 95, 99)
+            },
+            "espera_p90_por_tipo": {
+                tipo.value: _percentil(valores, 90) for tipo, valores in self.esperas_por_tipo.items()
+            },
+            "utilizacion_rampas": {
+                r.numero: r.minutos_ocupada / duracion if duracion else 0.0 for r in self.rampas
+            },
+        }
+
+# ========================================
+# LÍNEA DE COMANDOS
+# ========================================
+
+def parsear_rampas(texto: str) -> List[Optional[TipoCamion]]:
+    """"seco:3,refrigerado:2,mixta:1" -> lista de tipo_permitido ("mixta" = cualquier tipo)"""
+    rampas = []
+    for parte in filter(None, (p.strip() for p in texto.split(","))):
+        nombre, _, cantidad = parte.partition(":")
+        tipo = None if nombre in ("mixta", "cualquiera") else TipoCamion(nombre)
+        rampas.extend([tipo] * int(cantidad or 1))
+    return rampas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dias", type=int, default=30, help="Días a simular")
+    parser.add_argument("--rampas", help="Configuración hipotética, ej: seco:3,refrigerado:2,mixta:1 "
+                                         "(por defecto, las rampas activas de la BD)")
+    parser.add_argument("--factor-llegadas", type=float, default=1.0, help="Multiplica la demanda histórica")
+    parser.add_argument("--historia-dias", type=int, default=90, help="Ventana de historial a muestrear")
+    parser.add_argument("--sitio", type=int, default=SITIO_POR_DEFECTO, help="Centro de distribución a simular")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--sin-bd", action="store_true", help="Usar tiempos por defecto sin leer la BD")
+    parser.add_argument("--json", action="store_true", help="Imprimir el resultado como JSON")
+    args = parser.parse_args()
+
+    perfil = Perfil()
+    rampas = parsear_rampas(args.rampas) if args.rampas else None
+    if not args.sin_bd:
+        from database import SessionLocal
+        from models import Rampa
+        db = SessionLocal()
+        try:
+            perfil = perfil_desde_historial(db, args.historia_dias, args.sitio)
+            if rampas is None:
+                rampas = [r.tipo_permitido for r in db.query(Rampa).filter(
+                    Rampa.sitio_id == args.sitio, Rampa.activo == True
+                ).order_by(Rampa.numero)]
+        finally:
+            db.close()
+    if not rampas:
+        rampas = parsear_rampas("seco:2,refrigerado:2,mixta:2")
+
+    inicio = time.perf_counter()
+    resultado = Simulacion(perfil, rampas, args.dias, args.factor_llegadas, args.semilla).ejecutar()
+    resultado["segundos_simulacion"] = time.perf_counter() - inicio
+    resultado["movimientos_historicos"] = perfil.movimientos
+
+    if args.json:
+        print(json.dumps(resultado, indent=2, ensure_ascii=False))
+        return
+
+    def fmt(valor):
+        return "--" if valor is None else f"{valor:.1f}"
+
+    print(f"Simulación de {resultado['dias']} días, {resultado['rampas']} rampas "
+          f"({resultado['movimientos_historicos']} movimientos históricos) "
+          f"en {resultado['segundos_simulacion']:.2f} s")
+    print(f"  Camiones atendidos : {resultado['camiones_atendidos']}  (en cola al final: {resultado['camiones_sin_atender']})")
+    print(f"  Cola promedio      : {resultado['cola_promedio']:.2f}   máxima: {resultado['cola_maxima']}")
+    esperas = resultado["espera_minutos"]
+    print("  Espera en patio    : " + "  ".join(f"{p}={fmt(v)} min" for p, v in esperas.items()))
+    for tipo, p90 in resultado["espera_p90_por_tipo"].items():
+        print(f"    p90 {tipo:12s}: {fmt(p90)} min")
+    print("  Utilización        : " + "  ".join(
+        f"R{n}={u:.0%}" for n, u in resultado["utilizacion_rampas"].items()
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Sitios - Control de Patio
+Un despliegue atiende varios centros de distribución. Cada request y cada
+WebSocket trabaja sobre un solo sitio, que se toma de:
+
+    cabecera X-Sitio: <id>      clientes de la API, scripts, pruebas de carga
+    ?sitio=<id>                 pantallas del patio (EventSource no manda cabeceras)
+    cookie patio_sitio          navegador: la deja el login con el sitio del usuario
+    (ninguna)                   el sitio de la sesión (sesiones.py), o
+                                SITIO_POR_DEFECTO (despliegues de un solo CD)
+
+Los IDs de sitios activos se recuerdan en memoria, así validar el sitio de
+cada request no agrega consultas; un ID desconocido se busca una vez en la BD.
+"""
+import threading
+from typing import Optional, Set
+
+from starlette.requests import HTTPConnection
+
+from database import SessionLocal
+from models import Sitio, SITIO_POR_DEFECTO
+
+CABECERA_SITIO = "X-Sitio"
+PARAMETRO_SITIO = "sitio"
+COOKIE_SITIO = "patio_sitio"
+COOKIE_SITIO_MAX_AGE_S = 30 * 24 * 3600  # como la sesión guardada en localStorage
+
+
+class SitioInvalido(Exception):
+    pass
+
+
+class RegistroSitios:
+    def __init__(self):
+        self._activos: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def existe(self, sitio_id: int) -> bool:
+        """Sin consulta para los sitios ya vistos; los nuevos se buscan en la BD"""
+        if sitio_id in self._activos:
+            return True
+        db = SessionLocal()
+        try:
+            activo = db.query(Sitio.id).filter(Sitio.id == sitio_id, Sitio.activo == True).first()
+        finally:
+            db.close()
+        if activo:
+            with self._lock:
+                self._activos.add(sitio_id)
+        return bool(activo)
+
+    def conocido(self, sitio_id: int) -> bool:
+        return sitio_id in self._activos
+
+    def agregar(self, sitio_id: int):
+        with self._lock:
+            self._activos.add(sitio_id)
+
+    def quitar(self, sitio_id: int):
+        with self._lock:
+            self._activos.discard(sitio_id)
+
+
+registro = RegistroSitios()
+
+
+def sitio_pedido(conexion: HTTPConnection, defecto: int = SITIO_POR_DEFECTO) -> int:
+    """Sitio de la request o del handshake del WebSocket (sin validar que exista)"""
+    valor: Optional[str] = (
+        conexion.headers.get(CABECERA_SITIO)
+        or conexion.query_params.get(PARAMETRO_SITIO)
+        or conexion.cookies.get(COOKIE_SITIO)
+    )
+    if not valor:
+        return defecto
+    try:
+        return int(valor)
+    except ValueError:
+        raise SitioInvalido(f"Sitio inválido: {valor}")
@@ -0,0 +1,196 @@
+"""
+Transmisión SSE - Control de Patio
+Feed de solo lectura para las pantallas del patio (GET /api/stream/patio).
+
+Los mismos mensajes que salen por WebSocket (conexiones.py) se publican en el
+canal del sitio. Cada evento se codifica una vez en bytes SSE y se guarda en un
+buffer circular de SSE_BUFFER eventos; los espectadores despiertan con un solo
+asyncio.Event por sitio y copian los bytes ya armados, así cada pantalla extra
+cuesta una tarea dormida y nada de CPU por mensaje fuera del envío. El
+comentario de latido (cada SSE_PING_S, para que los proxies no corten) sale de
+una sola tarea por proceso, no de un timer por espectador.
+
+IDs de evento "<época>-<n>": n crece de a uno por sitio y la época cambia en
+cada arranque del proceso. Al reconectar con Last-Event-ID se reenvía lo que
+falta desde el buffer; si el ID es de otra época o ya salió del buffer, se
+manda primero un evento "estado" con la foto completa del patio. Tras un
+deploy todas las pantallas piden la foto a la vez: mientras no haya eventos
+nuevos (y por FOTO_MAX_S), la misma foto sirve a todas las de un sitio.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from mensajes import Mensaje, COMPLETO
+
+BUFFER = int(os.getenv("SSE_BUFFER", "512"))
+PING_S = float(os.getenv("SSE_PING_S", "20"))
+# El navegador reintenta solo a los RETRY_MS de perder la conexión
+RETRY_MS = 3000
+# Una foto compartida incluye minutos en rampa: no se reusa más que esto
+FOTO_MAX_S = 1.0
+
+# Mensajes que cambian las rampas o las colas (los demás no se transmiten)
+TIPOS_PATIO = {
+    "nuevo_ingreso", "camion_disponible", "solicitud_camion", "asignacion_rampa",
+    "chofer_confirmo", "camion_en_rampa", "carga_lista", "rampa_liberada",
+}
+
+EPOCA = format(int(time.time() * 1000), "x")
+PING = b": ping\n\n"
+
+
+def evento_sse(id_evento: str, tipo: str, datos: str) -> bytes:
+    return f"id: {id_evento}\nevent: {tipo}\ndata: {datos}\n\n".encode()
+
+
+class CanalSitio:
+    def __init__(self, tamano: int):
+        self.eventos: Deque[Tuple[int, bytes]] = deque(maxlen=tamano)
+        self.ultimo = 0
+        self.nuevo = asyncio.Event()
+        self.latidos = 0
+        self.espectadores = 0
+        self.fotos: Dict[str, Tuple[int, float, asyncio.Future]] = {}  # clave -> (ultimo, instante, foto)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def preparar(self):
+        """El Event queda atado al loop del primer wait (TestClient usa un loop por cliente)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.nuevo = asyncio.Event()
+            self.fotos = {}
+
+    def _despertar(self):
+        # Despierta a todos los que esperan; los siguientes esperan un Event nuevo
+        self.nuevo.set()
+        self.nuevo = asyncio.Event()
+
+    def publicar(self, tipo: str, datos: str):
+        self.ultimo += 1
+        self.eventos.append((self.ultimo, evento_sse(f"{EPOCA}-{self.ultimo}", tipo, datos)))
+        self._despertar()
+
+    async def foto(self, clave: str, estado: Callable[[], Awaitable[bytes]]) -> Tuple[int, bytes]:
+        """Foto del patio al evento actual; los pedidos simultáneos comparten una sola consulta"""
+        ahora = time.monotonic()
+        previa = self.fotos.get(clave)
+        if previa is None or previa[0] != self.ultimo or ahora - previa[1] > FOTO_MAX_S or (
+                previa[2].done() and previa[2].exception() is not None):
+            previa = self.fotos[clave] = (self.ultimo, ahora, asyncio.ensure_future(estado()))
+        return previa[0], await asyncio.shield(previa[2])
+
+    def latir(self):
+        self.latidos += 1
+        self._despertar()
+
+    def desde(self, n: int) -> Optional[List[bytes]]:
+        """Eventos posteriores a n, o None si alguno ya salió del buffer"""
+        if n >= self.ultimo:
+            return []
+        if not self.eventos or n < self.eventos[0][0] - 1:
+            return None
+        pendientes = []
+        for numero, datos in reversed(self.eventos):
+            if numero <= n:
+                break
+            pendientes.append(datos)
+        pendientes.reverse()
+        return pendientes
+
+
+class Transmision:
+    def __init__(self, tamano: int = BUFFER, ping_s: float = PING_S):
+        self.tamano = tamano
+        self.ping_s = ping_s
+        self.canales: Dict[int, CanalSitio] = {}
+        self.publicados = 0
+        self._latido: Optional[asyncio.Task] = None
+
+    def _canal(self, sitio_id: int) -> CanalSitio:
+        canal = self.canales.get(sitio_id)
+        if canal is None:
+            canal = self.canales[sitio_id] = CanalSitio(self.tamano)
+        return canal
+
+    def publicar(self, message: Mensaje, sitio_id: int):
+        if message.tipo not in TIPOS_PATIO:
+            return
+        self._canal(sitio_id).publicar(message.tipo, message.codificar(COMPLETO))
+        self.publicados += 1
+
+    @staticmethod
+    def _numero(ultimo_id: Optional[str]) -> Optional[int]:
+        """n del Last-Event-ID si es de esta época"""
+        if not ultimo_id:
+            return None
+        epoca, _, numero = ultimo_id.partition("-")
+        if epoca != EPOCA or not numero.isdigit():
+            return None
+        return int(numero)
+
+    async def eventos(
+        self, sitio_id: int, ultimo_id: Optional[str], estado: Callable[[], Awaitable[bytes]], clave: str = ""
+    ) -> AsyncIterator[bytes]:
+        """
+        Generador del StreamingResponse; Starlette lo cancela cuando el cliente se va.
+        estado() arma la foto; clave distingue fotos distintas (campos pedidos).
+        """
+        canal = self._canal(sitio_id)
+        canal.preparar()
+        canal.espectadores += 1
+        self._asegurar_latido()
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode()
+            n = self._numero(ultimo_id)
+            latidos = canal.latidos
+            while True:
+                pendientes = canal.desde(n) if n is not None else None
+                if pendientes is None:
+                    # Sin ID, de otra época o atrasado más que el buffer: foto completa
+                    n, foto = await canal.foto(clave, estado)
+                    yield evento_sse(f"{EPOCA}-{n}", "estado", foto.decode())
+                    continue
+                if pendientes:
+                    n = canal.ultimo
+                    yield b"".join(pendientes)
+                    continue
+                if latidos != canal.latidos:
+                    latidos = canal.latidos
+                    yield PING
+                    continue
+                await canal.nuevo.wait()
+        finally:
+            canal.espectadores -= 1
+            if self._latido is not None and not any(c.espectadores for c in self.canales.values()):
+                self._latido.cancel()
+
+    def _asegurar_latido(self):
+        loop = asyncio.get_running_loop()
+        if self._latido is None or self._latido.done() or self._latido.get_loop() is not loop:
+            self._latido = loop.create_task(self._latir())
+
+    async def _latir(self):
+        # Se cancela al irse el último espectador; eventos() la vuelve a crear
+        while any(canal.espectadores for canal in self.canales.values()):
+            await asyncio.sleep(self.ping_s)
+            for canal in self.canales.values():
+                if canal.espectadores:
+                    canal.latir()
+
+    def estadisticas(self) -> dict:
+        return {
+            "epoca": EPOCA,
+            "publicados": self.publicados,
+            "buffer": self.tamano,
+            "sitios": {
+                sitio_id: {"espectadores": canal.espectadores, "ultimo": canal.ultimo, "en_buffer": len(canal.eventos)}
+                for sitio_id, canal in self.canales.items()
+            },
+        }
+
+
+transmision = Transmision()
@@ -0,0 +1,197 @@
+"""
+Vigilancia de Tiempos (SLA) - Control de Patio
+Alerta a logística y despacho cuando un movimiento pasa demasiado tiempo en
+una etapa: camión disponible en patio sin asignar, o camión en rampa mucho
+más de lo normal.
+
+Cada movimiento activo tiene a lo sumo un vencimiento en un heap. Las
+transiciones lo rearman (rearmar) y una sola tarea duerme hasta el próximo
+vencimiento: no hay barridos periódicos de la BD. Al arrancar se carga una
+vez el estado de los movimientos activos (cargar_activos). El heap es uno
+para todos los sitios; cada alerta va a los usuarios del sitio del movimiento.
+
+Con varios procesos cada uno vigila lo que cargó o movió: antes de enviar, la
+alerta se reclama con un UPDATE condicional de movimientos.alerta_sla, y solo el
+proceso que lo gana la envía (a los usuarios conectados a él, como el resto de
+los avisos por WebSocket). Un reinicio tampoco repite las alertas ya enviadas.
+"""
+import asyncio
+import heapq
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import joinedload
+from starlette.concurrency import run_in_threadpool
+
+from database import SessionLocal, hora_local
+from models import Movimiento, Usuario, EstadoMovimiento, RolUsuario
+from flujo import HORA_DE_ESTADO
+from conexiones import ConnectionManager
+from mensajes import Mensaje
+
+# Minutos máximos por etapa antes de alertar
+LIMITES = {
+    EstadoMovimiento.DISPONIBLE_PATIO: timedelta(minutes=float(os.getenv("SLA_DISPONIBLE_MIN", "90"))),
+    EstadoMovimiento.EN_RAMPA: timedelta(minutes=float(os.getenv("SLA_EN_RAMPA_MIN", "120"))),
+}
+
+ROLES_ALERTA = (RolUsuario.LOGISTICA, RolUsuario.DESPACHO)
+
+
+class Vigilante:
+    def __init__(self, conexiones: ConnectionManager, limites: dict = None):
+        self.conexiones = conexiones
+        self.limites = limites or LIMITES
+        self._armados: Dict[int, Tuple[EstadoMovimiento, datetime]] = {}  # {movimiento_id: (estado, vence)}
+        self._heap = []  # (vence, movimiento_id); entradas reemplazadas se ignoran al salir
+        self._cambio = asyncio.Event()
+        self._tarea: Optional[asyncio.Task] = None
+        self._rearmados: Optional[set] = None  # IDs rearmados mientras corre cargar_activos
+        self.alertas = 0
+
+    # ----------------------------------------
+    # Vencimientos
+    # ----------------------------------------
+
+    def rearmar(self, movimiento: Movimiento):
+        """Llamar después de cada transición (ya confirmada en la BD)"""
+        if self._rearmados is not None:
+            self._rearmados.add(movimiento.id)
+        limite = self.limites.get(movimiento.estado)
+        if movimiento.alerta_sla == movimiento.estado:
+            limite = None  # la alerta de esta etapa ya salió
+        desde = getattr(movimiento, HORA_DE_ESTADO[movimiento.estado], None) if limite else None
+        if desde is None:
+            self._armados.pop(movimiento.id, None)
+            return
+        vence = hora_local(desde) + limite
+        self._armados[movimiento.id] = (movimiento.estado, vence)
+        adelanta = not self._heap or vence < self._heap[0][0]
+        heapq.heappush(self._heap, (vence, movimiento.id))
+        if len(self._heap) > 2 * len(self._armados) + 64:
+            self._compactar()
+        self._asegurar_tarea()
+        if adelanta:
+            self._cambio.set()
+
+    def _compactar(self):
+        self._heap = [(vence, mid) for mid, (_, vence) in self._armados.items()]
+        heapq.heapify(self._heap)
+
+    async def cargar_activos(self):
+        """
+        Arma los vencimientos de los movimientos activos (una vez, al arrancar).
+        La app ya atiende mientras tanto: si una transición rearmó un movimiento
+        durante la carga, lo leído de la BD es más viejo y se descarta.
+        """
+        self._rearmados = set()
+        try:
+            movimientos = await run_in_threadpool(_movimientos_activos, list(self.limites))
+        finally:
+            rearmados, self._rearmados = self._rearmados, None
+        for movimiento in movimientos:
+            if movimiento.id not in rearmados:
+                self.rearmar(movimiento)
+
+    def pendientes(self) -> int:
+        return len(self._armados)
+
+    # ----------------------------------------
+    # Tarea de fondo
+    # ----------------------------------------
+
+    def _asegurar_tarea(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # sin loop (carga inicial): arranca con el primer rearmar asíncrono
+        if self._tarea is None or self._tarea.done() or self._tarea.get_loop() is not loop:
+            self._cambio = asyncio.Event()
+            self._tarea = loop.create_task(self._vigilar())
+
+    async def _vigilar(self):
+        while self._heap:
+            vence, movimiento_id = self._heap[0]
+            espera = (vence - datetime.now()).total_seconds()
+            if espera > 0:
+                self._cambio.clear()
+                try:
+                    await asyncio.wait_for(self._cambio.wait(), timeout=espera)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            armado = self._armados.get(movimiento_id)
+            if armado is None or armado[1] != vence:
+                continue  # el movimiento cambió de etapa o se rearmó
+            del self._armados[movimiento_id]
+            try:
+                await self._alertar(movimiento_id, armado[0])
+            except Exception as error:
+                print(f"Error enviando alerta SLA del movimiento {movimiento_id}: {error}")
+
+    async def _alertar(self, movimiento_id: int, estado: EstadoMovimiento):
+        movimiento, destinatarios = await run_in_threadpool(_datos_alerta, movimiento_id, estado)
+        if movimiento is None or movimiento.estado != estado:
+            return
+        desde = hora_local(getattr(movimiento, HORA_DE_ESTADO[estado]))
+        minutos = int((datetime.now() - desde).total_seconds() // 60)
+        mensaje = Mensaje(
+            "alerta_sla",
+            movimiento_id=movimiento_id,
+            estado=estado.value,
+            minutos=minutos,
+            placa=movimiento.camion.placa if movimiento.camion else "?",
+            rampa=movimiento.rampa.numero if movimiento.rampa else None,
+        )
+        for usuario_id in destinatarios:
+            await self.conexiones.send_to_user(usuario_id, mensaje)
+        self.alertas += 1
+
+
+def _movimientos_activos(estados: list):
+    db = SessionLocal()
+    try:
+        return db.query(Movimiento).filter(Movimiento.estado.in_(estados)).all()
+    finally:
+        db.close()
+
+
+def _datos_alerta(movimiento_id: int, estado: EstadoMovimiento):
+    """
+    Reclama la alerta del movimiento en esa etapa y, si este proceso la ganó,
+    devuelve el movimiento y los usuarios de los roles de alerta de su sitio
+    """
+    db = SessionLocal()
+    try:
+        reclamada = db.execute(
+            update(Movimiento)
+            .where(
+                Movimiento.id == movimiento_id,
+                Movimiento.estado == estado,
+                or_(Movimiento.alerta_sla.is_(None), Movimiento.alerta_sla != estado),
+            )
+            # Marcar la alerta no es un cambio del movimiento: updated_at queda igual
+            .values(alerta_sla=estado, updated_at=Movimiento.updated_at)
+        ).rowcount
+        db.commit()
+        if not reclamada:
+            return None, []  # la envió otro proceso, o el movimiento ya cambió de etapa
+        movimiento = db.query(Movimiento).options(
+            joinedload(Movimiento.camion), joinedload(Movimiento.rampa)
+        ).filter(Movimiento.id == movimiento_id).first()
+        if movimiento is None:
+            return None, []
+        destinatarios = [
+            usuario_id for (usuario_id,) in
+            db.query(Usuario.id).filter(
+                Usuario.sitio_id == movimiento.sitio_id,
+                Usuario.rol.in_(ROLES_ALERTA),
+                Usuario.activo == True
+            )
+        ]
+        return movimiento, destinatarios
+    finally:
+        db.close()
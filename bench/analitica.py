@@ -0,0 +1,182 @@
+"""
+Analítica a escala - Control de Patio
+Mide /api/analytics/ocupacion y /api/analytics/estadias (backend/analitica.py)
+sobre el patio "grande" de bench/rutas.py: 1000 rampas y 1.000.000 de
+movimientos repartidos en ~125 días. Por cada cálculo reporta:
+
+    carga       lectura columnar (una consulta, arreglos NumPy)
+    calculo     intervalos, heatmap e histogramas
+    total       p50 de --repeticiones llamadas a la función completa
+
+y lo compara con el mismo cálculo fila por fila en Python (objetos de la
+consulta y bucles, como obtener_estadisticas); los resultados tienen que
+coincidir. Sale con código 1 si no coinciden.
+
+Usa la misma BD que rutas.py para ese tamaño (BENCH_DATABASE_URL o un SQLite
+temporal) y la siembra solo si no está sembrada.
+
+    python bench/analitica.py
+    python bench/analitica.py --tamano mediano --sin-referencia
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import rutas
+
+BACKEND = rutas.BACKEND
+
+
+def _medir(funcion, repeticiones: int):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, statistics.median(tiempos) * 1000
+
+
+# ========================================
+# REFERENCIA FILA POR FILA
+# ========================================
+
+def ocupacion_por_filas(db, sitio_id: int, dias: int, ahora: datetime) -> list:
+    """Rampas ocupadas en promedio (7 x 24) partiendo cada estadía hora por hora"""
+    import analitica
+    from models import Movimiento
+
+    hasta = ahora.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    desde = hasta - timedelta(days=dias)
+    filas = db.query(Movimiento.hora_en_rampa, Movimiento.hora_salida_rampa, Movimiento.hora_salida_cd).filter(
+        Movimiento.sitio_id == sitio_id, Movimiento.hora_ingreso_garita >= desde - analitica.MARGEN,
+        Movimiento.hora_ingreso_garita < ahora
+    ).all()
+
+    ocupado = defaultdict(float)  # (día, hora) -> segundos-rampa
+    for en_rampa, salida_rampa, salida_cd in filas:
+        fin = min(salida_rampa or salida_cd or ahora, ahora)
+        if en_rampa is None or fin <= en_rampa:
+            continue
+        inicio, fin = max(en_rampa, desde), min(fin, hasta)
+        while inicio < fin:
+            corte = min(fin, inicio.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1))
+            ocupado[(inicio.weekday(), inicio.hour)] += (corte - inicio).total_seconds()
+            inicio = corte
+
+    veces = defaultdict(int)
+    hora = desde
+    while hora < hasta:
+        veces[(hora.weekday(), hora.hour)] += 1
+        hora += timedelta(hours=1)
+    return [[ocupado[(d, h)] / (3600 * max(veces[(d, h)], 1)) for h in range(24)] for d in range(7)]
+
+
+def estadias_por_filas(db, sitio_id: int, dias: int, ahora: datetime) -> dict:
+    """Percentiles por tramo y tipo ordenando listas de Python"""
+    import analitica
+    from models import Camion, Movimiento
+
+    desde = ahora - timedelta(days=dias)
+    columnas = sorted({c for par in analitica.TRAMOS.values() for c in par})
+    filas = db.query(Camion.tipo, *[getattr(Movimiento, c) for c in columnas]).join(
+        Camion, Movimiento.camion_id == Camion.id
+    ).filter(
+        Movimiento.sitio_id == sitio_id, Movimiento.hora_ingreso_garita >= desde, Movimiento.hora_ingreso_garita < ahora
+    ).all()
+
+    valores = defaultdict(list)
+    for fila in filas:
+        horas = dict(zip(columnas, fila[1:]))
+        for tramo, (inicio, fin) in analitica.TRAMOS.items():
+            if horas[inicio] is not None and horas[fin] is not None and horas[fin] >= horas[inicio]:
+                valores[(tramo, fila[0].value)].append((horas[fin] - horas[inicio]).total_seconds() / 60)
+    return {clave: (len(lista), statistics.median(lista)) for clave, lista in valores.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamano", default="grande", choices=list(rutas.TAMANOS))
+    parser.add_argument("--dias", type=int, default=130, help="Ventana (la siembra grande ocupa ~125 días)")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--sin-referencia", action="store_true", help="No correr el cálculo fila por fila")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = rutas._url_bd(args.tamano)
+    sys.path.insert(0, BACKEND)
+    os.chdir(BACKEND)
+    import numpy as np
+    import analitica
+    from database import SessionLocal
+    from models import SITIO_POR_DEFECTO
+
+    n_rampas, n_movimientos = rutas.TAMANOS[args.tamano]
+    datos = rutas._siembra_existente(n_rampas, n_movimientos)
+    if datos is None:
+        print(f"Sembrando {n_rampas} rampas y {n_movimientos:,} movimientos...")
+        inicio = time.perf_counter()
+        datos = rutas._sembrar(n_rampas, n_movimientos)
+        print(f"  siembra {time.perf_counter() - inicio:.1f} s")
+    rutas._limpiar(datos)
+
+    sitio = SITIO_POR_DEFECTO
+    fallas = []
+    db = SessionLocal()
+    try:
+        desde = datetime.now() - timedelta(days=args.dias)
+        nombres = sorted({c for par in analitica.TRAMOS.values() for c in par})
+        columnas, carga_ms = _medir(lambda: analitica.columnas(db, sitio, desde, ["camion_id", *nombres]), args.repeticiones)
+        filas = len(columnas["camion_id"])
+        print(f"{filas:,} movimientos en la ventana de {args.dias} días")
+        print(f"  carga columnar          {carga_ms:8.1f} ms  ({carga_ms * 1e6 / max(filas, 1):.0f} ns por fila)")
+
+        inicio = columnas["hora_en_rampa"]
+        fin = np.where(np.isnan(columnas["hora_salida_rampa"]), columnas["hora_salida_cd"], columnas["hora_salida_rampa"])
+        validos = ~np.isnan(inicio) & ~np.isnan(fin) & (fin > inicio)
+        _, calculo_ms = _medir(
+            lambda: analitica.segundos_rampa_por_hora(inicio[validos], fin[validos], np.nanmin(inicio), args.dias * 24),
+            args.repeticiones,
+        )
+        print(f"  intervalos por hora     {calculo_ms:8.1f} ms")
+
+        # Mismo fin de ventana en todas las llamadas: las estadías abiertas no crecen entre una y otra
+        ahora = datetime.now()
+        ocupacion, ocupacion_ms = _medir(lambda: analitica.ocupacion(db, sitio, args.dias, hasta=ahora), args.repeticiones)
+        estadias, estadias_ms = _medir(lambda: analitica.estadias(db, sitio, args.dias, hasta=ahora), args.repeticiones)
+        print(f"  ocupacion (total)       {ocupacion_ms:8.1f} ms")
+        print(f"  estadias (total)        {estadias_ms:8.1f} ms")
+
+        if not args.sin_referencia:
+            inicio_ref = time.perf_counter()
+            referencia = ocupacion_por_filas(db, sitio, args.dias, ahora)
+            ocupacion_ref_ms = (time.perf_counter() - inicio_ref) * 1000
+            inicio_ref = time.perf_counter()
+            referencia_estadias = estadias_por_filas(db, sitio, args.dias, ahora)
+            estadias_ref_ms = (time.perf_counter() - inicio_ref) * 1000
+            print(f"  fila por fila: ocupacion {ocupacion_ref_ms:8.1f} ms ({ocupacion_ref_ms / ocupacion_ms:.0f}x), "
+                  f"estadias {estadias_ref_ms:8.1f} ms ({estadias_ref_ms / estadias_ms:.0f}x)")
+
+            # La referencia no redondea (3 decimales en la respuesta)
+            if not np.allclose(np.array(ocupacion["ocupacion"]), np.array(referencia), atol=2e-3):
+                diferencia = np.abs(np.array(ocupacion["ocupacion"]) - np.array(referencia)).max()
+                fallas.append(f"la ocupación no coincide con el cálculo fila por fila (hasta {diferencia:.3f} rampas)")
+            for (tramo, tipo), (n, mediana) in referencia_estadias.items():
+                obtenido = estadias["tramos"][tramo][tipo]
+                if obtenido["n"] != n or abs(obtenido["percentiles"]["p50"] - mediana) > 0.01:
+                    fallas.append(f"estadías {tramo}/{tipo}: n {obtenido['n']} vs {n}, "
+                                  f"p50 {obtenido['percentiles']['p50']} vs {round(mediana, 2)}")
+    finally:
+        db.close()
+
+    if fallas:
+        for falla in fallas:
+            print(f"FALLA: {falla}")
+        sys.exit(1)
+    print("OK" + ("" if args.sin_referencia else ": coincide con el cálculo fila por fila"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Arranque en frío - Control de Patio
+Mide, en procesos nuevos, cuánto tarda la app desde el import hasta la
+primera respuesta (GET /api/rampas), comparando:
+
+    antes   el esquema se aplicaba al importar main.py (create_all + inspección)
+    ahora   el esquema se migra aparte; el import no toca la BD y el pool se
+            calienta en segundo plano
+
+Usa DATABASE_URL (por defecto un SQLite temporal). Con Postgres remoto la
+diferencia es mayor: la inspección del esquema son varias idas y vueltas por tabla.
+
+    python bench/arranque.py [--repeticiones 7]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/patio_arranque.db")
+
+
+def _hijo(modo: str):
+    sys.path.insert(0, BACKEND)
+    os.chdir(BACKEND)
+    inicio = time.perf_counter()
+    if modo == "antes":
+        from database import crear_esquema
+        crear_esquema()
+    import main
+    importado = time.perf_counter()
+
+    from fastapi.testclient import TestClient
+    from models import SITIO_POR_DEFECTO, RolUsuario
+    from sesiones import sesiones
+    # Token firmado en memoria (microsegundos): el login con PBKDF2 no es parte del arranque
+    token = sesiones.emitir(1, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+    with TestClient(main.app, headers={"Authorization": f"Bearer {token}"}) as cliente:
+        respuesta = cliente.get("/api/rampas")
+        primera = time.perf_counter()
+        respuesta.raise_for_status()
+        segunda_inicio = time.perf_counter()
+        cliente.get("/api/rampas")
+        segunda = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (importado - inicio) * 1000,
+        "primera_respuesta_ms": (primera - inicio) * 1000,
+        "segunda_request_ms": (segunda - segunda_inicio) * 1000,
+    }))
+
+
+def _medir(modo: str, repeticiones: int) -> dict:
+    muestras = []
+    for _ in range(repeticiones):
+        salida = subprocess.run(
+            [sys.executable, __file__, "--hijo", modo],
+            check=True, capture_output=True, text=True
+        ).stdout
+        muestras.append(json.loads(salida.strip().splitlines()[-1]))
+    return {clave: statistics.median(m[clave] for m in muestras) for clave in muestras[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=7)
+    parser.add_argument("--hijo", choices=("antes", "ahora"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.hijo:
+        _hijo(args.hijo)
+        return
+
+    # La BD tiene que estar migrada en los dos casos
+    subprocess.run([sys.executable, "mantenimiento.py", "migrar"], cwd=BACKEND, check=True, capture_output=True)
+
+    print(f"Mediana de {args.repeticiones} procesos ({os.environ['DATABASE_URL'].split('://')[0]}):")
+    print(f"  {'modo':6s} {'import':>10s} {'1ª respuesta':>13s} {'2ª request':>11s}")
+    for modo in ("antes", "ahora"):
+        r = _medir(modo, args.repeticiones)
+        print(f"  {modo:6s} {r['import_ms']:8.1f} ms {r['primera_respuesta_ms']:10.1f} ms "
+              f"{r['segunda_request_ms']:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Costo de la autorización - Control de Patio
+Mide lo que agrega la sesión (backend/sesiones.py) a cada request sobre el
+patio "chico" de bench/rutas.py, llamando a la app en proceso
+(httpx.ASGITransport):
+
+    verificar       firma HMAC, vencimiento y revocaciones de un token (µs)
+    usuario en BD   lo que costaría en cambio buscar al usuario en cada request
+    request         GET /api/auth/sesion con token: latencia y consultas SQL
+    login           PBKDF2 del PIN (una vez por turno, no por request)
+
+y comprueba que la autorización rechaza lo que tiene que rechazar:
+
+    - sin token, token adulterado o vencido: 401
+    - token tras el logout, o emitido antes de cambiar el PIN: 401
+    - chofer en una ruta de gestión o en las notificaciones de otro: 403
+    - chofer asignando una rampa, pidiendo un reporte, buscando usuarios o
+      confirmando el movimiento del camión de otro chofer: 403
+    - handshake de /ws/{user_id} con el token de otro usuario: cerrado (1008)
+    - MAX_INTENTOS logins fallidos seguidos: 429, aun con el PIN correcto,
+      pero solo desde esa IP; MAX_INTENTOS_IP con códigos distintos: 429 a la IP
+
+Sale con código 1 si algún caso no da lo esperado o si la request con token
+hace alguna consulta.
+
+    python bench/autorizacion.py
+    python bench/autorizacion.py --iteraciones 200000 --repeticiones 500
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import rutas
+from contador_sql import ContadorConsultas
+
+BACKEND = rutas.BACKEND
+PIN_NUEVO = "5678"
+
+
+def _por_llamada(funcion, iteraciones: int) -> float:
+    """µs por llamada (mediana de 5 tandas)"""
+    tandas = []
+    for _ in range(5):
+        inicio = time.perf_counter()
+        for _ in range(iteraciones // 5):
+            funcion()
+        tandas.append((time.perf_counter() - inicio) / (iteraciones // 5) * 1e6)
+    return statistics.median(tandas)
+
+
+async def _latencia(cliente, url: str, repeticiones: int, contador: ContadorConsultas):
+    """p50 en ms y máximo de consultas por llamada"""
+    tiempos, consultas = [], 0
+    for _ in range(repeticiones):
+        contador.reiniciar()
+        inicio = time.perf_counter()
+        respuesta = await cliente.get(url)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        respuesta.raise_for_status()
+        consultas = max(consultas, contador.total)
+    return statistics.median(tiempos), consultas
+
+
+async def ejecutar(args, datos: dict) -> dict:
+    import httpx
+    import main
+    from database import engine
+    from models import SITIO_POR_DEFECTO, RolUsuario
+    from sesiones import MAX_INTENTOS, MAX_INTENTOS_IP, Sesiones, sesiones
+
+    chofer_id = datos["chofer_activo"]
+    otro_chofer_id = chofer_id - 1
+    codigo_chofer = f"C{chofer_id - 4:05d}"  # choferes desde el ID 4, C00000 en adelante
+    admin = sesiones.emitir(rutas.ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+    fallas = []
+
+    def cliente(token=None, ip="127.0.0.1"):
+        cabeceras = {"Authorization": f"Bearer {token}"} if token else {}
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app, client=(ip, 50000)),
+                                 base_url="http://bench", headers=cabeceras)
+
+    async def esperar(descripcion, estado, metodo, url, token=None, ip="127.0.0.1", **kwargs):
+        async with cliente(token, ip) as c:
+            respuesta = await c.request(metodo, url, **kwargs)
+        if respuesta.status_code != estado:
+            fallas.append(f"{descripcion}: {respuesta.status_code} (se esperaba {estado}) {respuesta.text[:120]}")
+        return respuesta
+
+    resultado = {}
+    with ContadorConsultas(engine) as contador:
+        async with cliente(admin) as c:
+            await c.get("/api/auth/sesion")  # calentamiento
+            resultado["request_ms"], resultado["request_consultas"] = await _latencia(
+                c, "/api/auth/sesion", args.repeticiones, contador
+            )
+
+        # Login: PBKDF2 del PIN
+        tiempos = []
+        for _ in range(max(3, args.repeticiones // 50)):
+            inicio = time.perf_counter()
+            respuesta = await esperar("login del chofer", 200, "POST", "/api/auth/login",
+                                      json={"codigo": codigo_chofer, "pin": rutas.PIN})
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        resultado["login_ms"] = statistics.median(tiempos)
+        chofer = respuesta.json().get("token")
+        if not chofer:
+            fallas.append(f"login del chofer {codigo_chofer}: {respuesta.json().get('mensaje')}")
+            return {**resultado, "fallas": fallas}
+
+    # Rechazos
+    carga, firma = admin.split(".")
+    adulterado = carga[:-2] + ("A" if carga[-2] != "A" else "B") + carga[-1] + "." + firma
+    vencido = Sesiones(secreto=sesiones.secreto, duracion_s=-1).emitir(rutas.ADMIN_ID, RolUsuario.ADMIN,
+                                                                      SITIO_POR_DEFECTO)
+    await esperar("sin token", 401, "GET", "/api/rampas/resumen")
+    await esperar("token adulterado", 401, "GET", "/api/rampas/resumen", adulterado)
+    await esperar("token con otra clave", 401, "GET", "/api/rampas/resumen",
+                  Sesiones(secreto=b"otra").emitir(rutas.ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO))
+    await esperar("token vencido", 401, "GET", "/api/rampas/resumen", vencido)
+    await esperar("chofer en su movimiento activo", 200, "GET", f"/api/chofer/{chofer_id}/movimiento-activo",
+                  chofer)
+    await esperar("chofer en el movimiento de otro", 403, "GET",
+                  f"/api/chofer/{otro_chofer_id}/movimiento-activo", chofer)
+    await esperar("chofer en las notificaciones de otro", 403, "GET", f"/api/notificaciones/{otro_chofer_id}",
+                  chofer)
+    await esperar("chofer creando una rampa", 403, "POST", "/api/rampas", chofer,
+                  json={"numero": 999_999, "nombre": "No debería"})
+    await esperar("chofer asignando una rampa", 403, "POST", "/api/movimientos/asignar", chofer,
+                  json={"movimiento_id": datos["movimiento_activo"], "rampa_id": 1})
+    await esperar("chofer pidiendo un reporte", 403, "POST", "/api/reportes", chofer,
+                  json={"tipo": "diario", "fecha": datos["fecha"], "formato": "csv"})
+    await esperar("chofer buscando usuarios", 403, "GET", "/api/buscar?q=C0", chofer)
+    await esperar("chofer confirmando el movimiento de otro", 403, "POST",
+                  f"/api/movimientos/{datos['movimiento_activo'] - 1}/confirmar-chofer", chofer)
+
+    # Logout: el mismo token deja de valer
+    de_logout = sesiones.emitir(rutas.ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+    await esperar("logout", 200, "POST", "/api/auth/logout", de_logout)
+    await esperar("token tras el logout", 401, "GET", "/api/auth/sesion", de_logout)
+
+    # Cambio de PIN: las sesiones abiertas del chofer se cierran, el PIN nuevo entra
+    await esperar("cambio de PIN", 200, "PUT", f"/api/usuarios/{chofer_id}", admin, json={"pin": PIN_NUEVO})
+    await esperar("token de antes del cambio de PIN", 401, "GET", "/api/auth/sesion", chofer)
+    respuesta = await esperar("login con el PIN nuevo", 200, "POST", "/api/auth/login",
+                              json={"codigo": codigo_chofer, "pin": PIN_NUEVO})
+    nuevo = respuesta.json().get("token")
+    if not nuevo:
+        fallas.append("login con el PIN nuevo rechazado")
+    else:
+        await esperar("token del PIN nuevo", 200, "GET", "/api/auth/sesion", nuevo)
+    await esperar("PIN original", 200, "PUT", f"/api/usuarios/{chofer_id}", admin, json={"pin": rutas.PIN})
+
+    # Bloqueo por intentos fallidos (el código del admin sembrado, que no vuelve a entrar)
+    for _ in range(MAX_INTENTOS):
+        await esperar("login con PIN incorrecto", 200, "POST", "/api/auth/login",
+                      json={"codigo": "A0001", "pin": "0000"})
+    await esperar("login bloqueado", 429, "POST", "/api/auth/login", json={"codigo": "A0001", "pin": rutas.PIN})
+    respuesta = await esperar("login desde otra IP", 200, "POST", "/api/auth/login", ip="10.0.0.2",
+                              json={"codigo": "A0001", "pin": rutas.PIN})
+    if respuesta.status_code == 200 and not respuesta.json().get("success"):
+        fallas.append("el bloqueo de un código desde una IP también lo bloqueó desde otra")
+    # Una IP probando muchos códigos: la bloquea el límite por IP
+    for n in range(MAX_INTENTOS_IP):
+        await esperar("login con otro código", 200, "POST", "/api/auth/login", ip="10.0.0.3",
+                      json={"codigo": f"X{n:05d}", "pin": "0000"})
+    await esperar("IP bloqueada", 429, "POST", "/api/auth/login", ip="10.0.0.3",
+                  json={"codigo": "A0001", "pin": rutas.PIN})
+
+    resultado["fallas"] = fallas
+    resultado["chofer_id"] = chofer_id
+    resultado["otro_chofer_id"] = otro_chofer_id
+    return resultado
+
+
+def _handshake_ajeno(chofer_id: int, otro_chofer_id: int) -> str:
+    """Motivo si /ws/{otro} acepta el token de un chofer, o None"""
+    from starlette.testclient import TestClient
+    from starlette.websockets import WebSocketDisconnect
+    import main
+    from models import SITIO_POR_DEFECTO, RolUsuario
+    from sesiones import sesiones
+
+    token = sesiones.emitir(chofer_id, RolUsuario.CHOFER, SITIO_POR_DEFECTO)
+    # Sin "with": no hace falta el ciclo de vida de la app para un handshake rechazado
+    cliente = TestClient(main.app)
+    try:
+        with cliente.websocket_connect(f"/ws/{otro_chofer_id}", headers={"Authorization": f"Bearer {token}"}):
+            return "el socket de otro usuario aceptó el token"
+    except WebSocketDisconnect as cierre:
+        return None if cierre.code == 1008 else f"cerrado con {cierre.code} (se esperaba 1008)"
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iteraciones", type=int, default=100_000, help="Llamadas para medir verificar()")
+    parser.add_argument("--repeticiones", type=int, default=200, help="Requests para la latencia")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = rutas._url_bd("chico")
+    sys.path.insert(0, BACKEND)
+    os.chdir(BACKEND)
+    from database import SessionLocal
+    from models import SITIO_POR_DEFECTO, RolUsuario, Usuario
+    from sesiones import sesiones
+
+    n_rampas, n_movimientos = rutas.TAMANOS["chico"]
+    datos = rutas._siembra_existente(n_rampas, n_movimientos)
+    if datos is None:
+        print(f"Sembrando {n_rampas} rampas y {n_movimientos:,} movimientos...")
+        datos = rutas._sembrar(n_rampas, n_movimientos)
+    rutas._limpiar(datos)
+
+    token = sesiones.emitir(rutas.ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+    verificar_us = _por_llamada(lambda: sesiones.verificar(token), args.iteraciones)
+    emitir_us = _por_llamada(lambda: sesiones.emitir(rutas.ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO),
+                             args.iteraciones // 10)
+
+    def usuario_en_bd():
+        db = SessionLocal()
+        try:
+            db.get(Usuario, rutas.ADMIN_ID)
+        finally:
+            db.close()
+    bd_us = _por_llamada(usuario_en_bd, max(5, args.iteraciones // 100))
+
+    try:
+        r = asyncio.run(ejecutar(args, datos))
+        if "chofer_id" in r:
+            motivo = _handshake_ajeno(r["chofer_id"], r["otro_chofer_id"])
+            if motivo:
+                r["fallas"].append(f"handshake ajeno: {motivo}")
+    finally:
+        rutas._limpiar(datos)
+
+    print(f"verificar token         {verificar_us:8.2f} µs por request")
+    print(f"emitir token            {emitir_us:8.2f} µs por login")
+    print(f"usuario en la BD        {bd_us:8.2f} µs por request ({bd_us / verificar_us:.0f}x verificar)")
+    if "request_ms" in r:
+        print(f"GET /api/auth/sesion    {r['request_ms'] * 1000:8.0f} µs p50, {r['request_consultas']} consultas")
+        if r["request_consultas"]:
+            r["fallas"].append(f"la request con token hizo {r['request_consultas']} consultas")
+    if "login_ms" in r:
+        print(f"login (PBKDF2)          {r['login_ms'] * 1000:8.0f} µs p50")
+    print(f"sesiones: {sesiones.estadisticas()}")
+
+    if r["fallas"]:
+        for falla in r["fallas"]:
+            print(f"FALLA: {falla}")
+        sys.exit(1)
+    print("OK: rechazos, revocaciones y bloqueo como se esperaba")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,105 @@
+"""
+Microbenchmark de mensajes WebSocket - Control de Patio
+1. Costo de un broadcast a N sockets: json.dumps por destinatario (antes)
+   contra un Mensaje codificado una vez y compartido (ahora).
+2. Bytes por mensaje en formato completo y compacto, sin comprimir y con
+   permessage-deflate (zlib raw con contexto compartido, como RFC 7692).
+
+Uso:
+    python bench/bench_mensajes.py [--destinatarios 200] [--mensajes 2000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from mensajes import Mensaje, COMPLETO, COMPACTO  # noqa: E402
+
+
+def _turno_chofer(n: int):
+    """Lo que recibe el teléfono de un chofer: pings y sus avisos"""
+    mensajes = []
+    for i in range(n):
+        movimiento_id = 10_000 + i // 3
+        if i % 3 == 0:
+            mensajes.append(Mensaje("asignacion_rampa", movimiento_id=movimiento_id,
+                                    rampa=random.randint(1, 40), notificacion_id=50_000 + i))
+        elif i % 3 == 1:
+            mensajes.append(Mensaje("carga_lista", movimiento_id=movimiento_id, notificacion_id=50_000 + i))
+        else:
+            mensajes.append(Mensaje("ping"))
+    return mensajes
+
+
+def _turno_logistica(n: int):
+    """Lo que recibe un tablero de logística: todo el ciclo de cada camión"""
+    ciclo = [
+        lambda m: Mensaje("nuevo_ingreso", movimiento_id=m, placa=f"A{m:06d}"),
+        lambda m: Mensaje("camion_disponible", movimiento_id=m),
+        lambda m: Mensaje("solicitud_camion", movimiento_id=m, prioridad="normal"),
+        lambda m: Mensaje("chofer_confirmo", movimiento_id=m),
+        lambda m: Mensaje("camion_en_rampa", movimiento_id=m),
+        lambda m: Mensaje("rampa_liberada", movimiento_id=m, rampa_id=random.randint(1, 40)),
+    ]
+    return [ciclo[i % len(ciclo)](10_000 + i // len(ciclo)) for i in range(n)]
+
+
+def _bytes(mensajes, formato: str):
+    crudo = 0
+    comprimido = 0
+    # Un compresor por conexión con contexto compartido entre mensajes
+    compresor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -zlib.MAX_WBITS)
+    for mensaje in mensajes:
+        datos = mensaje.codificar(formato).encode()
+        crudo += len(datos)
+        bloque = compresor.compress(datos) + compresor.flush(zlib.Z_SYNC_FLUSH)
+        comprimido += len(bloque) - 4  # RFC 7692: se quita el 00 00 ff ff final
+    return crudo / len(mensajes), comprimido / len(mensajes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destinatarios", type=int, default=200)
+    parser.add_argument("--mensajes", type=int, default=2000)
+    parser.add_argument("--repeticiones", type=int, default=2000)
+    args = parser.parse_args()
+    random.seed(1)
+
+    # 1. Broadcast
+    ejemplo = Mensaje("nuevo_ingreso", movimiento_id=123456, placa="A123456")
+    como_dict = ejemplo.como_dict()
+
+    def antes():
+        for _ in range(args.destinatarios):
+            json.dumps(como_dict, ensure_ascii=False, separators=(",", ":"))
+
+    def ahora():
+        mensaje = Mensaje("nuevo_ingreso", movimiento_id=123456, placa="A123456")
+        for _ in range(args.destinatarios):
+            mensaje.codificar(COMPLETO)
+
+    t_antes = min(timeit.repeat(antes, number=args.repeticiones // 10, repeat=5)) / (args.repeticiones // 10)
+    t_ahora = min(timeit.repeat(ahora, number=args.repeticiones // 10, repeat=5)) / (args.repeticiones // 10)
+    print(f"Broadcast a {args.destinatarios} sockets (solo codificación):")
+    print(f"  json por destinatario  {t_antes * 1e6:9.1f} µs")
+    print(f"  codificado una vez     {t_ahora * 1e6:9.1f} µs   ({t_antes / t_ahora:.0f}x)")
+
+    # 2. Tamaño
+    print(f"\nBytes promedio por mensaje ({args.mensajes} mensajes por conexión):")
+    print(f"  {'conexión':12s} {'formato':9s} {'crudo':>7s} {'deflate':>8s}")
+    for nombre, mensajes in (("chofer", _turno_chofer(args.mensajes)), ("logística", _turno_logistica(args.mensajes))):
+        base = None
+        for formato in (COMPLETO, COMPACTO):
+            crudo, comprimido = _bytes(mensajes, formato)
+            base = base or crudo
+            print(f"  {nombre:12s} {formato:9s} {crudo:7.1f} {comprimido:8.1f}   "
+                  f"({comprimido / base:.0%} del completo sin comprimir)")
+
+
+if __name__ == "__main__":
+    main()
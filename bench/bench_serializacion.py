@@ -0,0 +1,139 @@
+"""
+Microbenchmark de serialización - Control de Patio
+Compara el camino anterior (model_validate sobre objetos ORM + validación del
+response_model) contra el camino rápido de tuplas de una cola de 500 movimientos,
+y el tamaño del payload completo contra las vistas compactas por rol.
+
+Uso:
+    python bench/bench_serializacion.py [--movimientos 500] [--repeticiones 50]
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from models import EstadoMovimiento, EstadoRampa, Prioridad, RolUsuario, TipoCamion  # noqa: E402
+from schemas import ColaCamiones, MovimientoCompleto  # noqa: E402
+from serializacion import (  # noqa: E402
+    COLUMNAS_MOVIMIENTO, COMPLETA, VISTAS,
+    fila_a_movimiento, recortar, codificar
+)
+
+ESTADOS = [
+    EstadoMovimiento.DISPONIBLE_PATIO,
+    EstadoMovimiento.SOLICITADO,
+    EstadoMovimiento.ASIGNADO_EN_CAMINO,
+]
+
+
+def _datos_sinteticos(n: int):
+    """Genera n movimientos como dicts planos (uno por tabla)"""
+    base = datetime(2024, 1, 1, 6, 0)
+    datos = []
+    for i in range(n):
+        chofer = dict(
+            codigo=f"CHO{i:04d}", nombre=f"Chofer {i}", rol=RolUsuario.CHOFER,
+            telefono="809-555-0000", id=1000 + i, activo=True, created_at=base
+        )
+        camion = dict(
+            placa=f"A{i:06d}", tipo=TipoCamion.SECO, capacidad="10 ton",
+            id=i + 1, chofer_id=chofer["id"], activo=True, created_at=base
+        )
+        rampa = dict(
+            numero=i % 20 + 1, nombre=f"Rampa {i % 20 + 1}", tipo_permitido=None,
+            id=i % 20 + 1, estado=EstadoRampa.LIBRE, activo=True, created_at=base
+        )
+        hora = base + timedelta(minutes=i)
+        movimiento = {c: None for c in COLUMNAS_MOVIMIENTO}
+        movimiento.update(
+            id=i + 1, camion_id=camion["id"], rampa_id=rampa["id"],
+            estado=ESTADOS[i % 3], prioridad=Prioridad.NORMAL,
+            hora_ingreso_garita=hora, hora_disponible_patio=hora,
+            hora_solicitado=hora, hora_asignado=hora,
+            notas="Carga de prueba", created_at=hora, updated_at=hora
+        )
+        datos.append((movimiento, camion, chofer, rampa))
+    return datos
+
+
+def _como_orm(datos):
+    objetos = []
+    for movimiento, camion, chofer, rampa in datos:
+        obj_camion = SimpleNamespace(**camion, chofer=SimpleNamespace(**chofer))
+        objetos.append(SimpleNamespace(
+            **movimiento, camion=obj_camion, rampa=SimpleNamespace(**rampa), asignado_por=None
+        ))
+    return objetos
+
+
+def _como_filas(datos, seleccion=COMPLETA):
+    """Filas con la misma forma que devuelve consulta_movimientos para la selección"""
+    filas = []
+    for movimiento, camion, chofer, rampa in datos:
+        tablas = {"": movimiento, "camion": camion, "camion.chofer": chofer, "rampa": rampa}
+        fila = ()
+        for ruta, nombres in seleccion.bloques.items():
+            tabla = tablas.get(ruta, {})
+            fila += tuple(tabla.get(c) for c in nombres)
+        filas.append(fila)
+    return filas
+
+
+def camino_anterior(objetos, adaptador):
+    cola = ColaCamiones(
+        disponibles=[MovimientoCompleto.model_validate(m) for m in objetos if m.estado == ESTADOS[0]],
+        solicitados=[MovimientoCompleto.model_validate(m) for m in objetos if m.estado == ESTADOS[1]],
+        en_camino=[MovimientoCompleto.model_validate(m) for m in objetos if m.estado == ESTADOS[2]],
+    )
+    # Lo que hace FastAPI con el response_model: validar de nuevo y codificar
+    validado = adaptador.validate_python(jsonable_encoder(cola))
+    return adaptador.dump_json(validado)
+
+
+def camino_rapido(filas, seleccion=COMPLETA):
+    resultado = {"disponibles": [], "solicitados": [], "en_camino": []}
+    nombres = dict(zip(ESTADOS, resultado))
+    interna = seleccion.con_columnas("estado")
+    for fila in filas:
+        movimiento = fila_a_movimiento(fila, interna)
+        resultado[nombres[movimiento["estado"]]].append(recortar(movimiento, seleccion))
+    return codificar(resultado)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--movimientos", type=int, default=500)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    datos = _datos_sinteticos(args.movimientos)
+    objetos = _como_orm(datos)
+    filas = _como_filas(datos)
+    adaptador = TypeAdapter(ColaCamiones)
+
+    t_anterior = min(timeit.repeat(lambda: camino_anterior(objetos, adaptador), number=1, repeat=args.repeticiones))
+    t_rapido = min(timeit.repeat(lambda: camino_rapido(filas), number=1, repeat=args.repeticiones))
+
+    print(f"Cola de {args.movimientos} movimientos (mejor de {args.repeticiones})")
+    print(f"  model_validate + response_model : {t_anterior * 1000:8.2f} ms  ({len(camino_anterior(objetos, adaptador))} bytes)")
+    print(f"  tuplas + JSON precodificado     : {t_rapido * 1000:8.2f} ms  ({len(camino_rapido(filas))} bytes)")
+    print(f"  aceleración                     : {t_anterior / t_rapido:8.1f}x")
+
+    completo = len(camino_rapido(filas))
+    print("Tamaño del payload por vista")
+    print(f"  completo : {completo:8d} bytes  ({sum(len(n) for n in COMPLETA.bloques.values())} columnas)")
+    for nombre, seleccion in VISTAS.items():
+        tamano = len(camino_rapido(_como_filas(datos, seleccion.con_columnas("estado")), seleccion))
+        columnas = sum(len(n) for n in seleccion.bloques.values())
+        print(f"  {nombre:8s} : {tamano:8d} bytes  ({columnas} columnas, {tamano / completo:.0%} del completo)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+"""
+Búsqueda con flotas grandes - Control de Patio
+Siembra un SQLite temporal con --camiones camiones (placas de una letra y seis
+dígitos) y otros tantos choferes con nombre y apellido, y mide
+GET /api/buscar (backend/busqueda.py):
+
+    armado      lectura y armado del índice del sitio (una vez por proceso),
+                y cuánto crece la memoria del proceso
+    búsquedas   p50/p99 por tipo de consulta, llamando al índice en proceso,
+                y p50 de la ruta completa (httpx.ASGITransport, con sesión)
+    rearmado    p99 mientras el índice se rearma en el hilo de fondo (comparte
+                el GIL con el armado: tiene su propio límite)
+    LIKE        un LIKE '%q%' sobre la tabla de camiones, como referencia
+
+Tipos de consulta, sobre placas, códigos y nombres al azar:
+
+    exacta        la placa tal cual                   -> primera
+    prefijo       los 4 primeros caracteres            -> entre los resultados
+    mal leída     un carácter cambiado por otro que se le parece (8/B, 5/S...)
+    transpuesta   dos caracteres vecinos invertidos
+    incompleta    falta un carácter
+    código        código del chofer                    -> primero
+    nombre        apellido con dos letras invertidas   -> alguien con ese apellido
+
+Sale con código 1 si el p99 de algún tipo pasa de --limite-ms (o el de las
+búsquedas durante el rearmado, de --limite-rearmado-ms), si una exacta,
+prefijo o código no aparece donde debe, o si menos del --acierto-min de las
+placas y apellidos con error quedan entre los 5 primeros.
+
+    python bench/busqueda.py
+    python bench/busqueda.py --camiones 200000 --consultas 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import resource
+import threading
+import time
+
+import rutas
+
+BACKEND = rutas.BACKEND
+LETRAS = "ABCDEFGHJKLMNPRSTUVWXYZ"
+PARECIDOS = {"8": "B", "B": "8", "5": "S", "S": "5", "0": "D", "D": "0", "2": "Z", "Z": "2", "1": "7", "7": "1",
+             "6": "G", "G": "6"}
+NOMBRES = ["Pedro", "Carlos", "Miguel", "José", "Juan", "Luis", "Ramón", "Francisco", "Manuel", "Rafael",
+           "Ángel", "Jorge", "Andrés", "Héctor", "Julio", "Félix", "Víctor", "Santiago", "Eduardo", "Wilson"]
+APELLIDOS = ["Rodríguez", "Martínez", "Pérez", "García", "Sánchez", "Fernández", "Gómez", "Díaz", "Reyes",
+             "Jiménez", "Hernández", "Peña", "Castillo", "Núñez", "Vásquez", "Almonte", "Guzmán", "Tavárez",
+             "Batista", "Encarnación", "Mejía", "Rosario", "Santana", "Polanco", "Valdez", "Cabrera"]
+
+
+def _sembrar(n: int, rng: random.Random) -> list:
+    """n choferes con un camión cada uno; devuelve [(placa, código, apellido)]"""
+    from sqlalchemy import insert
+    from database import Base, engine, crear_esquema
+    from models import Camion, RolUsuario, SITIO_POR_DEFECTO, TipoCamion, Usuario
+    from sesiones import hashear_pin
+
+    Base.metadata.drop_all(bind=engine)
+    crear_esquema()
+    pin = hashear_pin(rutas.PIN)
+    placas = set()
+    while len(placas) < n:
+        placas.add(rng.choice(LETRAS) + f"{rng.randrange(1_000_000):06d}")
+    placas = sorted(placas)
+    rng.shuffle(placas)
+    tipos = list(TipoCamion)
+    usuarios, camiones, flota = [], [], []
+    for i, placa in enumerate(placas):
+        apellido = rng.choice(APELLIDOS)
+        codigo = f"CH{i + 1:06d}"
+        usuarios.append(dict(id=i + 2, sitio_id=SITIO_POR_DEFECTO, codigo=codigo, pin=pin, rol=RolUsuario.CHOFER,
+                             nombre=f"{rng.choice(NOMBRES)} {apellido}", activo=True))
+        camiones.append(dict(id=i + 1, sitio_id=SITIO_POR_DEFECTO, placa=placa, tipo=tipos[i % len(tipos)],
+                             chofer_id=i + 2, activo=rng.random() > 0.02))
+        flota.append((placa, codigo, apellido))
+    usuarios.insert(0, dict(id=1, sitio_id=SITIO_POR_DEFECTO, codigo="A0001", pin=pin, rol=RolUsuario.ADMIN,
+                            nombre="Admin bench", activo=True))
+    with engine.begin() as conn:
+        for tabla, filas in ((Usuario.__table__, usuarios), (Camion.__table__, camiones)):
+            for i in range(0, len(filas), rutas.LOTE_SIEMBRA):
+                conn.execute(insert(tabla), filas[i:i + rutas.LOTE_SIEMBRA])
+    return flota
+
+
+def _consultas(flota: list, n: int, rng: random.Random) -> dict:
+    """tipo -> [(consulta, esperado)]"""
+    def mal_leida(placa):
+        posiciones = [i for i, c in enumerate(placa) if c in PARECIDOS]
+        if not posiciones:
+            return None
+        i = rng.choice(posiciones)
+        return placa[:i] + PARECIDOS[placa[i]] + placa[i + 1:]
+
+    def transpuesta(placa):
+        i = rng.randrange(1, len(placa) - 1)
+        if placa[i] == placa[i + 1]:
+            return None
+        return placa[:i] + placa[i + 1] + placa[i] + placa[i + 2:]
+
+    def incompleta(placa):
+        i = rng.randrange(1, len(placa))
+        return placa[:i] + placa[i + 1:]
+
+    def con_error(apellido):
+        i = rng.randrange(1, len(apellido) - 1)
+        return apellido[:i] + apellido[i + 1] + apellido[i] + apellido[i + 2:]
+
+    tipos = {
+        "exacta": lambda f: (f[0], f[0]),
+        "prefijo": lambda f: (f[0][:4], f[0]),
+        "mal leída": lambda f: (mal_leida(f[0]), f[0]),
+        "transpuesta": lambda f: (transpuesta(f[0]), f[0]),
+        "incompleta": lambda f: (incompleta(f[0]), f[0]),
+        "código": lambda f: (f[1], f[1]),
+        "nombre": lambda f: (con_error(f[2]), f[2]),
+    }
+    consultas = {}
+    for tipo, armar in tipos.items():
+        lista = []
+        while len(lista) < n:
+            consulta, esperado = armar(rng.choice(flota))
+            if consulta and consulta != esperado or tipo in ("exacta", "código"):
+                lista.append((consulta, esperado))
+        consultas[tipo] = lista
+    return consultas
+
+
+def _posicion(resultados: list, tipo: str, esperado: str):
+    """Posición (desde 1) del resultado esperado, o None"""
+    from busqueda import normalizar
+    for i, r in enumerate(resultados, 1):
+        if tipo == "nombre":
+            if normalizar(esperado)[0] in normalizar(r["detalle"]):
+                return i
+        elif r["etiqueta"] == esperado:
+            return i
+    return None
+
+
+def _p(tiempos, p):
+    return rutas._percentil(tiempos, p)
+
+
+async def _ruta(consultas: dict, n: int) -> float:
+    """p50 en ms de GET /api/buscar por la app completa"""
+    import httpx
+    import main
+    from models import RolUsuario, SITIO_POR_DEFECTO
+    from sesiones import sesiones
+
+    token = sesiones.emitir(1, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+    tiempos = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench",
+                                 headers={"Authorization": f"Bearer {token}"}) as cliente:
+        for lista in consultas.values():
+            for consulta, _ in lista[:n]:
+                inicio = time.perf_counter()
+                respuesta = await cliente.get("/api/buscar", params={"q": consulta})
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                respuesta.raise_for_status()
+    return statistics.median(tiempos)
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--camiones", type=int, default=50_000, help="Camiones, y otros tantos choferes")
+    parser.add_argument("--consultas", type=int, default=200, help="Consultas por tipo")
+    parser.add_argument("--limite-ms", type=float, default=10, help="p99 máximo por tipo de consulta")
+    parser.add_argument("--limite-rearmado-ms", type=float, default=50,
+                        help="p99 máximo de las búsquedas mientras se rearma el índice")
+    parser.add_argument("--acierto-min", type=float, default=0.9,
+                        help="Fracción mínima de consultas con error resueltas entre los 5 primeros")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.gettempdir()}/patio_busqueda.db"
+    sys.path.insert(0, BACKEND)
+    os.chdir(BACKEND)
+    from sqlalchemy import text
+    from database import engine
+    from models import SITIO_POR_DEFECTO
+    from busqueda import busqueda
+
+    rng = random.Random(7)
+    inicio = time.perf_counter()
+    flota = _sembrar(args.camiones, rng)
+    print(f"{args.camiones:,} camiones y {args.camiones:,} choferes sembrados en {time.perf_counter() - inicio:.1f} s")
+    consultas = _consultas(flota, args.consultas, rng)
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    inicio = time.perf_counter()
+    busqueda.indice(SITIO_POR_DEFECTO)
+    armado_s = time.perf_counter() - inicio
+    rss = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024  # KB en Linux
+    e = busqueda.estadisticas()
+    print(f"  armado del índice       {armado_s * 1000:8.0f} ms  ({e['documentos']:,} documentos, "
+          f"{e['claves']:,} claves, RSS +{rss:.0f} MB)")
+
+    fallas = []
+    print(f"  {'consulta':14s} {'p50 ms':>8s} {'p99 ms':>8s} {'1.º':>6s} {'top 5':>6s} {'top 20':>6s}")
+    for tipo, lista in consultas.items():
+        tiempos, posiciones = [], []
+        for consulta, esperado in lista:
+            t0 = time.perf_counter()
+            resultados = busqueda.buscar(SITIO_POR_DEFECTO, consulta, activo=None)
+            tiempos.append((time.perf_counter() - t0) * 1000)
+            posiciones.append(_posicion(resultados, tipo, esperado))
+        primero = sum(p == 1 for p in posiciones) / len(posiciones)
+        top5 = sum(p is not None and p <= 5 for p in posiciones) / len(posiciones)
+        top20 = sum(p is not None for p in posiciones) / len(posiciones)
+        print(f"  {tipo:14s} {statistics.median(tiempos):8.2f} {_p(tiempos, 99):8.2f} "
+              f"{primero:6.0%} {top5:6.0%} {top20:6.0%}")
+        if _p(tiempos, 99) > args.limite_ms:
+            fallas.append(f"{tipo}: p99 {_p(tiempos, 99):.1f} ms > {args.limite_ms:.0f} ms")
+        if tipo in ("exacta", "código") and primero < 1:
+            fallas.append(f"{tipo}: {1 - primero:.0%} de las consultas sin el esperado primero")
+        elif tipo == "prefijo" and top20 < 1:
+            fallas.append(f"prefijo: {1 - top20:.0%} de las consultas sin la placa entre los resultados")
+        elif tipo not in ("exacta", "código", "prefijo") and top5 < args.acierto_min:
+            fallas.append(f"{tipo}: solo {top5:.0%} entre los 5 primeros (mínimo {args.acierto_min:.0%})")
+
+    ruta_ms = asyncio.run(_ruta(consultas, 20))
+    print(f"  GET /api/buscar (ruta)  {ruta_ms:8.2f} ms p50")
+
+    # Rearmado en el hilo de fondo mientras se sigue buscando en el índice anterior
+    tiempos = []
+    hilo = threading.Thread(target=busqueda._rearmar, args=(SITIO_POR_DEFECTO,))
+    hilo.start()
+    while hilo.is_alive():
+        consulta, _ = rng.choice(consultas["mal leída"])
+        t0 = time.perf_counter()
+        busqueda.buscar(SITIO_POR_DEFECTO, consulta, activo=None)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    hilo.join()
+    if tiempos:
+        print(f"  durante un rearmado     {statistics.median(tiempos):8.2f} ms p50, {_p(tiempos, 99):.2f} ms p99 "
+              f"({len(tiempos)} búsquedas)")
+        if _p(tiempos, 99) > args.limite_rearmado_ms:
+            fallas.append(f"durante el rearmado: p99 {_p(tiempos, 99):.1f} ms > {args.limite_rearmado_ms:.0f} ms")
+
+    tiempos = []
+    with engine.connect() as conn:
+        for consulta, _ in consultas["prefijo"][:20]:
+            t0 = time.perf_counter()
+            conn.execute(text("SELECT id, placa FROM camiones WHERE sitio_id = :s AND placa LIKE :q LIMIT 20"),
+                         {"s": SITIO_POR_DEFECTO, "q": f"%{consulta}%"}).all()
+            tiempos.append((time.perf_counter() - t0) * 1000)
+    print(f"  referencia LIKE '%q%'   {statistics.median(tiempos):8.2f} ms p50 (sin tolerancia a errores)")
+
+    if fallas:
+        for falla in fallas:
+            print(f"FALLA: {falla}")
+        sys.exit(1)
+    print(f"OK: p99 bajo {args.limite_ms:.0f} ms ({args.limite_rearmado_ms:.0f} ms durante el rearmado) "
+          f"y aciertos dentro de lo esperado")
+
+
+if __name__ == "__main__":
+    main_cli()
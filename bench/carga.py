@@ -0,0 +1,300 @@
+"""
+Generador de carga end-to-end - Control de Patio
+Crea choferes, camiones y rampas, abre sockets /ws/{user_id} y empuja
+movimientos por el ciclo completo a una tasa configurable:
+
+    ingreso -> disponible -> solicitar -> asignar -> confirmar -> en-rampa
+            -> carga-lista -> salida-rampa -> salida-cd
+
+Reporta throughput, p50/p99 por endpoint y el retraso de entrega por WebSocket.
+Entra con --codigo/--pin (un admin o logística; si no existe, crea los datos
+demo) y cada socket se abre con el token de su usuario.
+Se corre contra un servidor levantado con PostgreSQL local, por ejemplo:
+
+    cd backend && DATABASE_URL=postgresql://... uvicorn main:app --port 8000
+    python bench/carga.py --url http://localhost:8000 --camiones 50 --rampas 10 \\
+        --sockets 200 --tasa 5 --ciclos 500
+
+Requiere: pip install -r requirements-dev.txt
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+import websockets
+
+# Tipo de mensaje WebSocket que dispara cada paso del ciclo
+MENSAJE_DE_PASO = {
+    "ingreso": "nuevo_ingreso",
+    "disponible": "camion_disponible",
+    "solicitar": "solicitud_camion",
+    "asignar": "asignacion_rampa",
+    "confirmar": "chofer_confirmo",
+    "en-rampa": "camion_en_rampa",
+    "carga-lista": "carga_lista",
+    "salida-rampa": "rampa_liberada",
+}
+
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round((len(ordenados) - 1) * p / 100)))]
+
+
+class Carga:
+    def __init__(self, args):
+        self.args = args
+        self.prefijo = uuid.uuid4().hex[:6].upper()
+        self.latencias = defaultdict(list)      # endpoint -> [segundos]
+        self.errores = defaultdict(int)         # endpoint -> cantidad
+        self.enviados = {}                      # (tipo mensaje, movimiento_id) -> hora de envío
+        self.recibidos = []                     # (tipo mensaje, movimiento_id, hora de recepción)
+        self.ciclos_completos = 0
+        self.choferes = []
+        self.camiones = []
+        self.logistica_id = None
+        self.tokens = {}                        # usuario_id -> token de sesión
+
+    async def llamar(self, cliente, nombre, metodo, ruta, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            respuesta = await cliente.request(metodo, ruta, **kwargs)
+        except httpx.HTTPError:
+            self.errores[nombre] += 1
+            return None, inicio
+        self.latencias[nombre].append(time.perf_counter() - inicio)
+        if respuesta.status_code >= 400:
+            self.errores[nombre] += 1
+            return None, inicio
+        return respuesta.json(), inicio
+
+    # ========================================
+    # PREPARACIÓN
+    # ========================================
+
+    async def iniciar_sesion(self, cliente, codigo, pin):
+        datos, _ = await self.llamar(cliente, "login", "POST", "/api/auth/login", json={"codigo": codigo, "pin": pin})
+        # Las requests siguen con el token del operador, no con la cookie de este login
+        cliente.cookies.clear()
+        if not datos or not datos["success"]:
+            return None
+        self.tokens[datos["usuario"]["id"]] = datos["token"]
+        return datos["token"]
+
+    async def preparar(self, cliente):
+        token = await self.iniciar_sesion(cliente, self.args.codigo, self.args.pin)
+        if token is None:
+            # BD nueva: los datos de demo crean el admin con un PIN al azar
+            demo = (await cliente.post("/api/setup/datos-demo")).json()
+            pines = (demo.get("data") or {}).get("pines", {})
+            self.args.pin = pines.get(self.args.codigo, self.args.pin)
+            token = await self.iniciar_sesion(cliente, self.args.codigo, self.args.pin)
+        if token is None:
+            raise SystemExit(f"No se pudo entrar como {self.args.codigo}")
+        cliente.headers["Authorization"] = f"Bearer {token}"
+
+        p = self.prefijo
+        datos, _ = await self.llamar(cliente, "crear_usuario", "POST", "/api/usuarios", json={
+            "codigo": f"L{p}", "nombre": f"Logística carga {p}", "rol": "logistica", "pin": "1234"
+        })
+        self.logistica_id = datos["id"]
+        await self.iniciar_sesion(cliente, f"L{p}", "1234")
+
+        for i in range(self.args.camiones):
+            chofer, _ = await self.llamar(cliente, "crear_usuario", "POST", "/api/usuarios", json={
+                "codigo": f"C{p}{i:05d}", "nombre": f"Chofer carga {i}", "rol": "chofer", "pin": "1234"
+            })
+            camion, _ = await self.llamar(cliente, "crear_camion", "POST", "/api/camiones", json={
+                "placa": f"Z{p}{i:05d}", "tipo": "seco", "chofer_id": chofer["id"]
+            })
+            await self.iniciar_sesion(cliente, chofer["codigo"], "1234")
+            self.choferes.append(chofer)
+            self.camiones.append(camion)
+
+        # Números de rampa altos y aleatorios para no chocar con rampas reales
+        base = random.randint(10_000, 900_000)
+        self.rampas = asyncio.Queue()
+        for i in range(self.args.rampas):
+            rampa, _ = await self.llamar(cliente, "crear_rampa", "POST", "/api/rampas", json={
+                "numero": base + i, "nombre": f"Rampa carga {p}-{i}"
+            })
+            self.rampas.put_nowait(rampa["id"])
+
+    # ========================================
+    # WEBSOCKETS
+    # ========================================
+
+    async def escuchar(self, usuario_id, listo: asyncio.Event, fin: asyncio.Event):
+        url = self.args.url.replace("http", "ws", 1) + f"/ws/{usuario_id}"
+        cabeceras = {"Authorization": f"Bearer {self.tokens[usuario_id]}"}
+        async with websockets.connect(url, max_size=None, extra_headers=cabeceras) as ws:
+            listo.set()
+            while not fin.is_set():
+                try:
+                    texto = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                mensaje = json.loads(texto)
+                if isinstance(mensaje, dict) and mensaje.get("tipo") == "ping":
+                    await ws.send(json.dumps({"tipo": "pong"}))
+                    continue
+                if isinstance(mensaje, dict) and mensaje.get("movimiento_id"):
+                    self.recibidos.append((mensaje.get("tipo"), mensaje["movimiento_id"], time.perf_counter()))
+
+    # ========================================
+    # CICLO DE UN CAMIÓN
+    # ========================================
+
+    async def ciclo(self, cliente, indice):
+        camion = self.camiones[indice % len(self.camiones)]
+        chofer = self.choferes[indice % len(self.choferes)]
+
+        async def paso(nombre, metodo, ruta, movimiento_id=None, **kwargs):
+            datos, inicio = await self.llamar(cliente, nombre, metodo, ruta, **kwargs)
+            mov_id = movimiento_id or (datos or {}).get("id")
+            if nombre in MENSAJE_DE_PASO and mov_id:
+                self.enviados[(MENSAJE_DE_PASO[nombre], mov_id)] = inicio
+            return datos
+
+        mov = await paso("ingreso", "POST", "/api/movimientos/ingreso", json={
+            "placa": camion["placa"], "chofer_codigo": chofer["codigo"]
+        })
+        if not mov:
+            return
+        mid = mov["id"]
+        await paso("disponible", "POST", f"/api/movimientos/{mid}/disponible", mid)
+        await paso("solicitar", "POST", "/api/movimientos/solicitar", mid, json={
+            "movimiento_id": mid, "solicitado_por": "carga"
+        })
+        rampa_id = await self.rampas.get()
+        try:
+            await paso("asignar", "POST", "/api/movimientos/asignar", mid, json={
+                "movimiento_id": mid, "rampa_id": rampa_id
+            })
+            # Confirma el chofer del camión, con su propio token
+            await paso("confirmar", "POST", f"/api/movimientos/{mid}/confirmar-chofer", mid,
+                       headers={"Authorization": f"Bearer {self.tokens[chofer['id']]}"})
+            await paso("en-rampa", "POST", f"/api/movimientos/{mid}/en-rampa", mid)
+            await asyncio.sleep(self.args.servicio)
+            await paso("carga-lista", "POST", f"/api/movimientos/{mid}/carga-lista", mid)
+            await paso("salida-rampa", "POST", f"/api/movimientos/{mid}/salida-rampa", mid)
+        finally:
+            self.rampas.put_nowait(rampa_id)
+        if await paso("salida-cd", "POST", "/api/movimientos/salida-cd", mid, json={
+            "movimiento_id": mid, "chofer_codigo": chofer["codigo"]
+        }):
+            self.ciclos_completos += 1
+
+    async def ejecutar(self):
+        limites = httpx.Limits(max_connections=self.args.conexiones)
+        async with httpx.AsyncClient(base_url=self.args.url, limits=limites, timeout=30) as cliente:
+            await self.preparar(cliente)
+
+            # Sockets: uno por chofer y el resto repartido entre logística y choferes
+            destinatarios = [c["id"] for c in self.choferes] + [self.logistica_id]
+            fin = asyncio.Event()
+            oyentes = []
+            for i in range(self.args.sockets):
+                listo = asyncio.Event()
+                oyentes.append(asyncio.create_task(self.escuchar(destinatarios[i % len(destinatarios)], listo, fin)))
+                await listo.wait()
+
+            # Un camión solo puede tener un movimiento activo: cada camión corre sus ciclos en serie
+            inicio = time.perf_counter()
+            pendientes = set()
+            ocupados = set()
+            for i in range(self.args.ciclos):
+                indice = i % len(self.camiones)
+                while indice in ocupados:
+                    await asyncio.sleep(0.01)
+                ocupados.add(indice)
+                tarea = asyncio.create_task(self.ciclo(cliente, indice))
+                tarea.add_done_callback(lambda _, indice=indice: ocupados.discard(indice))
+                pendientes.add(tarea)
+                tarea.add_done_callback(pendientes.discard)
+                await asyncio.sleep(1 / self.args.tasa)
+            await asyncio.gather(*pendientes)
+            self.duracion = time.perf_counter() - inicio
+
+            await asyncio.sleep(1)  # últimos mensajes en vuelo
+            fin.set()
+            await asyncio.gather(*oyentes, return_exceptions=True)
+
+    # ========================================
+    # REPORTE
+    # ========================================
+
+    def reporte(self) -> dict:
+        retrasos = defaultdict(list)
+        for tipo, mov_id, recibido in self.recibidos:
+            enviado = self.enviados.get((tipo, mov_id))
+            if enviado is not None:
+                retrasos[tipo].append(recibido - enviado)
+
+        def ms(valor):
+            return None if valor is None else round(valor * 1000, 2)
+
+        peticiones = sum(len(v) for v in self.latencias.values())
+        return {
+            "duracion_s": round(self.duracion, 2),
+            "ciclos_completos": self.ciclos_completos,
+            "camiones_por_hora": round(self.ciclos_completos / self.duracion * 3600, 1),
+            "peticiones_por_segundo": round(peticiones / self.duracion, 1),
+            "sockets": self.args.sockets,
+            "endpoints": {
+                nombre: {
+                    "n": len(valores), "errores": self.errores[nombre],
+                    "p50_ms": ms(percentil(valores, 50)), "p99_ms": ms(percentil(valores, 99)),
+                }
+                for nombre, valores in sorted(self.latencias.items())
+            },
+            "websocket": {
+                tipo: {"entregas": len(valores), "p50_ms": ms(percentil(valores, 50)), "p99_ms": ms(percentil(valores, 99))}
+                for tipo, valores in sorted(retrasos.items())
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--camiones", type=int, default=20, help="Choferes/camiones a crear")
+    parser.add_argument("--rampas", type=int, default=6)
+    parser.add_argument("--sockets", type=int, default=50, help="Sockets /ws abiertos durante la prueba")
+    parser.add_argument("--tasa", type=float, default=2.0, help="Ciclos iniciados por segundo")
+    parser.add_argument("--ciclos", type=int, default=100, help="Ciclos completos a ejecutar")
+    parser.add_argument("--servicio", type=float, default=0.0, help="Segundos simulados de carga en rampa")
+    parser.add_argument("--conexiones", type=int, default=100, help="Conexiones HTTP máximas")
+    parser.add_argument("--codigo", default="ADMIN01", help="Usuario admin o logística con el que se crea todo")
+    parser.add_argument("--pin", default="1234", help="Con la BD vacía se usa el que devuelven los datos de demo")
+    parser.add_argument("--json", help="Guardar el reporte en este archivo")
+    args = parser.parse_args()
+
+    carga = Carga(args)
+    asyncio.run(carga.ejecutar())
+    reporte = carga.reporte()
+
+    print(f"{reporte['ciclos_completos']} ciclos en {reporte['duracion_s']} s -> "
+          f"{reporte['camiones_por_hora']} camiones/hora, {reporte['peticiones_por_segundo']} req/s, "
+          f"{reporte['sockets']} sockets")
+    print(f"{'endpoint':16s} {'n':>6s} {'err':>5s} {'p50 ms':>9s} {'p99 ms':>9s}")
+    for nombre, e in reporte["endpoints"].items():
+        print(f"{nombre:16s} {e['n']:6d} {e['errores']:5d} {e['p50_ms'] or 0:9.2f} {e['p99_ms'] or 0:9.2f}")
+    print(f"{'websocket':16s} {'entregas':>8s} {'p50 ms':>9s} {'p99 ms':>9s}")
+    for tipo, w in reporte["websocket"].items():
+        print(f"{tipo:16s} {w['entregas']:8d} {w['p50_ms'] or 0:9.2f} {w['p99_ms'] or 0:9.2f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reporte, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Contador de consultas SQL - Control de Patio
+Registra las sentencias que ejecutan los engines mientras está activo, con los
+eventos de SQLAlchemy (before_cursor_execute). Lo usan bench/rutas.py y
+bench/presupuesto_consultas.py; sirve igual desde cualquier prueba:
+
+    with ContadorConsultas(engine) as contador:
+        cliente.get("/api/rampas/resumen")
+    assert contador.total <= 2, contador.resumen()
+"""
+import re
+from collections import Counter
+
+from sqlalchemy import event
+
+# Literales y listas de parámetros fuera: dos sentencias iguales salvo sus
+# valores cuentan como la misma (así se ve un N+1)
+_PARAMETROS = re.compile(r"(\?|%\(\w+\)s|:\w+|\b\d+\b|'[^']*')")
+_LISTAS = re.compile(r"\((\s*\?\s*,?)+\)|\(\[POSTCOMPILE_\w+\]\)")
+_ESPACIOS = re.compile(r"\s+")
+_COLUMNAS = re.compile(r"^SELECT (.+?) FROM ")
+
+
+def normalizar(sentencia: str) -> str:
+    sentencia = _ESPACIOS.sub(" ", sentencia).strip()
+    sentencia = _LISTAS.sub("(…)", sentencia)
+    return _PARAMETROS.sub("?", sentencia)
+
+
+class ContadorConsultas:
+    def __init__(self, *motores):
+        self.motores = set(motores)
+        self.sentencias = []
+
+    def _registrar(self, conn, cursor, sentencia, parametros, contexto, executemany):
+        self.sentencias.append(sentencia)
+
+    def __enter__(self):
+        for motor in self.motores:
+            event.listen(motor, "before_cursor_execute", self._registrar)
+        return self
+
+    def __exit__(self, *exc):
+        for motor in self.motores:
+            event.remove(motor, "before_cursor_execute", self._registrar)
+
+    @property
+    def total(self) -> int:
+        return len(self.sentencias)
+
+    def reiniciar(self):
+        self.sentencias = []
+
+    def agrupadas(self) -> Counter:
+        return Counter(normalizar(s) for s in self.sentencias)
+
+    def resumen(self, ancho: int = 160) -> str:
+        """Sentencias agrupadas, las más repetidas primero"""
+        lineas = []
+        for sentencia, veces in self.agrupadas().most_common():
+            # La lista de columnas tapa lo que importa: tabla y filtro
+            sentencia = _COLUMNAS.sub("SELECT … FROM ", sentencia, count=1)
+            recorte = sentencia if len(sentencia) <= ancho else sentencia[:ancho - 1] + "…"
+            lineas.append(f"{veces:5d}× {recorte}")
+        return "\n".join(lineas)
@@ -0,0 +1,196 @@
+"""
+Presupuesto de consultas por ruta - Control de Patio
+Guardia contra N+1: siembra dos patios sintéticos (el segundo 4 veces más
+grande), llama cada ruta con los mismos casos que bench/rutas.py y cuenta las
+sentencias SQL por llamada. Falla (código 1) si una ruta:
+
+    - supera el presupuesto declarado en PRESUPUESTOS
+    - hace más consultas en el patio grande que en el chico (escala con las filas)
+    - no tiene presupuesto declarado (ruta nueva)
+
+y muestra las sentencias de la llamada culpable agrupadas, las repetidas primero.
+Al agregar o cambiar una ruta, declarar aquí cuántas consultas le corresponden.
+
+    python bench/presupuesto_consultas.py            # SQLite temporal
+    BENCH_DATABASE_URL=postgresql://localhost/patio_bench python bench/presupuesto_consultas.py
+
+La BD de BENCH_DATABASE_URL se borra y se siembra (ver bench/rutas.py).
+Requiere: pip install -r requirements-dev.txt
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+import rutas
+from contador_sql import ContadorConsultas
+
+# Patios: (rampas, movimientos)
+CHICO = (10, 1_000)
+GRANDE = (40, 4_000)
+
+# Consultas máximas por llamada (mismo nombre que los casos de bench/rutas.py)
+PRESUPUESTOS = {
+    "GET /": 0,
+    "GET /admin": 0,
+    "GET /chofer": 0,
+    "GET /despacho": 0,
+    "GET /sw-chofer.js": 0,
+    "GET /static/styles.css": 0,
+    "GET /api/auth/sesion": 0,
+    "GET /api/sitios": 1,
+    "GET /api/usuarios": 1,
+    "GET /api/camiones": 1,
+    "GET /api/rampas": 1,
+    "GET /api/rampas/resumen": 2,
+    "GET /api/buscar": 0,  # índice en memoria (busqueda.py)
+    "GET /api/movimientos": 1,
+    "GET /api/movimientos [fecha]": 1,
+    "GET /api/movimientos [estado, limit=1000]": 1,
+    "GET /api/movimientos [fields]": 1,
+    "GET /api/movimientos/activos": 1,
+    "GET /api/movimientos/{id} [activo]": 1,
+    "GET /api/movimientos/{id} [histórico]": 1,
+    "GET /api/estadisticas": 6,
+    "GET /api/patio/snapshot": 2,
+    "GET /api/changes": 2,
+    "GET /api/analytics/ocupacion": 2,
+    "GET /api/analytics/estadias": 2,
+    "GET /api/reportes/{id}": 0,
+    "GET /api/reportes/{id}/descarga": 0,
+    "GET /api/salud": 0,
+    "GET /api/metricas/db": 0,
+    "GET /api/ws/esquema": 0,
+    "GET /api/metricas/ws": 0,
+    "GET /api/metricas/stream": 0,
+    "GET /api/metricas/notificaciones": 0,
+    "GET /api/metricas/sesiones": 0,
+    "GET /api/metricas/reportes": 0,
+    "GET /api/metricas/busqueda": 0,
+    "GET /api/notificaciones/{usuario_id}": 1,
+    "GET /api/notificaciones/{usuario_id}/no-leidas": 1,  # COUNT solo la primera vez
+    "GET /api/chofer/{chofer_id}/movimiento-activo": 1,
+    "POST /api/sitios": 3,
+    "PUT /api/sitios/{id}": 3,
+    "POST /api/usuarios": 3,
+    "PUT /api/usuarios/{id}": 3,
+    "POST /api/auth/login": 1,
+    "POST /api/camiones": 3,
+    "PUT /api/camiones/{id}": 3,
+    "POST /api/rampas": 3,
+    "PUT /api/rampas/{id}": 3,
+    # Cada transición: + INSERT en transiciones, y en PostgreSQL + pg_advisory_xact_lock (cambios.py)
+    "POST /api/movimientos/ingreso": 9,
+    "POST /api/movimientos/{id}/disponible": 5,
+    "POST /api/movimientos/solicitar": 5,
+    "POST /api/movimientos/asignar": 8,
+    "POST /api/movimientos/{id}/confirmar-chofer": 7,
+    "POST /api/movimientos/{id}/en-rampa": 7,
+    "POST /api/movimientos/{id}/carga-lista": 7,
+    "POST /api/movimientos/{id}/salida-rampa": 7,
+    "POST /api/movimientos/salida-cd": 5,
+    "POST /api/notificaciones/{id}/leer": 3,
+    "POST /api/notificaciones/leer": 1,
+    "POST /api/notificaciones/{usuario_id}/leer-todas": 1,
+}
+
+
+class Guardia:
+    """Peor llamada (más sentencias) de cada ruta"""
+    def __init__(self, contador: ContadorConsultas):
+        self.contador = contador
+        self.peores = {}  # nombre -> lista de sentencias
+        self.registrar = True
+
+    def llamador(self, cliente):
+        async def llamar(nombre, metodo, ruta, url, params=None, json=None, medir=True):
+            self.contador.reiniciar()
+            respuesta = await cliente.request(metodo or "GET", url, params=params, json=json)
+            if respuesta.status_code >= 500 or (respuesta.status_code >= 400 and metodo != "GET"):
+                raise RuntimeError(f"{nombre}: {respuesta.status_code} {respuesta.text[:200]}")
+            if medir and self.registrar:
+                sentencias = list(self.contador.sentencias)
+                if len(sentencias) >= len(self.peores.get(nombre, ())):
+                    self.peores[nombre] = sentencias
+            return respuesta.json() if "json" in respuesta.headers.get("content-type", "") else None
+        return llamar
+
+
+async def _contar(main, contador: ContadorConsultas, datos: dict, pasadas: int) -> dict:
+    guardia = Guardia(contador)
+    prefijo = uuid.uuid4().hex[:5].upper()
+    async with rutas.Medidor().cliente(main.app) as cliente:
+        llamar = guardia.llamador(cliente)
+        guardia.registrar = False  # calentamiento: caches de la app vacías
+        for nombre, metodo, ruta, url, params in rutas.casos_lectura(datos):
+            await llamar(nombre, metodo, ruta, url, params)
+        await rutas.ciclo_escritura(llamar, prefijo, 0)
+        guardia.registrar = True
+        for i in range(pasadas):
+            for nombre, metodo, ruta, url, params in rutas.casos_lectura(datos):
+                await llamar(nombre, metodo, ruta, url, params)
+            await rutas.ciclo_escritura(llamar, prefijo, i + 1)
+    return guardia.peores
+
+
+async def verificar(pasadas: int) -> list:
+    import main
+    from database import engine, engine_lectura
+
+    resultados = {}
+    with ContadorConsultas(engine, engine_lectura) as contador:
+        for tamano in (CHICO, GRANDE):
+            datos = rutas._sembrar(*tamano)
+            if tamano == CHICO:
+                await main.calentar()
+            try:
+                resultados[tamano] = await _contar(main, contador, datos, pasadas)
+            finally:
+                rutas._limpiar(datos)
+
+    fallas = []
+    chico, grande = resultados[CHICO], resultados[GRANDE]
+    print(f"{'ruta':52s} {'chico':>6s} {'grande':>6s} {'máx.':>5s}")
+    for nombre in grande:
+        n_chico, n_grande = len(chico.get(nombre, ())), len(grande[nombre])
+        presupuesto = PRESUPUESTOS.get(nombre)
+        problemas = []
+        if presupuesto is None:
+            problemas.append("sin presupuesto declarado")
+        elif max(n_chico, n_grande) > presupuesto:
+            problemas.append(f"supera el presupuesto ({presupuesto})")
+        if n_grande > n_chico:
+            problemas.append("escala con las filas")
+        marca = f"  FALLA: {', '.join(problemas)}" if problemas else ""
+        print(f"{nombre:52s} {n_chico:6d} {n_grande:6d} {'-' if presupuesto is None else presupuesto:>5}{marca}")
+        if problemas:
+            detalle = ContadorConsultas()
+            detalle.sentencias = grande[nombre]
+            fallas.append((nombre, problemas, detalle.resumen()))
+    return fallas
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pasadas", type=int, default=2, help="Llamadas registradas por ruta y patio")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = os.getenv(
+        "BENCH_DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/patio_presupuesto.db"
+    ).replace("{tamano}", "presupuesto")
+    sys.path.insert(0, rutas.BACKEND)
+    os.chdir(rutas.BACKEND)
+
+    fallas = asyncio.run(verificar(args.pasadas))
+    for nombre, problemas, resumen in fallas:
+        print(f"\n{nombre}: {', '.join(problemas)}\n{resumen}")
+    if fallas:
+        print(f"\n{len(fallas)} rutas fuera de presupuesto")
+        sys.exit(1)
+    print("\nOK: todas las rutas dentro de su presupuesto y sin consultas por fila")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,251 @@
+"""
+Reportes en segundo plano - Control de Patio
+Levanta la app en proceso (uvicorn, mismo event loop) sobre el patio de
+bench/rutas.py y pide de golpe los reportes diarios de los últimos --dias días
+y los semanales de las últimas --semanas semanas, en CSV y XLSX, mientras un
+sondeo llama a las rutas del patio en vivo:
+
+    - latencia del sondeo (p50/p99) sin reportes y durante la ráfaga
+    - pedidos rechazados con 429 (más de REPORTES_COLA_MAX pendientes): se
+      reintentan hasta que entran todos
+    - tiempo hasta que todos quedan listos, y que cada archivo se abre (CSV con
+      sus tres secciones, XLSX con sus tres hojas)
+    - al repetir la ráfaga, todos salen listos del archivo ya generado
+
+Sale con código 1 si algún reporte falla, un archivo no se abre, la repetición
+genera algo de nuevo o el p99 del sondeo durante la ráfaga pasa de --limite-ms.
+
+    python bench/reportes.py
+    python bench/reportes.py --tamano chico --dias 7 --procesos 1
+"""
+import argparse
+import asyncio
+import io
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+
+import rutas
+
+BACKEND = rutas.BACKEND
+SONDEO = ("/api/rampas/resumen", "/api/movimientos/activos")
+SECCIONES = ("rampas", "atrasados", "confirmacion")
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _resumen(tiempos) -> str:
+    if not tiempos:
+        return "sin llamadas"
+    return (f"p50 {statistics.median(tiempos):7.1f} ms   p99 {rutas._percentil(tiempos, 99):7.1f} ms   "
+            f"({len(tiempos)} llamadas)")
+
+
+async def _sondear(cliente, tiempos: list, parar: asyncio.Event, intervalo: float):
+    """Llama a las rutas del patio cada intervalo hasta que se pida parar"""
+    i = 0
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        respuesta = await cliente.get(SONDEO[i % len(SONDEO)])
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        respuesta.raise_for_status()
+        i += 1
+        try:
+            await asyncio.wait_for(parar.wait(), intervalo)
+        except asyncio.TimeoutError:
+            pass
+
+
+def _pedidos(dias: int, semanas: int):
+    hoy = date.today()
+    pedidos = [("diario", hoy - timedelta(days=d)) for d in range(1, dias + 1)]
+    pedidos += [("semanal", hoy - timedelta(weeks=s)) for s in range(1, semanas + 1)]
+    return [{"tipo": tipo, "fecha": fecha.isoformat(), "formato": formato}
+            for tipo, fecha in pedidos for formato in ("csv", "xlsx")]
+
+
+async def _rafaga(cliente, pedidos) -> dict:
+    """Pide todos a la vez; los rechazados se reintentan hasta que haya lugar"""
+    trabajos, rechazos = {}, 0
+    faltan = list(pedidos)
+    while faltan:
+        respuestas = await asyncio.gather(*(cliente.post("/api/reportes", json=p) for p in faltan))
+        siguen = []
+        for pedido, respuesta in zip(faltan, respuestas):
+            if respuesta.status_code == 429:
+                rechazos += 1
+                siguen.append(pedido)
+                continue
+            respuesta.raise_for_status()
+            trabajo = respuesta.json()
+            trabajos[trabajo["id"]] = trabajo
+        faltan = siguen
+        if faltan:
+            await asyncio.sleep(0.5)
+    return {"trabajos": trabajos, "rechazos": rechazos}
+
+
+async def _esperar(cliente, trabajos: dict, timeout: float):
+    limite = time.perf_counter() + timeout
+    pendientes = [id_ for id_, t in trabajos.items() if t["estado"] in ("en_cola", "generando")]
+    while pendientes and time.perf_counter() < limite:
+        await asyncio.sleep(0.2)
+        respuestas = await asyncio.gather(*(cliente.get(f"/api/reportes/{id_}") for id_ in pendientes))
+        for respuesta in respuestas:
+            trabajo = respuesta.json()
+            trabajos[trabajo["id"]] = trabajo
+        pendientes = [id_ for id_, t in trabajos.items() if t["estado"] in ("en_cola", "generando")]
+    return pendientes
+
+
+def _validar(formato: str, contenido: bytes) -> str:
+    """Motivo por el que el archivo no sirve, o None"""
+    if formato == "csv":
+        texto = contenido.decode("utf-8-sig")
+        faltan = [s for s in SECCIONES if f"# {s}" not in texto]
+        return f"faltan secciones {faltan}" if faltan else None
+    try:
+        with zipfile.ZipFile(io.BytesIO(contenido)) as libro:
+            hojas = [n for n in libro.namelist() if n.startswith("xl/worksheets/")]
+            libro.read("xl/workbook.xml")
+    except zipfile.BadZipFile as error:
+        return f"XLSX inválido: {error}"
+    return None if len(hojas) == len(SECCIONES) else f"{len(hojas)} hojas"
+
+
+async def ejecutar(args) -> dict:
+    import httpx
+    import uvicorn
+    import main
+    from models import SITIO_POR_DEFECTO, RolUsuario
+    from reportes import reportes
+    from sesiones import sesiones
+
+    puerto = _puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=puerto, log_level="warning"))
+    tarea_servidor = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.05)
+
+    fallas = []
+    intervalo = args.sondeo_ms / 1000
+    pedidos = _pedidos(args.dias, args.semanas)
+    token = sesiones.emitir(rutas.ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", timeout=60,
+                                 headers={"Authorization": f"Bearer {token}"}) as cliente:
+        base = []
+        parar = asyncio.Event()
+        sondeo = asyncio.create_task(_sondear(cliente, base, parar, intervalo))
+        await asyncio.sleep(args.base_s)
+        parar.set()
+        await sondeo
+
+        durante = []
+        parar = asyncio.Event()
+        sondeo = asyncio.create_task(_sondear(cliente, durante, parar, intervalo))
+        inicio = time.perf_counter()
+        rafaga = await _rafaga(cliente, pedidos)
+        trabajos = rafaga["trabajos"]
+        colgados = await _esperar(cliente, trabajos, args.timeout)
+        total_s = time.perf_counter() - inicio
+        parar.set()
+        await sondeo
+
+        if colgados:
+            fallas.append(f"{len(colgados)} reportes sin terminar tras {args.timeout:.0f} s")
+        for trabajo in trabajos.values():
+            if trabajo["estado"] == "error":
+                fallas.append(f"{trabajo['id']}: {trabajo['error']}")
+            elif trabajo["estado"] == "listo":
+                respuesta = await cliente.get(trabajo["descarga"])
+                motivo = _validar(trabajo["formato"], respuesta.content) if respuesta.status_code == 200 \
+                    else f"descarga {respuesta.status_code}"
+                if motivo:
+                    fallas.append(f"{trabajo['id']}: {motivo}")
+
+        generados = reportes.generados
+        repeticion = await _rafaga(cliente, pedidos)
+        no_listos = [t["id"] for t in repeticion["trabajos"].values() if t["estado"] != "listo"]
+        if no_listos or reportes.generados != generados:
+            fallas.append(f"la repetición no salió del archivo ya generado ({len(no_listos)} pendientes)")
+        metricas = (await cliente.get("/api/metricas/reportes")).json()
+
+    servidor.should_exit = True
+    await tarea_servidor
+    reportes.cerrar()
+
+    p99 = rutas._percentil(durante, 99) if durante else 0
+    if p99 > args.limite_ms:
+        fallas.append(f"p99 del sondeo durante la ráfaga {p99:.0f} ms > {args.limite_ms:.0f} ms")
+    movimientos = [t["movimientos"] or 0 for t in trabajos.values()]
+    return {
+        "pedidos": len(pedidos),
+        "base": base,
+        "durante": durante,
+        "rechazos": rafaga["rechazos"],
+        "total_s": total_s,
+        "movimientos": sum(movimientos),
+        "metricas": metricas,
+        "fallas": fallas,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamano", default="mediano", choices=list(rutas.TAMANOS))
+    parser.add_argument("--dias", type=int, default=14, help="Reportes diarios (uno por día hacia atrás)")
+    parser.add_argument("--semanas", type=int, default=2, help="Reportes semanales")
+    parser.add_argument("--procesos", type=int, default=2)
+    parser.add_argument("--cola-max", type=int, default=20)
+    parser.add_argument("--sondeo-ms", type=float, default=50, help="Pausa entre llamadas del sondeo")
+    parser.add_argument("--base-s", type=float, default=3, help="Duración del sondeo sin reportes")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--limite-ms", type=float, default=500, help="p99 máximo del sondeo durante la ráfaga")
+    args = parser.parse_args()
+
+    # Antes de importar la app: los procesos del pool heredan el entorno
+    os.environ["DATABASE_URL"] = rutas._url_bd(args.tamano)
+    os.environ["REPORTES_DIR"] = tempfile.mkdtemp(prefix="patio_reportes_")
+    os.environ["REPORTES_PROCESOS"] = str(args.procesos)
+    os.environ["REPORTES_COLA_MAX"] = str(args.cola_max)
+    # spawn vuelve a cargar este script en cada proceso: la ruta tiene que servir después del chdir
+    sys.modules["__main__"].__file__ = os.path.abspath(__file__)
+    sys.path.insert(0, BACKEND)
+    os.chdir(BACKEND)
+
+    n_rampas, n_movimientos = rutas.TAMANOS[args.tamano]
+    datos = rutas._siembra_existente(n_rampas, n_movimientos)
+    if datos is None:
+        print(f"Sembrando {n_rampas} rampas y {n_movimientos:,} movimientos...")
+        datos = rutas._sembrar(n_rampas, n_movimientos)
+    rutas._limpiar(datos)
+
+    r = asyncio.run(ejecutar(args))
+    print(f"{r['pedidos']} reportes ({args.dias} diarios y {args.semanas} semanales, CSV y XLSX), "
+          f"{args.procesos} procesos, cola máxima {args.cola_max}")
+    print(f"  sondeo sin reportes     {_resumen(r['base'])}")
+    print(f"  sondeo en la ráfaga     {_resumen(r['durante'])}")
+    print(f"  todos listos en {r['total_s']:.1f} s ({r['movimientos']:,} movimientos leídos), "
+          f"{r['rechazos']} pedidos rechazados con 429 y reintentados")
+    m = r["metricas"]
+    print(f"  métricas: {m['generados']} generados, {m['desde_cache']} desde el archivo, "
+          f"{m['rechazados']} rechazados, {m['fallidos']} fallidos")
+
+    if r["fallas"]:
+        for falla in r["fallas"]:
+            print(f"FALLA: {falla}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,638 @@
+"""
+Benchmark de rutas de la API - Control de Patio
+Siembra un patio sintético, llama cada ruta de backend/main.py a través de la
+app ASGI (httpx.ASGITransport: sin red ni uvicorn) y registra por ruta:
+
+    latencia    p50 / p95 / máximo de --repeticiones llamadas (tras una de calentamiento)
+    consultas   sentencias SQL por llamada (eventos del engine)
+    memoria     pico de asignaciones por llamada (tracemalloc, en una pasada aparte)
+
+Tamaños (--tamanos):
+    chico       10 rampas      1.000 movimientos
+    mediano    100 rampas    100.000 movimientos
+    grande    1000 rampas  1.000.000 movimientos
+
+Cada tamaño corre en un proceso aparte contra BENCH_DATABASE_URL (nunca
+DATABASE_URL): la BD se BORRA y se siembra, salvo que ya tenga ese tamaño
+sembrado; lo que crean las rutas de escritura se borra al terminar. Si la URL
+contiene {tamano} se usa una BD por tamaño. La referencia es PostgreSQL local;
+sin la variable se usa un SQLite temporal por tamaño.
+
+    createdb patio_bench_chico && createdb patio_bench_mediano
+    BENCH_DATABASE_URL=postgresql://localhost/patio_bench_{tamano} \\
+        python bench/rutas.py --tamanos chico,mediano --salida bench/resultados/$(git rev-parse --short HEAD).json
+    python bench/rutas.py --tamanos chico --comparar bench/resultados/abc1234.json
+
+Con --comparar sale con código 1 si alguna ruta empeoró (latencia p50 o
+consultas). Las rutas de la app sin caso definido aparecen en "sin_caso".
+
+Requiere: pip install -r requirements-dev.txt
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from contador_sql import ContadorConsultas
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+TAMANOS = {
+    "chico": (10, 1_000),
+    "mediano": (100, 100_000),
+    "grande": (1000, 1_000_000),
+}
+
+LOTE_SIEMBRA = 10_000
+PIN = "1234"
+ADMIN_ID = 1
+
+# Rutas que el benchmark no llama
+EXCLUIDAS = {
+    ("POST", "/api/setup/datos-demo"): "solo con la BD vacía",
+    ("POST", "/api/reportes"): "genera en procesos aparte (bench/reportes.py)",
+    ("POST", "/api/auth/logout"): "revoca la sesión del cliente (bench/autorizacion.py)",
+}
+
+
+def _url_bd(tamano: str) -> str:
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        return f"sqlite:///{tempfile.gettempdir()}/patio_bench_{tamano}.db"
+    return url.replace("{tamano}", tamano)
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round((len(ordenados) - 1) * p / 100)))]
+
+# ========================================
+# SIEMBRA (proceso hijo)
+# ========================================
+
+def _sembrar(n_rampas: int, n_movimientos: int) -> dict:
+    """Patio sintético con IDs explícitos; devuelve los datos que usan los casos"""
+    from sqlalchemy import insert
+    from database import Base, engine, crear_esquema
+    from models import (
+        Sitio, Usuario, Camion, Rampa, Movimiento, Notificacion, LogEvento, Transicion,
+        EstadoMovimiento, EstadoRampa, RolUsuario, TipoCamion, Prioridad
+    )
+    from flujo import ETAPAS
+    from sesiones import hashear_pin
+
+    rng = random.Random(42)
+    ahora = datetime.now().replace(microsecond=0)
+    n_camiones = n_rampas * 4 + 20
+    # Un camión cubre ~8 ciclos por rampa y día: el histórico ocupa los días que haga falta
+    dias = max(7, n_movimientos // (n_rampas * 8))
+
+    Base.metadata.drop_all(bind=engine)
+    crear_esquema()
+
+    pin = hashear_pin(PIN)  # uno para todos: PBKDF2 por usuario demoraría la siembra
+    usuarios = [
+        dict(id=ADMIN_ID, codigo="A0001", nombre="Admin bench", pin=pin, rol=RolUsuario.ADMIN, activo=True),
+        dict(id=2, codigo="L0001", nombre="Logística bench", pin=pin, rol=RolUsuario.LOGISTICA, activo=True),
+        dict(id=3, codigo="D0001", nombre="Despacho bench", pin=pin, rol=RolUsuario.DESPACHO, activo=True),
+    ]
+    primer_chofer = len(usuarios) + 1
+    usuarios += [
+        dict(id=primer_chofer + i, codigo=f"C{i:05d}", nombre=f"Chofer {i}", pin=pin,
+             rol=RolUsuario.CHOFER, activo=True, telefono="809-555-0000")
+        for i in range(n_camiones)
+    ]
+    tipos = list(TipoCamion)
+    camiones = [
+        dict(id=i + 1, placa=f"B{i:06d}", tipo=tipos[i % len(tipos)], chofer_id=primer_chofer + i,
+             capacidad="10 ton", activo=True)
+        for i in range(n_camiones)
+    ]
+    rampas = [
+        dict(id=i + 1, numero=i + 1, nombre=f"Rampa {i + 1}", tipo_permitido=None,
+             estado=EstadoRampa.LIBRE, activo=True)
+        for i in range(n_rampas)
+    ]
+
+    # Activos: 60% de las rampas con camión asignado o cargando, y otra
+    # rampa entera de camiones en cola. La última rampa queda siempre libre.
+    en_rampa = int(n_rampas * 0.6)
+    estados_cola = (EstadoMovimiento.INGRESADO_GARITA, EstadoMovimiento.DISPONIBLE_PATIO,
+                    EstadoMovimiento.SOLICITADO)
+    estados_rampa = (EstadoMovimiento.ASIGNADO_EN_CAMINO, EstadoMovimiento.EN_RAMPA,
+                     EstadoMovimiento.CARGA_LISTA)
+    activos = [(estados_cola[i % 3], None) for i in range(n_rampas)]
+    activos += [(estados_rampa[i % 3], i + 1) for i in range(en_rampa)]
+    for estado, rampa_id in activos:
+        if estado in (EstadoMovimiento.EN_RAMPA, EstadoMovimiento.CARGA_LISTA):
+            rampas[rampa_id - 1]["estado"] = EstadoRampa.OCUPADA
+    n_historicos = max(0, n_movimientos - len(activos))
+
+    prioridades = [Prioridad.NORMAL] * 8 + [Prioridad.URGENTE, Prioridad.CRITICO]
+    duraciones = {  # minutos desde la etapa anterior
+        "hora_disponible_patio": (5, 20), "hora_solicitado": (5, 60), "hora_asignado": (1, 30),
+        "hora_en_rampa": (5, 20), "hora_carga_lista": (20, 90), "hora_salida_rampa": (1, 10),
+        "hora_salida_cd": (5, 20),
+    }
+
+    def movimiento(id_, estado, camion_id, rampa_id, ingreso):
+        fila = dict(id=id_, camion_id=camion_id, rampa_id=rampa_id, estado=estado,
+                    prioridad=rng.choice(prioridades), asignado_por_id=None, notas=None,
+                    solicitado_por_despacho=None, created_at=ingreso, updated_at=None,
+                    hora_confirmado_chofer=None)
+        hora = ingreso
+        alcanzado = True
+        for etapa, columna in ETAPAS:
+            if columna != "hora_ingreso_garita" and alcanzado:
+                hora = hora + timedelta(minutes=rng.uniform(*duraciones[columna]))
+            fila[columna] = hora if alcanzado else None
+            if columna == "hora_solicitado" and alcanzado:
+                fila["solicitado_por_despacho"] = "Despacho bench"
+            if columna == "hora_asignado" and alcanzado:
+                fila["asignado_por_id"] = 2
+                fila["hora_confirmado_chofer"] = hora + timedelta(minutes=2)
+            if etapa == estado:
+                alcanzado = False
+        return fila
+
+    def historicos():
+        for i in range(n_historicos):
+            ingreso = ahora - timedelta(days=dias) + timedelta(seconds=(dias * 86400 - 6 * 3600) * i / max(n_historicos, 1))
+            yield movimiento(i + 1, EstadoMovimiento.SALIDA_CD, rng.randint(1, n_camiones),
+                             rng.randint(1, n_rampas), ingreso)
+
+    def actuales():
+        for j, (estado, rampa_id) in enumerate(activos):
+            ingreso = ahora - timedelta(minutes=rng.uniform(30, 180))
+            fila = movimiento(n_historicos + j + 1, estado, j + 1, rampa_id, ingreso)
+            # Las horas simuladas no pueden quedar en el futuro
+            for _, columna in ETAPAS:
+                if fila[columna] and fila[columna] > ahora:
+                    fila[columna] = ahora
+            yield fila
+
+    # Notificaciones: asignación y carga lista de los últimos 20.000 históricos,
+    # ya leídas y confirmadas, más la asignación pendiente de cada activo en rampa
+    def notificaciones():
+        id_ = 0
+        for i in range(max(0, n_historicos - 20_000), n_historicos):
+            hora = ahora - timedelta(days=dias) + timedelta(seconds=(dias * 86400 - 6 * 3600) * i / max(n_historicos, 1))
+            for tipo in ("asignacion_rampa", "carga_lista"):
+                id_ += 1
+                yield dict(id=id_, usuario_id=primer_chofer + (i % n_camiones), movimiento_id=i + 1,
+                           tipo=tipo, mensaje=f"Aviso {tipo}", leida=True, confirmada=True,
+                           created_at=hora, leida_at=hora, confirmada_at=hora, entregada_at=hora)
+        for j, (estado, _) in enumerate(activos):
+            if estado in estados_rampa:
+                id_ += 1
+                yield dict(id=id_, usuario_id=primer_chofer + j, movimiento_id=n_historicos + j + 1,
+                           tipo="asignacion_rampa", mensaje="Diríjase a la rampa", leida=False,
+                           confirmada=estado != EstadoMovimiento.ASIGNADO_EN_CAMINO,
+                           created_at=ahora, leida_at=None, confirmada_at=None, entregada_at=ahora)
+
+    def en_lotes(conn, tabla, filas):
+        lote = []
+        for fila in filas:
+            lote.append(fila)
+            if len(lote) >= LOTE_SIEMBRA:
+                conn.execute(insert(tabla), lote)
+                lote = []
+        if lote:
+            conn.execute(insert(tabla), lote)
+
+    with engine.begin() as conn:
+        en_lotes(conn, Usuario.__table__, usuarios)
+        en_lotes(conn, Camion.__table__, camiones)
+        en_lotes(conn, Rampa.__table__, rampas)
+        en_lotes(conn, Movimiento.__table__, historicos())
+        en_lotes(conn, Movimiento.__table__, actuales())
+        en_lotes(conn, Notificacion.__table__, notificaciones())
+
+    with engine.begin() as conn:
+        maximos = {
+            tabla.name: conn.exec_driver_sql(f"SELECT COALESCE(MAX(id), 0) FROM {tabla.name}").scalar()
+            for tabla in (Sitio.__table__, Usuario.__table__, Camion.__table__, Rampa.__table__,
+                          Movimiento.__table__, Notificacion.__table__, Transicion.__table__)
+        }
+        datos = {
+            "rampas": n_rampas,
+            "movimientos": n_movimientos,
+            "maximos": maximos,
+            "chofer_activo": primer_chofer + len(activos) - 1,
+            "movimiento_activo": n_historicos + len(activos),
+            "movimiento_historico": max(1, n_historicos // 2),
+            "fecha": (ahora - timedelta(days=2)).strftime("%Y-%m-%d"),
+            "instante": (ahora - timedelta(days=1)).replace(hour=10, minute=0, second=0).isoformat(),
+        }
+        # Marca de siembra: la corrida siguiente la reutiliza si el tamaño coincide
+        conn.execute(insert(LogEvento.__table__), [dict(accion="bench_siembra", datos_json=json.dumps(datos))])
+        if engine.dialect.name == "postgresql":
+            for tabla in list(maximos) + ["log_eventos"]:
+                conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM {tabla}))"
+                )
+    return datos
+
+
+def _siembra_existente(n_rampas: int, n_movimientos: int):
+    from sqlalchemy import inspect
+    from database import SessionLocal, crear_esquema, engine
+    from models import LogEvento
+
+    if not inspect(engine).has_table("log_eventos"):
+        return None
+    crear_esquema()  # una siembra de un commit anterior se migra en vez de rehacerse
+    db = SessionLocal()
+    try:
+        marca = db.query(LogEvento).filter(LogEvento.accion == "bench_siembra").first()
+    except Exception:
+        return None  # esquema viejo: se vuelve a sembrar
+    finally:
+        db.close()
+    if marca is None:
+        return None
+    datos = json.loads(marca.datos_json)
+    if (datos["rampas"], datos["movimientos"]) != (n_rampas, n_movimientos):
+        return None
+    return datos
+
+
+def _limpiar(datos: dict):
+    """Borra lo que crearon las rutas de escritura (IDs por encima de la siembra)"""
+    from database import engine
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM log_eventos WHERE accion <> 'bench_siembra'"))
+        for tabla in ("notificaciones", "movimientos", "camiones", "rampas", "usuarios"):
+            conn.execute(text(f"DELETE FROM {tabla} WHERE id > :maximo"), {"maximo": datos["maximos"][tabla]})
+        conn.execute(text("DELETE FROM sitios WHERE id > :maximo"), {"maximo": datos["maximos"].get("sitios", 1)})
+        conn.execute(text("DELETE FROM transiciones WHERE id > :maximo"),
+                     {"maximo": datos["maximos"].get("transiciones", 0)})
+
+# ========================================
+# CASOS
+# ========================================
+
+def casos_lectura(d: dict):
+    """(nombre, método, ruta de la app, url, parámetros)"""
+    chofer, mov = d["chofer_activo"], d["movimiento_activo"]
+    reporte = f"1-diario-{d['fecha'].replace('-', '')}.csv"
+    return [
+        ("GET /", "GET", "/", "/", None),
+        ("GET /admin", "GET", "/admin", "/admin", None),
+        ("GET /chofer", "GET", "/chofer", "/chofer", None),
+        ("GET /despacho", "GET", "/despacho", "/despacho", None),
+        ("GET /sw-chofer.js", "GET", "/sw-chofer.js", "/sw-chofer.js", None),
+        ("GET /static/styles.css", "GET", "/static/{ruta:path}", "/static/styles.css", None),
+        ("GET /api/auth/sesion", "GET", "/api/auth/sesion", "/api/auth/sesion", None),
+        ("GET /api/sitios", "GET", "/api/sitios", "/api/sitios", None),
+        ("GET /api/usuarios", "GET", "/api/usuarios", "/api/usuarios", None),
+        ("GET /api/camiones", "GET", "/api/camiones", "/api/camiones", None),
+        ("GET /api/rampas", "GET", "/api/rampas", "/api/rampas", None),
+        ("GET /api/rampas/resumen", "GET", "/api/rampas/resumen", "/api/rampas/resumen", None),
+        ("GET /api/buscar", "GET", "/api/buscar", "/api/buscar", {"q": "B00O01"}),
+        ("GET /api/movimientos", "GET", "/api/movimientos", "/api/movimientos", None),
+        ("GET /api/movimientos [fecha]", "GET", "/api/movimientos", "/api/movimientos",
+         {"fecha": d["fecha"], "limit": 1000}),
+        ("GET /api/movimientos [estado, limit=1000]", "GET", "/api/movimientos", "/api/movimientos",
+         {"estado": "salida_cd", "limit": 1000}),
+        ("GET /api/movimientos [fields]", "GET", "/api/movimientos", "/api/movimientos",
+         {"fields": "id,estado,camion.placa", "limit": 1000}),
+        ("GET /api/movimientos/activos", "GET", "/api/movimientos/activos", "/api/movimientos/activos", None),
+        ("GET /api/movimientos/{id} [activo]", "GET", "/api/movimientos/{movimiento_id}",
+         f"/api/movimientos/{mov}", None),
+        ("GET /api/movimientos/{id} [histórico]", "GET", "/api/movimientos/{movimiento_id}",
+         f"/api/movimientos/{d['movimiento_historico']}", None),
+        ("GET /api/estadisticas", "GET", "/api/estadisticas", "/api/estadisticas", None),
+        ("GET /api/patio/snapshot", "GET", "/api/patio/snapshot", "/api/patio/snapshot", {"at": d["instante"]}),
+        ("GET /api/changes", "GET", "/api/changes", "/api/changes", {"since": 0, "limit": 1000}),
+        ("GET /api/analytics/ocupacion", "GET", "/api/analytics/ocupacion", "/api/analytics/ocupacion", None),
+        ("GET /api/analytics/estadias", "GET", "/api/analytics/estadias", "/api/analytics/estadias", None),
+        # Sin pedir el reporte antes: 404 sin tocar la BD (el pool se mide en bench/reportes.py)
+        ("GET /api/reportes/{id}", "GET", "/api/reportes/{reporte_id}", f"/api/reportes/{reporte}", None),
+        ("GET /api/reportes/{id}/descarga", "GET", "/api/reportes/{reporte_id}/descarga",
+         f"/api/reportes/{reporte}/descarga", None),
+        ("GET /api/salud", "GET", "/api/salud", "/api/salud", None),
+        ("GET /api/metricas/db", "GET", "/api/metricas/db", "/api/metricas/db", None),
+        ("GET /api/ws/esquema", "GET", "/api/ws/esquema", "/api/ws/esquema", None),
+        ("GET /api/metricas/ws", "GET", "/api/metricas/ws", "/api/metricas/ws", None),
+        ("GET /api/metricas/stream", "GET", "/api/metricas/stream", "/api/metricas/stream", None),
+        ("GET /api/metricas/notificaciones", "GET", "/api/metricas/notificaciones",
+         "/api/metricas/notificaciones", None),
+        ("GET /api/metricas/sesiones", "GET", "/api/metricas/sesiones", "/api/metricas/sesiones", None),
+        ("GET /api/metricas/reportes", "GET", "/api/metricas/reportes", "/api/metricas/reportes", None),
+        ("GET /api/metricas/busqueda", "GET", "/api/metricas/busqueda", "/api/metricas/busqueda", None),
+        ("GET /api/notificaciones/{usuario_id}", "GET", "/api/notificaciones/{usuario_id}",
+         f"/api/notificaciones/{chofer}", None),
+        ("GET /api/notificaciones/{usuario_id}/no-leidas", "GET", "/api/notificaciones/{usuario_id}/no-leidas",
+         f"/api/notificaciones/{chofer}/no-leidas", None),
+        ("GET /api/chofer/{chofer_id}/movimiento-activo", "GET", "/api/chofer/{chofer_id}/movimiento-activo",
+         f"/api/chofer/{chofer}/movimiento-activo", None),
+    ]
+
+
+async def ciclo_escritura(llamar, prefijo: str, i: int):
+    """
+    Crea chofer, camión y rampa propios y recorre el ciclo completo con ellos,
+    así las filas sembradas no cambian entre repeticiones.
+    """
+    sufijo = f"{prefijo}{i:04d}"
+    sitio = await llamar("POST /api/sitios", "POST", "/api/sitios", "/api/sitios", json={
+        "codigo": f"S{sufijo}", "nombre": f"CD bench {sufijo}"})
+    await llamar("PUT /api/sitios/{id}", "PUT", "/api/sitios/{sitio_id}",
+                 f"/api/sitios/{sitio['id']}", json={"activo": False})
+    chofer = await llamar("POST /api/usuarios", "POST", "/api/usuarios", "/api/usuarios", json={
+        "codigo": f"X{sufijo}", "nombre": f"Chofer bench {sufijo}", "rol": "chofer", "pin": PIN})
+    await llamar("PUT /api/usuarios/{id}", "PUT", "/api/usuarios/{usuario_id}",
+                 f"/api/usuarios/{chofer['id']}", json={"telefono": "809-555-1111"})
+    await llamar("POST /api/auth/login", "POST", "/api/auth/login", "/api/auth/login",
+                 json={"codigo": f"X{sufijo}", "pin": PIN})
+    camion = await llamar("POST /api/camiones", "POST", "/api/camiones", "/api/camiones", json={
+        "placa": f"Y{sufijo}", "tipo": "seco", "chofer_id": chofer["id"]})
+    await llamar("PUT /api/camiones/{id}", "PUT", "/api/camiones/{camion_id}",
+                 f"/api/camiones/{camion['id']}", json={"capacidad": "12 ton"})
+    rampa = await llamar("POST /api/rampas", "POST", "/api/rampas", "/api/rampas", json={
+        "numero": 1_000_000 + i, "nombre": f"Rampa bench {sufijo}"})
+    await llamar("PUT /api/rampas/{id}", "PUT", "/api/rampas/{rampa_id}",
+                 f"/api/rampas/{rampa['id']}", json={"nombre": f"Rampa bench {sufijo}*"})
+
+    mov = await llamar("POST /api/movimientos/ingreso", "POST", "/api/movimientos/ingreso",
+                       "/api/movimientos/ingreso", json={"placa": camion["placa"], "chofer_codigo": chofer["codigo"]})
+    mid = mov["id"]
+    pasos = [
+        ("POST /api/movimientos/{id}/disponible", "/api/movimientos/{movimiento_id}/disponible",
+         f"/api/movimientos/{mid}/disponible", None),
+        ("POST /api/movimientos/solicitar", "/api/movimientos/solicitar", "/api/movimientos/solicitar",
+         {"movimiento_id": mid, "solicitado_por": "bench"}),
+        ("POST /api/movimientos/asignar", "/api/movimientos/asignar", "/api/movimientos/asignar",
+         {"movimiento_id": mid, "rampa_id": rampa["id"]}),
+        ("POST /api/movimientos/{id}/confirmar-chofer", "/api/movimientos/{movimiento_id}/confirmar-chofer",
+         f"/api/movimientos/{mid}/confirmar-chofer", None),
+        ("POST /api/movimientos/{id}/en-rampa", "/api/movimientos/{movimiento_id}/en-rampa",
+         f"/api/movimientos/{mid}/en-rampa", None),
+        ("POST /api/movimientos/{id}/carga-lista", "/api/movimientos/{movimiento_id}/carga-lista",
+         f"/api/movimientos/{mid}/carga-lista", None),
+        ("POST /api/movimientos/{id}/salida-rampa", "/api/movimientos/{movimiento_id}/salida-rampa",
+         f"/api/movimientos/{mid}/salida-rampa", None),
+        ("POST /api/movimientos/salida-cd", "/api/movimientos/salida-cd", "/api/movimientos/salida-cd",
+         {"movimiento_id": mid, "chofer_codigo": chofer["codigo"]}),
+    ]
+    for nombre, ruta, url, cuerpo in pasos:
+        await llamar(nombre, "POST", ruta, url, json=cuerpo)
+
+    avisos = await llamar("GET /api/notificaciones/{usuario_id}", None, None,
+                          f"/api/notificaciones/{chofer['id']}", medir=False)
+    ids = [a["id"] for a in avisos]
+    await llamar("POST /api/notificaciones/{id}/leer", "POST", "/api/notificaciones/{notificacion_id}/leer",
+                 f"/api/notificaciones/{ids[0]}/leer")
+    await llamar("POST /api/notificaciones/leer", "POST", "/api/notificaciones/leer",
+                 "/api/notificaciones/leer", json={"ids": ids[1:]})
+    await llamar("POST /api/notificaciones/{usuario_id}/leer-todas", "POST",
+                 "/api/notificaciones/{usuario_id}/leer-todas", f"/api/notificaciones/{chofer['id']}/leer-todas")
+
+# ========================================
+# MEDICIÓN (proceso hijo)
+# ========================================
+
+class Medidor:
+    def __init__(self):
+        self.tiempos = {}
+        self.consultas = {}
+        self.picos = {}
+        self.estados = {}
+        self.rutas = {}  # nombre -> (método, ruta de la app)
+        self.contador = None  # ContadorConsultas activo durante la corrida
+        self.medir_memoria = False
+        self.registrar = True
+
+    def cliente(self, app):
+        """Cliente en proceso con la sesión del admin sembrado (el token manda sobre las cookies del login)"""
+        import httpx
+        from models import RolUsuario, SITIO_POR_DEFECTO
+        from sesiones import sesiones
+        token = sesiones.emitir(ADMIN_ID, RolUsuario.ADMIN, SITIO_POR_DEFECTO)
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench",
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    def llamador(self, cliente):
+        async def llamar(nombre, metodo, ruta, url, params=None, json=None, medir=True):
+            self.contador.reiniciar()
+            if self.medir_memoria:
+                tracemalloc.reset_peak()
+                antes = tracemalloc.get_traced_memory()[0]
+            inicio = time.perf_counter()
+            respuesta = await cliente.request(metodo or "GET", url, params=params, json=json)
+            duracion = time.perf_counter() - inicio
+            if respuesta.status_code >= 500 or (respuesta.status_code >= 400 and metodo != "GET"):
+                raise RuntimeError(f"{nombre}: {respuesta.status_code} {respuesta.text[:200]}")
+            if medir and self.registrar:
+                self.rutas[nombre] = (metodo, ruta)
+                self.estados.setdefault(nombre, set()).add(respuesta.status_code)
+                if self.medir_memoria:
+                    pico = tracemalloc.get_traced_memory()[1] - antes
+                    self.picos[nombre] = max(self.picos.get(nombre, 0), pico)
+                else:
+                    self.tiempos.setdefault(nombre, []).append(duracion)
+                    self.consultas.setdefault(nombre, []).append(self.contador.total)
+            return respuesta.json() if "json" in respuesta.headers.get("content-type", "") else None
+        return llamar
+
+    def resultado(self) -> dict:
+        rutas = {}
+        for nombre, tiempos in self.tiempos.items():
+            rutas[nombre] = {
+                "ruta": " ".join(self.rutas[nombre]),
+                "n": len(tiempos),
+                "p50_ms": round(statistics.median(tiempos) * 1000, 3),
+                "p95_ms": round(_percentil(tiempos, 95) * 1000, 3),
+                "max_ms": round(max(tiempos) * 1000, 3),
+                "consultas": max(self.consultas[nombre]),
+                "pico_kb": round(self.picos.get(nombre, 0) / 1024, 1),
+                "estados": sorted(self.estados[nombre]),
+            }
+        return rutas
+
+
+async def _medir(datos: dict, repeticiones: int) -> dict:
+    from fastapi.routing import APIRoute
+    import main
+    from database import engine, engine_lectura
+
+    medidor = Medidor()
+    medidor.contador = ContadorConsultas(engine, engine_lectura).__enter__()
+    await main.calentar()  # lo que hace el lifespan; ASGITransport no lo dispara
+
+    prefijo = uuid.uuid4().hex[:5].upper()
+    async with medidor.cliente(main.app) as cliente:
+        llamar = medidor.llamador(cliente)
+
+        # Calentamiento: una vuelta sin registrar
+        medidor.registrar = False
+        for nombre, metodo, ruta, url, params in casos_lectura(datos):
+            await llamar(nombre, metodo, ruta, url, params)
+        await ciclo_escritura(llamar, prefijo, 0)
+        medidor.registrar = True
+
+        for i in range(repeticiones):
+            for nombre, metodo, ruta, url, params in casos_lectura(datos):
+                await llamar(nombre, metodo, ruta, url, params)
+            await ciclo_escritura(llamar, prefijo, i + 1)
+
+        # Memoria en una pasada aparte: tracemalloc multiplica la latencia
+        medidor.medir_memoria = True
+        tracemalloc.start()
+        for nombre, metodo, ruta, url, params in casos_lectura(datos):
+            await llamar(nombre, metodo, ruta, url, params)
+        await ciclo_escritura(llamar, prefijo, repeticiones + 1)
+        tracemalloc.stop()
+    medidor.contador.__exit__()
+
+    medidas = {(m, r) for m, r in medidor.rutas.values()}
+    sin_caso = sorted(
+        f"{metodo} {ruta.path}"
+        for ruta in main.app.routes if isinstance(ruta, APIRoute)
+        for metodo in ruta.methods
+        if (metodo, ruta.path) not in medidas and (metodo, ruta.path) not in EXCLUIDAS
+    )
+    return {"rutas": medidor.resultado(), "sin_caso": sin_caso}
+
+
+def _hijo(tamano: str, repeticiones: int, resembrar: bool, salida: str):
+    os.environ["DATABASE_URL"] = _url_bd(tamano)
+    sys.path.insert(0, BACKEND)
+    os.chdir(BACKEND)
+    from database import engine
+
+    n_rampas, n_movimientos = TAMANOS[tamano]
+    inicio = time.perf_counter()
+    datos = None if resembrar else _siembra_existente(n_rampas, n_movimientos)
+    sembrado = datos is None
+    if sembrado:
+        datos = _sembrar(n_rampas, n_movimientos)
+    siembra_s = time.perf_counter() - inicio
+
+    _limpiar(datos)
+    try:
+        resultado = asyncio.run(_medir(datos, repeticiones))
+    finally:
+        _limpiar(datos)
+    resultado.update(
+        rampas=n_rampas, movimientos=n_movimientos, bd=engine.dialect.name,
+        siembra_s=round(siembra_s, 1) if sembrado else None,
+    )
+    with open(salida, "w") as f:
+        json.dump(resultado, f)
+
+# ========================================
+# ORQUESTACIÓN Y COMPARACIÓN
+# ========================================
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BACKEND, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "?"
+
+
+def comparar(anterior: dict, actual: dict, umbral: float) -> list:
+    """Rutas que empeoraron: p50 sobre el umbral (y más de 1 ms) o más consultas"""
+    regresiones = []
+    for tamano, datos in actual["tamanos"].items():
+        previo = anterior.get("tamanos", {}).get(tamano)
+        if not previo:
+            continue
+        print(f"\n{tamano}: {anterior.get('commit')} -> {actual.get('commit')}")
+        print(f"  {'ruta':52s} {'p50 ms':>17s} {'consultas':>10s}")
+        for nombre, r in datos["rutas"].items():
+            p = previo["rutas"].get(nombre)
+            if not p:
+                continue
+            peor_tiempo = r["p50_ms"] > p["p50_ms"] * (1 + umbral) and r["p50_ms"] - p["p50_ms"] > 1
+            peor_consultas = r["consultas"] > p["consultas"]
+            marca = "  REGRESIÓN" if peor_tiempo or peor_consultas else ""
+            print(f"  {nombre:52s} {p['p50_ms']:7.2f} -> {r['p50_ms']:7.2f} "
+                  f"{p['consultas']:4d} -> {r['consultas']:<4d}{marca}")
+            if marca:
+                regresiones.append(f"{tamano} {nombre}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", default="chico", help=f"Separados por coma: {', '.join(TAMANOS)}")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--resembrar", action="store_true", help="Sembrar aunque la BD ya tenga el tamaño")
+    parser.add_argument("--salida", help="Guardar los resultados en este JSON")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--umbral", type=float, default=0.25, help="Empeoramiento de p50 tolerado (0.25 = 25%%)")
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    parser.add_argument("--archivo-hijo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        _hijo(args.hijo, args.repeticiones, args.resembrar, args.archivo_hijo)
+        return
+
+    tamanos = [t.strip() for t in args.tamanos.split(",") if t.strip()]
+    for tamano in tamanos:
+        if tamano not in TAMANOS:
+            parser.error(f"Tamaño desconocido: {tamano}")
+
+    resultados = {
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "repeticiones": args.repeticiones,
+        "tamanos": {},
+    }
+    for tamano in tamanos:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            archivo = tmp.name
+        comando = [sys.executable, os.path.abspath(__file__), "--hijo", tamano, "--archivo-hijo", archivo,
+                   "--repeticiones", str(args.repeticiones)] + (["--resembrar"] if args.resembrar else [])
+        subprocess.run(comando, check=True)
+        with open(archivo) as f:
+            datos = json.load(f)
+        os.unlink(archivo)
+        resultados["tamanos"][tamano] = datos
+
+        sembrado = f", siembra {datos['siembra_s']} s" if datos["siembra_s"] is not None else ""
+        print(f"\n{tamano}: {datos['rampas']} rampas, {datos['movimientos']} movimientos ({datos['bd']}{sembrado})")
+        print(f"  {'ruta':52s} {'p50 ms':>8s} {'p95 ms':>8s} {'consultas':>9s} {'pico KB':>8s}")
+        for nombre, r in datos["rutas"].items():
+            print(f"  {nombre:52s} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} {r['consultas']:9d} {r['pico_kb']:8.1f}")
+        if datos["sin_caso"]:
+            print(f"  sin caso: {', '.join(datos['sin_caso'])}")
+
+    if args.salida:
+        os.makedirs(os.path.dirname(os.path.abspath(args.salida)), exist_ok=True)
+        with open(args.salida, "w") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar) as f:
+            anterior = json.load(f)
+        regresiones = comparar(anterior, resultados, args.umbral)
+        if regresiones:
+            print(f"\n{len(regresiones)} rutas empeoraron")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Prueba de resistencia de WebSockets - Control de Patio
+Levanta la app en proceso (uvicorn, mismo event loop) y abre/cierra miles de
+sockets /ws/{user_id} en rondas, mezclando tres tipos de cliente:
+
+    limpio     cierra el socket normalmente
+    cortado    aborta el TCP sin handshake de cierre (teléfono que cambia de red)
+    mudo       queda abierto sin responder los ping (socket medio abierto)
+
+Corre la carga dos veces: la primera de calentamiento fija la línea base; tras
+la segunda espera el timeout de inactividad y verifica que las conexiones, las
+objetos WebSocket, las tareas asyncio y la memoria (tracemalloc, sin contar
+las tablas hash) vuelven a esa línea base. Sale con
+código 1 si no vuelven.
+
+    python bench/soak_ws.py --rondas 10 --lote 300
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Latido corto para que la prueba dure segundos y no minutos
+os.environ.setdefault("WS_PING_S", "0.5")
+os.environ.setdefault("WS_IDLE_TIMEOUT_S", "2")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/patio_soak_ws.db")
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+os.chdir(BACKEND)  # main.py monta ../frontend relativo al backend
+
+import uvicorn  # noqa: E402
+import websockets  # noqa: E402
+
+from starlette.websockets import WebSocket  # noqa: E402
+
+from database import crear_esquema  # noqa: E402
+crear_esquema()
+import main  # noqa: E402
+from conexiones import manager  # noqa: E402
+from models import RolUsuario, SITIO_POR_DEFECTO  # noqa: E402
+from sesiones import sesiones  # noqa: E402
+
+TIPOS = ("limpio", "cortado", "mudo")
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Bloques grandes sueltos son tablas hash (selector, transportes, dict de
+# sockets) que se realocan al crecer o rehashear: no escalan con las conexiones
+BLOQUE_TABLA = 4096
+
+
+def _medir() -> dict:
+    gc.collect()
+    bloques = tracemalloc.take_snapshot().traces if tracemalloc.is_tracing() else ()
+    return {
+        "memoria_kb": round(sum(t.size for t in bloques if t.size < BLOQUE_TABLA) / 1024, 1),
+        "tablas_kb": round(sum(t.size for t in bloques if t.size >= BLOQUE_TABLA) / 1024, 1),
+        "websockets_vivos": sum(isinstance(o, WebSocket) for o in gc.get_objects()),
+        "tareas": len(asyncio.all_tasks()),
+        "sockets": manager.total_sockets(),
+        "usuarios": len(manager.active_connections),
+    }
+
+
+async def _cliente(url: str, token: str, tipo: str, mudos: list):
+    ws = await websockets.connect(
+        url, max_size=None, ping_interval=None, extra_headers={"Authorization": f"Bearer {token}"}
+    )
+    if tipo == "mudo":
+        mudos.append(ws)  # ni lee ni responde: el servidor debe desalojarlo
+        return
+    # Un pong para ejercitar el camino de actividad antes de irse
+    await ws.send('{"tipo": "pong"}')
+    if tipo == "limpio":
+        await ws.close()
+    else:
+        ws.transport.abort()
+
+
+async def _ronda(base_url: str, lote: int, tokens: dict, mudos: list, semaforo: asyncio.Semaphore):
+    async def uno(i):
+        async with semaforo:
+            tipo = TIPOS[i % len(TIPOS)]
+            usuario_id = random.randint(1, len(tokens))
+            await _cliente(f"{base_url}/ws/{usuario_id}", tokens[usuario_id], tipo, mudos)
+
+    await asyncio.gather(*(uno(i) for i in range(lote)))
+
+
+async def _esperar_vacio(timeout: float) -> bool:
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if manager.total_sockets() == 0 and not manager.active_connections:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def ejecutar(args) -> dict:
+    puerto = _puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(
+        main.app, host="127.0.0.1", port=puerto, log_level="warning", ws="websockets"
+    ))
+    tarea_servidor = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.05)
+    base_url = f"ws://127.0.0.1:{puerto}"
+    semaforo = asyncio.Semaphore(args.concurrencia)
+    espera_desalojo = manager.idle_timeout_s + 3 * manager.ping_s + 2
+    # Un token por usuario, emitido antes de la línea base
+    tokens = {i: sesiones.emitir(i, RolUsuario.CHOFER, SITIO_POR_DEFECTO) for i in range(1, args.usuarios + 1)}
+
+    async def ciclo(rondas):
+        mudos = []
+        for _ in range(rondas):
+            await _ronda(base_url, args.lote, tokens, mudos, semaforo)
+        pico = manager.total_sockets()
+        vacio = await _esperar_vacio(espera_desalojo + 10)
+        for ws in mudos:
+            ws.transport.abort()
+        mudos.clear()
+        await asyncio.sleep(1)  # cierres en vuelo del lado del servidor
+        return pico, vacio
+
+    # Calentamiento con la misma carga: imports perezosos, caches de SQLAlchemy y
+    # tablas hash (selector, transportes, tareas) que crecen hasta el pico de
+    # sockets y no se achican. Lo que crezca después de esto es fuga.
+    await ciclo(args.rondas)
+    tracemalloc.start()
+    base = _medir()
+    desalojados_antes = manager.desalojados
+
+    inicio = time.perf_counter()
+    pico, vacio = await ciclo(args.rondas)
+    duracion = time.perf_counter() - inicio
+    final = _medir()
+    tracemalloc.stop()
+
+    servidor.should_exit = True
+    await tarea_servidor
+
+    crecimiento_kb = final["memoria_kb"] - base["memoria_kb"]
+    fallas = []
+    if not vacio or final["sockets"] or final["usuarios"]:
+        fallas.append(f"quedaron {final['sockets']} sockets de {final['usuarios']} usuarios")
+    if final["websockets_vivos"] > base["websockets_vivos"]:
+        fallas.append(f"objetos WebSocket vivos {base['websockets_vivos']} -> {final['websockets_vivos']}")
+    if final["tareas"] > base["tareas"]:
+        fallas.append(f"tareas asyncio {base['tareas']} -> {final['tareas']}")
+    if crecimiento_kb > args.tolerancia_kb:
+        fallas.append(f"memoria creció {crecimiento_kb:.1f} KB (tolerancia {args.tolerancia_kb} KB)")
+
+    return {
+        "conexiones": args.rondas * args.lote,
+        "duracion_s": round(duracion, 2),
+        "pico_sockets": pico,
+        "desalojados": manager.desalojados - desalojados_antes,
+        "base": base,
+        "final": final,
+        "crecimiento_kb": round(crecimiento_kb, 1),
+        "fallas": fallas,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rondas", type=int, default=10)
+    parser.add_argument("--lote", type=int, default=300, help="Conexiones por ronda")
+    parser.add_argument("--usuarios", type=int, default=200, help="IDs de usuario entre los que se reparten")
+    parser.add_argument("--concurrencia", type=int, default=100, help="Conexiones abriéndose a la vez")
+    parser.add_argument("--tolerancia-kb", type=float, default=512,
+                        help="Crecimiento admitido: caches fijas de urllib, abc y email del cliente")
+    args = parser.parse_args()
+
+    reporte = asyncio.run(ejecutar(args))
+    print(f"{reporte['conexiones']} conexiones en {reporte['duracion_s']} s, "
+          f"pico {reporte['pico_sockets']} sockets, {reporte['desalojados']} desalojados por inactividad")
+    print(f"línea base: {reporte['base']}")
+    print(f"final:      {reporte['final']}  (memoria {reporte['crecimiento_kb']:+.1f} KB)")
+    if reporte["fallas"]:
+        for falla in reporte["fallas"]:
+            print(f"FALLA: {falla}")
+        sys.exit(1)
+    print("OK: conexiones, tareas y memoria volvieron a la línea base")
+
+
+if __name__ == "__main__":
+    main_cli()
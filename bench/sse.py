@@ -0,0 +1,238 @@
+"""
+Feed SSE para pantallas - Control de Patio
+Levanta la app en proceso (uvicorn, mismo event loop), conecta cientos de
+espectadores a /api/stream/patio y publica eventos en el canal del sitio:
+
+    - latencia de reparto: desde publicar hasta que el último espectador lo recibe
+    - memoria por espectador (tracemalloc, lado servidor y cliente juntos)
+    - reanudación: la mitad se desconecta, se publican más eventos y al volver con
+      Last-Event-ID cada uno recibe justo los que faltaban, sin foto completa
+    - al cerrar todos, el canal queda sin espectadores ni tareas colgadas
+
+Sale con código 1 si falta algún evento, se repite alguno o queda algo abierto.
+
+    python bench/sse.py --espectadores 500 --eventos 200
+"""
+import argparse
+import asyncio
+import gc
+import os
+import re
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/patio_sse.db")
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND)
+os.chdir(BACKEND)
+
+import uvicorn  # noqa: E402
+
+from database import crear_esquema  # noqa: E402
+crear_esquema()
+import main  # noqa: E402
+from mensajes import Mensaje  # noqa: E402
+from models import SITIO_POR_DEFECTO  # noqa: E402
+from transmision import transmision  # noqa: E402
+
+EVENTO = re.compile(rb"id: (\S+)\nevent: (\w+)\ndata: [^\n]*\"movimiento_id\":(\d+)")
+ESTADO = b"event: estado"
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+class Espectador:
+    """Cliente HTTP mínimo: una pantalla con EventSource"""
+
+    def __init__(self, puerto: int):
+        self.puerto = puerto
+        self.recibidos = {}  # movimiento_id -> instante
+        self.repetidos = 0
+        self.fotos = 0
+        self.ultimo_id = None
+        self._tarea = None
+        self._escritor = None
+
+    async def conectar(self, listo: asyncio.Event):
+        lector, self._escritor = await asyncio.open_connection("127.0.0.1", self.puerto)
+        cabeceras = f"Last-Event-ID: {self.ultimo_id}\r\n" if self.ultimo_id else ""
+        self._escritor.write(
+            f"GET /api/stream/patio HTTP/1.1\r\nHost: bench\r\nAccept: text/event-stream\r\n{cabeceras}\r\n".encode()
+        )
+        self._tarea = asyncio.create_task(self._leer(lector, listo))
+
+    async def _leer(self, lector, listo: asyncio.Event):
+        resto = b""
+        while True:
+            bloque = await lector.read(65536)
+            if not bloque:
+                return
+            datos = resto + bloque
+            ahora = time.perf_counter()
+            if ESTADO in datos:
+                self.fotos += datos.count(ESTADO)
+                listo.set()
+            fin = 0
+            for coincidencia in EVENTO.finditer(datos):
+                movimiento_id = int(coincidencia.group(3))
+                if movimiento_id in self.recibidos:
+                    self.repetidos += 1
+                else:
+                    self.recibidos[movimiento_id] = ahora
+                self.ultimo_id = coincidencia.group(1).decode()
+                fin = coincidencia.end()
+            if b"retry:" in datos and self.ultimo_id:
+                listo.set()  # reanudación: no llega foto
+            resto = datos[max(fin, len(datos) - 512):]
+
+    async def cerrar(self):
+        self._escritor.close()
+        self._tarea.cancel()
+        try:
+            await self._tarea
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+
+
+async def _conectar(espectadores, concurrencia: int):
+    semaforo = asyncio.Semaphore(concurrencia)
+
+    async def uno(espectador):
+        async with semaforo:
+            listo = asyncio.Event()
+            await espectador.conectar(listo)
+            await asyncio.wait_for(listo.wait(), timeout=30)
+
+    await asyncio.gather(*(uno(e) for e in espectadores))
+
+
+async def _publicar(desde: int, cantidad: int, tasa: float) -> dict:
+    enviados = {}
+    for movimiento_id in range(desde, desde + cantidad):
+        enviados[movimiento_id] = time.perf_counter()
+        transmision.publicar(Mensaje("camion_disponible", movimiento_id=movimiento_id), SITIO_POR_DEFECTO)
+        await asyncio.sleep(1 / tasa)
+    await asyncio.sleep(0.5)
+    return enviados
+
+
+async def _espectadores_en_canal(esperado: int, timeout: float) -> int:
+    canal = transmision.canales.get(SITIO_POR_DEFECTO)
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if canal is not None and canal.espectadores == esperado:
+            break
+        await asyncio.sleep(0.05)
+    return canal.espectadores if canal else 0
+
+
+async def ejecutar(args) -> dict:
+    puerto = _puerto_libre()
+    servidor = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=puerto, log_level="warning"))
+    tarea_servidor = asyncio.create_task(servidor.serve())
+    while not servidor.started:
+        await asyncio.sleep(0.05)
+    fallas = []
+
+    gc.collect()
+    tracemalloc.start()
+    memoria_base = tracemalloc.get_traced_memory()[0]
+    tareas_base = len(asyncio.all_tasks())
+
+    espectadores = [Espectador(puerto) for _ in range(args.espectadores)]
+    inicio = time.perf_counter()
+    await _conectar(espectadores, args.concurrencia)
+    conexion_s = time.perf_counter() - inicio
+    gc.collect()
+    memoria_kb = (tracemalloc.get_traced_memory()[0] - memoria_base) / 1024
+    tracemalloc.stop()
+
+    # Reparto en vivo
+    cpu = time.process_time()
+    enviados = await _publicar(1, args.eventos, args.tasa)
+    cpu_ms = (time.process_time() - cpu) * 1000
+    latencias = []
+    for movimiento_id, enviado in enviados.items():
+        llegadas = [e.recibidos[movimiento_id] for e in espectadores if movimiento_id in e.recibidos]
+        if len(llegadas) < len(espectadores):
+            fallas.append(f"evento {movimiento_id}: llegó a {len(llegadas)}/{len(espectadores)}")
+            break
+        latencias.append((max(llegadas) - enviado) * 1000)
+
+    # Reanudación: la mitad se va, se publican más eventos y vuelve con Last-Event-ID
+    mitad = espectadores[: len(espectadores) // 2]
+    await asyncio.gather(*(e.cerrar() for e in mitad))
+    await _espectadores_en_canal(len(espectadores) - len(mitad), 10)
+    enviados_ausentes = await _publicar(args.eventos + 1, args.eventos // 2, args.tasa)
+    fotos_antes = sum(e.fotos for e in mitad)
+    await _conectar(mitad, args.concurrencia)
+    await asyncio.sleep(0.5)
+    faltantes = sum(1 for e in mitad for m in enviados_ausentes if m not in e.recibidos)
+    if faltantes:
+        fallas.append(f"reanudación: {faltantes} eventos sin llegar")
+    if sum(e.fotos for e in mitad) != fotos_antes:
+        fallas.append("reanudación: se mandó la foto completa en vez de los eventos que faltaban")
+    repetidos = sum(e.repetidos for e in espectadores)
+    if repetidos:
+        fallas.append(f"{repetidos} eventos repetidos")
+
+    await asyncio.gather(*(e.cerrar() for e in espectadores))
+    quedan = await _espectadores_en_canal(0, 10)
+    await asyncio.sleep(0.5)
+    if quedan:
+        fallas.append(f"quedaron {quedan} espectadores en el canal")
+    if len(asyncio.all_tasks()) > tareas_base:
+        fallas.append(f"tareas asyncio {tareas_base} -> {len(asyncio.all_tasks())}")
+
+    servidor.should_exit = True
+    await tarea_servidor
+    return {
+        "espectadores": args.espectadores,
+        "eventos": args.eventos,
+        "conexion_s": round(conexion_s, 2),
+        "memoria_por_espectador_kb": round(memoria_kb / args.espectadores, 1),
+        "reparto_p50_ms": round(_percentil(latencias, 50) or 0, 2),
+        "reparto_p99_ms": round(_percentil(latencias, 99) or 0, 2),
+        "cpu_por_evento_y_espectador_us": round(cpu_ms * 1000 / (args.eventos * args.espectadores), 2),
+        "fallas": fallas,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--espectadores", type=int, default=500)
+    parser.add_argument("--eventos", type=int, default=200)
+    parser.add_argument("--tasa", type=float, default=50, help="Eventos por segundo")
+    parser.add_argument("--concurrencia", type=int, default=100, help="Pantallas conectándose a la vez")
+    args = parser.parse_args()
+
+    reporte = asyncio.run(ejecutar(args))
+    print(f"{reporte['espectadores']} espectadores conectados en {reporte['conexion_s']} s, "
+          f"{reporte['memoria_por_espectador_kb']} KB c/u")
+    print(f"{reporte['eventos']} eventos: reparto a todos p50 {reporte['reparto_p50_ms']} ms, "
+          f"p99 {reporte['reparto_p99_ms']} ms, CPU {reporte['cpu_por_evento_y_espectador_us']} µs "
+          f"por evento y espectador (servidor y clientes)")
+    if reporte["fallas"]:
+        for falla in reporte["fallas"]:
+            print(f"FALLA: {falla}")
+        sys.exit(1)
+    print("OK: todos los eventos llegaron una vez, la reanudación no perdió ninguno y el canal quedó vacío")
+
+
+if __name__ == "__main__":
+    main_cli()
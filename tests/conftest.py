@@ -0,0 +1,95 @@
+"""
+Pruebas - Control de Patio
+Fixtures comunes: la app completa sobre un SQLite temporal (uno por corrida),
+con los datos de demo del sitio 1 y un segundo sitio vacío.
+
+    python -m pytest -q
+
+Los tokens se emiten con sesiones.emitir (como bench/autorizacion.py): solo
+el login de los datos de demo paga el PBKDF2 del PIN.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+# Antes de importar la app: database.py arma el engine al importarse
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='patio_pruebas_')}/patio.db"
+sys.path.insert(0, BACKEND)
+
+SITIO = 1
+
+_numeros = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def cliente():
+    from fastapi.testclient import TestClient
+    from database import crear_esquema
+    crear_esquema()
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture(scope="session")
+def demo(cliente):
+    """Datos de demo del sitio 1: {"pines": {codigo: pin}, "usuarios": {codigo: usuario}}"""
+    respuesta = cliente.post("/api/setup/datos-demo")
+    assert respuesta.status_code == 200, respuesta.text
+    pines = respuesta.json()["data"]["pines"]
+    login = cliente.post("/api/auth/login", json={"codigo": "ADMIN01", "pin": pines["ADMIN01"]}).json()
+    cliente.cookies.clear()  # cada prueba manda su propio token
+    usuarios = cliente.get("/api/usuarios", headers={"Authorization": f"Bearer {login['token']}"}).json()
+    return {"pines": pines, "usuarios": {u["codigo"]: u for u in usuarios}}
+
+
+@pytest.fixture(scope="session")
+def cabeceras(demo):
+    """cabeceras(codigo, sitio=None): Authorization del usuario (y X-Sitio si se pide otro sitio)"""
+    from sesiones import sesiones
+
+    def armar(codigo: str, sitio: int = None) -> dict:
+        usuario = demo["usuarios"][codigo]
+        token = sesiones.emitir(usuario["id"], usuario["rol"], usuario["sitio_id"])
+        resultado = {"Authorization": f"Bearer {token}"}
+        if sitio is not None:
+            resultado["X-Sitio"] = str(sitio)
+        return resultado
+    return armar
+
+
+@pytest.fixture(scope="session")
+def otro_sitio(cliente, cabeceras):
+    """Un segundo centro de distribución con una rampa"""
+    respuesta = cliente.post("/api/sitios", json={"codigo": "CD-PRUEBAS", "nombre": "CD Pruebas"},
+                             headers=cabeceras("ADMIN01"))
+    assert respuesta.status_code == 200, respuesta.text
+    sitio_id = respuesta.json()["id"]
+    respuesta = cliente.post("/api/rampas", json={"numero": 1, "nombre": "Rampa 1 - Pruebas"},
+                             headers=cabeceras("ADMIN01", sitio_id))
+    assert respuesta.status_code == 200, respuesta.text
+    return sitio_id
+
+
+@pytest.fixture
+def camion_nuevo(cliente, cabeceras):
+    """camion_nuevo(sitio=1): alta de un chofer con su camión; devuelve (placa, codigo, chofer_id)"""
+    def crear(sitio: int = SITIO):
+        n = next(_numeros)
+        admin = cabeceras("ADMIN01", sitio)
+        chofer = cliente.post("/api/usuarios", headers=admin, json={
+            "codigo": f"PRU{n:04d}", "nombre": f"Chofer Prueba {n}", "rol": "chofer",
+            "telefono": f"809-555-{n:04d}", "pin": "2468",
+        })
+        assert chofer.status_code == 200, chofer.text
+        placa = f"P{n:06d}"
+        camion = cliente.post("/api/camiones", headers=admin, json={
+            "placa": placa, "tipo": "seco", "chofer_id": chofer.json()["id"],
+        })
+        assert camion.status_code == 200, camion.text
+        return placa, f"PRU{n:04d}", chofer.json()["id"]
+    return crear
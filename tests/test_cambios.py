@@ -0,0 +1,120 @@
+"""
+Feed de cambios (cambios.py, GET /api/changes): offsets en orden, sin huecos
+ni repetidos al paginar, por sitio, y 410 cuando lo pedido ya pasó al archivo.
+"""
+from datetime import datetime
+
+import pytest
+
+from conftest import SITIO
+from cambios import LIMITE_MAXIMO  # backend/ en el path desde conftest
+
+
+def _ingreso_y_disponible(cliente, cabeceras, camion_nuevo, sitio: int = SITIO) -> int:
+    """Un movimiento nuevo con dos transiciones (ingreso y disponible); devuelve su id"""
+    placa, codigo, _ = camion_nuevo(sitio)
+    admin = cabeceras("ADMIN01", sitio)
+    movimiento = cliente.post("/api/movimientos/ingreso", headers=admin,
+                              json={"placa": placa, "chofer_codigo": codigo})
+    assert movimiento.status_code == 200, movimiento.text
+    movimiento_id = movimiento.json()["id"]
+    assert cliente.post(f"/api/movimientos/{movimiento_id}/disponible", headers=admin).status_code == 200
+    return movimiento_id
+
+
+def _feed(cliente, cabeceras, sitio: int = SITIO, **params) -> dict:
+    respuesta = cliente.get("/api/changes", params=params, headers=cabeceras("ADMIN01", sitio))
+    assert respuesta.status_code == 200, respuesta.text
+    return respuesta.json()
+
+
+def _todo(cliente, cabeceras, sitio: int = SITIO, since: int = 0, limit: int = 1000) -> list:
+    """Recorre el feed como un consumidor: siguiente de cada respuesta mientras hay_mas"""
+    cambios = []
+    while True:
+        lote = _feed(cliente, cabeceras, sitio, since=since, limit=limit)
+        assert all(c["offset"] > since for c in lote["cambios"]), "repite un offset ya procesado"
+        cambios += lote["cambios"]
+        assert lote["siguiente"] == (lote["cambios"][-1]["offset"] if lote["cambios"] else since)
+        since = lote["siguiente"]
+        if not lote["hay_mas"]:
+            return cambios
+
+
+def test_transiciones_en_orden(cliente, cabeceras, camion_nuevo):
+    desde = _feed(cliente, cabeceras, since=0, limit=5000)["siguiente"]
+    movimiento_id = _ingreso_y_disponible(cliente, cabeceras, camion_nuevo)
+    nuevos = _todo(cliente, cabeceras, since=desde)
+    propios = [(c["estado_anterior"], c["estado"]) for c in nuevos if c["movimiento_id"] == movimiento_id]
+    assert propios == [(None, "ingresado_garita"), ("ingresado_garita", "disponible_patio")]
+    offsets = [c["offset"] for c in nuevos]
+    assert offsets == sorted(set(offsets)) and offsets[0] > desde
+
+
+def test_paginado_sin_huecos_ni_repetidos(cliente, cabeceras, camion_nuevo):
+    for _ in range(3):
+        _ingreso_y_disponible(cliente, cabeceras, camion_nuevo)
+    completo = _todo(cliente, cabeceras)
+    assert len(completo) >= 6
+    assert _todo(cliente, cabeceras, limit=1) == completo
+    assert _todo(cliente, cabeceras, limit=4) == completo
+    # Desde la mitad: exactamente lo que sigue
+    mitad = completo[len(completo) // 2]["offset"]
+    assert _todo(cliente, cabeceras, since=mitad) == [c for c in completo if c["offset"] > mitad]
+
+
+def test_al_dia_devuelve_vacio(cliente, cabeceras):
+    ultimo = _feed(cliente, cabeceras, since=0, limit=5000)["siguiente"]
+    lote = _feed(cliente, cabeceras, since=ultimo)
+    assert lote == {"cambios": [], "siguiente": ultimo, "hay_mas": False}
+
+
+def test_feed_por_sitio(cliente, cabeceras, camion_nuevo, otro_sitio):
+    ajeno = _ingreso_y_disponible(cliente, cabeceras, camion_nuevo, otro_sitio)
+    propio = _ingreso_y_disponible(cliente, cabeceras, camion_nuevo)
+    movimientos_propios = {c["movimiento_id"] for c in _todo(cliente, cabeceras)}
+    movimientos_ajenos = {c["movimiento_id"] for c in _todo(cliente, cabeceras, otro_sitio)}
+    assert propio in movimientos_propios and ajeno not in movimientos_propios
+    assert ajeno in movimientos_ajenos and propio not in movimientos_ajenos
+
+
+@pytest.mark.parametrize("params", [{"since": -1}, {"limit": 0}, {"limit": LIMITE_MAXIMO + 1}])
+def test_parametros_fuera_de_rango(cliente, cabeceras, params):
+    assert cliente.get("/api/changes", params=params, headers=cabeceras("ADMIN01")).status_code == 422
+
+
+def test_feed_pide_sesion(cliente):
+    assert cliente.get("/api/changes").status_code == 401
+
+
+def test_offsets_archivados(cliente, cabeceras, camion_nuevo, tmp_path):
+    """Un sitio propio: archivar solo toca las transiciones que se vuelven viejas acá"""
+    import mantenimiento
+    from database import SessionLocal
+    from models import Transicion
+
+    sitio = cliente.post("/api/sitios", json={"codigo": "CD-ARCHIVO", "nombre": "CD Archivo"},
+                         headers=cabeceras("ADMIN01")).json()["id"]
+    _ingreso_y_disponible(cliente, cabeceras, camion_nuevo, sitio)
+    viejos = [c["offset"] for c in _todo(cliente, cabeceras, sitio)]
+    _ingreso_y_disponible(cliente, cabeceras, camion_nuevo, sitio)
+    db = SessionLocal()
+    try:
+        db.query(Transicion).filter(Transicion.id.in_(viejos)).update({"momento": datetime(2020, 1, 15)})
+        db.commit()
+    finally:
+        db.close()
+
+    resumen = mantenimiento.archivar(directorio=str(tmp_path))
+    assert resumen["filas"]["transiciones"] == len(viejos)
+    assert list((tmp_path / "transiciones").rglob("*.ndjson.gz"))
+
+    for since in (0, viejos[0]):
+        respuesta = cliente.get("/api/changes", params={"since": since}, headers=cabeceras("ADMIN01", sitio))
+        assert respuesta.status_code == 410
+        assert f"since={viejos[-1]}" in respuesta.json()["detail"]
+    # Desde la marca, el feed sigue con lo que quedó vivo
+    restantes = _todo(cliente, cabeceras, sitio, since=viejos[-1])
+    assert len(restantes) == 2 and restantes[0]["offset"] > viejos[-1]
+    # Los demás sitios no tienen marca
+    assert _feed(cliente, cabeceras, since=0, limit=1)["cambios"]
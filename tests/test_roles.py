@@ -0,0 +1,181 @@
+"""
+Permisos por rol (README → Roles): gestión de usuarios, listados con códigos
+y teléfonos, y lo que ve una pantalla del patio sin sesión.
+"""
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from conftest import SITIO
+
+
+# ----------------------------------------
+# Usuarios: logística no crea ni toca admins
+# ----------------------------------------
+
+def test_logistica_no_crea_admin(cliente, cabeceras):
+    respuesta = cliente.post("/api/usuarios", headers=cabeceras("LOG001"), json={
+        "codigo": "ADMLOG", "nombre": "Admin de logística", "rol": "admin", "pin": "9999",
+    })
+    assert respuesta.status_code == 403
+
+
+def test_admin_crea_admin(cliente, cabeceras):
+    respuesta = cliente.post("/api/usuarios", headers=cabeceras("ADMIN01"), json={
+        "codigo": "ADM002", "nombre": "Segundo admin", "rol": "admin", "pin": "9999",
+    })
+    assert respuesta.status_code == 200
+    assert respuesta.json()["rol"] == "admin"
+
+
+def test_logistica_no_cambia_pin_de_admin(cliente, cabeceras, demo):
+    admin_id = demo["usuarios"]["ADMIN01"]["id"]
+    respuesta = cliente.put(f"/api/usuarios/{admin_id}", headers=cabeceras("LOG001"), json={"pin": "0000"})
+    assert respuesta.status_code == 403
+    # El PIN sigue siendo el de los datos de demo
+    login = cliente.post("/api/auth/login", json={"codigo": "ADMIN01", "pin": demo["pines"]["ADMIN01"]})
+    cliente.cookies.clear()
+    assert login.json()["success"]
+
+
+def test_logistica_edita_chofer(cliente, cabeceras, demo):
+    chofer_id = demo["usuarios"]["CHO003"]["id"]
+    respuesta = cliente.put(f"/api/usuarios/{chofer_id}", headers=cabeceras("LOG001"),
+                            json={"telefono": "809-555-0303"})
+    assert respuesta.status_code == 200
+    assert respuesta.json()["telefono"] == "809-555-0303"
+
+
+def test_datos_demo_sin_pin_fijo(demo):
+    assert len(demo["pines"]) == len(demo["usuarios"])
+    assert len(set(demo["pines"].values())) > 1
+
+
+def test_datos_demo_con_usuarios_pide_admin(cliente, cabeceras):
+    assert cliente.post("/api/setup/datos-demo").status_code == 401
+    assert cliente.post("/api/setup/datos-demo", headers=cabeceras("LOG001")).status_code == 403
+
+
+# ----------------------------------------
+# Listados con códigos de login y teléfonos
+# ----------------------------------------
+
+@pytest.mark.parametrize("ruta", ["/api/usuarios", "/api/camiones"])
+@pytest.mark.parametrize("codigo, estado", [
+    ("ADMIN01", 200), ("LOG001", 200), ("DES001", 200), ("CHO001", 403),
+])
+def test_listados_solo_personal(cliente, cabeceras, ruta, codigo, estado):
+    assert cliente.get(ruta, headers=cabeceras(codigo)).status_code == estado
+
+
+@pytest.mark.parametrize("ruta", ["/api/usuarios", "/api/camiones", "/api/buscar?q=CHO"])
+def test_listados_sin_sesion(cliente, ruta):
+    assert cliente.get(ruta).status_code == 401
+
+
+def test_chofer_no_busca(cliente, cabeceras):
+    assert cliente.get("/api/buscar?q=CHO", headers=cabeceras("CHO001")).status_code == 403
+
+
+# ----------------------------------------
+# Etapas del patio
+# ----------------------------------------
+
+def test_chofer_no_asigna_rampa(cliente, cabeceras, camion_nuevo):
+    placa, codigo, _ = camion_nuevo()
+    admin = cabeceras("ADMIN01")
+    movimiento = cliente.post("/api/movimientos/ingreso", headers=admin,
+                              json={"placa": placa, "chofer_codigo": codigo}).json()
+    assert cliente.post(f"/api/movimientos/{movimiento['id']}/disponible", headers=admin).status_code == 200
+    respuesta = cliente.post("/api/movimientos/asignar", headers=cabeceras("CHO001"),
+                             json={"movimiento_id": movimiento["id"], "rampa_id": 1})
+    assert respuesta.status_code == 403
+
+
+# ----------------------------------------
+# Pantallas del patio (SSE)
+# ----------------------------------------
+
+def _foto(seleccion, sesion) -> bytes:
+    """Evento estado (la foto) de /api/stream/patio, llamando a la ruta con sus dependencias ya resueltas"""
+    import main
+
+    async def primero():
+        request = Request({"type": "http", "method": "GET", "path": "/api/stream/patio",
+                           "headers": [], "query_string": b""})
+        respuesta = await main.stream_patio(request, None, seleccion, (SITIO, sesion))
+        try:
+            async for bloque in respuesta.body_iterator:
+                if b"event: estado" in bloque:
+                    return bloque
+        finally:
+            await respuesta.body_iterator.aclose()
+    return asyncio.run(primero())
+
+
+@pytest.fixture
+def patio_con_asignacion(cliente, cabeceras, camion_nuevo):
+    """Un camión con rampa asignada: la foto trae chofer y quién asignó"""
+    placa, codigo, _ = camion_nuevo()
+    admin = cabeceras("ADMIN01")
+    movimiento = cliente.post("/api/movimientos/ingreso", headers=admin,
+                              json={"placa": placa, "chofer_codigo": codigo}).json()
+    cliente.post(f"/api/movimientos/{movimiento['id']}/disponible", headers=admin)
+    respuesta = cliente.post("/api/movimientos/asignar", headers=admin,
+                             json={"movimiento_id": movimiento["id"], "rampa_id": 2})
+    assert respuesta.status_code == 200, respuesta.text
+    yield codigo
+    cliente.post("/api/movimientos/salida-cd", headers=admin,
+                 json={"movimiento_id": movimiento["id"], "chofer_codigo": codigo})
+
+
+@pytest.mark.parametrize("campos", [None, "id,camion.chofer.codigo,camion.chofer.telefono,asignado_por"])
+def test_pantalla_sin_sesion_sin_datos_personales(patio_con_asignacion, campos):
+    from serializacion import resolver_seleccion
+    foto = _foto(resolver_seleccion(campos, None), None)
+    assert patio_con_asignacion.encode() not in foto
+    assert b'"codigo"' not in foto
+    assert b'"telefono"' not in foto
+    assert b'"asignado_por"' not in foto
+
+
+def test_pantalla_de_chofer_sin_datos_personales(patio_con_asignacion, cabeceras):
+    from serializacion import COMPLETA
+    from sesiones import sesiones
+    sesion = sesiones.verificar(cabeceras("CHO001")["Authorization"].split()[1])
+    foto = _foto(COMPLETA, sesion)
+    assert patio_con_asignacion.encode() not in foto
+    assert b'"asignado_por"' not in foto
+
+
+def test_pantalla_de_personal_completa(patio_con_asignacion, cabeceras):
+    from serializacion import COMPLETA
+    from sesiones import sesiones
+    sesion = sesiones.verificar(cabeceras("DES001")["Authorization"].split()[1])
+    foto = _foto(COMPLETA, sesion)
+    assert patio_con_asignacion.encode() in foto
+    assert b'"asignado_por"' in foto
+
+
+# ----------------------------------------
+# Bloqueo de login
+# ----------------------------------------
+
+def test_bloqueo_por_codigo_e_ip():
+    from sesiones import MAX_INTENTOS, Sesiones
+    registro = Sesiones(secreto=b"pruebas")
+    for _ in range(MAX_INTENTOS):
+        registro.fallo("CHO001", "10.0.0.1")
+    assert registro.bloqueado("CHO001", "10.0.0.1")
+    assert not registro.bloqueado("CHO001", "10.0.0.2")  # el dueño del código sigue entrando
+
+
+def test_bloqueo_por_ip():
+    from sesiones import MAX_INTENTOS_IP, Sesiones
+    registro = Sesiones(secreto=b"pruebas")
+    for n in range(MAX_INTENTOS_IP):
+        registro.fallo(f"X{n:05d}", "10.0.0.3")
+    assert registro.bloqueado("CHO001", "10.0.0.3")
+    registro.exito("CHO001", "10.0.0.3")
+    assert registro.bloqueado("CHO002", "10.0.0.3")  # un login bueno no limpia la IP
@@ -0,0 +1,92 @@
+"""
+Aislamiento entre centros de distribución (sitios.py): cada request trabaja
+sobre el sitio de la sesión; otro sitio, con X-Sitio, solo los admin.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from conftest import SITIO
+
+
+@pytest.fixture
+def movimiento_en_otro_sitio(cliente, cabeceras, camion_nuevo, otro_sitio):
+    """Un camión disponible en el patio del segundo sitio: (placa, codigo)"""
+    placa, codigo, _ = camion_nuevo(otro_sitio)
+    admin = cabeceras("ADMIN01", otro_sitio)
+    movimiento = cliente.post("/api/movimientos/ingreso", headers=admin,
+                              json={"placa": placa, "chofer_codigo": codigo})
+    assert movimiento.status_code == 200, movimiento.text
+    assert cliente.post(f"/api/movimientos/{movimiento.json()['id']}/disponible", headers=admin).status_code == 200
+    return placa, codigo
+
+
+def _placas_activas(respuesta) -> set:
+    assert respuesta.status_code == 200, respuesta.text
+    return {m["camion"]["placa"] for cola in respuesta.json().values() for m in cola}
+
+
+@pytest.mark.parametrize("codigo", ["LOG001", "DES001", "CHO001"])
+def test_otro_sitio_solo_admin(cliente, cabeceras, otro_sitio, codigo):
+    respuesta = cliente.get("/api/rampas", headers=cabeceras(codigo, otro_sitio))
+    assert respuesta.status_code == 403
+
+
+def test_admin_ve_otro_sitio(cliente, cabeceras, otro_sitio):
+    propias = cliente.get("/api/rampas", headers=cabeceras("ADMIN01")).json()
+    ajenas = cliente.get("/api/rampas", headers=cabeceras("ADMIN01", otro_sitio)).json()
+    assert {r["sitio_id"] for r in propias} == {SITIO}
+    assert [(r["sitio_id"], r["nombre"]) for r in ajenas] == [(otro_sitio, "Rampa 1 - Pruebas")]
+
+
+def test_sitio_invalido_o_inexistente(cliente, cabeceras):
+    assert cliente.get("/api/rampas", headers=cabeceras("ADMIN01", "abc")).status_code == 400
+    assert cliente.get("/api/rampas", headers=cabeceras("ADMIN01", 999_999)).status_code == 404
+
+
+def test_movimientos_de_otro_sitio_no_aparecen(cliente, cabeceras, otro_sitio, movimiento_en_otro_sitio):
+    placa, _ = movimiento_en_otro_sitio
+    assert placa not in _placas_activas(cliente.get("/api/movimientos/activos", headers=cabeceras("DES001")))
+    assert placa in _placas_activas(
+        cliente.get("/api/movimientos/activos", headers=cabeceras("ADMIN01", otro_sitio))
+    )
+
+
+def test_camion_de_otro_sitio_no_ingresa(cliente, cabeceras, camion_nuevo, otro_sitio):
+    placa, codigo, _ = camion_nuevo(otro_sitio)
+    respuesta = cliente.post("/api/movimientos/ingreso", headers=cabeceras("LOG001"),
+                             json={"placa": placa, "chofer_codigo": codigo})
+    assert respuesta.status_code == 404
+    camiones = cliente.get("/api/camiones", headers=cabeceras("LOG001")).json()
+    assert placa not in {c["placa"] for c in camiones}
+
+
+def test_busqueda_por_sitio(cliente, cabeceras, camion_nuevo, otro_sitio):
+    placa, _, _ = camion_nuevo(otro_sitio)
+    propios = cliente.get("/api/buscar", params={"q": placa}, headers=cabeceras("ADMIN01")).json()
+    ajenos = cliente.get("/api/buscar", params={"q": placa}, headers=cabeceras("ADMIN01", otro_sitio)).json()
+    assert placa not in {r["etiqueta"] for r in propios}
+    assert ajenos[0]["etiqueta"] == placa
+
+
+def _sitio_de_pantalla(sitio, sesion):
+    """Dependencia de /api/stream/patio (la ruta misma no termina: es un feed)"""
+    import main
+    request = Request({"type": "http", "method": "GET", "path": "/api/stream/patio",
+                       "headers": [], "query_string": f"sitio={sitio}".encode()})
+    return asyncio.run(main.sitio_de_pantalla(request, sesion))
+
+
+def test_pantalla_de_otro_sitio(cabeceras, otro_sitio):
+    from sesiones import sesiones
+    # Sin sesión la pantalla elige el sitio; con sesión valen las reglas de siempre
+    assert _sitio_de_pantalla(otro_sitio, None) == (otro_sitio, None)
+    chofer = sesiones.verificar(cabeceras("CHO001")["Authorization"].split()[1])
+    with pytest.raises(HTTPException) as error:
+        _sitio_de_pantalla(otro_sitio, chofer)
+    assert error.value.status_code == 403
+    with pytest.raises(HTTPException) as error:
+        _sitio_de_pantalla(999_999, None)
+    assert error.value.status_code == 404